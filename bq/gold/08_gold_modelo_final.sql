@@ -1,6 +1,11 @@
 -- Consulta: 08_gold_modelo_final
 -- Crea la tabla: gold_data.modelo_final
-CREATE OR REPLACE TABLE `datamanagementbi.gold_data.modelo_final` AS
+-- Particionada por fecha y clusterizada: las recargas incrementales
+-- (python/src/materializacion_gold.py) solo reescriben los días afectados.
+CREATE OR REPLACE TABLE `datamanagementbi.gold_data.modelo_final`
+PARTITION BY fecha
+CLUSTER BY id_geografia, id_sector_economico
+AS
 SELECT
   c.fecha,
   c.id_geografia,
@@ -17,6 +22,4 @@ FROM
 LEFT JOIN `datamanagementbi.silver_data.dim_calendario` AS cal ON c.fecha = cal.fecha
 LEFT JOIN `datamanagementbi.silver_data.dim_geografia` AS geo ON c.id_geografia = geo.id_geografia
 LEFT JOIN `datamanagementbi.silver_data.fact_poblacion_anual` AS pob ON c.id_geografia = pob.id_geografia AND cal.anio = pob.anio
-LEFT JOIN `datamanagementbi.silver_data.fact_clima_horario` AS clima ON c.fecha = clima.fecha AND c.id_tramo_horario = clima.id_tramo_horario
-ORDER BY
-  c.fecha, c.id_geografia, c.id_tramo_horario, c.id_sector_economico;
\ No newline at end of file
+LEFT JOIN `datamanagementbi.silver_data.fact_clima_horario` AS clima ON c.fecha = clima.fecha AND c.id_tramo_horario = clima.id_tramo_horario;
\ No newline at end of file
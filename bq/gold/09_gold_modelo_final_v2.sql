@@ -1,13 +1,16 @@
 -- ===================================================================================== --
 -- Script: 09_gold_modelo_final_v2 (Enriquecido con Fiestas de Barrio)
 -- ===================================================================================== --
-CREATE OR REPLACE TABLE `datamanagementbi.gold_data.modelo_final_v2` AS
+CREATE OR REPLACE TABLE `datamanagementbi.gold_data.modelo_final_v2`
+PARTITION BY fecha
+CLUSTER BY id_geografia, id_sector_economico
+AS
 SELECT
   -- Seleccionamos todas las columnas del modelo original
   m.*,
   -- Añadimos la nueva característica: una bandera que indica si hay fiesta de barrio
   CASE WHEN fb.id_fiesta_dia IS NOT NULL THEN TRUE ELSE FALSE END AS es_fiesta_barrio,
-  fb.nombre_fiesta
+  fb.nombre_evento AS nombre_fiesta
 FROM
   `datamanagementbi.gold_data.modelo_final` AS m
 LEFT JOIN
@@ -1,6 +1,11 @@
 -- Consulta: 06_silver_fact_consumo_horario
 -- Crea la tabla: silver_data.fact_consumo_horario
-CREATE OR REPLACE TABLE `datamanagementbi.silver_data.fact_consumo_horario` AS
+-- Refresco diario: materializacion_gold.py reutiliza esta SELECT y solo reescribe
+-- las fechas nuevas, leyendo las tablas anuales de bronze de esa ventana.
+CREATE OR REPLACE TABLE `datamanagementbi.silver_data.fact_consumo_horario`
+PARTITION BY fecha
+CLUSTER BY id_geografia, id_sector_economico
+AS
 WITH
 consumo_unificado AS (
   SELECT Data, Codi_Postal, Tram_Horari, Sector_Economic, Valor FROM `datamanagementbi.bronze_data.raw_consumo_electrico_2021` UNION ALL
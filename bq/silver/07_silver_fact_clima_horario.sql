@@ -1,6 +1,8 @@
 -- Consulta: 07_silver_fact_clima_horario
 -- Crea la tabla: silver_data.fact_clima_horario
-CREATE OR REPLACE TABLE `datamanagementbi.silver_data.fact_clima_horario` AS
+CREATE OR REPLACE TABLE `datamanagementbi.silver_data.fact_clima_horario`
+PARTITION BY fecha
+AS
 WITH
 clima_formateado AS (
   SELECT
@@ -38,5 +40,4 @@ FROM clima_pivotado_por_estacion
 JOIN `datamanagementbi.silver_data.dim_tramo_horario` t
   ON PARSE_TIME('%H:%M:%S', FORMAT_TIME('%T', TIME(fecha_hora))) BETWEEN t.hora_inicio AND t.hora_fin
 GROUP BY fecha, id_tramo_horario
-HAVING id_tramo_horario IS NOT NULL
-ORDER BY fecha, id_tramo_horario;
\ No newline at end of file
+HAVING id_tramo_horario IS NOT NULL;
\ No newline at end of file
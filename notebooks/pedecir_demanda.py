@@ -3,20 +3,23 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from datetime import datetime, timedelta
-from google.cloud import bigquery
 import pickle 
+import os
+import sys
+
+# Módulos compartidos del pipeline (python/src)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python', 'src'))
+from cache_escenarios import CACHE_GLOBAL, calcular_version_predictor, normalizar_escenario
+from pronostico_multihorizonte import (EstadoLags, pronosticar_sector, climatologia_por_tramo,
+                                       construir_clima_futuro, indice_paso)
+from fuentes_datos import crear_fuente
 
 # ============================================================================
 # 1. CARGA DE DATOS HISTÓRICOS (DF)
 # ============================================================================
-# Esta sección carga tu DF histórico desde BigQuery
-print("⏳ Conectando a BigQuery y cargando datos históricos...")
-client = bigquery.Client(project='datamanagementbi')
-query = """
-    SELECT *
-    FROM `datamanagementbi.gold_data.modelo_final`
-"""
-df = client.query(query).to_dataframe()
+# Esta sección carga tu DF histórico desde la fuente configurada (BigQuery o DuckDB local)
+print("⏳ Conectando a la fuente de datos y cargando datos históricos...")
+df = crear_fuente().leer_tabla('gold_data.modelo_final')
 print(f"✅ Datos históricos (df) cargados: {len(df)} filas.")
 
 
@@ -51,7 +54,7 @@ class PredictorDemandaEnergetica:
     entrenados por sector económico.
     """
     
-    def __init__(self, modelos_entrenados, df_historico):
+    def __init__(self, modelos_entrenados, df_historico, cache=CACHE_GLOBAL):
         """
         Inicializar con los modelos ya entrenados y datos históricos.
         
@@ -61,10 +64,18 @@ class PredictorDemandaEnergetica:
             Diccionario con modelos por sector: {'Industrial': modelo, ...}
         df_historico : DataFrame
             DataFrame con datos históricos para estadísticas
+        cache : CacheEscenarios, optional
+            Caché de resultados compartida (por defecto la del proceso).
+            None desactiva la caché.
         """
         self.modelos = modelos_entrenados
         self.df_historico = df_historico
         
+        # Huella de modelos + histórico: las entradas de la caché solo se reutilizan
+        # por predictores equivalentes, aunque la caché sea compartida
+        self.cache = cache
+        self.version_predictor = calcular_version_predictor(modelos_entrenados, df_historico)
+        
         # Mapeo de sectores
         self.sector_map = {
             'Industrial': 1,
@@ -166,6 +177,23 @@ class PredictorDemandaEnergetica:
             # Por defecto, usar tarde (12-18)
             id_tramo = 3
         
+        def calcular():
+            return self._predecir_escenario(codigo_postal, sector, fecha, id_tramo,
+                                            temperatura, humedad, es_festivo)
+        
+        # Consultar la caché de escenarios antes de recalcular
+        if self.cache is None:
+            resultado = calcular()
+        else:
+            escenario = normalizar_escenario(codigo_postal, sector, fecha, id_tramo,
+                                             temperatura, humedad, es_festivo)
+            resultado = self.cache.obtener_o_calcular(self.version_predictor, escenario, calcular)
+        resultado['input']['hora'] = hora if hora is not None else f"Tramo {id_tramo}"
+        return resultado
+    
+    def _predecir_escenario(self, codigo_postal, sector, fecha, id_tramo,
+                            temperatura, humedad, es_festivo):
+        """Calcula la predicción de un escenario ya validado (sin pasar por la caché)."""
         # Extraer componentes de fecha
         mes = fecha.month
         dia_mes = fecha.day
@@ -243,7 +271,7 @@ class PredictorDemandaEnergetica:
                 'codigo_postal': codigo_postal,
                 'sector': sector,
                 'fecha': fecha.strftime('%Y-%m-%d'),
-                'hora': hora if hora is not None else f"Tramo {id_tramo}",
+                'hora': f"Tramo {id_tramo}",
                 'temperatura': temperatura,
                 'humedad': humedad,
                 'es_fin_de_semana': es_fds,
@@ -278,6 +306,16 @@ class PredictorDemandaEnergetica:
         if isinstance(fecha_fin, str):
             fecha_fin = datetime.strptime(fecha_fin, '%Y-%m-%d')
         
+        # Si el modelo usa lags de consumo, pronosticar de forma recursiva
+        # realimentando cada tramo predicho como lag del siguiente
+        if 'consumo_lag_1_hora' in self.modelos[sector].get_booster().feature_names:
+            df_recursivo = self._predecir_periodo_recursivo(
+                codigo_postal, sector, fecha_inicio, fecha_fin,
+                temperatura_promedio, humedad_promedio
+            )
+            if df_recursivo is not None:
+                return df_recursivo
+        
         predicciones = []
         fecha_actual = fecha_inicio
         
@@ -306,6 +344,51 @@ class PredictorDemandaEnergetica:
         
         return pd.DataFrame(predicciones)
     
+    def _predecir_periodo_recursivo(self,
+                                    codigo_postal,
+                                    sector,
+                                    fecha_inicio,
+                                    fecha_fin,
+                                    temperatura_promedio=None,
+                                    humedad_promedio=None):
+        """
+        Pronóstico recursivo desde el final del histórico hasta fecha_fin.
+        
+        Avanza todos los códigos postales del sector a la vez (una llamada a
+        'predict' por tramo) y devuelve solo el código postal solicitado.
+        Devuelve None si el periodo empieza antes del final del histórico.
+        """
+        df_sector = self.df_historico[
+            self.df_historico['id_sector_economico'] == self.sector_map[sector]
+        ]
+        estado = EstadoLags(df_sector)
+        if codigo_postal not in estado.ids:
+            return None
+        
+        paso_inicio = indice_paso([fecha_inicio], [1])[0]
+        paso_fin = indice_paso([fecha_fin], [4])[0]
+        if paso_inicio <= estado.ultimo_paso:
+            return None
+        
+        climatologia = climatologia_por_tramo(self.df_historico)
+        fechas_horizonte = pd.date_range(df_sector['fecha'].max(), fecha_fin, freq='D')
+        clima_futuro = construir_clima_futuro(
+            climatologia, fechas_horizonte, temperatura_promedio, humedad_promedio
+        ).set_index(['fecha', 'id_tramo_horario'])
+        
+        pasos, predicciones = pronosticar_sector(
+            self.modelos[sector], estado, paso_fin - estado.ultimo_paso,
+            clima_futuro=clima_futuro, climatologia=climatologia
+        )
+        
+        serie = predicciones[:, estado.ids.get_loc(codigo_postal)]
+        en_periodo = pasos >= paso_inicio
+        dias = (pasos[en_periodo] // 4).astype('datetime64[D]')
+        df_periodo = (pd.DataFrame({'fecha': dias, 'consumo_total_dia': serie[en_periodo]})
+                      .groupby('fecha', as_index=False)['consumo_total_dia'].sum())
+        df_periodo['es_fin_de_semana'] = df_periodo['fecha'].dt.weekday >= 5
+        return df_periodo
+    
     def comparar_escenarios(self, codigo_postal, sector, fecha, temperaturas):
         """
         Compara predicciones bajo diferentes escenarios de temperatura.
@@ -478,6 +561,12 @@ if 'resultados_modelos' in globals() and 'df' in globals():
     plt.tight_layout()
     plt.show()
     
+    # Métricas de la caché de escenarios
+    metricas_cache = CACHE_GLOBAL.metricas()
+    print(f"\n🗃️ Caché de escenarios: {metricas_cache['aciertos']} aciertos, "
+          f"{metricas_cache['fallos']} fallos (tasa de acierto {metricas_cache['tasa_acierto']:.1%})")
+    CACHE_GLOBAL.persistir()
+    
     print("\n" + "=" * 80)
     print("✨ Sistema de predicción listo para producción")
     print("=" * 80)
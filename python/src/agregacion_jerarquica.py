@@ -0,0 +1,412 @@
+# ============================================================================
+# AGREGACIÓN JERÁRQUICA Y RECONCILIACIÓN (CÓDIGO POSTAL -> BARRIO -> DISTRITO -> CIUDAD)
+# ============================================================================
+# Autor: Julio Clavijo
+# Versión: 1.0
+#
+# Descripción:
+# Las predicciones se guardan por (código postal, sector, fecha, tramo); los
+# cuadros de mando las agregaban con GROUP BY en cada consulta. Este módulo
+# precalcula las agregaciones una sola vez:
+#
+#   1. Una matriz de suma dispersa S (nodos x series inferiores) sobre el
+#      producto geografía x sector: código postal, barrio, distrito y ciudad,
+#      cada sector y el total. Se construye sin bucles como producto de
+#      Kronecker de la matriz geográfica y la de sectores.
+#   2. Las predicciones se pivotan a una matriz (series inferiores x tiempo)
+#      por bloques de columnas; cada bloque se agrega con un único producto
+#      S @ Y, para el valor real, el predicho y el número de series presentes.
+#   3. Si se aportan previsiones base de niveles agregados (p. ej. un modelo
+#      de ciudad), se reconcilian con las inferiores por mínimos cuadrados
+#      generalizados (WLS estructural, OLS o bottom-up): la matriz
+#      S'W^-1 S se factoriza una vez y cada bloque es un solve.
+#   4. El resultado se escribe en tablas pre-agregadas (por tramo o por día)
+#      con escritura_incremental.py, sustituyendo solo las fechas afectadas.
+#
+# Un código postal repartido entre k barrios aporta 1/k a cada uno.
+# ============================================================================
+
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import scipy.sparse as sp
+from scipy.sparse.linalg import splu
+
+from fuentes_datos import SECTORES
+
+# --- 1. CONFIGURACIÓN ---
+PROJECT_ID = "datamanagementbi"
+TABLA_PREDICCIONES = "gold_data.predicciones_modelo_final"
+TABLA_GEOGRAFIA = "silver_data.dim_geografia"
+TABLA_GOLD = "gold_data.modelo_final_v2"
+TABLAS_DESTINO = {
+    'tramo': "gold_data.predicciones_agregadas",
+    'dia': "gold_data.predicciones_agregadas_diarias",
+}
+
+# Nivel -> columna de la dimensión geográfica que lo define (de menor a mayor)
+NIVELES_GEOGRAFIA = {
+    'codigo_postal': 'id_geografia',
+    'barrio': 'nombre_barrio',
+    'distrito': 'nombre_distrito',
+    'ciudad': 'nombre_municipio',
+}
+SECTOR_TOTAL = (0, 'Total')
+SIN_ASIGNAR = 'Sin asignar'
+METODOS = ('wls', 'ols', 'bottom_up')
+CELDAS_POR_BLOQUE = 20_000_000  # series inferiores x columnas de tiempo por bloque
+
+ESQUEMA_AGREGADOS = pa.schema([
+    ('fecha', pa.date32()),
+    ('id_tramo_horario', pa.int64()),
+    ('nivel_geografia', pa.string()),
+    ('geografia', pa.string()),
+    ('id_sector_economico', pa.int64()),
+    ('sector_nombre', pa.string()),
+    ('series', pa.int64()),
+    ('consumo_kwh_real', pa.float64()),
+    ('consumo_kwh_predicho', pa.float64()),
+    ('consumo_kwh_reconciliado', pa.float64()),
+])
+ESQUEMA_AGREGADOS_DIARIOS = pa.schema([c for c in ESQUEMA_AGREGADOS if c.name != 'id_tramo_horario'])
+COLUMNAS_CLAVE_AGREGADOS = ['fecha', 'nivel_geografia', 'geografia', 'id_sector_economico', 'id_tramo_horario']
+COLUMNAS_CLUSTER_AGREGADOS = ['nivel_geografia', 'geografia', 'id_sector_economico']
+
+
+def esquema_destino(tiempo):
+    """(esquema, clave) de la tabla pre-agregada por 'tramo' o por 'dia'."""
+    if tiempo == 'dia':
+        return ESQUEMA_AGREGADOS_DIARIOS, [c for c in COLUMNAS_CLAVE_AGREGADOS if c != 'id_tramo_horario']
+    return ESQUEMA_AGREGADOS, COLUMNAS_CLAVE_AGREGADOS
+
+
+# --- 2. JERARQUÍA Y MATRIZ DE SUMA ---
+
+class JerarquiaGeografica:
+    """
+    Matriz de suma S de la jerarquía geografía x sector.
+
+    Las series inferiores son los pares (código postal, sector), en orden
+    código-mayor: la serie de (codigos[i], sectores[j]) es i * n_sectores + j.
+    Cada fila de S es un nodo (nivel, geografía, sector o total) y 'nodos'
+    la describe. Las filas de código postal x sector forman la identidad.
+    """
+
+    def __init__(self, geografia, sectores=SECTORES):
+        """
+        Args:
+            geografia (pd.DataFrame): id_geografia y las columnas de
+                NIVELES_GEOGRAFIA; un código puede aparecer en varias filas
+                (repartido entre barrios).
+            sectores (dict): id_sector_economico -> nombre.
+        """
+        geografia = geografia.assign(id_geografia=geografia['id_geografia'].astype(str)).drop_duplicates()
+        self.codigos = pd.Index(np.sort(geografia['id_geografia'].unique()))
+        self.sectores = pd.Index(sorted(sectores))
+        n_codigos, n_sectores = len(self.codigos), len(self.sectores)
+
+        # Sectores: identidad + fila de total
+        matriz_sectores = sp.vstack([sp.identity(n_sectores, format='csr'),
+                                     sp.csr_matrix(np.ones((1, n_sectores)))]).tocsr()
+        ids_sector = list(self.sectores) + [SECTOR_TOTAL[0]]
+        nombres_sector = [sectores[s] for s in self.sectores] + [SECTOR_TOTAL[1]]
+
+        bloques, nodos = [], []
+        for nivel, columna in NIVELES_GEOGRAFIA.items():
+            pares = geografia[['id_geografia']].assign(nodo=geografia[columna].astype(str)).drop_duplicates()
+            filas, etiquetas = pd.factorize(pares['nodo'], sort=True)
+            columnas = self.codigos.get_indexer(pares['id_geografia'])
+            # Un código en k nodos del mismo nivel aporta 1/k a cada uno
+            pesos = 1.0 / pares.groupby('id_geografia')['nodo'].transform('size').to_numpy()
+            matriz_geografia = sp.csr_matrix((pesos, (filas, columnas)), shape=(len(etiquetas), n_codigos))
+            bloques.append(sp.kron(matriz_geografia, matriz_sectores, format='csr'))
+            nodos.append(pd.DataFrame({
+                'nivel_geografia': nivel,
+                'geografia': np.repeat(np.asarray(etiquetas), len(ids_sector)),
+                'id_sector_economico': np.tile(ids_sector, len(etiquetas)),
+                'sector_nombre': np.tile(nombres_sector, len(etiquetas)),
+            }))
+        self.S = sp.vstack(bloques, format='csr')
+        self.S.sort_indices()
+        self.nodos = pd.concat(nodos, ignore_index=True)
+        # Nodos inferiores (código postal x sector) y nodos agregados
+        inferior = (self.nodos['nivel_geografia'] == 'codigo_postal') & (self.nodos['id_sector_economico'] != SECTOR_TOTAL[0])
+        self.inferiores = np.flatnonzero(inferior.to_numpy())
+        self.agregados = np.flatnonzero(~inferior.to_numpy())
+        # Número de series inferiores de cada nodo (para 'series' y el WLS estructural)
+        self.conteo = self.S.copy()
+        self.conteo.data[:] = 1.0
+
+    @property
+    def n_inferiores(self):
+        return self.S.shape[1]
+
+    def indice_inferior(self, id_geografia, id_sector):
+        """Índice de serie inferior de cada par (-1 si el código o el sector no están)."""
+        i = self.codigos.get_indexer(pd.Index(id_geografia).astype(str))
+        j = self.sectores.get_indexer(pd.Index(id_sector).astype(np.int64))
+        return np.where((i >= 0) & (j >= 0), i * len(self.sectores) + j, -1)
+
+    def indice_nodo(self, nivel, geografia, id_sector):
+        """Fila de S de cada (nivel, geografía, sector) (-1 si no existe)."""
+        claves = pd.MultiIndex.from_frame(self.nodos[['nivel_geografia', 'geografia', 'id_sector_economico']])
+        consulta = pd.MultiIndex.from_arrays([pd.Index(nivel).astype(str), pd.Index(geografia).astype(str),
+                                              pd.Index(id_sector).astype(np.int64)])
+        return claves.get_indexer(consulta)
+
+    def describir(self):
+        niveles = self.nodos.groupby('nivel_geografia', sort=False)['geografia'].nunique()
+        return (f"{self.n_inferiores:,} series inferiores, {len(self.nodos):,} nodos "
+                f"({', '.join(f'{n} {nivel}' for nivel, n in niveles.items())}), "
+                f"S con {self.S.nnz:,} no nulos")
+
+
+def cargar_geografia(fuente, codigos=None):
+    """
+    Dimensión geográfica desde silver_data.dim_geografia (o, si no existe, los
+    valores distintos del gold). Los códigos de 'codigos' que no aparezcan se
+    asignan a SIN_ASIGNAR en barrio y distrito.
+    """
+    columnas = ', '.join(NIVELES_GEOGRAFIA.values())
+    tabla = TABLA_GEOGRAFIA if fuente.existe_tabla(TABLA_GEOGRAFIA) else TABLA_GOLD
+    geografia = fuente.consultar(f"SELECT DISTINCT {columnas} FROM `{PROJECT_ID}.{tabla}`")
+    geografia['id_geografia'] = geografia['id_geografia'].astype(str)
+    geografia = geografia.fillna(SIN_ASIGNAR)
+    if codigos is not None:
+        faltan = pd.Index(pd.unique(pd.Index(codigos).astype(str))).difference(geografia['id_geografia'])
+        if len(faltan):
+            municipio = geografia['nombre_municipio'].mode()
+            geografia = pd.concat([geografia, pd.DataFrame({
+                'id_geografia': faltan, 'nombre_barrio': SIN_ASIGNAR, 'nombre_distrito': SIN_ASIGNAR,
+                'nombre_municipio': municipio.iloc[0] if len(municipio) else SIN_ASIGNAR,
+            })], ignore_index=True)
+    return geografia
+
+
+# --- 3. RECONCILIACIÓN ---
+
+class Reconciliador:
+    """
+    Reconciliación lineal de previsiones base observadas en un subconjunto de
+    nodos: inferiores = (So' W^-1 So)^-1 So' W^-1 y_o, y todos los nodos S @ inferiores.
+
+    'wls' usa W = diag(número de series inferiores del nodo) (escalado
+    estructural), 'ols' W = I y 'bottom_up' ignora los nodos agregados.
+    """
+
+    def __init__(self, jerarquia, observados, metodo='wls'):
+        if metodo not in METODOS:
+            raise ValueError(f"Método de reconciliación desconocido: {metodo} (opciones: {METODOS})")
+        self.jerarquia = jerarquia
+        self.metodo = metodo
+        if metodo == 'bottom_up':
+            observados = jerarquia.inferiores
+        self.observados = np.asarray(observados)
+        So = jerarquia.S[self.observados]
+        if metodo == 'wls':
+            pesos = 1.0 / np.asarray(jerarquia.conteo[self.observados].sum(axis=1)).ravel()
+        else:
+            pesos = np.ones(len(self.observados))
+        self._proyeccion = (So.T @ sp.diags(pesos)).tocsr()  # So' W^-1
+        self._lu = splu((self._proyeccion @ So).tocsc())
+
+    def reconciliar(self, base):
+        """
+        Args:
+            base (np.ndarray): (nodos observados x columnas) en el orden de 'observados'.
+
+        Returns:
+            np.ndarray: Series inferiores reconciliadas (inferiores x columnas).
+        """
+        return self._lu.solve(np.asarray(self._proyeccion @ base, dtype=np.float64))
+
+
+# --- 4. AGREGACIÓN ---
+
+def _claves_tiempo(df, tiempo):
+    """Clave entera por fila: día, o día * 100 + tramo."""
+    dias = pd.to_datetime(df['fecha']).to_numpy().astype('datetime64[D]').astype(np.int64)
+    if tiempo == 'dia':
+        return dias
+    return dias * 100 + df['id_tramo_horario'].to_numpy(dtype=np.int64)
+
+
+def _pivotar(inferior, columna, valores, n_inferiores, n_columnas):
+    """Matriz densa (series inferiores x columnas) con la suma de 'valores' (None = recuento)."""
+    plano = inferior * n_columnas + columna
+    return np.bincount(plano, weights=valores, minlength=n_inferiores * n_columnas).reshape(n_inferiores, n_columnas)
+
+
+def agregar(df, jerarquia, tiempo='tramo', previsiones_base=None, metodo='wls', celdas_por_bloque=CELDAS_POR_BLOQUE):
+    """
+    Agrega las predicciones de código postal x sector a todos los nodos de la
+    jerarquía y, opcionalmente, las reconcilia con previsiones base agregadas.
+
+    Args:
+        df (pd.DataFrame): fecha, id_tramo_horario, id_geografia,
+            id_sector_economico, consumo_kwh_real, consumo_kwh_predicho.
+        jerarquia (JerarquiaGeografica): Jerarquía con la matriz de suma.
+        tiempo (str): 'tramo' (fecha, tramo) o 'dia' (fecha).
+        previsiones_base (pd.DataFrame, optional): Previsiones de nodos
+            agregados: nivel_geografia, geografia, id_sector_economico, fecha,
+            [id_tramo_horario,] consumo_kwh_predicho. Sin ellas
+            'consumo_kwh_reconciliado' queda nulo (lo agregado ya es coherente).
+        metodo (str): 'wls', 'ols' o 'bottom_up'.
+        celdas_por_bloque (int): Tamaño de la matriz densa de cada bloque.
+
+    Returns:
+        tuple: (pd.DataFrame con el esquema de destino, dict de métricas).
+    """
+    inicio = time.perf_counter()
+    inferior = jerarquia.indice_inferior(df['id_geografia'], df['id_sector_economico'])
+    validas = inferior >= 0
+    claves = _claves_tiempo(df, tiempo)[validas]
+    columnas, tiempos = pd.factorize(claves, sort=True)
+    orden = np.argsort(columnas, kind='stable')
+    inferior, columnas = inferior[validas][orden], columnas[orden]
+    real = df['consumo_kwh_real'].to_numpy(dtype=np.float64)[validas][orden]
+    predicho = df['consumo_kwh_predicho'].to_numpy(dtype=np.float64)[validas][orden]
+    real = np.nan_to_num(real)
+    predicho = np.nan_to_num(predicho)
+    n_inf, n_tiempos = jerarquia.n_inferiores, len(tiempos)
+
+    # Previsiones base agregadas -> (nodo, columna) sobre los mismos tiempos
+    reconciliador, base = None, None
+    if previsiones_base is not None and len(previsiones_base):
+        nodo = jerarquia.indice_nodo(previsiones_base['nivel_geografia'], previsiones_base['geografia'],
+                                     previsiones_base['id_sector_economico'])
+        columna_base = pd.Index(tiempos).get_indexer(_claves_tiempo(previsiones_base, tiempo))
+        utiles = (nodo >= 0) & (columna_base >= 0) & np.isin(nodo, jerarquia.agregados)
+        reconciliador = Reconciliador(jerarquia, np.union1d(jerarquia.inferiores, np.unique(nodo[utiles])), metodo)
+        utiles &= np.isin(nodo, reconciliador.observados)
+        posicion = np.searchsorted(reconciliador.observados, nodo[utiles])
+        base = (posicion, columna_base[utiles], previsiones_base['consumo_kwh_predicho'].to_numpy(dtype=np.float64)[utiles])
+
+    S_agregados = jerarquia.S[jerarquia.agregados]
+    conteo_agregados = jerarquia.conteo[jerarquia.agregados]
+    ancho = max(1, celdas_por_bloque // max(n_inf, 1))
+    limites = np.searchsorted(columnas, np.arange(0, n_tiempos + ancho, ancho))
+    salidas = []
+    for b, desde in enumerate(range(0, n_tiempos, ancho)):
+        hasta = min(desde + ancho, n_tiempos)
+        tramo = slice(limites[b], limites[b + 1])
+        inf, col = inferior[tramo], columnas[tramo] - desde
+        n_col = hasta - desde
+        presentes = _pivotar(inf, col, None, n_inf, n_col) > 0
+        Y_real = _pivotar(inf, col, real[tramo], n_inf, n_col)
+        Y_pred = _pivotar(inf, col, predicho[tramo], n_inf, n_col)
+
+        series = np.rint(conteo_agregados @ presentes).astype(np.int64)
+        agregado_real = S_agregados @ Y_real
+        agregado_pred = S_agregados @ Y_pred
+        reconciliado = None
+        if reconciliador is not None:
+            # Los huecos de la previsión base se rellenan con la suma de las inferiores
+            y_obs = jerarquia.S[reconciliador.observados] @ Y_pred
+            en_bloque = (base[1] >= desde) & (base[1] < hasta)
+            y_obs[base[0][en_bloque], base[1][en_bloque] - desde] = base[2][en_bloque]
+            reconciliado = S_agregados @ reconciliador.reconciliar(y_obs)
+
+        fila, col_salida = np.nonzero(series)
+        nodos = jerarquia.nodos.iloc[jerarquia.agregados[fila]]
+        clave = tiempos[desde + col_salida]
+        salida = pd.DataFrame({
+            'fecha': (clave if tiempo == 'dia' else clave // 100).astype('datetime64[D]'),
+            'nivel_geografia': nodos['nivel_geografia'].to_numpy(),
+            'geografia': nodos['geografia'].to_numpy(),
+            'id_sector_economico': nodos['id_sector_economico'].to_numpy(),
+            'sector_nombre': nodos['sector_nombre'].to_numpy(),
+            'series': series[fila, col_salida],
+            'consumo_kwh_real': agregado_real[fila, col_salida],
+            'consumo_kwh_predicho': agregado_pred[fila, col_salida],
+            'consumo_kwh_reconciliado': reconciliado[fila, col_salida] if reconciliado is not None else np.nan,
+        })
+        if tiempo != 'dia':
+            salida.insert(1, 'id_tramo_horario', clave % 100)
+        salidas.append(salida)
+
+    esquema, _ = esquema_destino(tiempo)
+    resultado = pd.concat(salidas, ignore_index=True) if salidas else pd.DataFrame(columns=esquema.names)
+    metricas = {
+        'filas_entrada': int(len(df)),
+        'filas_descartadas': int((~validas).sum()),
+        'filas_salida': int(len(resultado)),
+        'columnas_tiempo': int(n_tiempos),
+        'bloques': len(salidas),
+        'nodos_observados': int(len(reconciliador.observados)) if reconciliador is not None else None,
+        'metodo': metodo if reconciliador is not None else None,
+        'segundos': round(time.perf_counter() - inicio, 3),
+    }
+    return resultado[esquema.names], metricas
+
+
+def describir_agregacion(metricas):
+    texto = (f"{metricas['filas_entrada']:,} filas -> {metricas['filas_salida']:,} agregados en "
+             f"{metricas['columnas_tiempo']:,} columnas de tiempo ({metricas['bloques']} bloques, "
+             f"{metricas['segundos']:.2f} s)")
+    if metricas['metodo']:
+        texto += f", reconciliado por {metricas['metodo']} con {metricas['nodos_observados']:,} nodos observados"
+    if metricas['filas_descartadas']:
+        texto += f"; {metricas['filas_descartadas']:,} filas fuera de la jerarquía"
+    return texto
+
+
+# --- 5. EJECUCIÓN ---
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from fuentes_datos import crear_fuente, construir_consulta
+    from escritura_incremental import EscritorBigQuery, EscritorLocal, ESQUEMA_PREDICCIONES
+
+    parser = argparse.ArgumentParser(description="Agrega y reconcilia las predicciones por barrio, distrito y ciudad")
+    parser.add_argument('--desde', help="Primera fecha (YYYY-MM-DD) a agregar")
+    parser.add_argument('--hasta', help="Última fecha (YYYY-MM-DD) a agregar")
+    parser.add_argument('--tiempo', choices=list(TABLAS_DESTINO), default='tramo',
+                        help="Granularidad temporal de la tabla pre-agregada")
+    parser.add_argument('--previsiones-agregadas',
+                        help="Parquet con previsiones base de nodos agregados a reconciliar")
+    parser.add_argument('--metodo', choices=METODOS, default='wls', help="Método de reconciliación")
+    parser.add_argument('--destino-local',
+                        help="Base DuckDB local de predicciones (origen y destino) en lugar de BigQuery")
+    args = parser.parse_args()
+
+    print("--- Iniciando la agregación jerárquica de predicciones ---")
+    load_dotenv()
+    fuente = crear_fuente()
+    columnas = ESQUEMA_PREDICCIONES.names
+    try:
+        if args.destino_local:
+            import duckdb
+            tabla_local = TABLA_PREDICCIONES.replace('.', '__')
+            consulta = construir_consulta(TABLA_PREDICCIONES, columnas, args.desde, args.hasta)
+            consulta = consulta.replace(f"`{PROJECT_ID}.{TABLA_PREDICCIONES}`", tabla_local)
+            with duckdb.connect(args.destino_local, read_only=True) as conexion:
+                df = conexion.execute(consulta).df()
+        else:
+            df = fuente.consultar(construir_consulta(TABLA_PREDICCIONES, columnas, args.desde, args.hasta))
+        jerarquia = JerarquiaGeografica(cargar_geografia(fuente, df['id_geografia']))
+        print(f"Paso 1: {len(df):,} predicciones leídas; jerarquía con {jerarquia.describir()}.")
+    except Exception as e:
+        print(f"❌ Error al leer las predicciones o la geografía: {e}")
+        exit()
+
+    previsiones_base = pd.read_parquet(args.previsiones_agregadas) if args.previsiones_agregadas else None
+    resultado, metricas = agregar(df, jerarquia, tiempo=args.tiempo, previsiones_base=previsiones_base,
+                                  metodo=args.metodo)
+    print(f"Paso 2: {describir_agregacion(metricas)}.")
+
+    destino = TABLAS_DESTINO[args.tiempo]
+    esquema, clave = esquema_destino(args.tiempo)
+    try:
+        if args.destino_local:
+            escritor = EscritorLocal(args.destino_local, destino, esquema=esquema, clave=clave)
+        else:
+            escritor = EscritorBigQuery(PROJECT_ID, destino, credentials=getattr(fuente, 'credentials', None),
+                                        esquema=esquema, clave=clave, cluster=COLUMNAS_CLUSTER_AGREGADOS)
+        resumen = escritor.escribir(resultado, modo='particiones')
+        print(f"✅ {resumen['filas']:,} filas escritas en '{destino}' ({resumen['fechas']} particiones).")
+    except Exception as e:
+        print(f"❌ Error al escribir las agregaciones: {e}")
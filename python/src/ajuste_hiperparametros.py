@@ -0,0 +1,354 @@
+# ============================================================================
+# AJUSTE DE HIPERPARÁMETROS POR SECTOR (VALIDACIÓN CRONOLÓGICA + HALVING)
+# ============================================================================
+# Autor: Julio Clavijo
+# Versión: 1.0
+#
+# Descripción:
+# Los tres scripts de entrenamiento fijaban los mismos hiperparámetros
+# (1000 árboles, learning_rate 0.05, profundidad 8). Este módulo los ajusta
+# por sector y los deja en HIPERPARAMETROS_PATH, de donde los leen:
+#
+#   1. Las matrices cuantizadas (QuantileDMatrix) de entrenamiento y
+#      validación se construyen UNA vez por sector y pliegue, y todas las
+#      pruebas las reutilizan (la validación comparte los cortes del
+#      entrenamiento con 'ref').
+#   2. Validación cronológica: pliegues de ventana creciente sobre el 80%
+#      de entrenamiento (el 20% de prueba de train_model_final no se toca),
+#      cortados en cambio de día.
+#   3. Successive halving: todas las configuraciones empiezan con pocas
+#      rondas; en cada escalón solo sigue el mejor tercio, continuando sus
+#      boosters (no se reentrena desde cero). La configuración actual
+#      siempre participa como referencia y, para compararla bien, se entrena
+#      hasta su early stopping aunque el halving la descarte.
+#   4. Las pruebas de un escalón se ejecutan en hilos (XGBoost libera el
+#      GIL y así comparten las matrices) con 'nucleos_por_prueba' hilos cada
+#      una, sin superar el presupuesto total de núcleos.
+# ============================================================================
+
+import os
+import json
+import math
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+# --- 1. CONFIGURACIÓN ---
+HIPERPARAMETROS_PATH = os.getenv("HIPERPARAMETROS_PATH", 'hiperparametros.json')
+# Valores de los scripts de entrenamiento cuando un sector no está ajustado
+PARAMETROS_POR_DEFECTO = {'n_estimators': 1000, 'learning_rate': 0.05, 'max_depth': 8}
+NUCLEOS = int(os.getenv("AJUSTE_NUCLEOS", os.cpu_count() or 1))
+NUM_CONFIGURACIONES = 27
+NUM_PLIEGUES = 3
+PROPORCION_VALIDACION = 0.1     # de las filas de entrenamiento, por pliegue
+PROPORCION_PRUEBA = 0.2         # la misma división que train_model_final.py
+RONDAS_MINIMAS = 50
+RONDAS_MAXIMAS = int(os.getenv("ENTRENAMIENTO_MAX_ARBOLES", 1000))
+FACTOR_HALVING = 3
+PACIENCIA = 10                  # rondas sin mejora para dar una configuración por terminada
+MAX_BIN = 256
+
+# Espacio de búsqueda: (mínimo, máximo, escala); las enteras se redondean
+ESPACIO = {
+    'learning_rate': (0.02, 0.3, 'log'),
+    'max_depth': (4, 10, 'entero'),
+    'min_child_weight': (1, 50, 'log'),
+    'subsample': (0.6, 1.0, 'lineal'),
+    'colsample_bytree': (0.5, 1.0, 'lineal'),
+    'reg_lambda': (0.1, 10, 'log'),
+}
+EXCLUIDAS = ['consumo_kwh', 'id_sector_economico', 'sector_nombre', 'nombre_municipio', 'festivo_descripcion']
+
+
+def hiperparametros(sector=None, ruta=HIPERPARAMETROS_PATH):
+    """
+    Argumentos de XGBRegressor para un sector: los ajustados en 'ruta' si
+    existen y, si no, PARAMETROS_POR_DEFECTO (n_estimators es siempre el
+    máximo; el early stopping decide los árboles).
+    """
+    parametros = dict(PARAMETROS_POR_DEFECTO)
+    if sector is not None and os.path.exists(ruta):
+        with open(ruta, encoding='utf-8') as file:
+            ajustados = json.load(file).get('sectores', {})
+        if sector in ajustados:
+            parametros.update(ajustados[sector]['parametros'])
+    return parametros
+
+
+# --- 2. DATOS Y PLIEGUES ---
+
+def preparar_sector(df_sector):
+    """X, y y fechas de un sector con el Feature Engineering de 'train_model_final.py'."""
+    df_sector = df_sector.copy()
+    df_sector['fecha'] = pd.to_datetime(df_sector['fecha'])
+    consumo = df_sector.groupby('id_geografia')['consumo_kwh']
+    df_sector['consumo_lag_1_hora'] = consumo.shift(1)
+    df_sector['consumo_lag_2_horas'] = consumo.shift(2)
+    df_sector['consumo_lag_1_dia'] = consumo.shift(4)
+    df_sector['consumo_media_movil_7d'] = consumo.rolling(window=28, min_periods=1).mean().reset_index(level=0, drop=True)
+    df_sector['temp_cuadrado'] = df_sector['temperatura_media_ciudad'] ** 2
+    df_sector['dist_confort'] = abs(df_sector['temperatura_media_ciudad'] - 20)
+    df_sector = df_sector.dropna().reset_index(drop=True)
+    for col in df_sector.columns:
+        if df_sector[col].dtype.name in ['object', 'category'] and col != 'sector_nombre':
+            df_sector[col] = df_sector[col].astype('category')
+    features = [col for col in df_sector.columns if col not in EXCLUIDAS + ['fecha']]
+    return df_sector[features], df_sector['consumo_kwh'], df_sector['fecha'].to_numpy()
+
+
+def cortes_cronologicos(fechas, n_pliegues=NUM_PLIEGUES, proporcion=PROPORCION_VALIDACION):
+    """
+    (fin_entrenamiento, fin_validacion) de cada pliegue de ventana creciente:
+    el último pliegue valida con las filas más recientes. Los cortes se
+    alinean al primer registro de un día para no partir un día entre ambos.
+    """
+    n = len(fechas)
+    tamano = int(n * proporcion)
+    cortes = []
+    for k in range(n_pliegues, 0, -1):
+        fin_validacion = n - (k - 1) * tamano
+        fin_entrenamiento = int(np.searchsorted(fechas, fechas[fin_validacion - tamano], side='left'))
+        if fin_entrenamiento > 0:
+            cortes.append((fin_entrenamiento, fin_validacion))
+    return cortes
+
+
+def construir_pliegues(X, y, cortes, nthread=NUCLEOS):
+    """
+    Matrices cuantizadas de cada pliegue, construidas una sola vez.
+
+    Returns:
+        list: [(QuantileDMatrix entrenamiento, QuantileDMatrix validación)]
+    """
+    pliegues = []
+    for fin_entrenamiento, fin_validacion in cortes:
+        entrenamiento = xgb.QuantileDMatrix(X.iloc[:fin_entrenamiento], label=y.iloc[:fin_entrenamiento],
+                                            enable_categorical=True, max_bin=MAX_BIN, nthread=nthread)
+        validacion = xgb.QuantileDMatrix(X.iloc[fin_entrenamiento:fin_validacion],
+                                         label=y.iloc[fin_entrenamiento:fin_validacion],
+                                         enable_categorical=True, max_bin=MAX_BIN, nthread=nthread, ref=entrenamiento)
+        pliegues.append((entrenamiento, validacion))
+    return pliegues
+
+
+# --- 3. CONFIGURACIONES Y PRUEBAS ---
+
+def muestrear_configuraciones(n, semilla=0):
+    """La configuración actual más n - 1 muestras aleatorias de ESPACIO."""
+    rng = np.random.default_rng(semilla)
+    configuraciones = [{k: v for k, v in PARAMETROS_POR_DEFECTO.items() if k != 'n_estimators'}]
+    for _ in range(n - 1):
+        configuracion = {}
+        for nombre, (minimo, maximo, escala) in ESPACIO.items():
+            if escala == 'log':
+                configuracion[nombre] = float(math.exp(rng.uniform(math.log(minimo), math.log(maximo))))
+            elif escala == 'entero':
+                configuracion[nombre] = int(rng.integers(minimo, maximo + 1))
+            else:
+                configuracion[nombre] = float(rng.uniform(minimo, maximo))
+        configuraciones.append(configuracion)
+    return configuraciones
+
+
+class Prueba:
+    """
+    Una configuración con un booster por pliegue, entrenable por escalones.
+
+    Cada prueba lleva su propia semilla y se resiembra en cada ronda
+    (seed_per_iteration): el estado aleatorio de XGBoost es por hilo y, al
+    continuar un booster, el muestreo (subsample, colsample) dependería de
+    qué pruebas se ejecutaron antes en el mismo hilo, es decir, del
+    presupuesto de núcleos.
+    """
+
+    def __init__(self, numero, parametros, semilla=0):
+        self.numero = numero
+        self.parametros = parametros
+        self.semilla = semilla
+        self.boosters = []
+        self.curvas = []          # MAPE de validación por ronda, uno por pliegue
+        self.rondas = 0
+        self.terminada = False    # sin mejora en PACIENCIA rondas
+
+    def avanzar(self, pliegues, rondas_objetivo, nthread):
+        """Continúa el entrenamiento de cada pliegue hasta 'rondas_objetivo' rondas."""
+        nuevas = rondas_objetivo - self.rondas
+        if nuevas <= 0 or self.terminada:
+            return self
+        parametros = {'objective': 'reg:squarederror', 'eval_metric': 'mape', 'tree_method': 'hist',
+                      'max_bin': MAX_BIN, 'nthread': nthread, 'seed': self.semilla, 'seed_per_iteration': True,
+                      **self.parametros}
+        for i, (entrenamiento, validacion) in enumerate(pliegues):
+            historial = {}
+            booster = xgb.train(parametros, entrenamiento, num_boost_round=nuevas, evals=[(validacion, 'validacion')],
+                                evals_result=historial, verbose_eval=False,
+                                xgb_model=self.boosters[i] if i < len(self.boosters) else None)
+            if i < len(self.boosters):
+                self.boosters[i] = booster
+                self.curvas[i].extend(historial['validacion']['mape'])
+            else:
+                self.boosters.append(booster)
+                self.curvas.append(historial['validacion']['mape'])
+        self.rondas = rondas_objetivo
+        self.terminada = self.rondas - 1 - self.mejor_ronda() >= PACIENCIA
+        return self
+
+    def curva_media(self):
+        return np.mean(np.array(self.curvas), axis=0)
+
+    def mejor_ronda(self):
+        return int(np.argmin(self.curva_media()))
+
+    def puntuacion(self):
+        """MAPE de validación (%) medio entre pliegues en la mejor ronda."""
+        return float(self.curva_media()[self.mejor_ronda()] * 100)
+
+    def resumen(self):
+        return {'prueba': self.numero, **self.parametros, 'rondas': self.rondas, 'arboles': self.mejor_ronda() + 1,
+                'mape_validacion': self.puntuacion()}
+
+
+def escalones(rondas_minimas=RONDAS_MINIMAS, rondas_maximas=RONDAS_MAXIMAS, factor=FACTOR_HALVING):
+    """Rondas de cada escalón: rondas_minimas * factor^k hasta rondas_maximas."""
+    rondas = [rondas_minimas]
+    while rondas[-1] < rondas_maximas:
+        rondas.append(min(rondas[-1] * factor, rondas_maximas))
+    return rondas
+
+
+# --- 4. AJUSTE DE UN SECTOR ---
+
+def ajustar_sector(df_sector, n_configuraciones=NUM_CONFIGURACIONES, n_pliegues=NUM_PLIEGUES, nucleos=NUCLEOS,
+                   nucleos_por_prueba=1, semilla=0, rondas_maximas=RONDAS_MAXIMAS):
+    """
+    Ajusta los hiperparámetros de un sector con successive halving.
+
+    Args:
+        df_sector (pd.DataFrame): Datos del sector en orden cronológico.
+        n_configuraciones (int): Configuraciones del primer escalón.
+        n_pliegues (int): Pliegues cronológicos de validación.
+        nucleos (int): Presupuesto total de núcleos.
+        nucleos_por_prueba (int): Hilos de XGBoost de cada prueba.
+        semilla (int): Semilla del muestreo de configuraciones.
+        rondas_maximas (int): Rondas del último escalón.
+
+    Returns:
+        tuple: (dict con la mejor configuración, dict de métricas con la
+            tabla de pruebas)
+    """
+    inicio = time.perf_counter()
+    X, y, fechas = preparar_sector(df_sector)
+    # Solo la parte de entrenamiento: el conjunto de prueba queda para la evaluación final
+    n_entrenamiento = int(len(X) * (1 - PROPORCION_PRUEBA))
+    X, y, fechas = X.iloc[:n_entrenamiento], y.iloc[:n_entrenamiento], fechas[:n_entrenamiento]
+    cortes = cortes_cronologicos(fechas, n_pliegues)
+    pliegues = construir_pliegues(X, y, cortes, nthread=nucleos)
+    segundos_matrices = time.perf_counter() - inicio
+
+    reloj = time.perf_counter()
+    nucleos_por_prueba = max(1, min(nucleos_por_prueba, nucleos))
+    concurrentes = max(1, nucleos // nucleos_por_prueba)
+    pruebas = [Prueba(i, p, semilla=semilla * n_configuraciones + i)
+               for i, p in enumerate(muestrear_configuraciones(n_configuraciones, semilla))]
+    vivas = pruebas
+    rondas_escalones = escalones(rondas_maximas=rondas_maximas)
+    with ThreadPoolExecutor(max_workers=concurrentes) as pool:
+        for numero_escalon, rondas in enumerate(rondas_escalones):
+            list(pool.map(lambda prueba: prueba.avanzar(pliegues, rondas, nucleos_por_prueba), vivas))
+            if numero_escalon < len(rondas_escalones) - 1:
+                vivas = sorted(vivas, key=Prueba.puntuacion)[:max(1, math.ceil(len(vivas) / FACTOR_HALVING))]
+                if all(prueba.terminada for prueba in vivas):
+                    break
+    # La configuración actual se entrena hasta su early stopping aunque el halving
+    # la descarte pronto (con learning_rate 0.05, 50 rondas la infravaloran)
+    referencia = pruebas[0]
+    for rondas in rondas_escalones:
+        referencia.avanzar(pliegues, rondas, nucleos_por_prueba)
+    segundos_pruebas = time.perf_counter() - reloj
+
+    tabla = pd.DataFrame([prueba.resumen() for prueba in pruebas]).sort_values('mape_validacion')
+    mejor = min(vivas + [referencia], key=Prueba.puntuacion)
+    resultado = {'parametros': mejor.parametros, 'arboles': mejor.mejor_ronda() + 1,
+                 'mape_validacion': mejor.puntuacion(), 'mape_validacion_actual': pruebas[0].puntuacion(),
+                 'rondas_actual': pruebas[0].rondas}
+    metricas = {
+        'filas': len(X),
+        'pliegues': [{'entrenamiento': int(a), 'validacion': int(b - a)} for a, b in cortes],
+        'configuraciones': len(pruebas),
+        'escalones': rondas_escalones,
+        'pruebas_concurrentes': concurrentes,
+        'nucleos_por_prueba': nucleos_por_prueba,
+        'rondas_entrenadas': sum(p.rondas for p in pruebas) * len(pliegues),
+        'rondas_sin_halving': len(pruebas) * rondas_escalones[-1] * len(pliegues),
+        'segundos_matrices': round(segundos_matrices, 3),
+        'segundos_pruebas': round(segundos_pruebas, 3),
+        'tabla': tabla,
+    }
+    return resultado, metricas
+
+
+def guardar_hiperparametros(resultados, ruta=HIPERPARAMETROS_PATH):
+    """Añade o reemplaza los sectores ajustados en el JSON (escritura atómica)."""
+    contenido = {'sectores': {}}
+    if os.path.exists(ruta):
+        with open(ruta, encoding='utf-8') as file:
+            contenido = json.load(file)
+    contenido['actualizado'] = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    contenido['sectores'].update(resultados)
+    temporal = f"{ruta}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as file:
+        json.dump(contenido, file, ensure_ascii=False, indent=1)
+    os.replace(temporal, ruta)
+
+
+# --- 5. EJECUCIÓN ---
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from fuentes_datos import crear_fuente, leer_por_sector, describir_lectura, COLUMNAS_MODELO_FINAL_V2, SECTORES
+
+    parser = argparse.ArgumentParser(description="Ajuste de hiperparámetros por sector con successive halving")
+    parser.add_argument('--sectores', nargs='+', default=list(SECTORES.values()), help="Sectores a ajustar")
+    parser.add_argument('--configuraciones', type=int, default=NUM_CONFIGURACIONES)
+    parser.add_argument('--pliegues', type=int, default=NUM_PLIEGUES)
+    parser.add_argument('--nucleos', type=int, default=NUCLEOS, help="Presupuesto total de núcleos")
+    parser.add_argument('--nucleos-por-prueba', type=int, default=1, help="Hilos de XGBoost de cada prueba")
+    parser.add_argument('--rondas-maximas', type=int, default=RONDAS_MAXIMAS)
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--salida', default=HIPERPARAMETROS_PATH, help="JSON de hiperparámetros por sector")
+    parser.add_argument('--desde', help="Primera fecha (YYYY-MM-DD) de los datos")
+    parser.add_argument('--hasta', help="Última fecha (YYYY-MM-DD) de los datos")
+    args = parser.parse_args()
+
+    print("--- Iniciando el ajuste de hiperparámetros ---")
+    load_dotenv()
+    try:
+        datos_por_sector, metricas_lectura = leer_por_sector(
+            crear_fuente(), "gold_data.modelo_final_v2", COLUMNAS_MODELO_FINAL_V2, desde=args.desde, hasta=args.hasta,
+            sectores={i: n for i, n in SECTORES.items() if n in args.sectores})
+        print(f"Paso 1: {describir_lectura(metricas_lectura)}.")
+    except Exception as e:
+        print(f"❌ Error al cargar datos desde la fuente: {e}")
+        exit()
+
+    resultados = {}
+    for sector_nombre, df_sector in datos_por_sector.items():
+        resultado, metricas = ajustar_sector(df_sector, args.configuraciones, args.pliegues, args.nucleos,
+                                             args.nucleos_por_prueba, args.semilla, args.rondas_maximas)
+        resultados[sector_nombre] = resultado
+        print(f"\n✅ {sector_nombre}: matrices de {len(metricas['pliegues'])} pliegues en "
+              f"{metricas['segundos_matrices']:.1f} s; {metricas['configuraciones']} configuraciones en "
+              f"{metricas['segundos_pruebas']:.1f} s ({metricas['pruebas_concurrentes']} a la vez, escalones "
+              f"{metricas['escalones']}; {metricas['rondas_entrenadas']:,} de {metricas['rondas_sin_halving']:,} rondas).")
+        print(f"   - MAPE de validación: {resultado['mape_validacion']:.2f}% "
+              f"(configuración actual: {resultado['mape_validacion_actual']:.2f}% con {resultado['rondas_actual']} rondas); "
+              f"{resultado['arboles']} árboles.")
+        print(metricas['tabla'].head(5).round(3).to_string(index=False))
+
+    guardar_hiperparametros(resultados, args.salida)
+    print(f"\n✅ Hiperparámetros guardados en '{args.salida}'; los scripts de entrenamiento los usan en la próxima ejecución.")
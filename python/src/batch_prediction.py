@@ -9,23 +9,66 @@
 # utiliza los modelos segmentados entrenados para generar predicciones para cada
 # registro, y sube el resultado (datos originales + predicciones) a una nueva
 # tabla en BigQuery: gold_data.predicciones_modelo_final.
+#
+# Con --explicar K guarda además, en la misma pasada por trozos, las K
+# contribuciones TreeSHAP de mayor valor absoluto de cada fila en un Parquet
+# de formato largo (clave de la fila, id de feature, valor).
+#
+# Cada paso se registra como etapa en metricas/ (tiempos, filas/s, pico de
+# RSS y bytes); con --profile se guarda además un perfil de CPU por etapa.
 # ============================================================================
 
 # --- 0. IMPORTACIÓN DE LIBRERÍAS ---
 import pandas as pd
-from google.oauth2 import service_account
+import numpy as np
 from dotenv import load_dotenv
 import pickle
 import warnings
 import os
+import argparse
+from puntuacion_paralela import puntuar_en_paralelo, rango_iteraciones
+from instrumentacion import agregar_argumentos, crear_instrumentacion
+from flota_modelos import RegistroFlota, MAX_RESIDENTES
+from explicabilidad import EscritorExplicaciones, contribuciones_trozo, top_contribuciones
+from escritura_incremental import EscritorBigQuery, EscritorLocal
+from fuentes_datos import crear_fuente, leer_por_sector, describir_lectura, COLUMNAS_MODELO_FINAL_V2, MARGEN_LAGS_DIAS, SECTORES
 
 warnings.filterwarnings('ignore', category=FutureWarning)
+
+parser = argparse.ArgumentParser(description="Predicción por lotes sobre gold_data.modelo_final_v2")
+parser.add_argument('--procesos', type=int, default=0,
+                    help="Procesos para puntuar en paralelo con memoria compartida (0 = modo secuencial)")
+parser.add_argument('--modo-escritura', choices=['completo', 'particiones', 'merge'],
+                    help="'completo' reemplaza toda la tabla; 'particiones' y 'merge' solo las fechas puntuadas "
+                         "(por defecto 'particiones' con --desde/--hasta y 'completo' sin ventana)")
+parser.add_argument('--desde', help="Primera fecha (YYYY-MM-DD) a puntuar y subir")
+parser.add_argument('--hasta', help="Última fecha (YYYY-MM-DD) a puntuar y subir")
+parser.add_argument('--destino-local', help="Base DuckDB local que sustituye a BigQuery como destino (pruebas sin conexión)")
+parser.add_argument('--explicar', type=int, default=0, metavar='K',
+                    help="Guarda las K contribuciones principales de cada fila (0 = sin explicación)")
+parser.add_argument('--salida-explicaciones', default='explicaciones_prediccion.parquet',
+                    help="Parquet de destino de las explicaciones por fila")
+parser.add_argument('--flota', metavar='DIRECTORIO',
+                    help="Registro de flota_modelos.py: las series con modelo propio se predicen con él")
+parser.add_argument('--flota-residentes', type=int, default=MAX_RESIDENTES,
+                    help="Modelos de la flota en memoria a la vez (LRU)")
+agregar_argumentos(parser)
+args = parser.parse_args()
+# Con una ventana de fechas, 'completo' sustituiría todo el histórico por las filas de la ventana
+if args.modo_escritura is None:
+    args.modo_escritura = 'particiones' if (args.desde or args.hasta) else 'completo'
+elif args.modo_escritura == 'completo' and (args.desde or args.hasta):
+    parser.error("--modo-escritura completo no admite --desde/--hasta (usa 'particiones' o 'merge')")
+# Las explicaciones se calculan con el modelo del sector; con la flota describirían otra predicción
+if args.flota and args.explicar > 0:
+    parser.error("--explicar no admite --flota: las contribuciones serían del modelo del sector, no del de la flota")
+instrumentacion = crear_instrumentacion('batch_prediction', args)
+
 print("--- Iniciando el pipeline de Predicción por Lotes ---")
 
 # --- 1. CONFIGURACIÓN Y CARGA DE MODELOS ---
 print("\nPaso 1: Cargando configuración y modelos entrenados...")
 load_dotenv()
-GCP_KEY_PATH = os.getenv("GCP_SERVICE_ACCOUNT_KEY_PATH")
 PROJECT_ID = "datamanagementbi"
 
 # Tabla de origen (de donde leeremos los datos a predecir)
@@ -35,11 +78,13 @@ DESTINATION_TABLE_ID = "gold_data.predicciones_modelo_final"
 
 # Carga de los modelos entrenados
 MODEL_FILE = 'modelos_entrenados_por_sector.pkl'
+etapa = instrumentacion.iniciar('carga_modelos')
 try:
     with open(MODEL_FILE, 'rb') as file:
         resultados_cargados = pickle.load(file)
     modelos_entrenados = {sector: res['modelo'] for sector, res in resultados_cargados.items()}
     print(f"✅ Modelos para los sectores {list(modelos_entrenados.keys())} cargados correctamente.")
+    etapa.terminar(bytes_entrada=os.path.getsize(MODEL_FILE))
 except FileNotFoundError:
     print(f"❌ ERROR: No se encontró el archivo de modelos '{MODEL_FILE}'.")
     print("   Asegúrate de ejecutar 'train_model_final.py' para generarlo.")
@@ -47,18 +92,19 @@ except FileNotFoundError:
 
 # --- 2. CARGA DEL DATASET COMPLETO A PREDECIR ---
 print(f"\nPaso 2: Cargando dataset completo desde '{SOURCE_TABLE_ID}'...")
+etapa = instrumentacion.iniciar('lectura')
 try:
-    credentials = service_account.Credentials.from_service_account_file(GCP_KEY_PATH)
-    query = f"SELECT * FROM `{PROJECT_ID}.{SOURCE_TABLE_ID}`"
-    df_full = pd.read_gbq(query, project_id=PROJECT_ID, credentials=credentials, progress_bar_type='console')
-
-    # Mapeo de IDs a nombres para facilitar el bucle
-    sector_map = {1: 'Industrial', 2: 'Residencial', 3: 'Servicios'}
-    df_full['sector_nombre'] = df_full['id_sector_economico'].map(sector_map)
-    
-    print(f"✅ Carga de datos completada. Se han cargado {len(df_full)} registros.")
+    fuente = crear_fuente()
+    credentials = fuente.credentials  # también se usan para subir el resultado
+    # Con --desde se leen además los días previos que necesitan los lags
+    desde_lectura = pd.Timestamp(args.desde) - pd.Timedelta(days=MARGEN_LAGS_DIAS) if args.desde else None
+    datos_por_sector, metricas_lectura = leer_por_sector(
+        fuente, SOURCE_TABLE_ID, COLUMNAS_MODELO_FINAL_V2, desde=desde_lectura, hasta=args.hasta)
+    print(f"✅ Carga de datos completada: {describir_lectura(metricas_lectura)}.")
+    etapa.terminar(filas=metricas_lectura['filas'],
+                   bytes_entrada=metricas_lectura.get('bytes_transferidos') or metricas_lectura.get('bytes_escaneados'))
 except Exception as e:
-    print(f"❌ Error al cargar datos desde BigQuery: {e}")
+    print(f"❌ Error al cargar datos desde la fuente: {e}")
     exit()
 
 # --- 3. GENERACIÓN DE PREDICCIONES POR LOTES ---
@@ -66,12 +112,21 @@ print("\nPaso 3: Generando predicciones para cada sector...")
 
 # Lista para almacenar los DataFrames con predicciones de cada sector
 lista_predicciones = []
+# En modo paralelo, sectores pendientes de puntuar en el pool de procesos
+bloques_paralelo = {}
+# Filas por trozo al puntuar y explicar en modo secuencial
+FILAS_POR_TROZO_EXPLICACION = 100_000
+escritor_explicaciones = None
+if args.explicar > 0:
+    features_por_sector = {id_sector: modelos_entrenados[nombre].get_booster().feature_names
+                           for id_sector, nombre in SECTORES.items() if nombre in modelos_entrenados}
+    escritor_explicaciones = EscritorExplicaciones(args.salida_explicaciones, features_por_sector)
 
 for sector_nombre in ['Industrial', 'Residencial', 'Servicios']:
     print(f"   - Prediciendo para el sector: {sector_nombre.upper()}")
 
-    # Filtrar el DataFrame para el sector actual
-    df_sector = df_full[df_full['sector_nombre'] == sector_nombre].copy()
+    # Datos del sector actual (ya filtrados en la consulta y ordenados cronológicamente)
+    df_sector = datos_por_sector[sector_nombre]
     
     if df_sector.empty:
         print(f"   - No hay datos para el sector {sector_nombre}. Saltando.")
@@ -81,6 +136,7 @@ for sector_nombre in ['Industrial', 'Residencial', 'Servicios']:
 
     # Aplicar EXACTAMENTE la misma ingeniería de características que en el entrenamiento
     print("      - Aplicando Feature Engineering...")
+    etapa = instrumentacion.iniciar(f'feature_engineering/{sector_nombre}', filas=len(df_sector))
     df_sector['fecha'] = pd.to_datetime(df_sector['fecha'])
 
     # Lags Horarios y Diarios
@@ -99,13 +155,26 @@ for sector_nombre in ['Industrial', 'Residencial', 'Servicios']:
     # O, para este caso, simplemente predeciremos sobre los datos válidos.
     df_sector.dropna(inplace=True)
 
+    # Ventana de fechas de esta ejecución (los lags ya se han calculado con todo el histórico)
+    if args.desde:
+        df_sector = df_sector[df_sector['fecha'] >= pd.Timestamp(args.desde)]
+    if args.hasta:
+        df_sector = df_sector[df_sector['fecha'] <= pd.Timestamp(args.hasta)]
+    etapa.terminar()
+
     if df_sector.empty:
         print(f"      - No hay datos válidos para el sector {sector_nombre} tras el feature engineering. Saltando.")
         continue
     
     # --- FIN DEL BLOQUE A AÑADIR ---
 
+    if args.procesos > 0:
+        # Modo paralelo: todos los sectores se puntúan juntos más abajo
+        bloques_paralelo[sector_nombre] = df_sector
+        continue
+
     # Seleccionar el modelo correcto
+    etapa = instrumentacion.iniciar(f'puntuacion/{sector_nombre}', filas=len(df_sector))
     modelo = modelos_entrenados[sector_nombre]
     
     # Obtener la lista de features que el modelo espera, en el orden correcto
@@ -121,19 +190,63 @@ for sector_nombre in ['Industrial', 'Residencial', 'Servicios']:
             X_pred[col] = X_pred[col].astype('category')
 
     # Generar predicciones
-    predicciones = modelo.predict(X_pred)
+    if escritor_explicaciones is None:
+        predicciones = modelo.predict(X_pred)
+    else:
+        # Misma pasada por trozos: predicción y top-K contribuciones de cada trozo
+        predicciones = np.empty(len(X_pred), dtype=np.float32)
+        booster, rango = modelo.get_booster(), rango_iteraciones(modelo)
+        for inicio in range(0, len(X_pred), FILAS_POR_TROZO_EXPLICACION):
+            trozo = X_pred.iloc[inicio:inicio + FILAS_POR_TROZO_EXPLICACION]
+            predicciones[inicio:inicio + len(trozo)] = modelo.predict(trozo)
+            indices, valores = top_contribuciones(contribuciones_trozo(booster, trozo, rango), args.explicar)
+            escritor_explicaciones.escribir(df_sector.iloc[inicio:inicio + len(trozo)], indices, valores)
     
     # Añadir la columna de predicciones al DataFrame del sector
     df_sector['consumo_kwh_predicho'] = predicciones
+    etapa.terminar()
     
     # Añadir el DataFrame resultante a nuestra lista
     lista_predicciones.append(df_sector)
 
+if bloques_paralelo:
+    print(f"   - Puntuando {len(bloques_paralelo)} sectores con {args.procesos} procesos (memoria compartida)...")
+    explicaciones_por_sector = {}
+    etapa = instrumentacion.iniciar('puntuacion', filas=sum(len(df) for df in bloques_paralelo.values()))
+    predicciones_por_sector, metricas = puntuar_en_paralelo(bloques_paralelo, modelos_entrenados, MODEL_FILE, args.procesos,
+                                                            top_k=args.explicar, explicaciones=explicaciones_por_sector)
+    for sector_nombre, df_sector in bloques_paralelo.items():
+        df_sector['consumo_kwh_predicho'] = predicciones_por_sector[sector_nombre]
+        lista_predicciones.append(df_sector)
+        if escritor_explicaciones is not None:
+            indices, valores = explicaciones_por_sector[sector_nombre]
+            for inicio in range(0, len(df_sector), FILAS_POR_TROZO_EXPLICACION):
+                fin = inicio + FILAS_POR_TROZO_EXPLICACION
+                escritor_explicaciones.escribir(df_sector.iloc[inicio:fin], indices[inicio:fin], valores[inicio:fin])
+    etapa.terminar()
+    print(f"   - {metricas['filas']} filas en {metricas['segundos']:.2f} s: "
+          f"{metricas['filas_por_segundo']:,.0f} filas/s en total, "
+          f"{metricas['filas_por_segundo_y_nucleo']:,.0f} filas/s por núcleo.")
+
 # Concatenar los resultados de todos los sectores en un único DataFrame
 df_resultado_final = pd.concat(lista_predicciones)
 
 print("✅ Predicciones generadas para todos los registros.")
 
+# Modelos por (sector, código postal): sustituyen al del sector donde existen
+if args.flota:
+    etapa = instrumentacion.iniciar('flota', filas=len(df_resultado_final))
+    registro = RegistroFlota(args.flota, args.flota_residentes)
+    predicciones_flota = registro.predecir(df_resultado_final)
+    con_modelo = ~np.isnan(predicciones_flota)
+    df_resultado_final.loc[con_modelo, 'consumo_kwh_predicho'] = predicciones_flota[con_modelo]
+    etapa.terminar()
+    print(f"✅ Flota: {int(con_modelo.sum())} de {len(df_resultado_final)} filas con modelo propio; {registro.describir()}.")
+if escritor_explicaciones is not None:
+    escritor_explicaciones.cerrar()
+    print(f"✅ {escritor_explicaciones.filas} contribuciones (top {args.explicar} por fila) guardadas en "
+          f"'{args.salida_explicaciones}'.")
+
 # --- 4. SUBIDA DE RESULTADOS A BIGQUERY ---
 print(f"\nPaso 4: Subiendo {len(df_resultado_final)} registros a la tabla '{DESTINATION_TABLE_ID}'...")
 
@@ -147,16 +260,22 @@ df_para_subir = df_resultado_final[columnas_finales].copy()
 # Renombramos 'consumo_kwh' para mayor claridad en la tabla final
 df_para_subir.rename(columns={'consumo_kwh': 'consumo_kwh_real'}, inplace=True)
 
+etapa = instrumentacion.iniciar('subida', filas=len(df_para_subir))
 try:
-    df_para_subir.to_gbq(
-        destination_table=DESTINATION_TABLE_ID,
-        project_id=PROJECT_ID,
-        credentials=credentials,
-        if_exists='replace', # 'replace' borra la tabla y la crea de nuevo. Usa 'append' si quieres añadir.
-        progress_bar=True
-    )
-    print("✅ ¡Éxito! La tabla de predicciones ha sido creada/actualizada en BigQuery.")
+    # Staging Parquet + sustitución de las particiones puntuadas ('completo' vacía la
+    # tabla sin recrearla, así que conserva la partición por fecha y el clustering)
+    if args.destino_local:
+        escritor = EscritorLocal(args.destino_local, DESTINATION_TABLE_ID)
+    else:
+        escritor = EscritorBigQuery(PROJECT_ID, DESTINATION_TABLE_ID, credentials=credentials)
+    resumen = escritor.escribir(df_para_subir, modo=args.modo_escritura)
+    print(f"✅ ¡Éxito! {resumen['filas']} filas escritas en {resumen['fechas']} particiones "
+          f"(modo '{args.modo_escritura}', staging Parquet de {resumen['bytes_staging'] / 1e6:.1f} MB).")
+    etapa.terminar(bytes_salida=resumen['bytes_staging'])
 except Exception as e:
     print(f"❌ Error al subir los datos a BigQuery: {e}")
+    etapa.terminar(ok=False)
 
+instrumentacion.cerrar()
+print(f"\nEtapas ({instrumentacion.directorio}/):\n{instrumentacion.resumen()}")
 print("\n--- Pipeline de Predicción por Lotes finalizado ---")
\ No newline at end of file
@@ -0,0 +1,383 @@
+# ============================================================================
+# BENCHMARK DE RENDIMIENTO A ESCALA (1x, 10x, 100x) SIN CONEXIÓN
+# ============================================================================
+# Autor: Julio Clavijo
+# Versión: 1.0
+#
+# Descripción:
+# Mide el rendimiento de los scripts sobre la tabla gold sintética de
+# datos_sinteticos.py, sin BigQuery ni APIs externas:
+#
+#   1. Generación de la tabla sintética a cada escala.
+#   2. Entrenamiento (train_model_final.py) y predicción por lotes
+#      (batch_prediction.py), ejecutados tal cual con FUENTE_DATOS=duckdb; los
+#      tiempos de lectura, feature engineering, fit, SHAP, puntuación y subida
+#      salen de su instrumentación por etapas (instrumentacion.py).
+#   3. Latencia de una predicción individual con PredictorDemanda (p50/p95/p99).
+#   4. Cargadores de clima (Catalunya y AEMET) contra APIs locales que imitan
+#      la paginación SODA y la descarga en dos pasos de AEMET.
+#
+# Cada resultado se añade a benchmarks/resultados.jsonl con el commit, de
+# modo que --comparar BASE [ACTUAL] muestra la variación entre dos commits.
+# ============================================================================
+
+import io
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import pickle
+import platform
+import argparse
+import importlib
+import threading
+import contextlib
+import subprocess
+from datetime import datetime, timezone
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from datos_sinteticos import generar_modelo_final_v2, escribir_gold, describir_generacion
+from fuentes_datos import SECTORES
+
+# --- 1. CONFIGURACIÓN ---
+DIRECTORIO_SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+DIRECTORIO_BENCHMARK = os.getenv("BENCHMARK_PATH", 'benchmarks')
+FICHERO_RESULTADOS = 'resultados.jsonl'
+ESCALAS = [1, 10, 100]
+CASOS = ['generacion', 'entrenamiento', 'prediccion_lotes', 'latencia', 'cargadores_clima']
+
+ARBOLES_BENCHMARK = 100          # máximo de árboles por sector (ENTRENAMIENTO_MAX_ARBOLES)
+SEGUNDOS_SHAP_BENCHMARK = 10     # presupuesto de SHAP por sector (EXPLICACION_MAX_SEGUNDOS)
+PREDICCIONES_LATENCIA = 200      # predicciones individuales medidas por escala
+DIAS_LECTURAS_POR_ESCALA = 30    # días de lecturas de la API de Catalunya por unidad de escala
+ANIOS_AEMET_POR_ESCALA = 1       # años de la API de AEMET por unidad de escala
+SIN_FIESTA = 'Sin fiesta'        # días sin fiesta en la tabla sintética (como en los motores de predicción)
+
+
+# --- 2. APIS METEOROLÓGICAS LOCALES ---
+
+def _lecturas_catalunya(dias, estaciones, variables, desde='2022-01-01', semilla=0):
+    """Lecturas semihorarias por estación: {estación: (instantes, variables, valores)}."""
+    rng = np.random.default_rng(semilla)
+    instantes = np.datetime64(desde, 'm') + np.arange(dias * 48) * np.timedelta64(30, 'm')
+    lecturas = {}
+    for estacion in estaciones:
+        n = len(instantes) * len(variables)
+        lecturas[estacion] = (np.repeat(instantes, len(variables)), np.tile(np.asarray(variables), len(instantes)),
+                              np.round(rng.normal(17, 6, n), 1))
+    return lecturas
+
+
+class _ManejadorApis(BaseHTTPRequestHandler):
+    """Rutas de las APIs simuladas; los datos viven en el servidor (self.server)."""
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, cuerpo):
+        datos = json.dumps(cuerpo).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/catalunya':
+            # Paginación SODA: $where con la estación, $limit y $offset
+            parametros = parse_qs(url.query)
+            estacion = re.search(r"codi_estacio = '(\w+)'", parametros['$where'][0]).group(1)
+            inicio = int(parametros['$offset'][0])
+            fin = inicio + int(parametros['$limit'][0])
+            instantes, variables, valores = self.server.lecturas.get(estacion, ([], [], []))
+            horas = np.datetime_as_string(instantes[inicio:fin], unit='s')
+            self._responder([{'codi_estacio': estacion, 'codi_variable': str(variable),
+                              'data_lectura': f"{hora}.000", 'valor_lectura': str(valor), 'codi_estat': 'V'}
+                             for hora, variable, valor in zip(horas, variables[inicio:fin], valores[inicio:fin])])
+        elif url.path.startswith('/aemet/valores/'):
+            anio = re.search(r'fechaini/(\d{4})', url.path).group(1)
+            self._responder({'estado': 200, 'datos': f"{self.server.url}/aemet/datos/{anio}"})
+        elif url.path.startswith('/aemet/datos/'):
+            anio = int(url.path.rsplit('/', 1)[1])
+            rng = np.random.default_rng(anio)
+            dias = pd.date_range(f'{anio}-01-01', f'{anio}-12-31')
+            tmed = 16.5 + 7.5 * np.sin(2 * np.pi * (dias.dayofyear - 110) / 365.25) + rng.normal(0, 1.5, len(dias))
+            self._responder([{'fecha': dia.strftime('%Y-%m-%d'), 'indicativo': '0200E',
+                              'tmed': f"{t:.1f}".replace('.', ','), 'tmin': f"{t - 4:.1f}".replace('.', ','),
+                              'tmax': f"{t + 4:.1f}".replace('.', ','), 'prec': f"{max(p, 0):.1f}".replace('.', ',')}
+                             for dia, t, p in zip(dias, tmed, rng.normal(-1, 2, len(dias)))])
+        else:
+            self.send_error(404)
+
+
+class ApisMeteorologicasLocales:
+    """
+    Servidor HTTP local con las APIs de Catalunya y AEMET. Mientras está
+    activo, los cargadores apuntan a él (RESOURCE_URL y URL_API_AEMET) y sin
+    la pausa entre peticiones de AEMET.
+    """
+
+    def __init__(self, dias_lecturas, estaciones, variables):
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', 0), _ManejadorApis)
+        self.servidor.lecturas = _lecturas_catalunya(dias_lecturas, estaciones, variables)
+        self.servidor.url = f"http://127.0.0.1:{self.servidor.server_address[1]}"
+        self._originales = []
+
+    def __enter__(self):
+        import historical_loader
+        import load_catalunya_weather
+        configuracion = [(load_catalunya_weather, 'RESOURCE_URL', f"{self.servidor.url}/catalunya"),
+                         (historical_loader, 'URL_API_AEMET', f"{self.servidor.url}/aemet"),
+                         (historical_loader, 'PAUSA_ENTRE_PETICIONES', 0)]
+        for modulo, atributo, valor in configuracion:
+            self._originales.append((modulo, atributo, getattr(modulo, atributo)))
+            setattr(modulo, atributo, valor)
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *excepcion):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+        for modulo, atributo, valor in self._originales:
+            setattr(modulo, atributo, valor)
+        return False
+
+
+# --- 3. CASOS DE MEDIDA ---
+
+def _medida(caso, segundos, filas=None, **extra):
+    return {'caso': caso, 'segundos': round(segundos, 4), 'filas': filas,
+            'filas_por_segundo': round(filas / segundos, 1) if filas and segundos else None, **extra}
+
+
+def medir_generacion(escala, directorio):
+    tabla, metricas = generar_modelo_final_v2(escala, sin_fiesta=SIN_FIESTA)
+    reloj = time.perf_counter()
+    ruta = escribir_gold(tabla, directorio)
+    print(f"   - Tabla sintética: {describir_generacion(metricas)}.")
+    return [_medida('generacion.tabla', metricas['segundos'], metricas['filas']),
+            _medida('generacion.parquet', time.perf_counter() - reloj, metricas['filas'],
+                    bytes_salida=os.path.getsize(ruta))]
+
+
+def _etapas_por_familia(ruta_jsonl):
+    """Agrega las etapas de instrumentacion.py por familia ('fit/Industrial' -> 'fit')."""
+    familias = {}
+    with open(ruta_jsonl, encoding='utf-8') as file:
+        for linea in file:
+            etapa = json.loads(linea)
+            familia = familias.setdefault(etapa['etapa'].split('/')[0],
+                                          {'segundos': 0.0, 'filas': 0, 'rss_pico_bytes': 0, 'ok': True})
+            familia['segundos'] += etapa['segundos']
+            familia['filas'] += etapa['filas'] or 0
+            familia['rss_pico_bytes'] = max(familia['rss_pico_bytes'], etapa['rss_pico_bytes'] or 0)
+            familia['ok'] &= etapa['ok']
+    return familias
+
+
+def medir_script(nombre, script, argumentos, directorio):
+    """Ejecuta un script del pipeline sobre la tabla sintética y recoge sus etapas."""
+    metricas = os.path.join(directorio, f"metricas_{nombre}")
+    shutil.rmtree(metricas, ignore_errors=True)
+    entorno = {**os.environ, 'FUENTE_DATOS': 'duckdb', 'DATOS_LOCALES_PATH': os.path.abspath(directorio),
+               'CACHE_GOLD': '0', 'METRICAS_PATH': os.path.abspath(metricas), 'INSTRUMENTACION': '1',
+               'ENTRENAMIENTO_MAX_ARBOLES': str(ARBOLES_BENCHMARK),
+               'EXPLICACION_MAX_SEGUNDOS': str(SEGUNDOS_SHAP_BENCHMARK)}
+    reloj = time.perf_counter()
+    proceso = subprocess.run([sys.executable, os.path.join(DIRECTORIO_SCRIPTS, script), *argumentos],
+                             cwd=directorio, env=entorno, capture_output=True, text=True)
+    segundos = time.perf_counter() - reloj
+    ruta_etapas = os.path.join(metricas, 'etapas.jsonl')
+    familias = _etapas_por_familia(ruta_etapas) if os.path.exists(ruta_etapas) else {}
+    if proceso.returncode != 0 or not familias or not all(f['ok'] for f in familias.values()):
+        salida = (proceso.stdout + proceso.stderr).strip().splitlines()
+        raise RuntimeError(f"{script} no terminó correctamente:\n      " + "\n      ".join(salida[-8:]))
+    medidas = [_medida(f"{nombre}.total", segundos)]
+    for familia, valores in familias.items():
+        medidas.append(_medida(f"{nombre}.{familia}", valores['segundos'], valores['filas'] or None,
+                               rss_pico_bytes=valores['rss_pico_bytes']))
+    return medidas
+
+
+def medir_latencia(directorio, n=PREDICCIONES_LATENCIA, sector='Servicios'):
+    """Latencia de PredictorDemanda.predecir() con escenarios de una fila."""
+    # predecir_demanda carga al importarse el pickle del directorio actual
+    anterior = os.getcwd()
+    os.chdir(directorio)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            predecir_demanda = importlib.import_module('predecir_demanda')
+    finally:
+        os.chdir(anterior)
+    with open(os.path.join(directorio, 'modelos_entrenados_por_sector.pkl'), 'rb') as file:
+        modelos = {nombre: resultado['modelo'] for nombre, resultado in pickle.load(file).items()}
+    predictor = predecir_demanda.PredictorDemanda(modelos)
+
+    import duckdb
+    id_sector = {nombre: id_sector for id_sector, nombre in SECTORES.items()}[sector]
+    origen = f"read_parquet('{os.path.join(directorio, 'gold_data', 'modelo_final_v2.parquet')}')"
+    conexion = duckdb.connect()
+    escenarios = conexion.execute(
+        f"SELECT * FROM {origen} WHERE id_sector_economico = {id_sector} USING SAMPLE {n} ROWS (reservoir, 7)").df()
+    # Como haría un servicio de predicción, las categóricas llegan con el dominio completo de
+    # la tabla (XGBoost no tiene que recodificar una categoría suelta por petición)
+    for columna in escenarios.columns[escenarios.dtypes == object]:
+        categorias = conexion.execute(f"SELECT DISTINCT {columna} FROM {origen} WHERE {columna} IS NOT NULL "
+                                      f"ORDER BY {columna}").df()[columna]
+        escenarios[columna] = pd.Categorical(escenarios[columna], categories=categorias)
+    historicos = pd.DataFrame({'consumo_kwh': escenarios['consumo_kwh']})
+    predictor.predecir(sector, escenarios.iloc[[0]], historicos)  # calentamiento
+    tiempos = []
+    for i in range(len(escenarios)):
+        reloj = time.perf_counter()
+        predictor.predecir(sector, escenarios.iloc[[i]], historicos)
+        tiempos.append(time.perf_counter() - reloj)
+    p50, p95, p99 = np.percentile(np.array(tiempos) * 1000, [50, 95, 99])
+    return [_medida('latencia.prediccion_individual', float(np.sum(tiempos)), len(tiempos),
+                    p50_ms=round(p50, 3), p95_ms=round(p95, 3), p99_ms=round(p99, 3))]
+
+
+def medir_cargadores(escala):
+    """Extracción de Catalunya (y su paso a silver) y de AEMET contra las APIs locales."""
+    import historical_loader
+    import load_catalunya_weather as catalunya
+    from clima_silver import construir_clima_silver
+
+    medidas = []
+    with ApisMeteorologicasLocales(DIAS_LECTURAS_POR_ESCALA * escala, catalunya.ESTACIONES_BARCELONA,
+                                   catalunya.VARIABLES_DE_INTERES):
+        with contextlib.redirect_stdout(io.StringIO()):
+            reloj = time.perf_counter()
+            lecturas = catalunya.fetch_catalunya_weather(catalunya.START_DATE, catalunya.ESTACIONES_BARCELONA,
+                                                         catalunya.VARIABLES_DE_INTERES, 'benchmark')
+            medidas.append(_medida('clima_catalunya.extraccion', time.perf_counter() - reloj, len(lecturas),
+                                   bytes_entrada=lecturas.attrs.get('bytes_descargados')))
+            reloj = time.perf_counter()
+            construir_clima_silver(lecturas)
+            medidas.append(_medida('clima_catalunya.silver', time.perf_counter() - reloj, len(lecturas)))
+
+            anios = ANIOS_AEMET_POR_ESCALA * escala
+            reloj = time.perf_counter()
+            diario = historical_loader.fetch_historical_weather(datetime(2024 - anios + 1, 1, 1), datetime(2024, 12, 31),
+                                                                historical_loader.IDEMA_BARCELONA)
+            medidas.append(_medida('clima_aemet.extraccion', time.perf_counter() - reloj, len(diario),
+                                   bytes_entrada=diario.attrs.get('bytes_descargados')))
+    return medidas
+
+
+# --- 4. EJECUCIÓN Y REGISTRO DE RESULTADOS ---
+
+def commit_actual():
+    """(commit abreviado, hay cambios sin confirmar); ('desconocido', None) fuera de git."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=DIRECTORIO_SCRIPTS,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        cambios = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=DIRECTORIO_SCRIPTS,
+                                 capture_output=True, text=True, check=True).stdout.strip()
+        return commit, bool(cambios)
+    except (OSError, subprocess.CalledProcessError):
+        return 'desconocido', None
+
+
+def ejecutar_benchmark(escalas=ESCALAS, casos=CASOS, directorio=DIRECTORIO_BENCHMARK):
+    """
+    Ejecuta los casos a cada escala y añade los resultados a resultados.jsonl.
+
+    Returns:
+        list: Resultados de esta ejecución (un dict por escala y caso).
+    """
+    commit, sin_confirmar = commit_actual()
+    comun = {'commit': commit, 'sin_confirmar': sin_confirmar,
+             'fecha': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+             'maquina': platform.node(), 'cpus': os.cpu_count(), 'python': platform.python_version()}
+    resultados = []
+    for escala in escalas:
+        print(f"\n=== Escala {escala}x ===")
+        trabajo = os.path.join(directorio, 'trabajo', f"escala_{escala}")
+        shutil.rmtree(trabajo, ignore_errors=True)
+        os.makedirs(trabajo)
+        pasos = {
+            'generacion': lambda: medir_generacion(escala, trabajo),
+            'entrenamiento': lambda: medir_script('entrenamiento', 'train_model_final.py', [], trabajo),
+            'prediccion_lotes': lambda: medir_script('prediccion_lotes', 'batch_prediction.py',
+                                                     ['--destino-local', 'predicciones.duckdb',
+                                                      '--modo-escritura', 'particiones'], trabajo),
+            'latencia': lambda: medir_latencia(trabajo),
+            'cargadores_clima': lambda: medir_cargadores(escala),
+        }
+        # Entrenar y puntuar necesitan la tabla; la latencia, además, los modelos
+        necesarios = set(casos) | ({'generacion'} if set(casos) - {'cargadores_clima'} else set())
+        if 'latencia' in casos or 'prediccion_lotes' in casos:
+            necesarios.add('entrenamiento')
+        for caso in CASOS:
+            if caso not in necesarios:
+                continue
+            try:
+                medidas = pasos[caso]()
+            except Exception as e:
+                print(f"   ❌ {caso}: {e}")
+                continue
+            for medida in medidas:
+                resultados.append({**comun, 'escala': escala, **medida})
+                print(f"   - {medida['caso']:<40} {medida['segundos']:>9.2f} s"
+                      + (f" {medida['filas_por_segundo']:>14,.0f} filas/s" if medida['filas_por_segundo'] else '')
+                      + (f"  p50 {medida['p50_ms']:.1f} ms, p99 {medida['p99_ms']:.1f} ms" if 'p50_ms' in medida else ''))
+
+    os.makedirs(directorio, exist_ok=True)
+    with open(os.path.join(directorio, FICHERO_RESULTADOS), 'a', encoding='utf-8') as file:
+        for resultado in resultados:
+            file.write(json.dumps(resultado, ensure_ascii=False) + '\n')
+    return resultados
+
+
+def cargar_resultados(directorio=DIRECTORIO_BENCHMARK):
+    ruta = os.path.join(directorio, FICHERO_RESULTADOS)
+    if not os.path.exists(ruta):
+        return pd.DataFrame()
+    return pd.read_json(ruta, lines=True, dtype={'commit': str})
+
+
+def comparar(resultados, base, actual):
+    """
+    Última medida de cada (escala, caso) de dos commits y su variación.
+
+    Returns:
+        pd.DataFrame: escala, caso, segundos_base, segundos_actual, variacion_pct
+                      (negativa = más rápido en 'actual').
+    """
+    def ultima(commit):
+        filas = resultados[resultados['commit'].str.startswith(commit)]
+        return filas.sort_values('fecha').groupby(['escala', 'caso'])['segundos'].last()
+
+    tabla = pd.concat({'segundos_base': ultima(base), 'segundos_actual': ultima(actual)}, axis=1).dropna()
+    tabla['variacion_pct'] = (tabla['segundos_actual'] / tabla['segundos_base'] - 1) * 100
+    return tabla.reset_index()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline sobre datos sintéticos (sin conexión)")
+    parser.add_argument('--escalas', type=int, nargs='+', default=ESCALAS, help="Escalas a medir (1 = 43.800 filas)")
+    parser.add_argument('--casos', nargs='+', choices=CASOS, default=CASOS, help="Casos a medir")
+    parser.add_argument('--directorio', default=DIRECTORIO_BENCHMARK, help="Directorio de trabajo y de resultados")
+    parser.add_argument('--comparar', nargs='+', metavar='COMMIT',
+                        help="Compara los resultados guardados de BASE con ACTUAL (por defecto HEAD) sin ejecutar nada")
+    args = parser.parse_args()
+
+    if args.comparar:
+        base, actual = args.comparar[0], (args.comparar[1] if len(args.comparar) > 1 else commit_actual()[0])
+        tabla = comparar(cargar_resultados(args.directorio), base, actual)
+        if tabla.empty:
+            print(f"❌ No hay resultados comunes de '{base}' y '{actual}' en {args.directorio}/{FICHERO_RESULTADOS}.")
+        else:
+            print(f"Variación de {actual} respecto a {base} (negativa = más rápido):\n")
+            print(tabla.to_string(index=False, float_format=lambda x: f"{x:,.2f}"))
+    else:
+        resultados = ejecutar_benchmark(args.escalas, args.casos, args.directorio)
+        print(f"\n✅ {len(resultados)} medidas añadidas a {args.directorio}/{FICHERO_RESULTADOS}.")
@@ -0,0 +1,242 @@
+# ============================================================================
+# CACHÉ DE RESULTADOS DE ESCENARIOS DE PREDICCIÓN
+# ============================================================================
+# Autor: Julio Clavijo
+# Versión: 1.0
+#
+# Descripción:
+# Los dashboards y los analistas piden una y otra vez los mismos escenarios
+# (codigo_postal, sector, fecha, tramo, temperatura, humedad, es_festivo).
+# Este módulo implementa una caché LRU con caducidad (TTL) compartida por
+# todos los predictores del proceso. Cada entrada va asociada a la huella del
+# predictor que la generó (modelos por sector + histórico de referencia), de
+# modo que predictores distintos conviven en la caché sin pisarse y las
+# entradas de versiones antiguas se desalojan solas por LRU o TTL.
+# Opcionalmente se persiste en disco con pickle.
+# ============================================================================
+
+import copy
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+
+import pandas as pd
+
+# --- 1. CONFIGURACIÓN ---
+MAX_ENTRADAS_DEFECTO = 10000
+TTL_SEGUNDOS_DEFECTO = 6 * 60 * 60  # 6 horas
+
+
+# --- 2. FUNCIONES AUXILIARES ---
+
+def calcular_version_modelos(modelos):
+    """
+    Calcula un identificador estable para un conjunto de modelos por sector.
+
+    Args:
+        modelos (dict): Diccionario {sector: modelo XGBoost entrenado}.
+
+    Returns:
+        str: Hash corto (12 caracteres) del contenido serializado de los boosters.
+    """
+    huella = hashlib.sha1()
+    for sector in sorted(modelos):
+        huella.update(sector.encode('utf-8'))
+        huella.update(bytes(modelos[sector].get_booster().save_raw()))
+    return huella.hexdigest()[:12]
+
+
+def calcular_huella_historico(df_historico):
+    """
+    Calcula un identificador estable del histórico usado por un predictor.
+
+    Args:
+        df_historico (pd.DataFrame): Datos históricos (población, clima por mes, lags...).
+
+    Returns:
+        str: Hash corto (12 caracteres) de columnas y contenido, sin tener en cuenta el índice.
+    """
+    huella = hashlib.sha1()
+    huella.update('|'.join(map(str, df_historico.columns)).encode('utf-8'))
+    huella.update(pd.util.hash_pandas_object(df_historico, index=False).values.tobytes())
+    return huella.hexdigest()[:12]
+
+
+def calcular_version_predictor(modelos, df_historico):
+    """
+    Identificador de un predictor: huella de sus modelos y de su histórico.
+
+    Dos predictores con los mismos modelos pero distinto histórico pueden dar
+    resultados distintos para el mismo escenario, así que no comparten entradas.
+
+    Returns:
+        str: '<version_modelos>-<huella_historico>'.
+    """
+    return f"{calcular_version_modelos(modelos)}-{calcular_huella_historico(df_historico)}"
+
+
+def normalizar_escenario(codigo_postal, sector, fecha, tramo, temperatura, humedad, es_festivo):
+    """
+    Convierte los parámetros de un escenario en una tupla hashable y canónica.
+
+    Solo se unifican representaciones que el modelo recibe igual (fecha como
+    '2025-07-15' o como datetime, 28 o 28.0 °C). El clima no se redondea ni el
+    código postal se rellena con ceros: la clave debe corresponder exactamente
+    a la entrada con la que se calculó el resultado guardado.
+
+    Returns:
+        tuple: (codigo_postal, sector, fecha ISO, tramo, temperatura, humedad, es_festivo)
+    """
+    if isinstance(fecha, (datetime, date)):
+        fecha = fecha.strftime('%Y-%m-%d')
+    else:
+        fecha = str(fecha)[:10]
+
+    def _valor(valor):
+        return None if valor is None else float(valor)
+
+    return (
+        codigo_postal,
+        str(sector),
+        fecha,
+        int(tramo),
+        _valor(temperatura),
+        _valor(humedad),
+        bool(es_festivo),
+    )
+
+
+# --- 3. CLASE DE LA CACHÉ ---
+
+class CacheEscenarios:
+    """
+    Caché LRU + TTL de resultados de predicción, segura entre hilos.
+
+    Las claves son (version_predictor, escenario_normalizado), por lo que
+    varios predictores pueden compartir la caché sin invalidarse entre sí.
+    """
+
+    def __init__(self, max_entradas=MAX_ENTRADAS_DEFECTO, ttl_segundos=TTL_SEGUNDOS_DEFECTO, ruta_disco=None):
+        """
+        Args:
+            max_entradas (int): Número máximo de escenarios almacenados.
+            ttl_segundos (float): Segundos de validez de cada entrada. None = sin caducidad.
+            ruta_disco (str, optional): Fichero pickle para persistir la caché entre ejecuciones.
+        """
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self.ruta_disco = ruta_disco
+        self._entradas = OrderedDict()  # clave -> (instante_insercion, resultado)
+        self._lock = threading.RLock()
+        self._reiniciar_metricas()
+
+        if ruta_disco and os.path.exists(ruta_disco):
+            self.cargar()
+
+    def _reiniciar_metricas(self):
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self.caducadas = 0
+
+    def obtener(self, version, escenario):
+        """Devuelve el resultado cacheado para esa versión de predictor, o None si no existe o caducó."""
+        clave = (version, escenario)
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            instante, resultado = entrada
+            if self.ttl_segundos is not None and time.time() - instante > self.ttl_segundos:
+                del self._entradas[clave]
+                self.caducadas += 1
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return resultado
+
+    def obtener_o_calcular(self, version, escenario, calcular):
+        """
+        Devuelve una copia del resultado cacheado o, si no existe, lo calcula y lo guarda.
+
+        Args:
+            calcular (callable): Función sin argumentos que calcula el resultado del escenario.
+        """
+        resultado = self.obtener(version, escenario)
+        if resultado is None:
+            resultado = calcular()
+            self.guardar(version, escenario, copy.deepcopy(resultado))
+            return resultado
+        return copy.deepcopy(resultado)
+
+    def guardar(self, version, escenario, resultado):
+        """Almacena un resultado asociado a la versión de predictor que lo generó."""
+        with self._lock:
+            clave = (version, escenario)
+            self._entradas[clave] = (time.time(), resultado)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+                self.desalojos += 1
+
+    def vaciar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def metricas(self):
+        """
+        Returns:
+            dict: Aciertos, fallos, tasa de acierto y contadores de desalojo/caducidad.
+        """
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                'entradas': len(self._entradas),
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'tasa_acierto': self.aciertos / consultas if consultas else 0.0,
+                'desalojos': self.desalojos,
+                'caducadas': self.caducadas,
+                'versiones': len({version for version, _ in self._entradas}),
+            }
+
+    def persistir(self, ruta=None):
+        """Escribe la caché en disco (escritura atómica vía fichero temporal)."""
+        ruta = ruta or self.ruta_disco
+        if not ruta:
+            return
+        with self._lock:
+            estado = {'entradas': list(self._entradas.items())}
+        ruta_tmp = f"{ruta}.tmp"
+        with open(ruta_tmp, 'wb') as file:
+            pickle.dump(estado, file)
+        os.replace(ruta_tmp, ruta)
+
+    def cargar(self, ruta=None):
+        """Carga una caché persistida, descartando las entradas caducadas."""
+        ruta = ruta or self.ruta_disco
+        try:
+            with open(ruta, 'rb') as file:
+                estado = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            print(f"⚠️ No se pudo cargar la caché de escenarios '{ruta}': {e}")
+            return
+        ahora = time.time()
+        with self._lock:
+            for clave, (instante, resultado) in estado.get('entradas', []):
+                if self.ttl_segundos is None or ahora - instante <= self.ttl_segundos:
+                    self._entradas[clave] = (instante, resultado)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+
+# --- 4. INSTANCIA COMPARTIDA POR PROCESO ---
+# Todos los predictores de un mismo proceso comparten esta caché. La ruta de
+# persistencia se puede fijar con la variable de entorno CACHE_ESCENARIOS_PATH.
+CACHE_GLOBAL = CacheEscenarios(ruta_disco=os.getenv("CACHE_ESCENARIOS_PATH"))
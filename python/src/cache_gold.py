@@ -0,0 +1,343 @@
+# ============================================================================
+# CACHÉ LOCAL DE LAS TABLAS GOLD (INSTANTÁNEAS PARQUET)
+# ============================================================================
+# Autor: Julio Clavijo
+# Versión: 1.0
+#
+# Descripción:
+# Los scripts de entrenamiento, la predicción por lotes y el notebook
+# descargaban gold_data.modelo_final / modelo_final_v2 completas en cada
+# ejecución. FuenteCacheada envuelve a cualquier FuenteDatos y guarda una
+# instantánea local de cada tabla gold:
+#
+#   1. La instantánea se identifica por la tabla y su última modificación
+#      (table.modified en BigQuery): si la tabla cambia, la siguiente lectura
+#      descarga una instantánea nueva y borra la anterior.
+#   2. Se guarda como Parquet comprimido (zstd), particionado por
+#      id_sector_economico, que es el filtro de todas las lecturas por sector.
+#   3. Las lecturas se hacen con pyarrow.dataset sobre ficheros mapeados en
+#      memoria, con poda de particiones y filtros de fecha; cualquier otra
+#      consulta sobre las tablas cacheadas se resuelve con DuckDB sobre los
+#      mismos ficheros.
+#   4. El tamaño total está limitado: al superarlo se eliminan las
+#      instantáneas usadas hace más tiempo (LRU entre tablas).
+#
+# Se activa por defecto con FUENTE_DATOS=bigquery (ver crear_fuente()).
+# ============================================================================
+
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import threading
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+from pyarrow import fs
+
+from fuentes_datos import FuenteDatos, traducir_a_duckdb
+
+# --- 1. CONFIGURACIÓN ---
+RUTA_CACHE = os.getenv("CACHE_GOLD_PATH", '.cache_gold')
+MAX_GB_CACHE = float(os.getenv("CACHE_GOLD_MAX_GB", '5'))
+TABLAS_CACHEADAS = ('gold_data.modelo_final', 'gold_data.modelo_final_v2')
+COLUMNA_PARTICION = 'id_sector_economico'
+COMPRESION = 'zstd'
+VIGENCIA_MODIFICACION_S = 30  # segundos que se reutiliza la consulta de última modificación
+FICHERO_METADATOS = '_instantanea.json'  # con '_' para que pyarrow y DuckDB lo ignoren
+
+
+# --- 2. ALMACÉN DE INSTANTÁNEAS ---
+
+class CacheInstantaneas:
+    """
+    Directorio de instantáneas Parquet: '<raiz>/<dataset.tabla>/<clave>/'.
+
+    La clave es un hash de la última modificación de la tabla. El mtime del
+    fichero de metadatos de cada instantánea marca su último uso (LRU).
+    """
+
+    def __init__(self, raiz=RUTA_CACHE, max_bytes=int(MAX_GB_CACHE * 1e9)):
+        self.raiz = raiz
+        self.max_bytes = max_bytes
+        self._sistema = fs.LocalFileSystem(use_mmap=True)
+        os.makedirs(raiz, exist_ok=True)
+
+    @staticmethod
+    def clave(modificacion):
+        return hashlib.sha1(str(modificacion).encode('utf-8')).hexdigest()[:16]
+
+    def ruta(self, tabla, modificacion):
+        return os.path.join(self.raiz, tabla, self.clave(modificacion))
+
+    def metadatos(self, tabla, modificacion):
+        """Metadatos de la instantánea vigente, o None si no está en la caché."""
+        ruta = os.path.join(self.ruta(tabla, modificacion), FICHERO_METADATOS)
+        if not os.path.exists(ruta):
+            return None
+        with open(ruta, encoding='utf-8') as file:
+            return json.load(file)
+
+    def guardar(self, tabla, modificacion, datos):
+        """
+        Escribe la instantánea de una tabla (en un directorio temporal que se
+        renombra al final) y elimina las anteriores de la misma tabla.
+
+        Returns:
+            dict: Metadatos de la instantánea (columnas, filas, bytes).
+        """
+        destino = self.ruta(tabla, modificacion)
+        temporal = f"{destino}.tmp-{os.getpid()}-{threading.get_ident()}"
+        particionada = COLUMNA_PARTICION in datos.column_names
+        opciones = ds.ParquetFileFormat().make_write_options(compression=COMPRESION)
+        ds.write_dataset(
+            datos, temporal, format='parquet', file_options=opciones,
+            partitioning=ds.partitioning(pa.schema([datos.schema.field(COLUMNA_PARTICION)]), flavor='hive')
+            if particionada else None,
+            max_rows_per_group=1 << 20, existing_data_behavior='overwrite_or_ignore')
+        metadatos = {
+            'tabla': tabla, 'modificacion': str(modificacion), 'creada': time.time(),
+            'columnas': datos.column_names, 'filas': datos.num_rows,
+            'particion': COLUMNA_PARTICION if particionada else None,
+            'tipo_particion': str(datos.schema.field(COLUMNA_PARTICION).type) if particionada else None,
+            'bytes': _bytes_directorio(temporal),
+        }
+        with open(os.path.join(temporal, FICHERO_METADATOS), 'w', encoding='utf-8') as file:
+            json.dump(metadatos, file)
+        try:
+            os.rename(temporal, destino)
+        except OSError:
+            shutil.rmtree(temporal, ignore_errors=True)  # otro proceso la guardó antes
+        for anterior in os.listdir(os.path.join(self.raiz, tabla)):
+            if anterior != os.path.basename(destino) and '.tmp-' not in anterior:
+                shutil.rmtree(os.path.join(self.raiz, tabla, anterior), ignore_errors=True)
+        self.aplicar_limite(conservar=destino)
+        return metadatos
+
+    def dataset(self, tabla, modificacion, metadatos):
+        """pyarrow.dataset de la instantánea, con los ficheros mapeados en memoria."""
+        ruta = self.ruta(tabla, modificacion)
+        os.utime(os.path.join(ruta, FICHERO_METADATOS))  # último uso, para el LRU
+        particion = None
+        if metadatos['particion']:
+            tipo = pa.type_for_alias(metadatos['tipo_particion'])
+            particion = ds.partitioning(pa.schema([(metadatos['particion'], tipo)]), flavor='hive')
+        return ds.dataset(ruta, format='parquet', partitioning=particion, filesystem=self._sistema)
+
+    def instantaneas(self):
+        """Lista (último uso, bytes, ruta) de todas las instantáneas guardadas."""
+        resultado = []
+        for tabla in os.listdir(self.raiz):
+            ruta_tabla = os.path.join(self.raiz, tabla)
+            if not os.path.isdir(ruta_tabla):
+                continue
+            for clave in os.listdir(ruta_tabla):
+                meta = os.path.join(ruta_tabla, clave, FICHERO_METADATOS)
+                if os.path.exists(meta):
+                    resultado.append((os.path.getmtime(meta), _bytes_directorio(os.path.dirname(meta)),
+                                      os.path.dirname(meta)))
+        return sorted(resultado)
+
+    def aplicar_limite(self, conservar=None):
+        """Elimina las instantáneas menos usadas hasta quedar bajo max_bytes."""
+        instantaneas = self.instantaneas()
+        total = sum(bytes_ for _, bytes_, _ in instantaneas)
+        eliminadas = []
+        for _, bytes_, ruta in instantaneas:
+            if total <= self.max_bytes:
+                break
+            if ruta == conservar:
+                continue
+            shutil.rmtree(ruta, ignore_errors=True)
+            total -= bytes_
+            eliminadas.append(ruta)
+        return eliminadas
+
+
+def _bytes_directorio(ruta):
+    return sum(os.path.getsize(os.path.join(base, f)) for base, _, ficheros in os.walk(ruta) for f in ficheros)
+
+
+def crear_cache():
+    """Caché con la configuración de entorno (CACHE_GOLD_PATH, CACHE_GOLD_MAX_GB)."""
+    return CacheInstantaneas(RUTA_CACHE, int(MAX_GB_CACHE * 1e9))
+
+
+# --- 3. FUENTE CON CACHÉ ---
+
+class FuenteCacheada(FuenteDatos):
+    """
+    Envuelve una FuenteDatos: las lecturas de TABLAS_CACHEADAS se sirven
+    desde la instantánea local vigente; el resto se delegan en la fuente.
+    """
+
+    def __init__(self, fuente, cache=None, tablas=TABLAS_CACHEADAS):
+        self.fuente = fuente
+        self.cache = cache or crear_cache()
+        self.tablas = set(tablas)
+        self.nombre = f"{fuente.nombre}+cache"
+        self.credentials = fuente.credentials
+        self._bloqueos = {tabla: threading.Lock() for tabla in self.tablas}
+        self._modificaciones = {}
+        self._duckdb = None
+        self._vistas = {}
+        self._bloqueo_duckdb = threading.Lock()
+        self.estadisticas = {'aciertos': 0, 'descargas': 0}
+
+    # --- Resolución de la instantánea ---
+
+    def _modificacion(self, tabla):
+        """Última modificación en la fuente, reutilizada durante unos segundos."""
+        ahora = time.monotonic()
+        guardada = self._modificaciones.get(tabla)
+        if guardada is None or ahora - guardada[1] > VIGENCIA_MODIFICACION_S:
+            guardada = (self.fuente.ultima_modificacion(tabla), ahora)
+            self._modificaciones[tabla] = guardada
+        return guardada[0]
+
+    def instantanea(self, tabla):
+        """
+        (modificación, metadatos) de la instantánea vigente de 'tabla',
+        descargándola si no está en la caché. None si no se puede cachear.
+        """
+        if tabla not in self.tablas:
+            return None
+        modificacion = self._modificacion(tabla)
+        if modificacion is None:
+            return None
+        with self._bloqueos[tabla]:
+            metadatos = self.cache.metadatos(tabla, modificacion)
+            if metadatos is not None:
+                self.estadisticas['aciertos'] += 1
+                return modificacion, metadatos
+            reloj = time.perf_counter()
+            metadatos = self.cache.guardar(tabla, modificacion, self.fuente.leer_tabla_arrow(tabla))
+            self.estadisticas['descargas'] += 1
+            print(f"   - Caché: '{tabla}' descargada ({metadatos['filas']} filas, "
+                  f"{metadatos['bytes'] / 1e6:,.1f} MB en disco) en {time.perf_counter() - reloj:.2f} s.")
+            return modificacion, metadatos
+
+    def _leer_instantanea(self, tabla, columnas=None, filtro=None):
+        vigente = self.instantanea(tabla)
+        if vigente is None:
+            return None
+        modificacion, metadatos = vigente
+        columnas = list(columnas) if columnas else metadatos['columnas']
+        return self.cache.dataset(tabla, modificacion, metadatos).to_table(columns=columnas, filter=filtro)
+
+    # --- Lecturas ---
+
+    def leer_tabla_arrow(self, tabla, columnas=None):
+        datos = self._leer_instantanea(tabla, columnas)
+        return self.fuente.leer_tabla_arrow(tabla, columnas) if datos is None else datos
+
+    def leer_seleccion(self, tabla, columnas=None, desde=None, hasta=None, sectores=None):
+        filtro = None
+        condiciones = []
+        if desde is not None:
+            condiciones.append(ds.field('fecha') >= pa.scalar(_fecha(desde), pa.date32()))
+        if hasta is not None:
+            condiciones.append(ds.field('fecha') <= pa.scalar(_fecha(hasta), pa.date32()))
+        if sectores is not None:
+            condiciones.append(ds.field(COLUMNA_PARTICION).isin([int(s) for s in sectores]))
+        for condicion in condiciones:
+            filtro = condicion if filtro is None else filtro & condicion
+        datos = self._leer_instantanea(tabla, columnas, filtro)
+        return self.fuente.leer_seleccion(tabla, columnas, desde, hasta, sectores) if datos is None else datos
+
+    def leer_arrow(self, sql):
+        """Consultas sobre tablas cacheadas: DuckDB sobre las instantáneas; el resto, la fuente."""
+        tablas = _tablas_referenciadas(sql)
+        vigentes = {t: self.instantanea(t) for t in tablas}
+        if not tablas or any(v is None for v in vigentes.values()):
+            return self.fuente.leer_arrow(sql)
+        with self._bloqueo_duckdb:
+            conexion = self._conexion_duckdb()
+            for tabla, (modificacion, metadatos) in vigentes.items():
+                if self._vistas.get(tabla) != modificacion:
+                    dataset, nombre = tabla.split('.')
+                    patron = os.path.join(self.cache.ruta(tabla, modificacion), '**', '*.parquet')
+                    conexion.execute(f"CREATE SCHEMA IF NOT EXISTS {dataset}")
+                    conexion.execute(
+                        f"CREATE OR REPLACE VIEW {tabla} AS SELECT {', '.join(metadatos['columnas'])} "
+                        f"FROM read_parquet('{patron}', hive_partitioning = true"
+                        + (f", hive_types = {{'{metadatos['particion']}': BIGINT}}" if metadatos['particion'] else '')
+                        + ")")
+                    self._vistas[tabla] = modificacion
+            cursor = conexion.cursor()
+        return cursor.execute(traducir_a_duckdb(sql)).arrow()
+
+    def _conexion_duckdb(self):
+        if self._duckdb is None:
+            import duckdb
+            self._duckdb = duckdb.connect()
+        return self._duckdb
+
+    # --- Delegadas en la fuente ---
+
+    def leer_clasico(self, sql):
+        return self.fuente.leer_clasico(sql)
+
+    def ejecutar(self, sql):
+        self.fuente.ejecutar(sql)
+        self._modificaciones.clear()  # la sentencia puede haber modificado una tabla cacheada
+
+    def bytes_escaneados(self, sql):
+        tablas = _tablas_referenciadas(sql)
+        if tablas and all(self.instantanea(t) is not None for t in tablas):
+            return 0  # se resuelve en local, sin escanear el almacén
+        return self.fuente.bytes_escaneados(sql)
+
+    def existe_tabla(self, tabla):
+        return self.fuente.existe_tabla(tabla)
+
+    def ultima_modificacion(self, tabla):
+        return self.fuente.ultima_modificacion(tabla)
+
+    def ultima_fecha(self, tabla):
+        return self.fuente.ultima_fecha(tabla)
+
+
+# --- 4. FUNCIONES AUXILIARES ---
+
+def _fecha(valor):
+    import pandas as pd
+    return pd.Timestamp(valor).date()
+
+
+def _tablas_referenciadas(sql):
+    """Tablas 'dataset.tabla' de los identificadores `proyecto.dataset.tabla` de una consulta."""
+    return {'.'.join(r.split('.')[-2:]) for r in re.findall(r'`([\w-]+(?:\.[\w-]+){1,2})`', sql)}
+
+
+# --- 5. EJECUCIÓN PRINCIPAL ---
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+    from fuentes_datos import crear_fuente
+
+    parser = argparse.ArgumentParser(description="Caché local de las tablas gold")
+    parser.add_argument('--fuente', choices=['bigquery', 'duckdb'], help="Sobrescribe FUENTE_DATOS")
+    parser.add_argument('--precargar', nargs='*', default=None, metavar='TABLA',
+                        help="Descarga (si han cambiado) las tablas indicadas, o todas las cacheadas")
+    parser.add_argument('--vaciar', action='store_true', help="Elimina todas las instantáneas")
+    args = parser.parse_args()
+
+    load_dotenv()
+    cache = crear_cache()
+    if args.vaciar:
+        shutil.rmtree(cache.raiz, ignore_errors=True)
+        print(f"✅ Caché '{cache.raiz}' vaciada.")
+        exit()
+    if args.precargar is not None:
+        os.environ['CACHE_GOLD'] = '0'  # la fuente subyacente, sin envolver dos veces
+        fuente = FuenteCacheada(crear_fuente(args.fuente), cache)
+        for tabla in args.precargar or sorted(TABLAS_CACHEADAS):
+            inicio = time.perf_counter()
+            filas = fuente.leer_tabla_arrow(tabla, ['fecha']).num_rows
+            print(f"✅ {tabla}: {filas} filas disponibles en local ({time.perf_counter() - inicio:.2f} s).")
+
+    for ultimo_uso, bytes_, ruta in cache.instantaneas():
+        print(f"   - {ruta}: {bytes_ / 1e6:,.1f} MB, último uso {time.strftime('%Y-%m-%d %H:%M', time.localtime(ultimo_uso))}")
@@ -0,0 +1,388 @@
+# ============================================================================
+# MOTOR DE CALIDAD DE DATOS (BRONZE Y SILVER)
+# ============================================================================
+# Autor: Julio Clavijo
+# Versión: 1.0
+#
+# Descripción:
+# El README promete comprobaciones de nulos, negativos, duplicados y rangos,
+# pero en el código solo existían el 'WHERE c.Valor > 0' del script 06 y el
+# dropna de los entrenamientos. Este módulo evalúa reglas declarativas
+# (diccionarios en REGLAS_*) sobre lotes Arrow:
+#
+#   1. Cada lote se recorre una sola vez: todas las reglas se evalúan sobre
+#      él con pyarrow.compute (una máscara booleana por regla).
+#   2. Por regla se acumulan las violaciones y una muestra aleatoria de filas
+#      infractoras de tamaño fijo (muestreo por prioridad entre lotes).
+#   3. La regla de unicidad guarda un hash de 64 bits de la clave de cada
+#      fila ya vista, de modo que los duplicados entre lotes se detectan sin
+#      volver a leer los datos.
+#
+# Se usa en línea en los cargadores (antes de subir a GCS) y sobre tablas de
+# bronze/silver leídas por lotes desde la fuente de datos.
+# ============================================================================
+
+import time
+import fnmatch
+import argparse
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# --- 1. CONFIGURACIÓN ---
+FILAS_POR_LOTE = 1_000_000
+MUESTRAS_POR_REGLA = 5
+
+TRAMOS_HORARIOS = ['De 00:00:00 a 05:59:59', 'De 06:00:00 a 11:59:59',
+                   'De 12:00:00 a 17:59:59', 'De 18:00:00 a 23:59:59']
+
+# Tipos de regla: 'no_nulo', 'rango' (minimo/maximo, 'excluir_minimo'),
+# 'valores' (lista permitida), 'patron' (regex sobre el texto), 'menor_igual'
+# (columna <= otra) y 'unico' (combinación de 'columnas' sin repetir).
+# 'severidad' es 'error' (por defecto) o 'aviso'.
+REGLAS_CONSUMO_BRONZE = [
+    {'nombre': 'fecha_no_nula', 'tipo': 'no_nulo', 'columna': 'Data'},
+    {'nombre': 'valor_no_nulo', 'tipo': 'no_nulo', 'columna': 'Valor'},
+    {'nombre': 'valor_no_negativo', 'tipo': 'rango', 'columna': 'Valor', 'minimo': 0},
+    {'nombre': 'codigo_postal_valido', 'tipo': 'patron', 'columna': 'Codi_Postal', 'patron': r'^0?8\d{3}$'},
+    {'nombre': 'tramo_conocido', 'tipo': 'valores', 'columna': 'Tram_Horari',
+     'valores': TRAMOS_HORARIOS + ['No consta'], 'severidad': 'aviso'},
+    {'nombre': 'sector_no_nulo', 'tipo': 'no_nulo', 'columna': 'Sector_Economic'},
+    {'nombre': 'registro_unico', 'tipo': 'unico',
+     'columnas': ['Data', 'Codi_Postal', 'Tram_Horari', 'Sector_Economic']},
+]
+
+REGLAS_CLIMA_BRONZE = [
+    {'nombre': 'lectura_con_fecha', 'tipo': 'no_nulo', 'columna': 'data_lectura'},
+    {'nombre': 'valor_numerico', 'tipo': 'patron', 'columna': 'valor_lectura',
+     'patron': r'^\s*-?\d+(\.\d+)?\s*$'},
+    {'nombre': 'estacion_conocida', 'tipo': 'valores', 'columna': 'codi_estacio', 'valores': ['X4', 'X8', 'D5']},
+    {'nombre': 'variable_conocida', 'tipo': 'valores', 'columna': 'codi_variable',
+     'valores': ['32', '33', '35', '30', '36'], 'severidad': 'aviso'},
+    {'nombre': 'lectura_unica', 'tipo': 'unico', 'columnas': ['data_lectura', 'codi_estacio', 'codi_variable']},
+]
+
+REGLAS_AEMET_BRONZE = [
+    {'nombre': 'fecha_no_nula', 'tipo': 'no_nulo', 'columna': 'fecha'},
+    {'nombre': 'tmed_en_rango', 'tipo': 'rango', 'columna': 'tmed', 'minimo': -15, 'maximo': 50},
+    {'nombre': 'precipitacion_no_negativa', 'tipo': 'rango', 'columna': 'prec', 'minimo': 0},
+    {'nombre': 'tmin_menor_que_tmax', 'tipo': 'menor_igual', 'columna': 'tmin', 'otra': 'tmax'},
+    {'nombre': 'dia_unico', 'tipo': 'unico', 'columnas': ['fecha']},
+]
+
+REGLAS_CONSUMO_SILVER = [
+    {'nombre': 'fecha_no_nula', 'tipo': 'no_nulo', 'columna': 'fecha'},
+    {'nombre': 'geografia_no_nula', 'tipo': 'no_nulo', 'columna': 'id_geografia'},
+    {'nombre': 'consumo_no_nulo', 'tipo': 'no_nulo', 'columna': 'consumo_kwh'},
+    {'nombre': 'consumo_positivo', 'tipo': 'rango', 'columna': 'consumo_kwh', 'minimo': 0, 'excluir_minimo': True},
+    {'nombre': 'tramo_valido', 'tipo': 'valores', 'columna': 'id_tramo_horario', 'valores': [1, 2, 3, 4]},
+    {'nombre': 'sector_valido', 'tipo': 'valores', 'columna': 'id_sector_economico', 'valores': [1, 2, 3]},
+    {'nombre': 'registro_unico', 'tipo': 'unico',
+     'columnas': ['fecha', 'id_geografia', 'id_sector_economico', 'id_tramo_horario']},
+]
+
+REGLAS_CLIMA_SILVER = [
+    {'nombre': 'tramo_valido', 'tipo': 'valores', 'columna': 'id_tramo_horario', 'valores': [1, 2, 3, 4]},
+    {'nombre': 'temperatura_no_nula', 'tipo': 'no_nulo', 'columna': 'temperatura_media_ciudad', 'severidad': 'aviso'},
+    {'nombre': 'temperatura_en_rango', 'tipo': 'rango', 'columna': 'temperatura_media_ciudad',
+     'minimo': -15, 'maximo': 50},
+    {'nombre': 'humedad_en_rango', 'tipo': 'rango', 'columna': 'humedad_media_ciudad', 'minimo': 0, 'maximo': 100},
+    {'nombre': 'precipitacion_no_negativa', 'tipo': 'rango', 'columna': 'precipitacion_total_ciudad', 'minimo': 0},
+    {'nombre': 'tramo_unico', 'tipo': 'unico', 'columnas': ['fecha', 'id_tramo_horario']},
+]
+
+# Reglas por tabla ('dataset.tabla', admite comodines)
+REGLAS_POR_TABLA = {
+    'bronze_data.raw_consumo_electrico_*': REGLAS_CONSUMO_BRONZE,
+    'bronze_data.raw_clima_historico': REGLAS_CLIMA_BRONZE,
+    'silver_data.fact_consumo_horario': REGLAS_CONSUMO_SILVER,
+    'silver_data.fact_clima_horario': REGLAS_CLIMA_SILVER,
+}
+
+
+# --- 2. EVALUACIÓN VECTORIZADA DE CADA TIPO DE REGLA ---
+
+def _sin_nulos(mascara):
+    """Máscara Arrow -> NumPy bool, con los nulos como 'no viola'."""
+    return pc.fill_null(mascara, False).to_numpy(zero_copy_only=False)
+
+
+def _columna(lote, nombre):
+    """Columna del lote; las diccionario (p. ej. Categorical de pandas) se decodifican a su tipo de valor."""
+    columna = lote.column(nombre)
+    if pa.types.is_dictionary(columna.type):
+        columna = pc.cast(columna, columna.type.value_type)
+    return columna
+
+
+def _no_nulo(lote, regla):
+    columna = _columna(lote, regla['columna'])
+    nulo = pc.is_null(columna, nan_is_null=pa.types.is_floating(columna.type))
+    return nulo.to_numpy(zero_copy_only=False)
+
+
+def _rango(lote, regla):
+    columna = _columna(lote, regla['columna'])
+    viola = pa.array(np.zeros(len(columna), dtype=bool))
+    if regla.get('minimo') is not None:
+        comparar = pc.less_equal if regla.get('excluir_minimo') else pc.less
+        viola = pc.or_(viola, comparar(columna, regla['minimo']))
+    if regla.get('maximo') is not None:
+        viola = pc.or_(viola, pc.greater(columna, regla['maximo']))
+    return _sin_nulos(viola)
+
+
+def _valores(lote, regla):
+    columna = _columna(lote, regla['columna'])
+    permitidos = pa.array(regla['valores']).cast(columna.type)
+    return _sin_nulos(pc.invert(pc.is_in(columna, value_set=permitidos)))
+
+
+def _patron(lote, regla):
+    columna = _columna(lote, regla['columna'])
+    if not (pa.types.is_string(columna.type) or pa.types.is_large_string(columna.type)):
+        columna = pc.cast(columna, pa.string())
+    return _sin_nulos(pc.invert(pc.match_substring_regex(columna, regla['patron'])))
+
+
+def _menor_igual(lote, regla):
+    return _sin_nulos(pc.greater(_columna(lote, regla['columna']), _columna(lote, regla['otra'])))
+
+
+_EVALUADORES = {
+    'no_nulo': _no_nulo,
+    'rango': _rango,
+    'valores': _valores,
+    'patron': _patron,
+    'menor_igual': _menor_igual,
+}
+
+
+class _Vistos:
+    """
+    Hashes de clave ya vistos, en niveles ordenados que se fusionan cuando
+    el último alcanza al anterior (cada hash se copia O(log n) veces).
+    """
+
+    def __init__(self):
+        self.niveles = []
+
+    def contiene(self, hashes):
+        presente = np.zeros(len(hashes), dtype=bool)
+        for nivel in self.niveles:
+            posicion = np.minimum(np.searchsorted(nivel, hashes), len(nivel) - 1)
+            presente |= nivel[posicion] == hashes
+        return presente
+
+    def anadir(self, hashes):
+        if len(hashes) == 0:
+            return  # un nivel vacío rompería contiene() (nivel[len(nivel) - 1])
+        self.niveles.append(np.unique(hashes))
+        while len(self.niveles) > 1 and len(self.niveles[-1]) >= len(self.niveles[-2]):
+            ultimo = self.niveles.pop()
+            self.niveles[-1] = np.union1d(self.niveles[-1], ultimo)
+
+
+def _hash_clave(lote, columnas):
+    """Hash de 64 bits por fila de la combinación de columnas."""
+    return pd.util.hash_pandas_object(lote.select(columnas).to_pandas(), index=False).to_numpy()
+
+
+# --- 3. VALIDADOR ---
+
+class ValidadorCalidad:
+    """
+    Acumula el resultado de un conjunto de reglas sobre una secuencia de
+    lotes Arrow. Cada lote se procesa una sola vez (procesar()) y el
+    resultado se consulta al final con informe() y muestras().
+    """
+
+    def __init__(self, reglas, n_muestras=MUESTRAS_POR_REGLA, semilla=0):
+        nombres = [r['nombre'] for r in reglas]
+        if len(set(nombres)) != len(nombres):
+            raise ValueError("Los nombres de las reglas deben ser únicos")
+        for regla in reglas:
+            if regla['tipo'] not in _EVALUADORES and regla['tipo'] != 'unico':
+                raise ValueError(f"Tipo de regla desconocido en '{regla['nombre']}': '{regla['tipo']}'")
+        self.reglas = reglas
+        self.n_muestras = n_muestras
+        self._rng = np.random.default_rng(semilla)
+        self.filas = 0
+        self.lotes = 0
+        self.segundos = 0.0
+        self.violaciones = {r['nombre']: 0 for r in reglas}
+        self.filas_evaluadas = {r['nombre']: 0 for r in reglas}
+        self.no_aplicables = {}  # regla -> columnas ausentes en algún lote
+        self._muestras = {r['nombre']: (np.empty(0), None) for r in reglas}
+        self._vistos = {r['nombre']: _Vistos() for r in reglas if r['tipo'] == 'unico'}
+
+    def _mascara(self, lote, regla):
+        if regla['tipo'] != 'unico':
+            return _EVALUADORES[regla['tipo']](lote, regla)
+        hashes = _hash_clave(lote, regla['columnas'])
+        # Duplicado dentro del lote (todas las apariciones salvo la primera) o con lotes anteriores
+        _, primeras = np.unique(hashes, return_index=True)
+        repetido = np.ones(len(hashes), dtype=bool)
+        repetido[primeras] = False
+        repetido |= self._vistos[regla['nombre']].contiene(hashes)
+        self._vistos[regla['nombre']].anadir(hashes)
+        return repetido
+
+    def _muestrear(self, nombre, lote, indices):
+        """Muestreo por prioridad: se conservan las n filas con menor clave aleatoria."""
+        claves, muestra = self._muestras[nombre]
+        nuevas = self._rng.random(len(indices))
+        if len(indices) > self.n_muestras:
+            elegidas = np.argpartition(nuevas, self.n_muestras)[:self.n_muestras]
+            nuevas, indices = nuevas[elegidas], indices[elegidas]
+        filas = pa.Table.from_batches([lote.take(pa.array(indices))]).append_column(
+            '_fila', pa.array(indices + self.filas, type=pa.int64()))
+        claves = np.concatenate([claves, nuevas])
+        muestra = filas if muestra is None else pa.concat_tables([muestra, filas])
+        orden = np.argsort(claves)[:self.n_muestras]
+        self._muestras[nombre] = (claves[orden], muestra.take(pa.array(orden)))
+
+    def procesar(self, lote):
+        """
+        Evalúa todas las reglas sobre un lote (pa.RecordBatch o pd.DataFrame).
+
+        Las reglas que usan columnas que el lote no tiene (p. ej. 'prec' en una
+        respuesta de AEMET sin precipitación) no se evalúan en ese lote y el
+        informe las marca como no aplicables.
+        """
+        reloj = time.perf_counter()
+        if isinstance(lote, pd.DataFrame):
+            lote = pa.RecordBatch.from_pandas(lote, preserve_index=False)
+        for regla in self.reglas:
+            faltan = [c for c in regla.get('columnas', [regla.get('columna'), regla.get('otra')])
+                      if c is not None and c not in lote.schema.names]
+            if faltan:
+                self.no_aplicables.setdefault(regla['nombre'], set()).update(faltan)
+                continue
+            self.filas_evaluadas[regla['nombre']] += lote.num_rows
+            indices = np.flatnonzero(self._mascara(lote, regla))
+            if len(indices):
+                self.violaciones[regla['nombre']] += len(indices)
+                if self.n_muestras:
+                    self._muestrear(regla['nombre'], lote, indices)
+        self.filas += lote.num_rows
+        self.lotes += 1
+        self.segundos += time.perf_counter() - reloj
+        return self
+
+    def informe(self):
+        """
+        DataFrame con una fila por regla: violaciones y porcentaje sobre las
+        filas evaluadas, y si la regla se pudo aplicar a todos los lotes.
+        """
+        filas = []
+        for regla in self.reglas:
+            violaciones = self.violaciones[regla['nombre']]
+            evaluadas = self.filas_evaluadas[regla['nombre']]
+            faltan = self.no_aplicables.get(regla['nombre'])
+            filas.append({
+                'regla': regla['nombre'], 'tipo': regla['tipo'],
+                'columnas': ', '.join(c for c in regla.get('columnas', [regla.get('columna'), regla.get('otra')]) if c),
+                'severidad': regla.get('severidad', 'error'),
+                'aplicable': 'no' if not evaluadas and faltan else 'parcial' if faltan else 'sí',
+                'filas': evaluadas, 'violaciones': violaciones,
+                'porcentaje': 100 * violaciones / evaluadas if evaluadas else 0.0,
+            })
+        return pd.DataFrame(filas)
+
+    def muestras(self):
+        """{regla: DataFrame con hasta n_muestras filas infractoras ('_fila' = posición global)}."""
+        return {nombre: muestra.to_pandas() for nombre, (_, muestra) in self._muestras.items() if muestra is not None}
+
+    def hay_errores(self):
+        return any(self.violaciones[r['nombre']] for r in self.reglas if r.get('severidad', 'error') == 'error')
+
+    def metricas(self):
+        return {'filas': self.filas, 'lotes': self.lotes, 'segundos': self.segundos,
+                'filas_por_segundo': self.filas / self.segundos if self.segundos else 0.0}
+
+
+# --- 4. FUNCIONES DE ALTO NIVEL ---
+
+def validar(datos, reglas, filas_por_lote=FILAS_POR_LOTE, n_muestras=MUESTRAS_POR_REGLA):
+    """
+    Valida un DataFrame, una tabla Arrow o un iterable de lotes en una pasada.
+
+    Returns:
+        ValidadorCalidad: con informe(), muestras(), hay_errores() y metricas().
+    """
+    validador = ValidadorCalidad(reglas, n_muestras)
+    if isinstance(datos, pd.DataFrame):
+        datos = pa.Table.from_pandas(datos, preserve_index=False)
+    lotes = datos.to_batches(max_chunksize=filas_por_lote) if isinstance(datos, pa.Table) else datos
+    for lote in lotes:
+        validador.procesar(lote)
+    return validador
+
+
+def reglas_para(tabla):
+    """Reglas de REGLAS_POR_TABLA que corresponden a 'dataset.tabla'."""
+    for patron, reglas in REGLAS_POR_TABLA.items():
+        if fnmatch.fnmatch(tabla, patron):
+            return reglas
+    raise ValueError(f"No hay reglas de calidad definidas para '{tabla}'")
+
+
+def validar_tabla(fuente, tabla, reglas=None, filas_por_lote=FILAS_POR_LOTE, n_muestras=MUESTRAS_POR_REGLA):
+    """Valida una tabla de la fuente leyéndola por lotes (solo las columnas que usan las reglas)."""
+    from fuentes_datos import PROJECT_ID
+
+    reglas = reglas or reglas_para(tabla)
+    columnas = []
+    for regla in reglas:
+        for columna in regla.get('columnas', [regla.get('columna'), regla.get('otra')]):
+            if columna is not None and columna not in columnas:
+                columnas.append(columna)
+    sql = f"SELECT {', '.join(columnas)} FROM `{PROJECT_ID}.{tabla}`"
+    return validar(fuente.leer_lotes(sql, filas_por_lote), reglas, filas_por_lote, n_muestras)
+
+
+def describir_validacion(validador, titulo):
+    """Resumen en texto del informe y de las muestras de las reglas violadas."""
+    informe = validador.informe()
+    metricas = validador.metricas()
+    lineas = [f"--- Calidad de datos: {titulo} ({metricas['filas']:,} filas, {metricas['lotes']} lotes, "
+              f"{metricas['filas_por_segundo']:,.0f} filas/s) ---",
+              informe.to_string(index=False, float_format=lambda x: f"{x:,.3f}")]
+    for nombre, faltan in validador.no_aplicables.items():
+        lineas.append(f"⚠️ Regla '{nombre}' no aplicada donde faltaban las columnas: {', '.join(sorted(faltan))}")
+    for nombre, muestra in validador.muestras().items():
+        lineas.append(f"\nMuestra de '{nombre}':\n{muestra.to_string(index=False)}")
+    return '\n'.join(lineas)
+
+
+# --- 5. EJECUCIÓN PRINCIPAL ---
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from fuentes_datos import crear_fuente
+
+    parser = argparse.ArgumentParser(description="Comprobaciones de calidad de datos sobre tablas bronze/silver")
+    parser.add_argument('tablas', nargs='*', help="Tablas 'dataset.tabla'; por defecto las silver con reglas")
+    parser.add_argument('--fuente', choices=['bigquery', 'duckdb'], help="Sobrescribe FUENTE_DATOS")
+    parser.add_argument('--filas-por-lote', type=int, default=FILAS_POR_LOTE)
+    parser.add_argument('--muestras', type=int, default=MUESTRAS_POR_REGLA, help="Filas infractoras por regla")
+    parser.add_argument('--estricto', action='store_true', help="Termina con código 1 si alguna regla 'error' falla")
+    args = parser.parse_args()
+
+    load_dotenv()
+    fuente = crear_fuente(args.fuente)
+    tablas = args.tablas or [t for t in REGLAS_POR_TABLA if t.startswith('silver_data.')]
+    con_errores = []
+    for tabla in tablas:
+        validador = validar_tabla(fuente, tabla, filas_por_lote=args.filas_por_lote, n_muestras=args.muestras)
+        print(describir_validacion(validador, tabla) + "\n")
+        if validador.hay_errores():
+            con_errores.append(tabla)
+    if con_errores:
+        print(f"❌ Reglas de severidad 'error' incumplidas en: {', '.join(con_errores)}")
+        if args.estricto:
+            exit(1)
+    else:
+        print("✅ Todas las reglas de severidad 'error' se cumplen.")
@@ -0,0 +1,264 @@
+# ============================================================================
+# CLIMA LISTO PARA SILVER: TRAMOS HORARIOS Y PIVOTE VECTORIZADOS
+# ============================================================================
+# Autor: Julio Clavijo
+# Versión: 1.0
+#
+# Descripción:
+# '07_silver_fact_clima_horario.sql' escanea todas las lecturas crudas de
+# bronze_data.raw_clima_historico, pivota las variables por estación y hora y
+# asigna el tramo horario con un JOIN por rango (BETWEEN) contra
+# dim_tramo_horario. Este módulo hace lo mismo en el paso de ingesta, sobre
+# arrays de NumPy/Arrow:
+#
+#   1. El tramo de cada hora sale de una tabla de 24 posiciones calculada una
+#      sola vez (hora -> id_tramo_horario), en lugar del JOIN por rango.
+#   2. Cada lectura se codifica como (hora, estación, variable) y el pivote se
+#      resuelve con una única agregación agrupada (np.bincount) por nivel:
+#      primero por estación y hora, después por fecha y tramo.
+#   3. El resultado tiene las mismas columnas que silver_data.fact_clima_horario
+#      y se carga directamente (load job de Parquet), sin ejecutar el script 07:
+#      python python/src/pipeline_sql.py --omitir 07_silver_fact_clima_horario
+# ============================================================================
+
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# --- 1. CONFIGURACIÓN ---
+# Descripciones de 'Tram_Horari' en los datos de consumo (dim_tramo_horario)
+TRAMOS_HORARIOS = ['De 00:00:00 a 05:59:59', 'De 06:00:00 a 11:59:59',
+                   'De 12:00:00 a 17:59:59', 'De 18:00:00 a 23:59:59']
+
+# Variables pivotadas por estación y hora: (código, columna, agregación)
+VARIABLES_PIVOTE = [
+    ('32', 'temperatura', 'media'),
+    ('33', 'humedad_relativa', 'media'),
+    ('35', 'precipitacion', 'suma'),
+    ('30', 'velocidad_viento', 'media'),
+    ('36', 'irradiancia_solar', 'media'),
+]
+
+# Estaciones con columna propia de temperatura en la tabla silver
+ESTACION_RAVAL, ESTACION_UNIVERSITARIA, ESTACION_FABRA = 'X4', 'X8', 'D5'
+
+TABLA_DESTINO = 'silver_data.fact_clima_horario'
+ESQUEMA_CLIMA_TRAMO = pa.schema([
+    ('fecha', pa.date32()),
+    ('id_tramo_horario', pa.int64()),
+    ('temperatura_media_ciudad', pa.float64()),
+    ('humedad_media_ciudad', pa.float64()),
+    ('precipitacion_total_ciudad', pa.float64()),
+    ('temp_raval', pa.float64()),
+    ('temp_zuniversitaria', pa.float64()),
+    ('temp_fabra', pa.float64()),
+    ('temp_spread_montana_centro', pa.float64()),
+])
+
+
+# --- 2. FUNCIONES AUXILIARES ---
+
+def tramo_por_hora(descripciones=TRAMOS_HORARIOS):
+    """
+    Tabla hora del día (0-23) -> id_tramo_horario.
+
+    Los ids se numeran como en dim_tramo_horario (orden de la descripción) y
+    cada hora se asigna al último tramo que empieza antes o a esa hora, de modo
+    que una hora nunca cae en dos tramos aunque las descripciones se solapen
+    en el extremo ('De 00:00:00 a 06:00:00').
+
+    Returns:
+        np.ndarray: int64 de longitud 24 (0 para horas sin tramo).
+    """
+    tabla = np.zeros(24, dtype=np.int64)
+    for id_tramo, descripcion in enumerate(sorted(descripciones), start=1):
+        inicio = re.match(r'De (\d{2}):\d{2}:\d{2}', descripcion)
+        if inicio is None:
+            raise ValueError(f"Tramo horario no reconocido: '{descripcion}'")
+        tabla[int(inicio.group(1)):] = id_tramo
+    return tabla
+
+
+def _columna_numpy(datos, columna):
+    """Columna de un DataFrame o de una tabla Arrow como array de NumPy."""
+    if isinstance(datos, pa.Table):
+        return datos.column(columna).to_numpy(zero_copy_only=False)
+    return datos[columna].to_numpy()
+
+
+def _media(suma, cuenta):
+    """Media con NaN donde no hay valores (equivale al NULL de AVG)."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(cuenta > 0, suma / np.maximum(cuenta, 1), np.nan)
+
+
+def _suma(suma, cuenta):
+    """Suma con NaN donde no hay valores (equivale al NULL de SUM)."""
+    return np.where(cuenta > 0, suma, np.nan)
+
+
+# --- 3. PIVOTE POR ESTACIÓN Y HORA ---
+
+def pivotar_por_estacion(lecturas):
+    """
+    Agrega las lecturas crudas por (hora, estación), una columna por variable.
+
+    Equivale a la CTE 'clima_pivotado_por_estacion' del script 07: se
+    descartan los valores no numéricos, se trunca la lectura a la hora y se
+    calcula la media (o la suma, para la precipitación) de cada variable.
+
+    Args:
+        lecturas (pd.DataFrame | pa.Table): Columnas data_lectura,
+            codi_estacio, codi_variable y valor_lectura, tal y como las
+            devuelve la API de Dades Obertes.
+
+    Returns:
+        pd.DataFrame: fecha_hora, codi_estacio y las columnas de
+                      VARIABLES_PIVOTE, ordenado por hora y estación.
+    """
+    valor = pd.to_numeric(pd.Series(_columna_numpy(lecturas, 'valor_lectura')), errors='coerce').to_numpy()
+    validas = ~np.isnan(valor)
+    valor = valor[validas]
+    horas = (pd.to_datetime(_columna_numpy(lecturas, 'data_lectura')[validas])
+             .to_numpy().astype('datetime64[h]').astype(np.int64))
+    estaciones, cod_estacion = np.unique(_columna_numpy(lecturas, 'codi_estacio')[validas].astype(str),
+                                         return_inverse=True)
+    variables = _columna_numpy(lecturas, 'codi_variable')[validas].astype(str)
+
+    # Cada grupo (hora, estación) es una fila de la salida, aunque solo tenga variables fuera del pivote
+    hora_base = horas.min() if len(horas) else 0
+    grupo = (horas - hora_base) * len(estaciones) + cod_estacion
+    grupos, cod_grupo = np.unique(grupo, return_inverse=True)
+
+    # Código de variable: 0..n-1 para las del pivote, n para el resto
+    codigos = [codigo for codigo, _, _ in VARIABLES_PIVOTE]
+    cod_variable = np.full(len(variables), len(codigos), dtype=np.int64)
+    for i, codigo in enumerate(codigos):
+        cod_variable[variables == codigo] = i
+
+    # Una sola agregación agrupada para todas las variables a la vez
+    celdas = cod_grupo * (len(codigos) + 1) + cod_variable
+    tamano = len(grupos) * (len(codigos) + 1)
+    suma = np.bincount(celdas, weights=valor, minlength=tamano).reshape(len(grupos), -1)
+    cuenta = np.bincount(celdas, minlength=tamano).reshape(len(grupos), -1)
+
+    resultado = {
+        'fecha_hora': (grupos // max(len(estaciones), 1) + hora_base).astype('datetime64[h]').astype('datetime64[ns]'),
+        'codi_estacio': estaciones[grupos % max(len(estaciones), 1)] if len(estaciones) else np.array([], dtype=str),
+    }
+    for i, (_, columna, agregacion) in enumerate(VARIABLES_PIVOTE):
+        resultado[columna] = (_suma if agregacion == 'suma' else _media)(suma[:, i], cuenta[:, i])
+    return pd.DataFrame(resultado)
+
+
+# --- 4. AGREGACIÓN POR FECHA Y TRAMO ---
+
+def agregar_por_tramo(por_estacion, descripciones_tramos=TRAMOS_HORARIOS):
+    """
+    Agrega el pivote por estación a (fecha, tramo horario) con el esquema de
+    silver_data.fact_clima_horario.
+
+    Args:
+        por_estacion (pd.DataFrame): Salida de pivotar_por_estacion().
+        descripciones_tramos (list): Descripciones de dim_tramo_horario.
+
+    Returns:
+        pa.Table: Tabla con ESQUEMA_CLIMA_TRAMO, ordenada por fecha y tramo.
+    """
+    horas = por_estacion['fecha_hora'].to_numpy().astype('datetime64[h]').astype(np.int64)
+    tramo = tramo_por_hora(descripciones_tramos)[horas % 24]
+    con_tramo = tramo > 0
+    horas, tramo = horas[con_tramo], tramo[con_tramo]
+    estacion = por_estacion['codi_estacio'].to_numpy()[con_tramo]
+
+    n_tramos = len(descripciones_tramos) + 1
+    grupo = (horas // 24) * n_tramos + tramo
+    grupos, cod_grupo = np.unique(grupo, return_inverse=True)
+
+    def _agregada(valores, mascara=None):
+        """Suma y número de valores no nulos por grupo (opcionalmente filtrados)."""
+        valores = valores[con_tramo]
+        incluir = ~np.isnan(valores) if mascara is None else ~np.isnan(valores) & mascara
+        return (np.bincount(cod_grupo[incluir], weights=valores[incluir], minlength=len(grupos)),
+                np.bincount(cod_grupo[incluir], minlength=len(grupos)))
+
+    temperatura = por_estacion['temperatura'].to_numpy()
+    temp_raval = _media(*_agregada(temperatura, estacion == ESTACION_RAVAL))
+    temp_fabra = _media(*_agregada(temperatura, estacion == ESTACION_FABRA))
+    columnas = {
+        'fecha': (grupos // n_tramos).astype('datetime64[D]'),
+        'id_tramo_horario': grupos % n_tramos,
+        'temperatura_media_ciudad': _media(*_agregada(temperatura)),
+        'humedad_media_ciudad': _media(*_agregada(por_estacion['humedad_relativa'].to_numpy())),
+        'precipitacion_total_ciudad': _suma(*_agregada(por_estacion['precipitacion'].to_numpy())),
+        'temp_raval': temp_raval,
+        'temp_zuniversitaria': _media(*_agregada(temperatura, estacion == ESTACION_UNIVERSITARIA)),
+        'temp_fabra': temp_fabra,
+        'temp_spread_montana_centro': temp_fabra - temp_raval,
+    }
+    # NaN -> NULL, como en la tabla de BigQuery
+    return pa.table({c.name: pa.array(columnas[c.name], type=c.type, from_pandas=True)
+                     for c in ESQUEMA_CLIMA_TRAMO}, schema=ESQUEMA_CLIMA_TRAMO)
+
+
+def construir_clima_silver(lecturas, descripciones_tramos=TRAMOS_HORARIOS):
+    """
+    Lecturas crudas -> (clima por estación y hora, clima por fecha y tramo).
+
+    Returns:
+        tuple: (pd.DataFrame por estación y hora, pa.Table por fecha y tramo
+               con el esquema de silver_data.fact_clima_horario)
+    """
+    por_estacion = pivotar_por_estacion(lecturas)
+    return por_estacion, agregar_por_tramo(por_estacion, descripciones_tramos)
+
+
+def cargar_en_bigquery(tabla, project_id, credentials=None, destino=TABLA_DESTINO):
+    """
+    Sustituye la tabla silver con un load job de Parquet, particionada por
+    fecha como la crea el script 07.
+
+    Returns:
+        int: Filas cargadas.
+    """
+    import os
+    import tempfile
+    import pyarrow.parquet as pq
+    from google.cloud import bigquery
+
+    client = bigquery.Client(project=project_id, credentials=credentials)
+    config = bigquery.LoadJobConfig(
+        source_format=bigquery.SourceFormat.PARQUET,
+        write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+        time_partitioning=bigquery.TimePartitioning(type_=bigquery.TimePartitioningType.DAY, field='fecha'),
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = os.path.join(tmp, 'fact_clima_horario.parquet')
+        pq.write_table(tabla, ruta, compression='snappy')
+        with open(ruta, 'rb') as file:
+            client.load_table_from_file(file, f"{project_id}.{destino}", job_config=config).result()
+    return tabla.num_rows
+
+
+# --- 5. EJECUCIÓN PRINCIPAL ---
+if __name__ == "__main__":
+    import os
+    import time
+    import argparse
+    import pyarrow.parquet as pq
+
+    parser = argparse.ArgumentParser(description="Construye silver_data.fact_clima_horario desde las lecturas crudas")
+    parser.add_argument('entrada', help="Parquet con las lecturas crudas (raw_clima_historico)")
+    parser.add_argument('--salida', default=os.path.join('datos_locales', 'silver_data', 'fact_clima_horario.parquet'),
+                        help="Parquet de salida")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    lecturas = pq.read_table(args.entrada, columns=['data_lectura', 'codi_estacio', 'codi_variable', 'valor_lectura'])
+    por_estacion, por_tramo = construir_clima_silver(lecturas)
+    os.makedirs(os.path.dirname(args.salida) or '.', exist_ok=True)
+    pq.write_table(por_tramo, args.salida, compression='zstd')
+    print(f"✅ {lecturas.num_rows:,} lecturas -> {len(por_estacion):,} filas estación-hora -> "
+          f"{por_tramo.num_rows:,} filas fecha-tramo en {time.perf_counter() - inicio:.2f} s ('{args.salida}').")
@@ -0,0 +1,247 @@
+# ============================================================================
+# GENERADOR SINTÉTICO DE LA TABLA GOLD modelo_final_v2
+# ============================================================================
+# Autor: Julio Clavijo
+# Versión: 1.0
+#
+# Descripción:
+# Sin conexión a BigQuery no había datos con los que medir el rendimiento.
+# Este módulo genera, de forma vectorizada y reproducible (semilla), una tabla
+# con el esquema de gold_data.modelo_final_v2 y patrones realistas:
+#
+#   1. Estacionalidad anual de la temperatura (y de la humedad y las
+#      estaciones del Raval, Zona Universitària y Fabra), con ruido diario.
+#   2. Perfil por tramo horario propio de cada sector, efecto fin de semana
+#      y festivos, y fiestas de barrio en parte de los códigos postales.
+#   3. Sensibilidad del consumo al frío y al calor distinta por sector, y un
+#      ruido persistente (AR(1) diario) por código postal y sector para que
+#      los lags tengan señal.
+#
+# La escala se controla con códigos postales × años × sectores; 'escala=1'
+# son 10 códigos postales, 1 año y los 3 sectores (43.800 filas).
+# El resultado se guarda como Parquet en <raíz>/gold_data/modelo_final_v2.parquet,
+# que FuenteDuckDB expone como la tabla gold (FUENTE_DATOS=duckdb).
+# ============================================================================
+
+import os
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from fuentes_datos import SECTORES
+
+# --- 1. CONFIGURACIÓN ---
+CODIGOS_POSTALES_BASE = 10  # códigos postales con escala=1
+FECHA_INICIO = '2023-01-01'
+TABLA_GOLD = 'gold_data.modelo_final_v2'
+TRAMOS = [1, 2, 3, 4]  # 00-06h, 06-12h, 12-18h, 18-00h
+
+DIAS_SEMANA = ['lunes', 'martes', 'miércoles', 'jueves', 'viernes', 'sábado', 'domingo']
+DISTRITOS = ['Ciutat Vella', 'Eixample', 'Sants-Montjuïc', 'Les Corts', 'Sarrià-Sant Gervasi',
+             'Gràcia', 'Horta-Guinardó', 'Nou Barris', 'Sant Andreu', 'Sant Martí']
+# Festivos fijos de Barcelona (mes, día)
+FESTIVOS = [(1, 1), (1, 6), (5, 1), (6, 24), (8, 15), (9, 11), (9, 24), (10, 12), (11, 1), (12, 6),
+            (12, 8), (12, 25), (12, 26)]
+# Fiestas de barrio: (nombre, mes, día de inicio, duración en días)
+FIESTAS_BARRIO = [
+    ('Festa Major de Gràcia', 8, 15, 7), ('Festa Major de Sants', 8, 24, 8),
+    ('Festa Major del Poblenou', 9, 14, 5), ('Festa Major de la Barceloneta', 9, 29, 6),
+    ('Festa Major del Raval', 7, 17, 3), ('Festa Major de Sant Andreu', 11, 27, 5),
+]
+
+# Patrones por sector: perfil por tramo, efectos de calendario y sensibilidad térmica
+PATRONES_SECTOR = {
+    'Industrial': {'perfil': [0.8, 1.25, 1.2, 0.75], 'fin_de_semana': 0.55, 'festivo': 0.5, 'fiesta': 1.0,
+                   'calefaccion': 0.005, 'refrigeracion': 0.012, 'base': 60_000},
+    'Residencial': {'perfil': [0.65, 0.9, 1.0, 1.45], 'fin_de_semana': 1.1, 'festivo': 1.12, 'fiesta': 1.06,
+                    'calefaccion': 0.035, 'refrigeracion': 0.045, 'base': 45_000},
+    'Servicios': {'perfil': [0.4, 1.3, 1.45, 0.85], 'fin_de_semana': 0.7, 'festivo': 0.62, 'fiesta': 1.15,
+                  'calefaccion': 0.015, 'refrigeracion': 0.04, 'base': 55_000},
+}
+DESFASE_TEMPERATURA_TRAMO = np.array([-3.5, 0.5, 3.5, 0.0])
+
+
+# --- 2. COMPONENTES DEL GENERADOR ---
+
+def _clima(fechas, rng):
+    """Temperatura, humedad, precipitación y estaciones por (día, tramo)."""
+    dias = len(fechas)
+    dia_anio = fechas.dayofyear.to_numpy()
+    estacional = 16.5 + 7.5 * np.sin(2 * np.pi * (dia_anio - 110) / 365.25)
+    # Anomalía diaria persistente (unos días más cálidos o fríos que la media)
+    anomalia = np.zeros(dias)
+    ruido = rng.normal(0, 1.2, dias)
+    for d in range(1, dias):
+        anomalia[d] = 0.7 * anomalia[d - 1] + ruido[d]
+    temperatura = (estacional + anomalia)[:, None] + DESFASE_TEMPERATURA_TRAMO + rng.normal(0, 0.6, (dias, 4))
+    humedad = np.clip(68 - 0.9 * (temperatura - 16.5) + rng.normal(0, 6, (dias, 4)), 20, 100)
+    lluvia = rng.random(dias) < 0.16
+    precipitacion = np.where(lluvia[:, None], rng.gamma(0.8, 3.0, (dias, 4)), 0.0)
+    raval = temperatura + 0.6 + rng.normal(0, 0.3, (dias, 4))
+    zuniversitaria = temperatura + rng.normal(0, 0.3, (dias, 4))
+    fabra = temperatura - 2.8 + rng.normal(0, 0.4, (dias, 4))
+    return {
+        'temperatura_media_ciudad': temperatura, 'humedad_media_ciudad': humedad,
+        'precipitacion_total_ciudad': precipitacion, 'temp_raval': raval,
+        'temp_zuniversitaria': zuniversitaria, 'temp_fabra': fabra,
+        'temp_spread_montana_centro': fabra - raval,
+    }
+
+
+def _fiestas(fechas, n_codigos, rng):
+    """Índice de fiesta (-1 = ninguna) por (día, código postal); la mitad de los códigos tiene una."""
+    fiesta_codigo = np.where(rng.random(n_codigos) < 0.5, rng.integers(0, len(FIESTAS_BARRIO), n_codigos), -1)
+    en_fiesta = np.full(len(fechas), -1)
+    for i, (_, mes, dia, duracion) in enumerate(FIESTAS_BARRIO):
+        for anio in np.unique(fechas.year):
+            inicio = pd.Timestamp(anio, mes, dia)
+            en_fiesta[(fechas >= inicio) & (fechas < inicio + pd.Timedelta(days=duracion))] = i
+    return np.where((en_fiesta[:, None] == fiesta_codigo[None, :]) & (fiesta_codigo >= 0), fiesta_codigo, -1)
+
+
+def _ruido_persistente(dias, columnas, rng, phi=0.8, sigma=0.04):
+    """Ruido AR(1) multiplicativo por día (log-escala), independiente por columna."""
+    ruido = rng.normal(0, sigma, (dias, columnas))
+    for d in range(1, dias):
+        ruido[d] += phi * ruido[d - 1]
+    return np.exp(ruido)
+
+
+def _diccionario(indices, valores):
+    return pa.DictionaryArray.from_arrays(pa.array(indices, pa.int32()), pa.array(valores, pa.string()))
+
+
+# --- 3. GENERACIÓN ---
+
+def generar_modelo_final_v2(escala=1, codigos_postales=None, anios=1, sectores=None, desde=FECHA_INICIO, semilla=42,
+                            sin_fiesta=None):
+    """
+    Genera la tabla gold modelo_final_v2 sintética.
+
+    Args:
+        escala (int): Multiplica los códigos postales base (10 por unidad de escala).
+        codigos_postales (int, optional): Códigos postales exactos (ignora 'escala').
+        anios (int): Años de histórico desde 'desde'.
+        sectores (list, optional): Nombres de sector (por defecto los de SECTORES).
+        desde (str): Primera fecha.
+        semilla (int): Semilla del generador (misma semilla = misma tabla).
+        sin_fiesta (str, optional): nombre_fiesta de los días sin fiesta; None deja
+            NULL, como el LEFT JOIN del script gold.
+
+    Returns:
+        tuple: (pa.Table ordenada por fecha, tramo, código postal y sector, métricas)
+    """
+    reloj = time.perf_counter()
+    rng = np.random.default_rng(semilla)
+    n_codigos = codigos_postales or CODIGOS_POSTALES_BASE * escala
+    nombres_sector = sectores or list(SECTORES.values())
+    ids_sector = {nombre: id_sector for id_sector, nombre in SECTORES.items()}
+    fechas = pd.date_range(desde, pd.Timestamp(desde) + pd.DateOffset(years=anios) - pd.Timedelta(days=1), freq='D')
+    dias, n_tramos, n_sectores = len(fechas), len(TRAMOS), len(nombres_sector)
+
+    # Atributos por código postal
+    codigos = np.array([f"{8000 + i + 1:05d}" for i in range(n_codigos)])
+    poblacion = np.round(rng.lognormal(np.log(25_000), 0.45, n_codigos)).astype(np.int64)
+    distrito = np.arange(n_codigos) % len(DISTRITOS)
+    tamano_relativo = poblacion / 25_000
+
+    # Calendario por día
+    dia_semana = fechas.dayofweek.to_numpy()
+    fin_de_semana = dia_semana >= 5
+    festivo = np.isin(fechas.month * 100 + fechas.day, [m * 100 + d for m, d in FESTIVOS])
+    clima = _clima(fechas, rng)
+    fiesta = _fiestas(fechas, n_codigos, rng)  # (dias, codigos)
+
+    # Consumo con forma (dias, tramos, codigos, sectores)
+    consumo = np.empty((dias, n_tramos, n_codigos, n_sectores))
+    temperatura = clima['temperatura_media_ciudad']
+    tendencia = 1 + 0.01 * (np.arange(dias) / 365.25)
+    for s, nombre in enumerate(nombres_sector):
+        p = PATRONES_SECTOR[nombre]
+        termico = 1 + p['calefaccion'] * np.maximum(15 - temperatura, 0) + p['refrigeracion'] * np.maximum(temperatura - 22, 0)
+        calendario = np.where(festivo, p['festivo'], np.where(fin_de_semana, p['fin_de_semana'], 1.0)) * tendencia
+        por_dia_tramo = termico * np.asarray(p['perfil'])[None, :] * calendario[:, None]  # (dias, tramos)
+        por_codigo = p['base'] * tamano_relativo * rng.lognormal(0, 0.25, n_codigos)  # (codigos,)
+        efecto_fiesta = np.where(fiesta >= 0, p['fiesta'], 1.0) * _ruido_persistente(dias, n_codigos, rng)  # (dias, codigos)
+        ruido = rng.lognormal(0, 0.03, (dias, n_tramos, n_codigos))
+        consumo[..., s] = por_dia_tramo[:, :, None] * por_codigo[None, None, :] * efecto_fiesta[:, None, :] * ruido
+
+    # Índices de cada fila en el orden (fecha, tramo, código postal, sector)
+    n = dias * n_tramos * n_codigos * n_sectores
+    bloque = n_codigos * n_sectores
+    i_dia = np.repeat(np.arange(dias), n_tramos * bloque)
+    i_tramo = np.tile(np.repeat(np.arange(n_tramos), bloque), dias)
+    i_codigo = np.tile(np.repeat(np.arange(n_codigos), n_sectores), dias * n_tramos)
+    i_sector = np.tile(np.arange(n_sectores), dias * n_tramos * n_codigos)
+    fiesta_fila = fiesta[i_dia, i_codigo]
+
+    columnas = {
+        'fecha': pa.array(fechas.to_numpy().astype('datetime64[D]')[i_dia]),
+        'id_geografia': _diccionario(i_codigo, codigos),
+        'id_tramo_horario': np.asarray(TRAMOS, dtype=np.int64)[i_tramo],
+        'id_sector_economico': np.array([ids_sector[nombre] for nombre in nombres_sector], dtype=np.int64)[i_sector],
+        'consumo_kwh': consumo.reshape(n),
+        'anio': fechas.year.to_numpy().astype(np.int64)[i_dia],
+        'mes': fechas.month.to_numpy().astype(np.int64)[i_dia],
+        'dia_del_mes': fechas.day.to_numpy().astype(np.int64)[i_dia],
+        'dia_de_la_semana_nombre': _diccionario(dia_semana[i_dia], DIAS_SEMANA),
+        'es_fin_de_semana': fin_de_semana[i_dia],
+        'es_festivo': festivo[i_dia],
+        'nombre_barrio': _diccionario(i_codigo, [f"Barri {codigo}" for codigo in codigos]),
+        'nombre_distrito': _diccionario(distrito[i_codigo], DISTRITOS),
+        'nombre_municipio': _diccionario(np.zeros(n, dtype=np.int32), ['Barcelona']),
+        'poblacion': poblacion[i_codigo],
+    }
+    for nombre, valores in clima.items():
+        columnas[nombre] = valores[i_dia, i_tramo]
+    columnas['es_fiesta_barrio'] = fiesta_fila >= 0
+    nombres_fiesta = [nombre for nombre, *_ in FIESTAS_BARRIO]
+    if sin_fiesta is None:
+        columnas['nombre_fiesta'] = pa.DictionaryArray.from_arrays(
+            pa.array(np.maximum(fiesta_fila, 0), pa.int32(), mask=fiesta_fila < 0), pa.array(nombres_fiesta, pa.string()))
+    else:
+        columnas['nombre_fiesta'] = _diccionario(np.where(fiesta_fila < 0, len(nombres_fiesta), fiesta_fila),
+                                                 nombres_fiesta + [sin_fiesta])
+    tabla = pa.table(columnas)
+    metricas = {'filas': n, 'codigos_postales': n_codigos, 'dias': dias, 'sectores': n_sectores,
+                'segundos': time.perf_counter() - reloj}
+    return tabla, metricas
+
+
+def escribir_gold(tabla, raiz, nombre=TABLA_GOLD):
+    """Guarda la tabla como <raiz>/<dataset>/<tabla>.parquet (la vista que crea FuenteDuckDB)."""
+    dataset, tabla_nombre = nombre.split('.')
+    os.makedirs(os.path.join(raiz, dataset), exist_ok=True)
+    ruta = os.path.join(raiz, dataset, f"{tabla_nombre}.parquet")
+    pq.write_table(tabla, ruta, compression='zstd', row_group_size=1_000_000)
+    return ruta
+
+
+def describir_generacion(metricas):
+    return (f"{metricas['filas']:,} filas ({metricas['codigos_postales']} códigos postales × {metricas['dias']} días "
+            f"× 4 tramos × {metricas['sectores']} sectores) en {metricas['segundos']:.1f} s")
+
+
+# --- 4. EJECUCIÓN DESDE LÍNEA DE COMANDOS ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera una tabla gold modelo_final_v2 sintética para pruebas sin conexión")
+    parser.add_argument('--destino', default='datos_sinteticos', help="Raíz local (DATOS_LOCALES_PATH) donde escribir")
+    parser.add_argument('--escala', type=int, default=1, help="Multiplicador de códigos postales (1 = 10 códigos)")
+    parser.add_argument('--codigos-postales', type=int, help="Número exacto de códigos postales")
+    parser.add_argument('--anios', type=int, default=1, help="Años de histórico")
+    parser.add_argument('--sectores', nargs='+', choices=list(SECTORES.values()), help="Sectores a generar")
+    parser.add_argument('--desde', default=FECHA_INICIO, help="Primera fecha (YYYY-MM-DD)")
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--sin-fiesta', help="Valor de nombre_fiesta sin fiesta (por defecto NULL, como el gold)")
+    args = parser.parse_args()
+
+    tabla, metricas = generar_modelo_final_v2(args.escala, args.codigos_postales, args.anios, args.sectores,
+                                              args.desde, args.semilla, args.sin_fiesta)
+    ruta = escribir_gold(tabla, args.destino)
+    print(f"✅ {describir_generacion(metricas)}.")
+    print(f"   Guardada en '{ruta}' ({os.path.getsize(ruta) / 1e6:.1f} MB). "
+          f"Úsala con FUENTE_DATOS=duckdb DATOS_LOCALES_PATH={args.destino}")
@@ -0,0 +1,301 @@
+# ============================================================================
+# DETECCIÓN VECTORIZADA DE PICOS Y ANOMALÍAS DE CONSUMO
+# ============================================================================
+# Autor: Julio Clavijo
+# Versión: 1.0
+#
+# Descripción:
+# El objetivo del proyecto es explicar los picos de consumo, pero hasta ahora
+# se buscaban a ojo en los notebooks. Este detector trabaja sobre todas las
+# series (sector, id_geografia) a la vez:
+#
+#   1. El consumo se pivota a una matriz 2-D (series x pasos), con un paso
+#      por (fecha, tramo) igual que en el pronóstico multi-horizonte y NaN
+#      en los huecos.
+#   2. Línea base robusta: mediana del mismo tramo y día de la semana en las
+#      SEMANAS_BASE semanas anteriores (desplazamientos de 28 pasos).
+#   3. Escala robusta: 1.4826 x mediana del residuo absoluto en los
+#      VENTANA_ESCALA pasos anteriores (MAD). La puntuación es residuo/escala;
+#      por encima de UMBRAL_PUNTUACION es un pico y por debajo de -UMBRAL un valle.
+#   4. Estado incremental: se guardan los últimos pasos de cada serie (lo
+#      necesario para la base y la escala), de modo que los tramos nuevos se
+#      puntúan con el mismo cálculo sin recalcular el histórico.
+#   5. Los picos se cruzan con el clima y los festivos / fiestas de barrio
+#      del gold, y se resume cuántos coinciden con cada factor.
+#
+# Todo son operaciones NumPy sobre bloques de series; no hay bucles por serie
+# ni por paso.
+# ============================================================================
+
+import os
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from pronostico_multihorizonte import TRAMOS_POR_DIA, COLUMNAS_CLIMA, indice_paso
+
+# --- 1. CONFIGURACIÓN ---
+TABLA_GOLD = "gold_data.modelo_final_v2"
+RUTA_ESTADO = os.getenv("DETECCION_PICOS_ESTADO_PATH", 'deteccion_picos.npz')
+PASOS_POR_SEMANA = 7 * TRAMOS_POR_DIA
+SEMANAS_BASE = 6            # semanas anteriores de la línea base
+VENTANA_ESCALA = 28         # pasos anteriores para la escala (MAD)
+MIN_SEMANAS_BASE = 3        # semanas con dato necesarias para la base
+UMBRAL_PUNTUACION = 4.0
+ESCALA_MINIMA_RELATIVA = 0.01  # escala mínima como fracción de la línea base
+FACTOR_MAD = 1.4826
+CELDAS_POR_BLOQUE = 2_000_000  # series x pasos puntuados a la vez
+
+COLUMNAS_SERIE = ['id_sector_economico', 'id_geografia']
+COLUMNAS_EVENTOS = ['es_festivo', 'es_fin_de_semana', 'es_fiesta_barrio', 'nombre_fiesta']
+COLUMNAS_LECTURA = ['fecha', 'id_tramo_horario'] + COLUMNAS_SERIE + ['consumo_kwh'] + COLUMNAS_CLIMA + COLUMNAS_EVENTOS
+
+
+def pasos_contexto(semanas_base=SEMANAS_BASE, ventana_escala=VENTANA_ESCALA):
+    """Pasos de histórico que necesita la puntuación del primer paso nuevo."""
+    return semanas_base * PASOS_POR_SEMANA + ventana_escala
+
+
+# --- 2. CÁLCULO VECTORIZADO ---
+
+def _mediana(valores, eje, min_validos=1):
+    """Mediana ignorando NaN por ordenación (más rápida que np.nanmedian en bloque)."""
+    ordenados = np.sort(valores, axis=eje)
+    validos = np.sum(~np.isnan(valores), axis=eje)
+    bajo = np.expand_dims(np.maximum(validos - 1, 0) // 2, eje)
+    alto = np.expand_dims(np.maximum(validos, 1) // 2, eje)
+    mediana = 0.5 * (np.take_along_axis(ordenados, bajo, eje) + np.take_along_axis(ordenados, alto, eje))
+    mediana = np.squeeze(mediana, eje)
+    return np.where(validos >= min_validos, mediana, np.nan)
+
+
+def puntuar_matriz(X, contexto, semanas_base=SEMANAS_BASE, ventana_escala=VENTANA_ESCALA):
+    """
+    Línea base, escala y puntuación de las columnas posteriores al contexto.
+
+    Args:
+        X (np.ndarray): (series x pasos); las 'contexto' primeras columnas son
+            histórico (pasos_contexto(); NaN si no lo hay).
+        contexto (int): Columnas de histórico al principio de X.
+
+    Returns:
+        dict: 'base', 'residuo', 'escala', 'puntuacion', cada uno (series x pasos nuevos).
+    """
+    desfase = semanas_base * PASOS_POR_SEMANA
+    assert contexto == desfase + ventana_escala, "El contexto no coincide con la configuración"
+    n_pasos = X.shape[1] - desfase  # pasos con línea base (incluye los de la ventana de escala)
+    base = _mediana(np.stack([X[:, desfase - k * PASOS_POR_SEMANA: desfase - k * PASOS_POR_SEMANA + n_pasos]
+                              for k in range(1, semanas_base + 1)]), eje=0, min_validos=MIN_SEMANAS_BASE)
+    residuo = X[:, desfase:] - base
+    # Escala del paso j: residuos de los 'ventana_escala' pasos anteriores
+    ventanas = sliding_window_view(np.abs(residuo), ventana_escala, axis=1)[:, :n_pasos - ventana_escala]
+    escala = FACTOR_MAD * _mediana(ventanas, eje=2, min_validos=ventana_escala // 2)
+    base, residuo = base[:, ventana_escala:], residuo[:, ventana_escala:]
+    escala = np.fmax(escala, ESCALA_MINIMA_RELATIVA * np.abs(base))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        puntuacion = np.where(escala > 0, residuo / escala, np.nan)
+    return {'base': base, 'residuo': residuo, 'escala': escala, 'puntuacion': puntuacion}
+
+
+# --- 3. DETECTOR CON ESTADO ---
+
+class DetectorPicos:
+    """
+    Detector de picos y valles con estado incremental.
+
+    El estado son las series conocidas y los últimos pasos_contexto() pasos
+    de cada una (desde 'ultimo_paso' hacia atrás). puntuar() recibe lecturas
+    posteriores, las coloca tras el contexto y puntúa solo los pasos nuevos.
+    """
+
+    def __init__(self, semanas_base=SEMANAS_BASE, ventana_escala=VENTANA_ESCALA, umbral=UMBRAL_PUNTUACION):
+        self.semanas_base = semanas_base
+        self.ventana_escala = ventana_escala
+        self.umbral = umbral
+        self.contexto = pasos_contexto(semanas_base, ventana_escala)
+        self.series = pd.DataFrame(columns=COLUMNAS_SERIE)
+        self.historico = np.empty((0, self.contexto), dtype=np.float32)
+        self.ultimo_paso = None
+
+    def _indices_series(self, df):
+        """Fila de cada lectura en la matriz; añade al estado las series nuevas."""
+        claves = df[COLUMNAS_SERIE].astype({'id_sector_economico': np.int64, 'id_geografia': str})
+        conocidas = pd.MultiIndex.from_frame(self.series.astype({'id_sector_economico': np.int64, 'id_geografia': str}))
+        consulta = pd.MultiIndex.from_frame(claves)
+        nuevas = consulta.unique().difference(conocidas)
+        if len(nuevas):
+            self.series = pd.concat([self.series, nuevas.to_frame(index=False)], ignore_index=True)
+            self.historico = np.vstack([self.historico, np.full((len(nuevas), self.contexto), np.nan, np.float32)])
+            conocidas = pd.MultiIndex.from_frame(self.series.astype({'id_sector_economico': np.int64, 'id_geografia': str}))
+        return conocidas.get_indexer(consulta)
+
+    def puntuar(self, df):
+        """
+        Puntúa las lecturas de pasos posteriores al último puntuado.
+
+        Args:
+            df (pd.DataFrame): fecha, id_tramo_horario, id_sector_economico,
+                id_geografia, consumo_kwh (puede traer más columnas).
+
+        Returns:
+            tuple: (pd.DataFrame de eventos, dict de métricas).
+        """
+        inicio = time.perf_counter()
+        paso = indice_paso(df['fecha'], df['id_tramo_horario'])
+        nuevas = paso > self.ultimo_paso if self.ultimo_paso is not None else np.ones(len(df), dtype=bool)
+        df, paso = df[nuevas], paso[nuevas]
+        if not len(df):
+            return pd.DataFrame(), {'lecturas': 0, 'descartadas': int((~nuevas).sum()), 'pasos': 0,
+                                    'series': len(self.series), 'eventos': 0, 'segundos': 0.0}
+        serie = self._indices_series(df)
+        primero = self.ultimo_paso + 1 if self.ultimo_paso is not None else int(paso.min())
+        n_nuevos = int(paso.max()) - primero + 1
+        nuevos = np.full((len(self.series), n_nuevos), np.nan, dtype=np.float32)
+        nuevos[serie, paso - primero] = df['consumo_kwh'].to_numpy(dtype=np.float32)
+        X = np.hstack([self.historico, nuevos])
+
+        # Bloques de series para acotar la memoria de las ventanas
+        filas_bloque = max(1, CELDAS_POR_BLOQUE // X.shape[1])
+        eventos = []
+        for desde in range(0, len(self.series), filas_bloque):
+            r = puntuar_matriz(X[desde:desde + filas_bloque], self.contexto, self.semanas_base, self.ventana_escala)
+            fila, columna = np.nonzero(np.abs(np.nan_to_num(r['puntuacion'])) > self.umbral)
+            eventos.append(pd.DataFrame({
+                'serie': desde + fila, 'paso': primero + columna,
+                'consumo_kwh': nuevos[desde + fila, columna],
+                'linea_base': r['base'][fila, columna],
+                'escala': r['escala'][fila, columna],
+                'puntuacion': r['puntuacion'][fila, columna],
+            }))
+        self.historico = X[:, -self.contexto:]
+        self.ultimo_paso = primero + n_nuevos - 1
+
+        eventos = pd.concat(eventos, ignore_index=True)
+        dias, tramos = np.divmod(eventos['paso'].to_numpy(), TRAMOS_POR_DIA)
+        eventos = pd.concat([
+            self.series.iloc[eventos['serie']].reset_index(drop=True),
+            pd.DataFrame({'fecha': dias.astype('datetime64[D]'), 'id_tramo_horario': tramos + 1,
+                          'tipo': np.where(eventos['puntuacion'] > 0, 'pico', 'valle')}),
+            eventos[['consumo_kwh', 'linea_base', 'escala', 'puntuacion']],
+        ], axis=1).sort_values(['fecha', 'id_tramo_horario', 'id_sector_economico', 'id_geografia'], ignore_index=True)
+        metricas = {
+            'lecturas': int(len(df)),
+            'descartadas': int((~nuevas).sum()),
+            'pasos': n_nuevos,
+            'series': int(len(self.series)),
+            'eventos': int(len(eventos)),
+            'segundos': round(time.perf_counter() - inicio, 3),
+        }
+        return eventos, metricas
+
+    def guardar(self, ruta=RUTA_ESTADO):
+        np.savez_compressed(
+            ruta, historico=self.historico,
+            sectores=self.series['id_sector_economico'].to_numpy(np.int64),
+            geografias=self.series['id_geografia'].astype(str).to_numpy().astype(np.str_),
+            configuracion=np.array([self.semanas_base, self.ventana_escala, self.ultimo_paso], dtype=np.int64),
+            umbral=np.float64(self.umbral))
+
+    @classmethod
+    def cargar(cls, ruta=RUTA_ESTADO):
+        with np.load(ruta, allow_pickle=False) as datos:
+            semanas_base, ventana_escala, ultimo_paso = (int(v) for v in datos['configuracion'])
+            detector = cls(semanas_base, ventana_escala, float(datos['umbral']))
+            detector.series = pd.DataFrame({'id_sector_economico': datos['sectores'],
+                                            'id_geografia': datos['geografias'].astype(object)})
+            detector.historico = datos['historico']
+            detector.ultimo_paso = ultimo_paso
+        return detector
+
+    def fecha_siguiente(self):
+        """Primera fecha con pasos sin puntuar (para leer solo lo nuevo)."""
+        if self.ultimo_paso is None:
+            return None
+        return pd.Timestamp(np.datetime64((self.ultimo_paso + 1) // TRAMOS_POR_DIA, 'D'))
+
+
+# --- 4. CONTEXTO DE LOS PICOS ---
+
+def unir_contexto(eventos, df):
+    """Añade a cada evento el clima y los festivos / fiestas de barrio de su lectura."""
+    columnas = [c for c in COLUMNAS_CLIMA + COLUMNAS_EVENTOS if c in df.columns]
+    if eventos.empty or not columnas:
+        return eventos
+    claves = ['fecha', 'id_tramo_horario'] + COLUMNAS_SERIE
+    contexto = df[claves + columnas].assign(fecha=pd.to_datetime(df['fecha']), id_geografia=df['id_geografia'].astype(str))
+    contexto = contexto.drop_duplicates(claves)
+    return eventos.astype({'id_geografia': str}).merge(contexto, on=claves, how='left')
+
+
+def resumir_eventos(eventos, df):
+    """
+    Proporción de picos que coinciden con cada factor frente a la de todas
+    las lecturas, y temperatura media de los picos frente a la general.
+    """
+    picos = eventos[eventos['tipo'] == 'pico'] if len(eventos) else eventos
+    filas = []
+    for columna in ['es_festivo', 'es_fin_de_semana', 'es_fiesta_barrio']:
+        if columna in df.columns and len(picos):
+            filas.append({'factor': columna, 'en_picos': picos[columna].astype(float).mean(),
+                          'en_lecturas': df[columna].astype(float).mean()})
+    if 'temperatura_media_ciudad' in df.columns and len(picos):
+        filas.append({'factor': 'temperatura_media_ciudad', 'en_picos': picos['temperatura_media_ciudad'].mean(),
+                      'en_lecturas': df['temperatura_media_ciudad'].mean()})
+    resumen = pd.DataFrame(filas, columns=['factor', 'en_picos', 'en_lecturas'])
+    resumen['razon'] = resumen['en_picos'] / resumen['en_lecturas']
+    return resumen
+
+
+# --- 5. EJECUCIÓN ---
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from fuentes_datos import crear_fuente, construir_consulta
+
+    parser = argparse.ArgumentParser(description="Detecta picos y valles de consumo en todas las series")
+    parser.add_argument('--desde', help="Primera fecha (YYYY-MM-DD) a leer (sin --incremental)")
+    parser.add_argument('--hasta', help="Última fecha (YYYY-MM-DD) a leer")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Carga el estado guardado y puntúa solo los tramos posteriores")
+    parser.add_argument('--estado', default=RUTA_ESTADO, help="Fichero .npz del estado del detector")
+    parser.add_argument('--umbral', type=float, default=UMBRAL_PUNTUACION, help="Puntuación absoluta mínima")
+    parser.add_argument('--salida', default='picos_consumo.parquet', help="Parquet de destino de los eventos")
+    args = parser.parse_args()
+
+    print("--- Iniciando la detección de picos de consumo ---")
+    load_dotenv()
+    if args.incremental and os.path.exists(args.estado):
+        detector = DetectorPicos.cargar(args.estado)
+        detector.umbral = args.umbral
+        desde = detector.fecha_siguiente()
+        print(f"Paso 1: Estado cargado ({len(detector.series)} series); se leen los tramos desde {desde.date()}.")
+    else:
+        detector = DetectorPicos(umbral=args.umbral)
+        desde = args.desde
+        print("Paso 1: Detector nuevo; se puntúa todo el histórico leído.")
+
+    try:
+        inicio = time.perf_counter()
+        df = crear_fuente().consultar(construir_consulta(TABLA_GOLD, COLUMNAS_LECTURA, desde, args.hasta))
+        print(f"Paso 2: {len(df):,} lecturas en {time.perf_counter() - inicio:.2f} s.")
+    except Exception as e:
+        print(f"❌ Error al leer el consumo: {e}")
+        exit()
+
+    eventos, metricas = detector.puntuar(df)
+    print(f"Paso 3: {metricas['series']:,} series x {metricas['pasos']:,} tramos puntuados en "
+          f"{metricas['segundos']:.2f} s -> {metricas['eventos']:,} eventos"
+          + (f" ({metricas['descartadas']:,} lecturas ya puntuadas descartadas)." if metricas['descartadas'] else "."))
+    detector.guardar(args.estado)
+
+    eventos = unir_contexto(eventos, df)
+    if len(eventos):
+        eventos.to_parquet(args.salida, index=False)
+        print(f"✅ {(eventos['tipo'] == 'pico').sum():,} picos y {(eventos['tipo'] == 'valle').sum():,} valles "
+              f"guardados en '{args.salida}'; estado en '{args.estado}'.")
+        print(resumir_eventos(eventos, df).round(3).to_string(index=False))
+    else:
+        print(f"✅ Sin eventos nuevos; estado en '{args.estado}'.")
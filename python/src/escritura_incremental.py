@@ -0,0 +1,262 @@
+# ============================================================================
+# ESCRITURA INCREMENTAL POR PARTICIONES DE LA TABLA DE PREDICCIONES
+# ============================================================================
+# Autor: Julio Clavijo
+# Versión: 1.0
+#
+# Descripción:
+# 'batch_prediction.py' subía todas las predicciones con
+# to_gbq(if_exists='replace'), borrando y re-enviando la tabla completa en cada
+# ejecución. Este módulo sube solo las fechas puntuadas en la ejecución actual:
+#
+#   1. Las filas se escriben a un Parquet comprimido y se cargan en una tabla
+#      de staging con un load job (sin streaming fila a fila por pandas-gbq).
+#   2. Solo se sustituyen las particiones 'fecha' afectadas:
+#        - modo 'particiones': DELETE de esas fechas + INSERT, en una transacción.
+#        - modo 'merge': MERGE por clave (fecha, id_geografia, sector, tramo).
+#        - modo 'completo': se vacía la tabla y se inserta todo, sin recrearla
+#          (conserva la partición y el clustering).
+#   3. La tabla destino está particionada por 'fecha' y clusterizada por
+#      'id_geografia' e 'id_sector_economico'.
+#
+# EscritorLocal reproduce la misma lógica sobre DuckDB para poder probarla
+# sin conexión a BigQuery. Ambos escritores aceptan otro esquema y otra clave
+# (p. ej. las tablas pre-agregadas de agregacion_jerarquica.py).
+# ============================================================================
+
+import os
+import time
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# --- 1. CONFIGURACIÓN ---
+COLUMNAS_CLAVE = ['fecha', 'id_geografia', 'id_sector_economico', 'id_tramo_horario']
+COLUMNAS_CLUSTER = ['id_geografia', 'id_sector_economico']
+ESQUEMA_PREDICCIONES = pa.schema([
+    ('fecha', pa.date32()),
+    ('id_geografia', pa.string()),
+    ('id_sector_economico', pa.int64()),
+    ('sector_nombre', pa.string()),
+    ('id_tramo_horario', pa.int64()),
+    ('consumo_kwh_real', pa.float64()),
+    ('consumo_kwh_predicho', pa.float64()),
+])
+
+
+# --- 2. FUNCIONES AUXILIARES ---
+
+def escribir_parquet_staging(df, ruta, compresion='snappy', esquema=ESQUEMA_PREDICCIONES):
+    """
+    Convierte las predicciones al esquema de destino y las escribe en Parquet.
+
+    Returns:
+        list: Fechas (datetime.date) presentes en el fichero, ordenadas.
+    """
+    df = df.assign(fecha=pd.to_datetime(df['fecha']).dt.date)
+    if 'id_geografia' in esquema.names:
+        df['id_geografia'] = df['id_geografia'].astype(str)
+    tabla = pa.Table.from_pandas(df[esquema.names], schema=esquema, preserve_index=False)
+    pq.write_table(tabla, ruta, compression=compresion)
+    return sorted(df['fecha'].unique())
+
+
+def _lista_fechas_sql(fechas):
+    """Lista literal de fechas; permite la poda de particiones en ambos motores."""
+    return ', '.join(f"DATE '{f.isoformat()}'" for f in fechas)
+
+
+def sql_reemplazar_todo(destino, staging, esquema=ESQUEMA_PREDICCIONES):
+    """Vacía la tabla e inserta el staging, sin recrearla (se conservan partición y cluster)."""
+    return [
+        f"DELETE FROM {destino} WHERE TRUE",
+        f"INSERT INTO {destino} ({', '.join(esquema.names)}) "
+        f"SELECT {', '.join(esquema.names)} FROM {staging}",
+    ]
+
+
+def sql_reemplazar_particiones(destino, staging, fechas, esquema=ESQUEMA_PREDICCIONES):
+    """DELETE + INSERT de las fechas afectadas (sin transacción envolvente)."""
+    return [
+        f"DELETE FROM {destino} WHERE fecha IN ({_lista_fechas_sql(fechas)})",
+        f"INSERT INTO {destino} ({', '.join(esquema.names)}) "
+        f"SELECT {', '.join(esquema.names)} FROM {staging}",
+    ]
+
+
+def sql_merge(destino, staging, fechas, esquema=ESQUEMA_PREDICCIONES, clave=COLUMNAS_CLAVE):
+    """MERGE por clave restringido a las particiones afectadas (sintaxis BigQuery)."""
+    condicion = ' AND '.join(f"T.{c} = S.{c}" for c in clave)
+    no_clave = [c for c in esquema.names if c not in clave]
+    return (
+        f"MERGE {destino} T USING {staging} S\n"
+        f"ON {condicion} AND T.fecha IN ({_lista_fechas_sql(fechas)})\n"
+        f"WHEN MATCHED THEN UPDATE SET {', '.join(f'{c} = S.{c}' for c in no_clave)}\n"
+        f"WHEN NOT MATCHED THEN INSERT ROW"
+    )
+
+
+# --- 3. ESCRITOR BIGQUERY ---
+
+class EscritorBigQuery:
+    """Carga por Parquet + sustitución de particiones en BigQuery."""
+
+    def __init__(self, project_id, tabla_destino, credentials=None, dataset_staging=None,
+                 esquema=ESQUEMA_PREDICCIONES, clave=COLUMNAS_CLAVE, cluster=COLUMNAS_CLUSTER):
+        from google.cloud import bigquery
+        self._bq = bigquery
+        self.esquema, self.clave, self.cluster = esquema, clave, cluster
+        self.client = bigquery.Client(project=project_id, credentials=credentials)
+        self.project_id = project_id
+        self.tabla_destino = f"{project_id}.{tabla_destino}"
+        dataset = dataset_staging or tabla_destino.split('.')[0]
+        self.tabla_staging = f"{project_id}.{dataset}._staging_{tabla_destino.split('.')[-1]}_{int(time.time())}"
+        # Nombres usados al migrar una tabla existente sin particionar (ver _migrar)
+        self.tabla_migracion = f"{self.tabla_destino}_migracion"
+        self.tabla_respaldo = f"{self.tabla_destino}_sin_particionar"
+
+    def _existe(self, tabla):
+        try:
+            return self.client.get_table(tabla)
+        except Exception:
+            return None
+
+    def _asegurar_tabla(self):
+        """Crea la tabla particionada/clusterizada o migra una existente que no lo esté."""
+        bigquery = self._bq
+        tabla = self._existe(self.tabla_destino)
+        if tabla is None and self._existe(self.tabla_migracion):
+            # Una migración anterior se interrumpió tras apartar la tabla original
+            self._completar_migracion()
+        elif tabla is None:
+            esquema = [bigquery.SchemaField(c.name, {
+                pa.date32(): 'DATE', pa.string(): 'STRING', pa.int64(): 'INT64', pa.float64(): 'FLOAT64'
+            }[c.type]) for c in self.esquema]
+            nueva = bigquery.Table(self.tabla_destino, schema=esquema)
+            nueva.time_partitioning = bigquery.TimePartitioning(type_=bigquery.TimePartitioningType.DAY, field='fecha')
+            nueva.clustering_fields = self.cluster
+            self.client.create_table(nueva)
+            print(f"   - Tabla '{self.tabla_destino}' creada (partición: fecha, cluster: {self.cluster}).")
+        elif tabla.time_partitioning is None or tabla.time_partitioning.field != 'fecha':
+            self._migrar()
+        elif self._existe(self.tabla_respaldo):
+            self.client.delete_table(self.tabla_respaldo, not_found_ok=True)
+
+    def _migrar(self):
+        """
+        Migra una tabla sin particionar (p. ej. la creada por to_gbq, con
+        'fecha' TIMESTAMP) a una nueva particionada por fecha y la sustituye.
+
+        BigQuery no permite cambiar la partición con CREATE OR REPLACE sobre
+        la misma tabla ni hacer DDL de tablas dentro de una transacción, así
+        que se copia a '<tabla>_migracion' con las columnas convertidas al
+        esquema de destino y después se renombra: la original pasa a
+        '<tabla>_sin_particionar' y la copia ocupa su nombre. Los datos
+        siempre están bajo alguno de los dos nombres; si el proceso se corta
+        entre los dos renombrados, la siguiente escritura termina el cambio.
+        """
+        tipos = {pa.date32(): 'DATE', pa.string(): 'STRING', pa.int64(): 'INT64', pa.float64(): 'FLOAT64'}
+        columnas = ', '.join(f"CAST({c.name} AS {tipos[c.type]}) AS {c.name}" for c in self.esquema)
+        print(f"   - Migrando '{self.tabla_destino}' a tabla particionada por fecha (una sola vez)...")
+        self.client.query(
+            f"CREATE OR REPLACE TABLE `{self.tabla_migracion}` "
+            f"PARTITION BY fecha CLUSTER BY {', '.join(self.cluster)} AS "
+            f"SELECT {columnas} FROM `{self.tabla_destino}`"
+        ).result()
+        self.client.query(
+            f"ALTER TABLE `{self.tabla_destino}` RENAME TO `{self.tabla_respaldo.split('.')[-1]}`"
+        ).result()
+        self._completar_migracion()
+
+    def _completar_migracion(self):
+        """Da a '<tabla>_migracion' el nombre de la tabla y borra la original apartada."""
+        self.client.query(
+            f"ALTER TABLE `{self.tabla_migracion}` RENAME TO `{self.tabla_destino.split('.')[-1]}`"
+        ).result()
+        self.client.delete_table(self.tabla_respaldo, not_found_ok=True)
+
+    def escribir(self, df, modo='particiones'):
+        """
+        Sube las predicciones reemplazando solo sus particiones (o toda la
+        tabla con modo='completo'). Un df vacío no modifica la tabla.
+
+        Returns:
+            dict: Filas, fechas afectadas y bytes del Parquet de staging.
+        """
+        if df.empty:
+            return {'filas': 0, 'fechas': 0, 'bytes_staging': 0}
+        bigquery = self._bq
+        self._asegurar_tabla()
+        with tempfile.TemporaryDirectory() as tmp:
+            ruta = os.path.join(tmp, 'staging.parquet')
+            fechas = escribir_parquet_staging(df, ruta, esquema=self.esquema)
+            bytes_staging = os.path.getsize(ruta)
+            config = bigquery.LoadJobConfig(source_format=bigquery.SourceFormat.PARQUET,
+                                            write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE)
+            with open(ruta, 'rb') as file:
+                self.client.load_table_from_file(file, self.tabla_staging, job_config=config).result()
+
+        destino, staging = f"`{self.tabla_destino}`", f"`{self.tabla_staging}`"
+        try:
+            if modo == 'merge':
+                script = sql_merge(destino, staging, fechas, self.esquema, self.clave)
+            else:
+                sentencias = (sql_reemplazar_todo(destino, staging, self.esquema) if modo == 'completo'
+                              else sql_reemplazar_particiones(destino, staging, fechas, self.esquema))
+                script = ";\n".join(["BEGIN TRANSACTION"] + sentencias + ["COMMIT TRANSACTION"])
+            self.client.query(script).result()
+        finally:
+            self.client.delete_table(self.tabla_staging, not_found_ok=True)
+        return {'filas': len(df), 'fechas': len(fechas), 'bytes_staging': bytes_staging}
+
+
+# --- 4. ESCRITOR LOCAL (DUCKDB) ---
+
+class EscritorLocal:
+    """
+    Sustituto local de BigQuery sobre DuckDB con la misma lógica de
+    staging Parquet + sustitución de particiones.
+    """
+
+    def __init__(self, ruta_db, tabla_destino='predicciones_modelo_final', esquema=ESQUEMA_PREDICCIONES,
+                 clave=COLUMNAS_CLAVE):
+        import duckdb
+        self.conexion = duckdb.connect(ruta_db)
+        self.tabla_destino = tabla_destino.replace('.', '__')
+        self.esquema, self.clave = esquema, clave
+        tipos = {pa.date32(): 'DATE', pa.string(): 'VARCHAR', pa.int64(): 'BIGINT', pa.float64(): 'DOUBLE'}
+        columnas = ', '.join(f"{c.name} {tipos[c.type]}" for c in esquema)
+        # Sin PRIMARY KEY: DuckDB no permite borrar y reinsertar la misma clave en una transacción
+        self.conexion.execute(f"CREATE TABLE IF NOT EXISTS {self.tabla_destino} ({columnas})")
+
+    def escribir(self, df, modo='particiones'):
+        if df.empty:
+            return {'filas': 0, 'fechas': 0, 'bytes_staging': 0}
+        with tempfile.TemporaryDirectory() as tmp:
+            ruta = os.path.join(tmp, 'staging.parquet')
+            fechas = escribir_parquet_staging(df, ruta, esquema=self.esquema)
+            bytes_staging = os.path.getsize(ruta)
+            staging = f"read_parquet('{ruta}')"
+            self.conexion.execute("BEGIN TRANSACTION")
+            try:
+                if modo == 'merge':
+                    # DuckDB no tiene MERGE: se borran las claves presentes en staging y se insertan
+                    condicion = ' AND '.join(f"{self.tabla_destino}.{c} = s.{c}" for c in self.clave)
+                    self.conexion.execute(f"DELETE FROM {self.tabla_destino} USING {staging} s "
+                                          f"WHERE {condicion} AND {self.tabla_destino}.fecha IN ({_lista_fechas_sql(fechas)})")
+                    self.conexion.execute(f"INSERT INTO {self.tabla_destino} SELECT * FROM {staging}")
+                else:
+                    sentencias = (sql_reemplazar_todo(self.tabla_destino, staging, self.esquema) if modo == 'completo'
+                                  else sql_reemplazar_particiones(self.tabla_destino, staging, fechas, self.esquema))
+                    for sentencia in sentencias:
+                        self.conexion.execute(sentencia)
+                self.conexion.execute("COMMIT")
+            except Exception:
+                self.conexion.execute("ROLLBACK")
+                raise
+        return {'filas': len(df), 'fechas': len(fechas), 'bytes_staging': bytes_staging}
+
+    def leer(self):
+        return self.conexion.execute(f"SELECT * FROM {self.tabla_destino} ORDER BY {', '.join(self.clave)}").df()
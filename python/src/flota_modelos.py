@@ -0,0 +1,320 @@
+# ============================================================================
+# FLOTA DE MODELOS POR (SECTOR, CÓDIGO POSTAL)
+# ============================================================================
+# Autor: Julio Clavijo
+# Versión: 1.0
+#
+# Descripción:
+# La segmentación se quedaba en tres modelos de sector, aunque la demanda
+# residencial o de servicios de Ciutat Vella y de Sarrià-Sant Gervasi se
+# parecen poco. Este modo opcional entrena un modelo ligero por serie
+# (sector, id_geografia):
+#
+#   1. Las features de todas las series se vuelcan UNA vez, como float32, en
+#      memoria compartida, ordenadas por serie y cronológicamente dentro de
+#      cada una (sin categóricas: el código postal ya está fijado por el modelo).
+#   2. Un pool de procesos entrena cada serie sobre una vista de su tramo de
+#      filas (sin copiar la entrada), con división cronológica y early
+#      stopping, un núcleo por proceso.
+#   3. Cada modelo se guarda en FLOTA_PATH/modelos/ (formato UBJSON de
+#      XGBoost) y un índice (indice.json) registra sus filas, árboles, MAPE
+#      de prueba y tamaño.
+#   4. En predicción, RegistroFlota carga los modelos bajo demanda y mantiene
+#      como mucho FLOTA_MAX_RESIDENTES en memoria (LRU).
+#
+# 'batch_prediction.py --flota <directorio>' usa la flota para las series que
+# tienen modelo y el de su sector para el resto.
+# ============================================================================
+
+import os
+import json
+import time
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+# --- 1. CONFIGURACIÓN ---
+DIRECTORIO_FLOTA = os.getenv("FLOTA_PATH", 'flota_modelos')
+MAX_RESIDENTES = int(os.getenv("FLOTA_MAX_RESIDENTES", 64))
+FICHERO_INDICE = 'indice.json'
+MIN_FILAS = 500                 # filas mínimas de una serie para entrenar su modelo
+PROPORCION_PRUEBA = 0.2
+MAX_ARBOLES = 300
+PARAMETROS_FLOTA = {
+    'objective': 'reg:squarederror',
+    'eta': 0.1,
+    'max_depth': 4,
+    'subsample': 0.8,
+    'eval_metric': 'mape',
+    'nthread': 1,  # el paralelismo lo aporta el pool
+}
+DTYPE_FEATURES = np.float32
+
+COLUMNAS_CLIMA = [
+    'temperatura_media_ciudad', 'humedad_media_ciudad', 'precipitacion_total_ciudad',
+    'temp_raval', 'temp_zuniversitaria', 'temp_fabra', 'temp_spread_montana_centro',
+]
+COLUMNAS_LAGS = ['consumo_lag_1_hora', 'consumo_lag_2_horas', 'consumo_lag_1_dia', 'consumo_media_movil_7d']
+FEATURES_FLOTA = (['id_tramo_horario', 'anio', 'mes', 'dia_del_mes', 'dia_semana', 'es_fin_de_semana',
+                   'es_festivo', 'es_fiesta_barrio'] + COLUMNAS_CLIMA + COLUMNAS_LAGS + ['temp_cuadrado', 'dist_confort'])
+
+
+# --- 2. FEATURES ---
+
+def aplicar_feature_engineering(df_sector):
+    """Lags y features no lineales de 'train_model_final.py' (df de un sector, orden cronológico)."""
+    df_sector = df_sector.copy()
+    df_sector['fecha'] = pd.to_datetime(df_sector['fecha'])
+    consumo = df_sector.groupby('id_geografia')['consumo_kwh']
+    df_sector['consumo_lag_1_hora'] = consumo.shift(1)
+    df_sector['consumo_lag_2_horas'] = consumo.shift(2)
+    df_sector['consumo_lag_1_dia'] = consumo.shift(4)
+    df_sector['consumo_media_movil_7d'] = consumo.rolling(window=28, min_periods=1).mean().reset_index(level=0, drop=True)
+    df_sector['temp_cuadrado'] = df_sector['temperatura_media_ciudad'] ** 2
+    df_sector['dist_confort'] = abs(df_sector['temperatura_media_ciudad'] - 20)
+    return df_sector.dropna(subset=COLUMNAS_LAGS + ['temperatura_media_ciudad'])
+
+
+def matriz_flota(df):
+    """Matriz float32 (filas x FEATURES_FLOTA) de un df con el Feature Engineering aplicado."""
+    matriz = np.empty((len(df), len(FEATURES_FLOTA)), dtype=DTYPE_FEATURES)
+    for j, columna in enumerate(FEATURES_FLOTA):
+        if columna == 'dia_semana':
+            valores = pd.to_datetime(df['fecha']).dt.weekday.to_numpy()
+        else:
+            valores = pd.to_numeric(df[columna], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+        matriz[:, j] = valores
+    return matriz
+
+
+def _series_contiguas(sectores, geografias):
+    """(id_sector, id_geografia, inicio, fin) de cada serie en filas ya ordenadas por serie."""
+    cambio = np.r_[True, (sectores[1:] != sectores[:-1]) | (geografias[1:] != geografias[:-1])]
+    inicios = np.flatnonzero(cambio)
+    fines = np.r_[inicios[1:], len(sectores)]
+    return [(int(sectores[i]), str(geografias[i]), int(i), int(f)) for i, f in zip(inicios, fines)]
+
+
+# --- 3. ENTRENAMIENTO EN PARALELO ---
+_ESTADO_PROCESO = {}
+
+
+def _inicializar_proceso(nombre_x, forma, nombre_y, directorio):
+    """Se conecta a la memoria compartida una vez por proceso."""
+    _ESTADO_PROCESO['x'] = shared_memory.SharedMemory(name=nombre_x)
+    _ESTADO_PROCESO['y'] = shared_memory.SharedMemory(name=nombre_y)
+    _ESTADO_PROCESO['forma'] = forma
+    _ESTADO_PROCESO['directorio'] = directorio
+
+
+def _entrenar_serie(id_sector, id_geografia, inicio, fin):
+    """Entrena y guarda el modelo de una serie sobre su vista de la memoria compartida."""
+    reloj = time.perf_counter()
+    forma = _ESTADO_PROCESO['forma']
+    X = np.ndarray(forma, dtype=DTYPE_FEATURES, buffer=_ESTADO_PROCESO['x'].buf)[inicio:fin]
+    y = np.ndarray((forma[0],), dtype=DTYPE_FEATURES, buffer=_ESTADO_PROCESO['y'].buf)[inicio:fin]
+    corte = int(len(X) * (1 - PROPORCION_PRUEBA))
+    entrenamiento = xgb.DMatrix(X[:corte], label=y[:corte], feature_names=FEATURES_FLOTA, nthread=1)
+    prueba = xgb.DMatrix(X[corte:], label=y[corte:], feature_names=FEATURES_FLOTA, nthread=1)
+    booster = xgb.train(PARAMETROS_FLOTA, entrenamiento, num_boost_round=MAX_ARBOLES, evals=[(prueba, 'prueba')],
+                        early_stopping_rounds=10, verbose_eval=False)
+    arboles = booster.best_iteration + 1
+    prediccion = booster.predict(prueba, iteration_range=(0, arboles))
+    real = y[corte:].astype(np.float64)
+    validos = real != 0
+    mape = float(np.mean(np.abs(prediccion[validos] - real[validos]) / np.abs(real[validos])) * 100) if validos.any() else None
+    # Se guarda solo hasta la mejor iteración: el registro no necesita iteration_range
+    booster = booster[:arboles]
+    fichero = f"{id_sector}_{id_geografia}.ubj"
+    ruta = os.path.join(_ESTADO_PROCESO['directorio'], 'modelos', fichero)
+    booster.save_model(ruta)
+    return {'id_sector_economico': id_sector, 'id_geografia': id_geografia, 'fichero': fichero,
+            'filas_entrenamiento': corte, 'filas_prueba': len(X) - corte, 'arboles': arboles,
+            'mape': mape, 'bytes': os.path.getsize(ruta), 'segundos': round(time.perf_counter() - reloj, 3)}
+
+
+def entrenar_flota(datos_por_sector, directorio=DIRECTORIO_FLOTA, n_procesos=None, min_filas=MIN_FILAS):
+    """
+    Entrena un modelo por (sector, id_geografia) en un pool de procesos.
+
+    Args:
+        datos_por_sector (dict): {sector_nombre: df del sector en orden
+            cronológico} (fuentes_datos.leer_por_sector).
+        directorio (str): Directorio del registro (modelos/ e indice.json).
+        n_procesos (int, optional): Procesos del pool (por defecto, los núcleos).
+        min_filas (int): Las series con menos filas no reciben modelo.
+
+    Returns:
+        tuple: (pd.DataFrame del índice, dict de métricas)
+    """
+    inicio = time.perf_counter()
+    n_procesos = n_procesos or os.cpu_count() or 1
+    partes = []
+    for df_sector in datos_por_sector.values():
+        if len(df_sector):
+            partes.append(aplicar_feature_engineering(df_sector))
+    df = pd.concat(partes, ignore_index=True)
+    df['id_geografia'] = df['id_geografia'].astype(str)
+    # Orden por serie y, dentro de cada una, cronológico (mergesort es estable)
+    df = df.sort_values(['id_sector_economico', 'id_geografia'], kind='mergesort', ignore_index=True)
+    series = [s for s in _series_contiguas(df['id_sector_economico'].to_numpy(), df['id_geografia'].to_numpy())
+              if s[3] - s[2] >= min_filas]
+    segundos_features = time.perf_counter() - inicio
+
+    forma = (len(df), len(FEATURES_FLOTA))
+    memoria_x = shared_memory.SharedMemory(create=True, size=max(forma[0] * forma[1] * 4, 1))
+    memoria_y = shared_memory.SharedMemory(create=True, size=max(forma[0] * 4, 1))
+    os.makedirs(os.path.join(directorio, 'modelos'), exist_ok=True)
+    try:
+        X = np.ndarray(forma, dtype=DTYPE_FEATURES, buffer=memoria_x.buf)
+        X[:] = matriz_flota(df)
+        np.ndarray((forma[0],), dtype=DTYPE_FEATURES, buffer=memoria_y.buf)[:] = df['consumo_kwh'].to_numpy(np.float32)
+        del X
+        reloj = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=n_procesos, initializer=_inicializar_proceso,
+                                 initargs=(memoria_x.name, forma, memoria_y.name, directorio)) as pool:
+            tamano_lote = max(1, len(series) // (4 * n_procesos))
+            resultados = list(pool.map(_entrenar_serie, *zip(*series), chunksize=tamano_lote)) if series else []
+        segundos_pool = time.perf_counter() - reloj
+    finally:
+        memoria_x.close(); memoria_x.unlink()
+        memoria_y.close(); memoria_y.unlink()
+
+    indice = pd.DataFrame(resultados)
+    guardar_indice(indice, directorio)
+    metricas = {
+        'series': len(series),
+        'series_omitidas': int(df.groupby(['id_sector_economico', 'id_geografia']).ngroups - len(series)),
+        'filas': forma[0],
+        'procesos': n_procesos,
+        'segundos_features': round(segundos_features, 3),
+        'segundos_entrenamiento': round(segundos_pool, 3),
+        'modelos_por_minuto': round(60 * len(series) / segundos_pool, 1) if segundos_pool else None,
+        'mape_mediano': float(indice['mape'].median()) if len(indice) else None,
+        'bytes': int(indice['bytes'].sum()) if len(indice) else 0,
+    }
+    return indice, metricas
+
+
+def guardar_indice(indice, directorio):
+    """Escribe indice.json de forma atómica, con las features y los parámetros de la flota."""
+    contenido = {
+        'creado': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'features': FEATURES_FLOTA,
+        'parametros': PARAMETROS_FLOTA,
+        'modelos': indice.to_dict(orient='records'),
+    }
+    ruta = os.path.join(directorio, FICHERO_INDICE)
+    temporal = f"{ruta}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as file:
+        json.dump(contenido, file, ensure_ascii=False, indent=1)
+    os.replace(temporal, ruta)
+
+
+# --- 4. REGISTRO CON CARGA PEREZOSA (LRU) ---
+
+class RegistroFlota:
+    """
+    Modelos de la flota cargados bajo demanda, con como mucho 'max_residentes'
+    en memoria: al cargar uno nuevo con el registro lleno se descarta el usado
+    hace más tiempo.
+    """
+
+    def __init__(self, directorio=DIRECTORIO_FLOTA, max_residentes=MAX_RESIDENTES):
+        self.directorio = directorio
+        self.max_residentes = max_residentes
+        with open(os.path.join(directorio, FICHERO_INDICE), encoding='utf-8') as file:
+            contenido = json.load(file)
+        if contenido['features'] != FEATURES_FLOTA:
+            raise ValueError("Las features del índice no coinciden con las de esta versión de la flota")
+        self.indice = {(int(m['id_sector_economico']), str(m['id_geografia'])): m for m in contenido['modelos']}
+        self._residentes = OrderedDict()
+        self.cargas, self.aciertos, self.expulsiones = 0, 0, 0
+
+    def __contains__(self, clave):
+        return clave in self.indice
+
+    def modelo(self, id_sector, id_geografia):
+        """Booster de la serie (None si no tiene modelo en la flota)."""
+        clave = (int(id_sector), str(id_geografia))
+        if clave in self._residentes:
+            self._residentes.move_to_end(clave)
+            self.aciertos += 1
+            return self._residentes[clave]
+        if clave not in self.indice:
+            return None
+        booster = xgb.Booster({'nthread': 1})
+        booster.load_model(os.path.join(self.directorio, 'modelos', self.indice[clave]['fichero']))
+        self.cargas += 1
+        self._residentes[clave] = booster
+        if len(self._residentes) > self.max_residentes:
+            self._residentes.popitem(last=False)
+            self.expulsiones += 1
+        return booster
+
+    def predecir(self, df):
+        """
+        Predicciones de la flota para un df con el Feature Engineering aplicado.
+
+        Returns:
+            np.ndarray: Alineado con df; NaN en las filas sin modelo en la flota.
+        """
+        predicciones = np.full(len(df), np.nan, dtype=np.float32)
+        if not len(df):
+            return predicciones
+        sectores = df['id_sector_economico'].to_numpy(np.int64)
+        geografias = df['id_geografia'].astype(str).to_numpy()
+        # Agrupar por serie para cargar cada modelo una sola vez
+        orden = np.lexsort((geografias, sectores))
+        X = matriz_flota(df.iloc[orden])
+        for id_sector, id_geografia, inicio, fin in _series_contiguas(sectores[orden], geografias[orden]):
+            booster = self.modelo(id_sector, id_geografia)
+            if booster is not None:
+                predicciones[orden[inicio:fin]] = booster.inplace_predict(X[inicio:fin])
+        return predicciones
+
+    def describir(self):
+        return (f"{len(self.indice)} modelos en el índice, {len(self._residentes)} residentes "
+                f"(máx. {self.max_residentes}); {self.cargas} cargas, {self.aciertos} aciertos, "
+                f"{self.expulsiones} expulsiones")
+
+
+# --- 5. EJECUCIÓN ---
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from fuentes_datos import crear_fuente, leer_por_sector, describir_lectura, COLUMNAS_MODELO_FINAL_V2
+
+    parser = argparse.ArgumentParser(description="Entrena la flota de modelos por (sector, código postal)")
+    parser.add_argument('--directorio', default=DIRECTORIO_FLOTA, help="Directorio del registro de la flota")
+    parser.add_argument('--procesos', type=int, default=0, help="Procesos del pool (0 = todos los núcleos)")
+    parser.add_argument('--desde', help="Primera fecha (YYYY-MM-DD) de entrenamiento")
+    parser.add_argument('--hasta', help="Última fecha (YYYY-MM-DD) de entrenamiento")
+    parser.add_argument('--min-filas', type=int, default=MIN_FILAS, help="Filas mínimas de una serie")
+    args = parser.parse_args()
+
+    print("--- Iniciando el entrenamiento de la flota de modelos ---")
+    load_dotenv()
+    try:
+        datos_por_sector, metricas_lectura = leer_por_sector(
+            crear_fuente(), "gold_data.modelo_final_v2", COLUMNAS_MODELO_FINAL_V2, desde=args.desde, hasta=args.hasta)
+        print(f"Paso 1: {describir_lectura(metricas_lectura)}.")
+    except Exception as e:
+        print(f"❌ Error al cargar datos desde la fuente: {e}")
+        exit()
+
+    indice, metricas = entrenar_flota(datos_por_sector, args.directorio, args.procesos or None, args.min_filas)
+    print(f"✅ Paso 2: {metricas['series']} modelos entrenados con {metricas['procesos']} procesos en "
+          f"{metricas['segundos_entrenamiento']:.1f} s ({metricas['modelos_por_minuto']} modelos/min; "
+          f"features en {metricas['segundos_features']:.1f} s), {metricas['series_omitidas']} series con menos "
+          f"de {args.min_filas} filas omitidas.")
+    if len(indice):
+        print(f"   - MAPE de prueba mediano: {metricas['mape_mediano']:.2f}%; "
+              f"{metricas['bytes'] / 1e6:.1f} MB en '{args.directorio}/modelos/'.")
+        print(indice.groupby('id_sector_economico')[['mape', 'arboles']].median().round(2).to_string())
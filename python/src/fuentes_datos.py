@@ -0,0 +1,626 @@
+# ============================================================================
+# CAPA DE FUENTES DE DATOS (BIGQUERY / DUCKDB LOCAL)
+# ============================================================================
+# Autor: Julio Clavijo
+# Versión: 1.0
+#
+# Descripción:
+# Punto único de lectura para los scripts de entrenamiento, predicción y el
+# notebook, que antes repetían cada uno pd.read_gbq(...) o
+# bigquery.Client(...).query(...).to_dataframe() con su propia autenticación.
+#
+#   - FuenteBigQuery: lee con la Storage Read API directamente a Arrow
+#     (sin paginar filas JSON por la API REST).
+#   - FuenteDuckDB: ejecuta las mismas consultas, y los scripts de 'bq/silver'
+#     y 'bq/gold', sobre ficheros Parquet locales. El SQL de BigQuery se
+#     traduce al dialecto de DuckDB con traducir_a_duckdb().
+#
+# Ambas entregan Arrow y lo convierten a pandas sin pasar por objetos Python
+# en las columnas numéricas y de fecha (y, si se pide, con las columnas de
+# texto como 'category' codificadas en Arrow).
+#
+# La fuente se elige con la variable de entorno FUENTE_DATOS
+# ('bigquery' por defecto, o 'duckdb' con DATOS_LOCALES_PATH).
+# ============================================================================
+
+import os
+import re
+import glob
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# --- 1. CONFIGURACIÓN ---
+PROJECT_ID = "datamanagementbi"
+DATOS_LOCALES = 'datos_locales'
+NOMBRE_DB_LOCAL = 'lakehouse.duckdb'
+
+# Columnas que leen los modelos de las tablas gold, en el orden de la tabla
+# (el entrenamiento toma las features en el orden de las columnas)
+COLUMNAS_MODELO_FINAL = [
+    'fecha', 'id_geografia', 'id_tramo_horario', 'id_sector_economico', 'consumo_kwh',
+    'anio', 'mes', 'dia_del_mes', 'dia_de_la_semana_nombre', 'es_fin_de_semana', 'es_festivo',
+    'nombre_barrio', 'nombre_distrito', 'poblacion',
+    'temperatura_media_ciudad', 'humedad_media_ciudad', 'precipitacion_total_ciudad',
+    'temp_raval', 'temp_zuniversitaria', 'temp_fabra', 'temp_spread_montana_centro',
+]
+COLUMNAS_MODELO_FINAL_V2 = COLUMNAS_MODELO_FINAL + ['es_fiesta_barrio', 'nombre_fiesta']
+ORDEN_CRONOLOGICO = ['fecha', 'id_tramo_horario', 'id_geografia']
+SECTORES = {1: 'Industrial', 2: 'Residencial', 3: 'Servicios'}
+# Días de histórico previos a 'desde' que necesitan los lags (media móvil de 28 tramos = 7 días)
+MARGEN_LAGS_DIAS = 7
+
+# Equivalencias directas de tipos y funciones BigQuery -> DuckDB
+TIPOS_DUCKDB = {'FLOAT64': 'DOUBLE', 'INT64': 'BIGINT', 'BOOL': 'BOOLEAN', 'NUMERIC': 'DECIMAL(38, 9)'}
+
+
+# --- 2. CONVERSIÓN ARROW -> PANDAS ---
+
+def tabla_a_pandas(tabla, categoricas=()):
+    """
+    Convierte una tabla Arrow al DataFrame que usan los scripts.
+
+    Las columnas numéricas sin nulos se convierten sin copia ('split_blocks'
+    evita consolidarlas en un único bloque) y las fechas llegan como
+    datetime64 en lugar de objetos datetime.date. Las columnas indicadas en
+    'categoricas' se codifican como diccionario en Arrow y llegan a pandas
+    como 'category' sin crear un objeto str por fila.
+
+    La tabla se libera durante la conversión ('self_destruct'), así que no
+    debe reutilizarse después.
+    """
+    for columna in categoricas:
+        if columna in tabla.column_names and not pa.types.is_dictionary(tabla.schema.field(columna).type):
+            indice = tabla.column_names.index(columna)
+            tabla = tabla.set_column(indice, columna, pc.dictionary_encode(tabla.column(columna)))
+    return tabla.to_pandas(date_as_object=False, split_blocks=True, self_destruct=True)
+
+
+# --- 3. TRADUCCIÓN DEL DIALECTO DE BIGQUERY ---
+
+def _separar_argumentos(texto):
+    """Divide los argumentos de una llamada por las comas de primer nivel."""
+    argumentos, nivel, inicio, comillas = [], 0, 0, None
+    for i, caracter in enumerate(texto):
+        if comillas:
+            if caracter == comillas:
+                comillas = None
+        elif caracter in "'\"":
+            comillas = caracter
+        elif caracter == '(':
+            nivel += 1
+        elif caracter == ')':
+            nivel -= 1
+        elif caracter == ',' and nivel == 0:
+            argumentos.append(texto[inicio:i].strip())
+            inicio = i + 1
+    argumentos.append(texto[inicio:].strip())
+    return argumentos
+
+
+def _cierre_parentesis(sql, apertura):
+    """Posición del paréntesis que cierra el abierto en 'apertura'."""
+    nivel, comillas = 0, None
+    for i in range(apertura, len(sql)):
+        caracter = sql[i]
+        if comillas:
+            if caracter == comillas:
+                comillas = None
+        elif caracter in "'\"":
+            comillas = caracter
+        elif caracter == '(':
+            nivel += 1
+        elif caracter == ')':
+            nivel -= 1
+            if nivel == 0:
+                return i
+    raise ValueError(f"Paréntesis sin cerrar en la posición {apertura}")
+
+
+def _reescribir_llamadas(sql, nombre, reescribir):
+    """
+    Sustituye cada llamada nombre(...) por reescribir(argumentos, resto),
+    que devuelve (texto_nuevo, caracteres consumidos de 'resto'). Los
+    argumentos se traducen antes que la llamada que los contiene.
+    """
+    patron = re.compile(rf'(?<![\w.]){nombre}\s*\(', re.IGNORECASE)
+    partes, posicion = [], 0
+    while True:
+        coincidencia = patron.search(sql, posicion)
+        if coincidencia is None:
+            break
+        apertura = coincidencia.end() - 1
+        cierre = _cierre_parentesis(sql, apertura)
+        interior = _reescribir_llamadas(sql[apertura + 1:cierre], nombre, reescribir)
+        nuevo, consumidos = reescribir(_separar_argumentos(interior), sql[cierre + 1:])
+        partes.append(sql[posicion:coincidencia.start()] + nuevo)
+        posicion = cierre + 1 + consumidos
+    partes.append(sql[posicion:])
+    return ''.join(partes)
+
+
+def _unnest_con_alias(args, resto):
+    # BigQuery nombra la columna con el alias; DuckDB necesita alias_tabla(columna)
+    alias = re.match(r'\s+AS\s+(\w+)', resto, re.IGNORECASE)
+    if alias is None:
+        return f"UNNEST({args[0]})", 0
+    return f"UNNEST({args[0]}) AS _{alias.group(1)}({alias.group(1)})", alias.end()
+
+
+def _extract(args, resto):
+    parte = args[0]
+    if re.match(r'\s*DAYOFWEEK\s+FROM\s', parte, re.IGNORECASE):
+        # BigQuery: 1 = domingo ... 7 = sábado; DuckDB (DOW): 0 = domingo
+        return f"(EXTRACT(DOW FROM {re.split(r'FROM', parte, 1, flags=re.IGNORECASE)[1].strip()}) + 1)", 0
+    return f"EXTRACT({parte})", 0
+
+
+_FUNCIONES = {
+    'TIMESTAMP_TRUNC': lambda a, r: (f"date_trunc('{a[1].lower()}', {a[0]})", 0),
+    'TIMESTAMP': lambda a, r: (f"CAST({a[0]} AS TIMESTAMP)", 0),
+    'DATE': lambda a, r: (f"CAST({a[0]} AS DATE)", 0),
+    'TIME': lambda a, r: (f"CAST({a[0]} AS TIME)", 0),
+    'PARSE_TIME': lambda a, r: (f"CAST(strptime({a[1]}, {a[0]}) AS TIME)", 0),
+    'FORMAT_TIME': lambda a, r: (f"strftime(DATE '2000-01-01' + {a[1]}, {a[0]})", 0),
+    'GENERATE_DATE_ARRAY': lambda a, r: (
+        f"list_transform(generate_series(CAST({a[0]} AS DATE), CAST({a[1]} AS DATE), "
+        f"{a[2] if len(a) > 2 else 'INTERVAL 1 DAY'}), d -> CAST(d AS DATE))", 0),
+    'FARM_FINGERPRINT': lambda a, r: (f"CAST(hash({a[0]}) >> 1 AS BIGINT)", 0),
+    'SAFE_CAST': lambda a, r: (f"TRY_CAST({a[0]})", 0),
+    'EXTRACT': _extract,
+    'UNNEST': _unnest_con_alias,
+}
+
+
+def traducir_a_duckdb(sql):
+    """
+    Traduce el SQL de BigQuery que usa este proyecto al dialecto de DuckDB.
+
+    Cubre lo que aparece en 'bq/silver' y 'bq/gold' y en las consultas de los
+    scripts: nombres `proyecto.dataset.tabla`, identificadores entre
+    acentos graves, tipos FLOAT64/INT64, las funciones de fecha y hora y las
+    cláusulas PARTITION BY / CLUSTER BY (que se eliminan).
+    FARM_FINGERPRINT se sustituye por hash() de DuckDB: los identificadores
+    son estables pero no coinciden con los de BigQuery.
+    """
+    # `proyecto.dataset.tabla` / `dataset.tabla` -> dataset.tabla; `Columna` -> "Columna"
+    def _identificador(coincidencia):
+        partes = coincidencia.group(1).split('.')
+        if len(partes) == 1:
+            return f'"{partes[0]}"'
+        return '.'.join(partes[-2:])
+    sql = re.sub(r'`([^`]+)`', _identificador, sql)
+
+    # DuckDB no tiene particionado ni clustering en CREATE TABLE ... AS
+    sql = re.sub(r'\s+PARTITION\s+BY\s+[\w().]+(?=\s+(?:CLUSTER\s+BY|AS)\s)', '', sql, flags=re.IGNORECASE)
+    sql = re.sub(r'\s+CLUSTER\s+BY\s+\w+(?:\s*,\s*\w+)*(?=\s+AS\s)', '', sql, flags=re.IGNORECASE)
+
+    for tipo, equivalente in TIPOS_DUCKDB.items():
+        sql = re.sub(rf'\bAS\s+{tipo}\b', f'AS {equivalente}', sql, flags=re.IGNORECASE)
+    for nombre, reescribir in _FUNCIONES.items():
+        sql = _reescribir_llamadas(sql, nombre, reescribir)
+    return sql
+
+
+# --- 4. FUENTES ---
+
+class FuenteDatos:
+    """
+    Interfaz común de lectura. Las consultas se escriben siempre en el
+    dialecto de BigQuery (como en 'bq/'), con `proyecto.dataset.tabla`.
+    """
+    nombre = 'base'
+    credentials = None  # credenciales de GCP para escrituras, si las hay
+
+    def leer_arrow(self, sql):
+        raise NotImplementedError
+
+    def leer_clasico(self, sql):
+        """Lectura a pandas por la ruta anterior a esta capa (solo para comparativas)."""
+        raise NotImplementedError
+
+    def ejecutar(self, sql):
+        """Ejecuta una sentencia sin resultado (CREATE, DELETE, ...)."""
+        raise NotImplementedError
+
+    def bytes_escaneados(self, sql):
+        """Bytes que escanearía la consulta en el almacén (None si el motor no lo informa)."""
+        return None
+
+    def existe_tabla(self, tabla):
+        raise NotImplementedError
+
+    def ultima_modificacion(self, tabla):
+        """Marca de la última modificación de una tabla (str), o None si no se conoce."""
+        return None
+
+    def ultima_fecha(self, tabla):
+        """Fecha más reciente de una tabla con columna 'fecha' (None si está vacía)."""
+        valor = self.leer_arrow(f"SELECT MAX(fecha) AS fecha FROM `{PROJECT_ID}.{tabla}`").column('fecha')[0].as_py()
+        return None if valor is None else pd.Timestamp(valor)
+
+    def consultar(self, sql, categoricas=()):
+        return tabla_a_pandas(self.leer_arrow(sql), categoricas=categoricas)
+
+    def leer_lotes(self, sql, filas_por_lote=1_000_000):
+        """Resultado de una consulta como iterable de pa.RecordBatch (para recorridos de una pasada)."""
+        return self.leer_arrow(sql).to_batches(max_chunksize=filas_por_lote)
+
+    def leer_tabla_arrow(self, tabla, columnas=None):
+        """Lee una tabla completa (u opcionalmente algunas columnas) a Arrow."""
+        lista = ', '.join(columnas) if columnas else '*'
+        return self.leer_arrow(f"SELECT {lista} FROM `{PROJECT_ID}.{tabla}`")
+
+    def leer_tabla(self, tabla, columnas=None, categoricas=()):
+        """
+        Lee una tabla completa, opcionalmente solo algunas columnas.
+
+        Args:
+            tabla (str): 'dataset.tabla' (p. ej. 'gold_data.modelo_final_v2').
+            columnas (list, optional): Columnas a leer; todas si es None.
+            categoricas (iterable): Columnas a entregar como 'category'.
+        """
+        return tabla_a_pandas(self.leer_tabla_arrow(tabla, columnas), categoricas=categoricas)
+
+    def leer_seleccion(self, tabla, columnas=None, desde=None, hasta=None, sectores=None):
+        """Lectura Arrow de construir_consulta() (las fuentes con caché la resuelven sin SQL)."""
+        return self.leer_arrow(construir_consulta(tabla, columnas, desde, hasta, sectores))
+
+    def ejecutar_fichero(self, ruta_sql):
+        with open(ruta_sql, encoding='utf-8') as file:
+            self.ejecutar(file.read())
+
+
+class FuenteBigQuery(FuenteDatos):
+    """Lectura desde BigQuery por la Storage Read API (Arrow)."""
+    nombre = 'bigquery'
+
+    def __init__(self, project_id=PROJECT_ID, ruta_clave=None):
+        from google.cloud import bigquery
+        from google.oauth2 import service_account
+
+        if ruta_clave:
+            self.credentials = service_account.Credentials.from_service_account_file(ruta_clave)
+        self.project_id = project_id
+        self.client = bigquery.Client(project=project_id, credentials=self.credentials)
+
+    def leer_arrow(self, sql):
+        # create_bqstorage_client: descarga por streams Arrow en paralelo si
+        # google-cloud-bigquery-storage está instalado (si no, cae a REST)
+        return self.client.query(sql).result().to_arrow(create_bqstorage_client=True)
+
+    def leer_lotes(self, sql, filas_por_lote=1_000_000):
+        # Por streams de la Storage Read API, sin materializar el resultado completo
+        try:
+            from google.cloud import bigquery_storage
+            lector = bigquery_storage.BigQueryReadClient(credentials=self.credentials)
+        except ImportError:
+            lector = None
+        for lote in self.client.query(sql).result().to_arrow_iterable(bqstorage_client=lector):
+            yield from pa.Table.from_batches([lote]).to_batches(max_chunksize=filas_por_lote)
+
+    def leer_tabla_arrow(self, tabla, columnas=None):
+        # Sin consulta: lectura directa de la tabla (no factura bytes escaneados)
+        referencia = self.client.get_table(f"{self.project_id}.{tabla}")
+        campos = [c for c in referencia.schema if columnas is None or c.name in columnas]
+        filas = self.client.list_rows(referencia, selected_fields=campos)
+        return filas.to_arrow(create_bqstorage_client=True)
+
+    def bytes_escaneados(self, sql):
+        from google.cloud import bigquery
+        # Dry run: BigQuery estima los bytes tras la poda de columnas y particiones, sin coste
+        config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+        return self.client.query(sql, job_config=config).total_bytes_processed
+
+    def existe_tabla(self, tabla):
+        from google.api_core.exceptions import NotFound
+        try:
+            self.client.get_table(f"{self.project_id}.{tabla}")
+            return True
+        except NotFound:
+            return False
+
+    def ultima_modificacion(self, tabla):
+        return self.client.get_table(f"{self.project_id}.{tabla}").modified.isoformat()
+
+    def ultima_fecha(self, tabla):
+        # Metadatos de particiones: no escanea la tabla
+        dataset, nombre = tabla.split('.')
+        sql = (f"SELECT MAX(partition_id) AS particion "
+               f"FROM `{self.project_id}.{dataset}.INFORMATION_SCHEMA.PARTITIONS` "
+               f"WHERE table_name = '{nombre}' AND partition_id NOT IN ('__NULL__', '__UNPARTITIONED__')")
+        particion = self.leer_arrow(sql).column('particion')[0].as_py()
+        if particion is None:
+            return super().ultima_fecha(tabla)  # tabla aún sin particionar
+        return pd.Timestamp(particion)
+
+    def leer_clasico(self, sql):
+        return pd.read_gbq(sql, project_id=self.project_id, credentials=self.credentials, progress_bar_type=None)
+
+    def ejecutar(self, sql):
+        self.client.query(sql).result()
+
+
+class FuenteDuckDB(FuenteDatos):
+    """
+    Sustituto local de BigQuery sobre DuckDB.
+
+    Cada fichero o directorio Parquet en 'raiz/<dataset>/<tabla>[.parquet]'
+    se expone como la vista dataset.tabla, de modo que las consultas y los
+    scripts de 'bq/' se ejecutan sin cambios. Las tablas que crean esos
+    scripts (silver, gold) se guardan en la base 'raiz/lakehouse.duckdb'.
+    """
+    nombre = 'duckdb'
+
+    def __init__(self, raiz=DATOS_LOCALES, ruta_db=None):
+        import duckdb
+
+        self.raiz = raiz
+        os.makedirs(raiz, exist_ok=True)
+        self.conexion = duckdb.connect(ruta_db or os.path.join(raiz, NOMBRE_DB_LOCAL))
+        self._bloqueo_catalogo = threading.Lock()
+        self._rutas_parquet = {}
+        self.registrar_parquet()
+
+    def registrar_parquet(self):
+        """Crea (o refresca) una vista por cada tabla Parquet de la raíz local."""
+        tablas_base = {f"{esquema}.{tabla}" for esquema, tabla in
+                       self.conexion.execute("SELECT schema_name, table_name FROM duckdb_tables()").fetchall()}
+        for dataset in sorted(os.listdir(self.raiz)):
+            ruta_dataset = os.path.join(self.raiz, dataset)
+            if not os.path.isdir(ruta_dataset):
+                continue
+            self.conexion.execute(f"CREATE SCHEMA IF NOT EXISTS {dataset}")
+            for entrada in sorted(os.listdir(ruta_dataset)):
+                ruta = os.path.join(ruta_dataset, entrada)
+                if entrada.endswith('.parquet'):
+                    tabla, patron = entrada[:-len('.parquet')], ruta
+                elif os.path.isdir(ruta) and glob.glob(os.path.join(ruta, '**', '*.parquet'), recursive=True):
+                    tabla, patron = entrada, os.path.join(ruta, '**', '*.parquet')
+                else:
+                    continue
+                if f"{dataset}.{tabla}" in tablas_base:
+                    continue  # ya materializada en la base local
+                self._rutas_parquet[f"{dataset}.{tabla}"] = patron
+                self.conexion.execute(
+                    f"CREATE OR REPLACE VIEW {dataset}.{tabla} AS "
+                    f"SELECT * FROM read_parquet('{patron}', hive_partitioning = true)")
+
+    def leer_arrow(self, sql):
+        # Un cursor por lectura: permite lanzar varias en paralelo sobre la misma base
+        return self.conexion.cursor().execute(traducir_a_duckdb(sql)).arrow()
+
+    def leer_clasico(self, sql):
+        return self.conexion.cursor().execute(traducir_a_duckdb(sql)).df()
+
+    def leer_lotes(self, sql, filas_por_lote=1_000_000):
+        return self.conexion.cursor().execute(traducir_a_duckdb(sql)).fetch_record_batch(filas_por_lote)
+
+    def existe_tabla(self, tabla):
+        dataset, nombre = tabla.split('.')
+        return bool(self.conexion.cursor().execute(
+            "SELECT COUNT(*) FROM duckdb_tables() WHERE schema_name = ? AND table_name = ?", [dataset, nombre]
+        ).fetchone()[0])
+
+    def ultima_modificacion(self, tabla):
+        # Solo se conoce para las vistas sobre Parquet (mtime del fichero más reciente)
+        patron = self._rutas_parquet.get(tabla)
+        ficheros = glob.glob(patron, recursive=True) if patron else []
+        return str(max(os.path.getmtime(f) for f in ficheros)) if ficheros else None
+
+    def ejecutar(self, sql):
+        sql = traducir_a_duckdb(sql)
+        cursor = self.conexion.cursor()
+        # En BigQuery los datasets ya existen; aquí se crean al primer uso
+        with self._bloqueo_catalogo:
+            for dataset in re.findall(r'CREATE\s+(?:OR\s+REPLACE\s+)?(?:TABLE|VIEW)\s+(\w+)\.', sql, re.IGNORECASE):
+                cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {dataset}")
+        cursor.execute(sql)
+
+    def exportar_parquet(self, tabla, ruta, compresion='zstd'):
+        """Vuelca una tabla local a Parquet (p. ej. para compartir un gold construido en local)."""
+        self.conexion.execute(f"COPY (SELECT * FROM {tabla}) TO '{ruta}' (FORMAT PARQUET, COMPRESSION {compresion})")
+
+
+def crear_fuente(tipo=None):
+    """
+    Devuelve la fuente configurada por entorno.
+
+    FUENTE_DATOS: 'bigquery' (por defecto) o 'duckdb'.
+    GCP_SERVICE_ACCOUNT_KEY_PATH: clave de servicio para BigQuery (opcional;
+        sin ella se usan las credenciales por defecto de la máquina).
+    DATOS_LOCALES_PATH: raíz de los Parquet locales para DuckDB.
+    CACHE_GOLD: '1' (por defecto con BigQuery) o '0'; caché local de las
+        tablas gold (cache_gold.py), con CACHE_GOLD_PATH y CACHE_GOLD_MAX_GB.
+    """
+    tipo = (tipo or os.getenv("FUENTE_DATOS") or 'bigquery').lower()
+    if tipo == 'duckdb':
+        fuente = FuenteDuckDB(os.getenv("DATOS_LOCALES_PATH") or DATOS_LOCALES)
+    elif tipo == 'bigquery':
+        fuente = FuenteBigQuery(ruta_clave=os.getenv("GCP_SERVICE_ACCOUNT_KEY_PATH"))
+    else:
+        raise ValueError(f"FUENTE_DATOS desconocida: '{tipo}' (usa 'bigquery' o 'duckdb')")
+    if os.getenv("CACHE_GOLD", '1' if tipo == 'bigquery' else '0') == '1':
+        from cache_gold import FuenteCacheada, crear_cache
+        fuente = FuenteCacheada(fuente, crear_cache())
+    return fuente
+
+
+# --- 5. LECTURAS DE LOS MODELOS CON PUSHDOWN ---
+
+def construir_consulta(tabla, columnas=None, desde=None, hasta=None, sectores=None):
+    """
+    SELECT de una tabla gold con la proyección y los filtros en la consulta.
+
+    No incluye ORDER BY: ordenar toda la tabla obliga a BigQuery a hacerlo
+    en un único worker; la ordenación se hace en local, por sector.
+
+    Args:
+        tabla (str): 'dataset.tabla'.
+        columnas (list, optional): Columnas a leer; todas si es None.
+        desde, hasta (str | date, optional): Ventana de fechas (inclusiva).
+        sectores (iterable, optional): id_sector_economico a leer.
+    """
+    condiciones = []
+    if desde is not None:
+        condiciones.append(f"fecha >= DATE '{pd.Timestamp(desde).date().isoformat()}'")
+    if hasta is not None:
+        condiciones.append(f"fecha <= DATE '{pd.Timestamp(hasta).date().isoformat()}'")
+    if sectores is not None:
+        condiciones.append(f"id_sector_economico IN ({', '.join(str(int(s)) for s in sectores)})")
+    sql = f"SELECT {', '.join(columnas) if columnas else '*'} FROM `{PROJECT_ID}.{tabla}`"
+    return sql + (f" WHERE {' AND '.join(condiciones)}" if condiciones else '')
+
+
+def categorias_por_sector(fuente, tabla, columnas, sectores=SECTORES):
+    """
+    Valores distintos de cada columna de texto por sector, sobre toda la tabla.
+
+    Los scripts codifican las categóricas con .astype('category'), que toma
+    las categorías de las filas leídas. Al leer solo una ventana de fechas,
+    los códigos cambiarían respecto a una lectura completa; fijando aquí las
+    categorías del histórico completo se obtienen los mismos códigos.
+
+    Returns:
+        dict: {sector_nombre: {columna: [valores ordenados]}}
+    """
+    def _distintos(columna):
+        sql = (f"SELECT DISTINCT id_sector_economico, {columna} AS valor FROM `{PROJECT_ID}.{tabla}` "
+               f"WHERE {columna} IS NOT NULL")
+        return columna, fuente.leer_arrow(sql).to_pandas()
+
+    categorias = {nombre: {} for nombre in sectores.values()}
+    with ThreadPoolExecutor(max_workers=max(len(columnas), 1)) as pool:
+        for columna, df in pool.map(_distintos, columnas):
+            for id_sector, nombre in sectores.items():
+                categorias[nombre][columna] = sorted(df.loc[df['id_sector_economico'] == id_sector, 'valor'])
+    return categorias
+
+
+def leer_por_sector(fuente, tabla, columnas=None, sectores=SECTORES, desde=None, hasta=None,
+                    orden=ORDEN_CRONOLOGICO, categoricas=()):
+    """
+    Lee una tabla gold con una consulta filtrada por sector, lanzadas en
+    paralelo, y ordena cada sector en local.
+
+    Con una ventana de fechas, las columnas de texto llegan como 'category'
+    con las categorías de toda la tabla (ver categorias_por_sector()).
+
+    Args:
+        fuente (FuenteDatos): Fuente de lectura.
+        tabla (str): 'dataset.tabla'.
+        columnas (list, optional): Proyección (p. ej. COLUMNAS_MODELO_FINAL_V2).
+        sectores (dict): {id_sector_economico: sector_nombre}.
+        desde, hasta (str | date, optional): Ventana de fechas a leer.
+        orden (list): Columnas por las que ordenar cada sector.
+        categoricas (iterable): Columnas a entregar como 'category'.
+
+    Returns:
+        tuple: ({sector_nombre: df_sector ordenado}, métricas de la lectura)
+    """
+    consultas = {nombre: construir_consulta(tabla, columnas, desde, hasta, [id_sector])
+                 for id_sector, nombre in sectores.items()}
+    reloj = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(consultas)) as pool:
+        lecturas = pool.map(lambda id_sector: fuente.leer_seleccion(tabla, columnas, desde, hasta, [id_sector]),
+                            sectores)
+        tablas = dict(zip(consultas, lecturas))
+    segundos_lectura = time.perf_counter() - reloj
+
+    categorias = {}
+    if desde is not None or hasta is not None:
+        esquema = next(iter(tablas.values())).schema
+        columnas_texto = [c.name for c in esquema if pa.types.is_string(c.type) or pa.types.is_large_string(c.type)]
+        categorias = categorias_por_sector(fuente, tabla, columnas_texto, sectores)
+
+    bloques, bytes_transferidos = {}, 0
+    for nombre, tabla_arrow in tablas.items():
+        bytes_transferidos += tabla_arrow.nbytes
+        df_sector = tabla_a_pandas(tabla_arrow, categoricas=categoricas)
+        for columna, valores in categorias.get(nombre, {}).items():
+            df_sector[columna] = pd.Categorical(df_sector[columna], categories=valores)
+        df_sector['sector_nombre'] = nombre
+        bloques[nombre] = df_sector.sort_values(orden, kind='stable', ignore_index=True)
+    del tablas
+
+    escaneados = [fuente.bytes_escaneados(sql) for sql in consultas.values()]
+    metricas = {
+        'filas': sum(len(df) for df in bloques.values()),
+        'segundos_lectura': segundos_lectura,
+        'segundos_totales': time.perf_counter() - reloj,
+        'bytes_transferidos': bytes_transferidos,
+        'bytes_escaneados': None if None in escaneados else sum(escaneados),
+    }
+    return bloques, metricas
+
+
+def describir_lectura(metricas):
+    """Resumen de una línea de las métricas de leer_por_sector()."""
+    escaneados = metricas['bytes_escaneados']
+    return (f"{metricas['filas']} filas en {metricas['segundos_totales']:.2f} s "
+            f"({metricas['bytes_transferidos'] / 1e6:,.1f} MB transferidos"
+            + (f", {escaneados / 1e6:,.1f} MB escaneados)" if escaneados is not None else ")"))
+
+
+# --- 6. COMPARATIVA DE RUTAS DE LECTURA ---
+
+def comparar_lecturas(fuente, tabla, repeticiones=3, categoricas=()):
+    """
+    Mide la ruta clásica (read_gbq / fetchdf) frente a la ruta Arrow sobre la
+    misma tabla. Devuelve un DataFrame con el mejor tiempo de cada ruta,
+    filas por segundo y memoria del DataFrame resultante.
+    """
+    sql = f"SELECT * FROM `{PROJECT_ID}.{tabla}`"
+    rutas = {
+        'clasica': lambda: fuente.leer_clasico(sql),
+        'arrow': lambda: fuente.consultar(sql),
+        'arrow_categorica': lambda: fuente.consultar(sql, categoricas=categoricas),
+    }
+    if not categoricas:
+        del rutas['arrow_categorica']
+
+    filas = []
+    for ruta, leer in rutas.items():
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            df = leer()
+            tiempos.append(time.perf_counter() - inicio)
+        mejor = min(tiempos)
+        filas.append({'fuente': fuente.nombre, 'ruta': ruta, 'filas': len(df), 'segundos': mejor,
+                      'filas_por_segundo': len(df) / mejor if mejor else 0.0,
+                      'mb_dataframe': df.memory_usage(deep=True).sum() / 1e6})
+    return pd.DataFrame(filas)
+
+
+# --- 7. EJECUCIÓN PRINCIPAL ---
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description="Fuentes de datos: ejecución de SQL de 'bq/' y comparativa de lecturas")
+    parser.add_argument('--fuente', choices=['bigquery', 'duckdb'], help="Sobrescribe FUENTE_DATOS")
+    parser.add_argument('--sql', nargs='*', default=[], help="Scripts de 'bq/' a ejecutar en orden")
+    parser.add_argument('--benchmark', metavar='TABLA', help="Tabla 'dataset.tabla' a leer por ambas rutas")
+    parser.add_argument('--repeticiones', type=int, default=3)
+    args = parser.parse_args()
+
+    load_dotenv()
+    fuente = crear_fuente(args.fuente)
+    print(f"--- Fuente de datos: {fuente.nombre} ---")
+
+    for ruta_sql in args.sql:
+        inicio = time.perf_counter()
+        fuente.ejecutar_fichero(ruta_sql)
+        print(f"✅ {os.path.basename(ruta_sql)} ejecutado en {time.perf_counter() - inicio:.2f} s.")
+
+    if args.benchmark:
+        print(f"\nComparando rutas de lectura sobre '{args.benchmark}'...")
+        resultado = comparar_lecturas(fuente, args.benchmark, args.repeticiones,
+                                      categoricas=['id_geografia', 'nombre_barrio', 'nombre_distrito',
+                                                   'nombre_municipio', 'dia_de_la_semana_nombre', 'nombre_fiesta'])
+        print(resultado.to_string(index=False, float_format=lambda x: f"{x:,.2f}"))
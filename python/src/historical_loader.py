@@ -5,6 +5,9 @@ import time
 import os
 from google.cloud import storage
 from dotenv import load_dotenv
+from calidad_datos import validar, describir_validacion, REGLAS_AEMET_BRONZE
+from lago_datos import escribir as escribir_en_lago
+from instrumentacion import crear_instrumentacion
 
 # --- 1. CONFIGURACIÓN ---
 # Carga las variables de tu archivo .env (tu "caja fuerte") para que el script pueda usarlas.
@@ -18,12 +21,16 @@ START_DATE = datetime(2021, 1, 1)
 END_DATE = datetime.now()
 GCS_BUCKET_NAME = "dm-bi-project-raw-data" # El nombre de tu bucket en GCS
 HEADERS = {'accept': 'application/json', 'api_key': API_KEY}
+URL_API_AEMET = "https://opendata.aemet.es/opendata/api"  # Se sustituye por una API local en benchmark.py
+PAUSA_ENTRE_PETICIONES = 6  # segundos entre años, para no sobrecargar la API
 
 # --- 2. FUNCIONES (Tus "Herramientas" reutilizables) ---
 
 # Herramienta 1: Descarga los datos del clima de AEMET año por año.
+# Los bytes descargados quedan en df.attrs['bytes_descargados'].
 def fetch_historical_weather(start_date, end_date, idema):
     all_data = []
+    bytes_descargados = 0
     # Itera desde el año de inicio hasta el año actual.
     for year in range(start_date.year, end_date.year + 1):
         print(f"Procesando año: {year}...")
@@ -33,7 +40,7 @@ def fetch_historical_weather(start_date, end_date, idema):
         end_str = f"{year}-12-31T23:59:59UTC"
 
         # Construye y realiza la llamada a la API.
-        url_solicitud = (f"https://opendata.aemet.es/opendata/api/valores/climatologicos/diarios/datos/"
+        url_solicitud = (f"{URL_API_AEMET}/valores/climatologicos/diarios/datos/"
                        f"fechaini/{start_str}/fechafin/{end_str}/estacion/{idema}")
         try:
             # El primer 'get' obtiene la URL donde están los datos reales.
@@ -48,20 +55,24 @@ def fetch_historical_weather(start_date, end_date, idema):
                 response_datos = requests.get(url_datos, headers=HEADERS, verify=True)
                 response_datos.raise_for_status()
                 datos_anuales = response_datos.json()
+                bytes_descargados += len(response_datos.content)
                 all_data.extend(datos_anuales)
                 print(f"Año {year} descargado con éxito.")
             else:
                 print(f"Error en la solicitud para el año {year}: {respuesta_url.get('descripcion')}")
             
             # Pausa para no sobrecargar la API de AEMET.
-            time.sleep(6)
+            time.sleep(PAUSA_ENTRE_PETICIONES)
         except requests.exceptions.RequestException as e:
             print(f"Error de red procesando el año {year}: {e}")
             continue
     # Convierte la lista de datos en una tabla de Pandas.
-    return pd.DataFrame(all_data)
+    df = pd.DataFrame(all_data)
+    df.attrs['bytes_descargados'] = bytes_descargados
+    return df
 
 # Herramienta 2: Sube la tabla de Pandas a Google Cloud Storage como un archivo Parquet.
+# Devuelve el tamaño en bytes del Parquet subido.
 def upload_df_to_gcs(df, bucket_name, destination_blob_name):
     # Guarda temporalmente el DataFrame como un archivo .parquet en tu disco.
     temp_file_path = "temp_historical_data.parquet"
@@ -77,27 +88,48 @@ def upload_df_to_gcs(df, bucket_name, destination_blob_name):
     print(f"Archivo {destination_blob_name} subido con éxito a GCS.")
     
     # Borra el archivo temporal de tu disco.
+    tamano = os.path.getsize(temp_file_path)
     os.remove(temp_file_path)
+    return tamano
 
 # --- 3. EJECUCIÓN PRINCIPAL ---
 # Esta es la sección que se ejecuta cuando corres 'python historical_loader.py'.
 if __name__ == "__main__":
+    # Cada paso se registra como etapa en metricas/ (con --profile, también su perfil de CPU).
+    instrumentacion = crear_instrumentacion('historical_loader')
+
     # 1. Llama a la herramienta para descargar los datos.
-    historical_df = fetch_historical_weather(START_DATE, END_DATE, IDEMA_BARCELONA)
+    with instrumentacion.etapa('extraccion') as etapa:
+        historical_df = fetch_historical_weather(START_DATE, END_DATE, IDEMA_BARCELONA)
+        etapa.filas, etapa.bytes_entrada = len(historical_df), historical_df.attrs.get('bytes_descargados')
     
     if not historical_df.empty:
         # 2. Limpia y transforma los datos.
-        historical_df['fecha'] = pd.to_datetime(historical_df['fecha'])
-        numeric_cols = ['tmed', 'tmin', 'tmax', 'prec']
-        for col in numeric_cols:
-            if col in historical_df.columns:
-                # Convierte texto como '0,5' a números como 0.5.
-                historical_df[col] = pd.to_numeric(historical_df[col].str.replace(',', '.'), errors='coerce')
+        with instrumentacion.etapa('limpieza', filas=len(historical_df)):
+            historical_df['fecha'] = pd.to_datetime(historical_df['fecha'])
+            numeric_cols = ['tmed', 'tmin', 'tmax', 'prec']
+            for col in numeric_cols:
+                if col in historical_df.columns:
+                    # Convierte texto como '0,5' a números como 0.5.
+                    historical_df[col] = pd.to_numeric(historical_df[col].str.replace(',', '.'), errors='coerce')
+
+        # 2.1. Comprueba la calidad (fechas, rangos, tmin <= tmax, días duplicados) e informa.
+        with instrumentacion.etapa('validacion', filas=len(historical_df)):
+            validacion = validar(historical_df, REGLAS_AEMET_BRONZE)
+        print(describir_validacion(validacion, "clima diario AEMET"))
         
         # 3. Define un nombre para el archivo en la nube.
         blob_name = f"api_raw_data/clima_historico_{START_DATE.year}-{END_DATE.year}.parquet"
         
         # 4. Llama a la herramienta para subir los datos.
-        upload_df_to_gcs(historical_df, GCS_BUCKET_NAME, blob_name)
+        with instrumentacion.etapa('subida_gcs', filas=len(historical_df)) as etapa:
+            etapa.bytes_salida = upload_df_to_gcs(historical_df, GCS_BUCKET_NAME, blob_name)
+
+        # 5. Si hay lago local (LAGO_DATOS_PATH), guarda también los datos particionados por año/mes/estación.
+        if os.getenv("LAGO_DATOS_PATH"):
+            with instrumentacion.etapa('lago', filas=len(historical_df)):
+                escribir_en_lago(historical_df, 'raw_clima_aemet', os.getenv("LAGO_DATOS_PATH"), reemplazar=True)
+        instrumentacion.cerrar()
+        print(f"\nEtapas ({instrumentacion.directorio}/):\n{instrumentacion.resumen()}")
     else:
         print("No se pudieron obtener datos históricos.")
\ No newline at end of file
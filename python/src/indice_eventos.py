@@ -0,0 +1,277 @@
+# ============================================================================
+# ÍNDICE DE INTERVALOS DE FESTIVOS Y FIESTAS DE BARRIO
+# ============================================================================
+# Autor: Julio Clavijo
+# Versión: 1.0
+#
+# Descripción:
+# En el gold, 'es_fiesta_barrio' y 'nombre_fiesta' salen de
+# silver_data.dim_fiestas_barrio, que expande cada evento a una fila por día
+# y código postal. En predicción (rejillas de escenarios, pronóstico
+# multi-horizonte, streaming) esas features se fijaban a "sin fiesta". Este
+# módulo las calcula a partir de los rangos SIN expandir:
+#
+#   1. Los eventos (fecha_inicio, fecha_fin, id_geografia, nombre) se ordenan
+#      por (código postal, inicio) en arrays NumPy, con una clave entera
+#      combinada y el máximo acumulado de 'fecha_fin' dentro de cada código.
+#   2. Una consulta de millones de pares (fecha, código postal) es un único
+#      np.searchsorted: el último evento iniciado antes de la fecha en ese
+#      código y el máximo acumulado de su fin dicen si hay algún evento activo.
+#   3. Los festivos de la ciudad (raw_festivos_barcelona) son un array
+#      ordenado de días con su descripción.
+#   4. El índice se guarda en un .npz para cargarlo sin acceso a la fuente.
+#
+# Con varios eventos solapados en el mismo día y código postal, el gold
+# duplica la fila (LEFT JOIN); aquí se devuelve uno solo: el de fin más
+# tardío entre los ya iniciados. solapamientos() devuelve todos.
+# ============================================================================
+
+import os
+import re
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# --- 1. CONFIGURACIÓN ---
+PROJECT_ID = "datamanagementbi"
+RUTA_SQL_FIESTAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..',
+                                'bq', 'silver', '08_silver_dim_fiestas_barrio.sql')
+TABLA_FESTIVOS = "bronze_data.raw_festivos_barcelona"
+RUTA_INDICE = os.getenv("INDICE_EVENTOS_PATH", 'indice_eventos.npz')
+
+# Clave combinada (código postal, día): el día se desplaza para que sea siempre
+# positivo y cada código ocupa un tramo disjunto de 2**32 valores
+_DESPLAZAMIENTO = 2 ** 31
+_ESCALA = 2 ** 32
+
+
+def _a_dias(fechas):
+    """Fechas (str, datetime, datetime64) -> días desde 1970-01-01 (int64)."""
+    fechas = pd.to_datetime(pd.Index(np.atleast_1d(fechas))).values
+    return fechas.astype('datetime64[D]').astype(np.int64)
+
+
+# --- 2. ÍNDICE ---
+
+class IndiceEventos:
+    """
+    Índice de intervalos de eventos por código postal y de festivos de la ciudad.
+
+    Todas las consultas son vectorizadas: reciben arrays de fechas y de
+    id_geografia del mismo tamaño y no iteran por fila en Python.
+    """
+
+    def __init__(self, inicios, fines, id_geografias, nombres, festivos=(), descripciones=None):
+        """
+        Args:
+            inicios, fines (array-like): Fechas de inicio y fin (inclusive) de cada evento.
+            id_geografias (array-like): Código postal de cada evento (como en dim_geografia).
+            nombres (array-like): Nombre de cada evento.
+            festivos (array-like, optional): Días festivos de toda la ciudad.
+            descripciones (array-like, optional): Descripción de cada festivo.
+        """
+        inicio, fin = _a_dias(inicios), _a_dias(fines)
+        id_geografias = np.asarray(id_geografias, dtype=object)
+        nombres = np.asarray(nombres, dtype=object)
+        # Igual que GENERATE_DATE_ARRAY: un rango invertido no produce ningún día
+        validos = (fin >= inicio) & pd.notna(id_geografias)
+        inicio, fin, id_geografias, nombres = inicio[validos], fin[validos], id_geografias[validos], nombres[validos]
+
+        self.geografias = pd.Index(pd.unique(id_geografias)).sort_values()
+        codigo = self.geografias.get_indexer(id_geografias).astype(np.int64)
+        orden = np.lexsort((inicio, codigo))
+        self._codigo, self._inicio, self._fin = codigo[orden], inicio[orden], fin[orden]
+        self._nombre = nombres[orden]
+        self._clave = self._codigo * _ESCALA + self._inicio + _DESPLAZAMIENTO
+        self._duracion_max = int((self._fin - self._inicio).max()) if len(orden) else 0
+
+        # Máximo acumulado del fin dentro de cada código: el desplazamiento por
+        # código impide que el acumulado arrastre valores del código anterior
+        fin_desplazado = self._codigo * _ESCALA + self._fin + _DESPLAZAMIENTO
+        maximo = np.maximum.accumulate(fin_desplazado) if len(orden) else fin_desplazado
+        self._fin_maximo = maximo - self._codigo * _ESCALA - _DESPLAZAMIENTO
+        posiciones = np.arange(len(orden))
+        self._evento_maximo = np.maximum.accumulate(np.where(fin_desplazado == maximo, posiciones, 0)) \
+            if len(orden) else posiciones
+
+        dias_festivos = _a_dias(festivos) if len(festivos) else np.empty(0, dtype=np.int64)
+        descripciones = np.asarray(descripciones if descripciones is not None
+                                   else [None] * len(dias_festivos), dtype=object)
+        dias_festivos, primera = np.unique(dias_festivos, return_index=True)
+        self._festivos, self._descripciones = dias_festivos, descripciones[primera]
+
+    def __len__(self):
+        return len(self._clave)
+
+    # --- Construcción ---
+
+    @classmethod
+    def desde_fuente(cls, fuente):
+        """
+        Lee los rangos de eventos (CTE 1-4 de bq/silver/08) y los festivos.
+
+        Args:
+            fuente (FuenteDatos): BigQuery o DuckDB local (requiere silver_data.dim_geografia).
+        """
+        with open(RUTA_SQL_FIESTAS, encoding='utf-8') as file:
+            sql = file.read()
+        # Se reutilizan las CTE hasta 'eventos_con_id_geo', antes de la expansión por día
+        ctes = re.search(r'\bWITH\b(.*?),\s*-- CTE 5', sql, re.DOTALL)
+        if ctes is None:
+            raise ValueError(f"No se encuentran las CTE de eventos en '{RUTA_SQL_FIESTAS}'")
+        eventos = fuente.consultar(
+            f"WITH {ctes.group(1)}\n"
+            "SELECT nombre_evento, fecha_inicio, fecha_fin, id_geografia FROM eventos_con_id_geo"
+        )
+        festivos = fuente.consultar(
+            f"SELECT Fecha AS fecha, `Descripción` AS descripcion FROM `{PROJECT_ID}.{TABLA_FESTIVOS}` "
+            "WHERE Fecha IS NOT NULL"
+        )
+        return cls(eventos['fecha_inicio'], eventos['fecha_fin'], eventos['id_geografia'], eventos['nombre_evento'],
+                   festivos['fecha'], festivos['descripcion'])
+
+    def guardar(self, ruta=RUTA_INDICE):
+        """Guarda los rangos (sin expandir) y los festivos en un .npz."""
+        temporal = f"{ruta}.tmp.npz"
+        np.savez_compressed(
+            temporal,
+            inicio=self._inicio, fin=self._fin,
+            id_geografia=self.geografias.to_numpy(dtype=str)[self._codigo],
+            nombre=self._nombre.astype(str),
+            festivos=self._festivos,
+            descripciones=np.array(['' if d is None else str(d) for d in self._descripciones], dtype=str),
+        )
+        os.replace(temporal, ruta)
+
+    @classmethod
+    def cargar(cls, ruta=RUTA_INDICE):
+        with np.load(ruta, allow_pickle=False) as datos:
+            return cls(datos['inicio'].astype('datetime64[D]'), datos['fin'].astype('datetime64[D]'),
+                       datos['id_geografia'], datos['nombre'],
+                       datos['festivos'].astype('datetime64[D]'), datos['descripciones'])
+
+    # --- Consultas ---
+
+    def _posiciones(self, dias, id_geografias):
+        """Código de cada consulta (-1 si no tiene eventos) y último evento iniciado (-1 si ninguno)."""
+        codigo = self.geografias.get_indexer(np.asarray(id_geografias, dtype=object)).astype(np.int64)
+        clave = codigo * _ESCALA + dias + _DESPLAZAMIENTO
+        ultimo = np.searchsorted(self._clave, clave, side='right') - 1
+        en_codigo = (codigo >= 0) & (ultimo >= 0)
+        en_codigo[en_codigo] = self._codigo[ultimo[en_codigo]] == codigo[en_codigo]
+        return codigo, np.where(en_codigo, ultimo, -1)
+
+    def _es_festivo_dias(self, dias):
+        if not len(self._festivos):
+            return np.zeros(len(dias), dtype=bool)
+        posicion = np.minimum(np.searchsorted(self._festivos, dias), len(self._festivos) - 1)
+        return self._festivos[posicion] == dias
+
+    def es_festivo(self, fechas):
+        """Array bool: la fecha es festiva en toda la ciudad."""
+        return self._es_festivo_dias(_a_dias(fechas))
+
+    def fechas_festivas(self):
+        return pd.DatetimeIndex(self._festivos.astype('datetime64[D]'))
+
+    def consultar(self, fechas, id_geografias, sin_evento=None):
+        """
+        Features de calendario de eventos para cada par (fecha, código postal).
+
+        Args:
+            fechas (array-like): Fechas de las consultas.
+            id_geografias (array-like): Código postal de cada consulta.
+            sin_evento: Valor de 'nombre_fiesta' cuando no hay evento (None
+                como el NULL del gold; 'Sin fiesta' en los motores de predicción).
+
+        Returns:
+            dict: 'es_festivo', 'es_fiesta_barrio' (bool) y 'nombre_fiesta'
+                (object), un valor por consulta.
+        """
+        dias = _a_dias(fechas)
+        _, ultimo = self._posiciones(dias, id_geografias)
+        activo = ultimo >= 0
+        activo[activo] = self._fin_maximo[ultimo[activo]] >= dias[activo]
+        nombre = np.full(len(dias), sin_evento, dtype=object)
+        nombre[activo] = self._nombre[self._evento_maximo[ultimo[activo]]]
+        return {'es_festivo': self._es_festivo_dias(dias),
+                'es_fiesta_barrio': activo, 'nombre_fiesta': nombre}
+
+    def solapamientos(self, fechas, id_geografias):
+        """
+        Todos los eventos activos en cada par (fecha, código postal).
+
+        Solo se revisan los eventos iniciados como mucho 'duración máxima'
+        días antes de la fecha, así que el coste es proporcional al número
+        de candidatos y no al total de eventos.
+
+        Returns:
+            pd.DataFrame: 'consulta' (posición del par) y 'fecha_inicio',
+                'fecha_fin', 'id_geografia', 'nombre_evento' de cada evento activo.
+        """
+        dias = _a_dias(fechas)
+        codigo, ultimo = self._posiciones(dias, id_geografias)
+        desde = np.searchsorted(self._clave, codigo * _ESCALA + dias - self._duracion_max + _DESPLAZAMIENTO)
+        anchos = np.where(ultimo >= 0, ultimo + 1 - desde, 0)
+        consulta = np.repeat(np.arange(len(dias)), anchos)
+        desplazamiento = np.arange(anchos.sum()) - np.repeat(np.cumsum(anchos) - anchos, anchos)
+        candidato = desde[consulta] + desplazamiento
+        activos = self._fin[candidato] >= dias[consulta]
+        consulta, evento = consulta[activos], candidato[activos]
+        return pd.DataFrame({
+            'consulta': consulta,
+            'fecha_inicio': self._inicio[evento].astype('datetime64[D]'),
+            'fecha_fin': self._fin[evento].astype('datetime64[D]'),
+            'id_geografia': self.geografias.to_numpy()[self._codigo[evento]],
+            'nombre_evento': self._nombre[evento],
+        })
+
+    def anotar(self, df, columna_fecha='fecha', columna_geografia='id_geografia', sin_evento=None):
+        """Devuelve una copia de df con 'es_festivo', 'es_fiesta_barrio' y 'nombre_fiesta'."""
+        eventos = self.consultar(df[columna_fecha].to_numpy(), df[columna_geografia].to_numpy(),
+                                 sin_evento=sin_evento)
+        return df.assign(**eventos)
+
+    def describir(self):
+        if not len(self):
+            return f"0 eventos, {len(self._festivos)} festivos"
+        return (f"{len(self)} eventos en {len(self.geografias)} códigos postales "
+                f"({np.datetime64(int(self._inicio.min()), 'D')} a {np.datetime64(int(self._fin.max()), 'D')}, "
+                f"duración máxima {self._duracion_max + 1} días), {len(self._festivos)} festivos")
+
+
+def cargar_indice(ruta=RUTA_INDICE):
+    """Índice guardado por este script, o None si no existe (las features quedan como 'sin fiesta')."""
+    return IndiceEventos.cargar(ruta) if ruta and os.path.exists(ruta) else None
+
+
+# --- 3. EJECUCIÓN PRINCIPAL ---
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from fuentes_datos import crear_fuente
+
+    parser = argparse.ArgumentParser(description="Construye el índice de festivos y fiestas de barrio")
+    parser.add_argument('--salida', default=RUTA_INDICE, help="Fichero .npz de destino")
+    parser.add_argument('--consultar', nargs=2, metavar=('FECHA', 'ID_GEOGRAFIA'),
+                        help="Consulta un par tras construir el índice")
+    args = parser.parse_args()
+
+    print("--- Construyendo el índice de eventos ---")
+    load_dotenv()
+    try:
+        inicio = time.perf_counter()
+        indice = IndiceEventos.desde_fuente(crear_fuente())
+        indice.guardar(args.salida)
+        print(f"✅ {indice.describir()} en {time.perf_counter() - inicio:.2f} s. Guardado en '{args.salida}'.")
+    except Exception as e:
+        print(f"❌ Error al construir el índice: {e}")
+        exit()
+
+    if args.consultar:
+        fecha, id_geografia = args.consultar
+        eventos = indice.consultar([fecha], [id_geografia])
+        print(f"   - {fecha} / {id_geografia}: festivo={eventos['es_festivo'][0]}, "
+              f"fiesta de barrio={eventos['es_fiesta_barrio'][0]} ({eventos['nombre_fiesta'][0]})")
+        print(indice.solapamientos([fecha], [id_geografia]).drop(columns='consulta').to_string(index=False))
@@ -0,0 +1,265 @@
+# ============================================================================
+# INSTRUMENTACIÓN POR ETAPAS (TIEMPOS, MEMORIA, FILAS Y BYTES)
+# ============================================================================
+# Autor: Julio Clavijo
+# Versión: 1.0
+#
+# Descripción:
+# Hasta ahora el progreso de los scripts eran solo mensajes "Paso N ...".
+# Esta capa ligera registra, para cada etapa (lectura, feature engineering,
+# fit, SHAP, subida, ...):
+#
+#   1. Tiempo de reloj y de CPU, filas y filas/s.
+#   2. Pico de memoria residente (RSS) durante la etapa, muestreado por un
+#      hilo en segundo plano, y bytes de entrada y salida si se conocen.
+#   3. Una línea JSON por etapa en METRICAS_PATH/etapas.jsonl.
+#   4. Un textfile de Prometheus por script (METRICAS_PATH/<script>.prom) para
+#      el textfile collector de node_exporter, reescrito de forma atómica.
+#   5. Con --profile, un perfil de CPU (cProfile) por etapa en
+#      METRICAS_PATH/perfiles/, con su resumen de texto.
+#
+# INSTRUMENTACION=0 desactiva la escritura de ficheros (las etapas siguen
+# midiéndose, pero no se registran).
+# ============================================================================
+
+import os
+import sys
+import json
+import time
+import uuid
+import atexit
+import pstats
+import cProfile
+import argparse
+import threading
+from datetime import datetime, timezone
+
+# --- 1. CONFIGURACIÓN ---
+DIRECTORIO_METRICAS = os.getenv("METRICAS_PATH", 'metricas')
+ACTIVADA = os.getenv("INSTRUMENTACION", '1') == '1'
+INTERVALO_MUESTREO = 0.05  # segundos entre lecturas de RSS
+FICHERO_JSONL = 'etapas.jsonl'
+LINEAS_RESUMEN_PERFIL = 30
+
+METRICAS_PROMETHEUS = [
+    # (nombre, campo, descripción)
+    ('pipeline_etapa_segundos', 'segundos', 'Duración de reloj de la etapa en la última ejecución.'),
+    ('pipeline_etapa_cpu_segundos', 'cpu_segundos', 'Tiempo de CPU del proceso durante la etapa.'),
+    ('pipeline_etapa_filas', 'filas', 'Filas procesadas por la etapa.'),
+    ('pipeline_etapa_filas_por_segundo', 'filas_por_segundo', 'Filas por segundo de reloj.'),
+    ('pipeline_etapa_rss_pico_bytes', 'rss_pico_bytes', 'Pico de memoria residente durante la etapa.'),
+    ('pipeline_etapa_bytes_entrada', 'bytes_entrada', 'Bytes leídos por la etapa.'),
+    ('pipeline_etapa_bytes_salida', 'bytes_salida', 'Bytes escritos por la etapa.'),
+    ('pipeline_etapa_ok', 'ok', '1 si la etapa terminó correctamente, 0 si no.'),
+]
+
+
+# --- 2. MEMORIA ---
+
+def rss_actual():
+    """Memoria residente actual del proceso en bytes (/proc en Linux; pico histórico si no)."""
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico if sys.platform == 'darwin' else pico * 1024  # macOS en bytes, Linux en KB
+    except ImportError:
+        return None
+
+
+# --- 3. ETAPAS ---
+
+class Etapa:
+    """Medición de una etapa en curso. Se cierra con terminar() o al salir del 'with'."""
+
+    def __init__(self, instrumentacion, nombre, filas=None, bytes_entrada=None, bytes_salida=None):
+        self._instrumentacion = instrumentacion
+        self.nombre = nombre
+        self.filas = filas
+        self.bytes_entrada = bytes_entrada
+        self.bytes_salida = bytes_salida
+        self.rss_pico = rss_actual()
+        self.perfil = None
+        self.terminada = False
+        self._fecha_inicio = datetime.now(timezone.utc)
+        self._inicio = time.perf_counter()
+        self._inicio_cpu = time.process_time()
+
+    def registrar_rss(self, rss):
+        if rss is not None and (self.rss_pico is None or rss > self.rss_pico):
+            self.rss_pico = rss
+
+    def terminar(self, filas=None, bytes_entrada=None, bytes_salida=None, ok=True):
+        """Cierra la etapa; los argumentos sustituyen a los valores ya fijados."""
+        if self.terminada:
+            return None
+        self.terminada = True
+        self.filas = filas if filas is not None else self.filas
+        self.bytes_entrada = bytes_entrada if bytes_entrada is not None else self.bytes_entrada
+        self.bytes_salida = bytes_salida if bytes_salida is not None else self.bytes_salida
+        self.registrar_rss(rss_actual())
+        segundos = time.perf_counter() - self._inicio
+        registro = {
+            'script': self._instrumentacion.script,
+            'ejecucion': self._instrumentacion.ejecucion,
+            'etapa': self.nombre,
+            'inicio': self._fecha_inicio.isoformat(timespec='milliseconds'),
+            'segundos': round(segundos, 6),
+            'cpu_segundos': round(time.process_time() - self._inicio_cpu, 6),
+            'filas': self.filas,
+            'filas_por_segundo': round(self.filas / segundos, 1) if self.filas is not None and segundos else None,
+            'rss_pico_bytes': self.rss_pico,
+            'bytes_entrada': self.bytes_entrada,
+            'bytes_salida': self.bytes_salida,
+            'ok': ok,
+        }
+        self._instrumentacion._cerrar_etapa(self, registro)
+        return registro
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        self.terminar(ok=tipo is None)
+        return False
+
+
+class Instrumentacion:
+    """
+    Registro de las etapas de una ejecución de un script.
+
+    Uso en scripts con bloques:
+        with inst.etapa('lectura') as e:
+            df = ...
+            e.filas = len(df)
+    Uso en scripts planos (con exit() en los errores):
+        e = inst.iniciar('lectura'); ...; e.terminar(filas=len(df))
+
+    Las etapas que siguen abiertas al salir del proceso se registran con ok=False.
+    """
+
+    def __init__(self, script, directorio=DIRECTORIO_METRICAS, perfil=False, activada=ACTIVADA):
+        self.script = script
+        self.directorio = directorio
+        self.perfil = perfil
+        self.activada = activada
+        self.ejecucion = uuid.uuid4().hex[:12]
+        self.registros = []
+        self._abiertas = []
+        self._bloqueo = threading.Lock()
+        self._parar = threading.Event()
+        self._muestreo = threading.Thread(target=self._muestrear, daemon=True)
+        self._muestreo.start()
+        atexit.register(self.cerrar)
+
+    def _muestrear(self):
+        while not self._parar.wait(INTERVALO_MUESTREO):
+            with self._bloqueo:
+                abiertas = list(self._abiertas)
+            if abiertas:
+                rss = rss_actual()
+                for etapa in abiertas:
+                    etapa.registrar_rss(rss)
+
+    def iniciar(self, nombre, **medidas):
+        """Abre una etapa. Con --profile se perfila si no hay otra etapa perfilándose."""
+        etapa = Etapa(self, nombre, **medidas)
+        with self._bloqueo:
+            perfilando = any(e.perfil is not None for e in self._abiertas)
+            self._abiertas.append(etapa)
+        if self.perfil and not perfilando:
+            etapa.perfil = cProfile.Profile()
+            etapa.perfil.enable()
+        return etapa
+
+    def etapa(self, nombre, **medidas):
+        return self.iniciar(nombre, **medidas)
+
+    def _cerrar_etapa(self, etapa, registro):
+        with self._bloqueo:
+            if etapa in self._abiertas:
+                self._abiertas.remove(etapa)
+            self.registros.append(registro)
+        if etapa.perfil is not None:
+            etapa.perfil.disable()
+            registro['perfil'] = self._guardar_perfil(etapa)
+        if self.activada:
+            os.makedirs(self.directorio, exist_ok=True)
+            with open(os.path.join(self.directorio, FICHERO_JSONL), 'a', encoding='utf-8') as file:
+                file.write(json.dumps(registro, ensure_ascii=False) + '\n')
+            self.escribir_prometheus()
+
+    def _guardar_perfil(self, etapa):
+        if not self.activada:
+            return None
+        directorio = os.path.join(self.directorio, 'perfiles')
+        os.makedirs(directorio, exist_ok=True)
+        base = os.path.join(directorio, f"{self.script}-{etapa.nombre.replace('/', '_')}-{self.ejecucion}")
+        etapa.perfil.dump_stats(f"{base}.prof")
+        with open(f"{base}.txt", 'w', encoding='utf-8') as file:
+            pstats.Stats(etapa.perfil, stream=file).sort_stats('cumulative').print_stats(LINEAS_RESUMEN_PERFIL)
+        return f"{base}.prof"
+
+    def escribir_prometheus(self):
+        """Reescribe METRICAS_PATH/<script>.prom con la última medición de cada etapa."""
+        ultimas = {}
+        for registro in self.registros:
+            ultimas[registro['etapa']] = registro
+        lineas = []
+        for nombre, campo, descripcion in METRICAS_PROMETHEUS:
+            lineas += [f"# HELP {nombre} {descripcion}", f"# TYPE {nombre} gauge"]
+            for etapa, registro in ultimas.items():
+                valor = registro[campo]
+                if valor is not None:
+                    etiquetas = f'script="{self.script}",etapa="{etapa}"'
+                    lineas.append(f"{nombre}{{{etiquetas}}} {float(valor):.6g}")
+        lineas += ["# HELP pipeline_ultima_ejecucion_timestamp_seconds Fin de la última etapa registrada.",
+                   "# TYPE pipeline_ultima_ejecucion_timestamp_seconds gauge",
+                   f'pipeline_ultima_ejecucion_timestamp_seconds{{script="{self.script}"}} {time.time():.3f}']
+        ruta = os.path.join(self.directorio, f"{self.script}.prom")
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as file:
+            file.write('\n'.join(lineas) + '\n')
+        os.replace(temporal, ruta)
+
+    def resumen(self):
+        """Tabla de texto con las etapas registradas."""
+        lineas = [f"{'etapa':<32} {'segundos':>9} {'filas':>12} {'filas/s':>12} {'RSS pico MB':>12}"]
+        for r in self.registros:
+            filas = f"{r['filas']:,}" if r['filas'] is not None else '-'
+            velocidad = f"{r['filas_por_segundo']:,.0f}" if r['filas_por_segundo'] is not None else '-'
+            rss = f"{r['rss_pico_bytes'] / 1e6:,.0f}" if r['rss_pico_bytes'] is not None else '-'
+            lineas.append(f"{r['etapa']:<32} {r['segundos']:>9.2f} {filas:>12} {velocidad:>12} {rss:>12}"
+                          + ('' if r['ok'] else '  (incompleta)'))
+        return '\n'.join(lineas)
+
+    def cerrar(self):
+        """Registra como fallidas las etapas abiertas y detiene el muestreo."""
+        with self._bloqueo:
+            abiertas = list(reversed(self._abiertas))
+        for etapa in abiertas:
+            etapa.terminar(ok=False)
+        self._parar.set()
+
+
+# --- 4. INTEGRACIÓN CON LOS SCRIPTS ---
+
+def agregar_argumentos(parser):
+    parser.add_argument('--profile', action='store_true',
+                        help="Guarda un perfil de CPU (cProfile) por etapa en METRICAS_PATH/perfiles/")
+
+
+def crear_instrumentacion(script, args=None):
+    """
+    Instrumentación de un script. Con args (argparse) se usa su --profile; sin
+    él, se busca --profile en sys.argv (scripts sin argparse).
+    """
+    if args is None:
+        lector = argparse.ArgumentParser(add_help=False)
+        agregar_argumentos(lector)
+        args, _ = lector.parse_known_args()
+    return Instrumentacion(script, perfil=getattr(args, 'profile', False))
@@ -0,0 +1,335 @@
+# ============================================================================
+# ORGANIZACIÓN DEL LAGO DE DATOS LOCAL (PARTICIONES HIVE + COMPACTACIÓN)
+# ============================================================================
+# Autor: Julio Clavijo
+# Versión: 1.0
+#
+# Descripción:
+# Las extracciones crudas se guardaban como un único Parquet monolítico
+# ('clima_historico_2021-2025.parquet', 'catalunya_clima_barcelona_2022-
+# presente_COMPLETO.parquet'), y las cargas incrementales generarían muchos
+# ficheros pequeños. Este módulo mantiene cada fuente como un dataset Hive:
+#
+#   <raiz>/bronze_data/<fuente>/anio=YYYY/mes=M[/<estación>=X]/part-*.parquet
+#
+#   1. Cada fichero se escribe ordenado (estación, fecha) en grupos de filas
+#      con estadísticas min/max, de modo que los lectores podan por
+#      partición (año, mes, estación) y por grupo de filas (fecha).
+#   2. La compactación fusiona los ficheros pequeños de cada partición en un
+#      único fichero ordenado, con grupos de FILAS_POR_GRUPO filas y sin
+#      duplicados por la clave de la fuente. Se puede lanzar como proceso
+#      periódico (--cada) o como hilo en segundo plano.
+#
+# La raíz (LAGO_DATOS_PATH, o DATOS_LOCALES_PATH) es la misma que usa
+# FuenteDuckDB: cada fuente aparece como la vista bronze_data.<fuente>.
+# ============================================================================
+
+import os
+import time
+import uuid
+import argparse
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# --- 1. CONFIGURACIÓN ---
+RAIZ_LAGO = os.getenv("LAGO_DATOS_PATH") or os.getenv("DATOS_LOCALES_PATH") or 'datos_locales'
+DATASET_BRONZE = 'bronze_data'
+FILAS_POR_GRUPO = 128_000             # filas por grupo de filas tras compactar
+BYTES_FICHERO_PEQUENO = 32 * 1024**2  # ficheros por debajo de este tamaño se compactan
+COMPRESION = 'zstd'
+
+# Por fuente: columna de fecha, partición bajo anio/mes, orden dentro del
+# fichero y clave para eliminar duplicados al compactar
+FUENTES = {
+    'raw_clima_historico': {                 # Meteocat, lecturas horarias por estación
+        'fecha': 'data_lectura', 'estacion': 'codi_estacio',
+        'orden': ['data_lectura', 'codi_variable'],
+        'clave': ['data_lectura', 'codi_estacio', 'codi_variable'],
+    },
+    'raw_clima_aemet': {                     # AEMET, valores diarios por estación
+        'fecha': 'fecha', 'estacion': 'indicativo',
+        'orden': ['fecha'],
+        'clave': ['fecha', 'indicativo'],
+    },
+    'raw_consumo_electrico': {               # Open Data BCN, consumo diario por CP, sector y tramo
+        'fecha': 'Data', 'estacion': None,
+        'orden': ['Data', 'Codi_Postal', 'Sector_Economic', 'Tram_Horari'],
+        'clave': ['Data', 'Codi_Postal', 'Sector_Economic', 'Tram_Horari'],
+    },
+}
+
+
+# --- 2. FUNCIONES AUXILIARES ---
+
+def ruta_fuente(fuente, raiz=RAIZ_LAGO):
+    return os.path.join(raiz, DATASET_BRONZE, fuente)
+
+
+def columnas_particion(fuente):
+    config = FUENTES[fuente]
+    return ['anio', 'mes'] + ([config['estacion']] if config['estacion'] else [])
+
+
+def _esquema_particion(fuente):
+    campos = [('anio', pa.int32()), ('mes', pa.int32())]
+    if FUENTES[fuente]['estacion']:
+        campos.append((FUENTES[fuente]['estacion'], pa.string()))
+    return pa.schema(campos)
+
+
+def _con_anio_mes(tabla, columna_fecha):
+    """Añade anio/mes a partir de la columna de fecha (texto ISO, fecha o timestamp)."""
+    fechas = tabla.column(columna_fecha)
+    if pa.types.is_string(fechas.type) or pa.types.is_large_string(fechas.type):
+        fechas = pa.array(pd.to_datetime(fechas.to_numpy(zero_copy_only=False)))
+    return (tabla.append_column('anio', pc.cast(pc.year(fechas), pa.int32()))
+                 .append_column('mes', pc.cast(pc.month(fechas), pa.int32())))
+
+
+def _ordenar(tabla, fuente):
+    config = FUENTES[fuente]
+    orden = ([config['estacion']] if config['estacion'] else []) + config['orden']
+    return tabla.sort_by([(c, 'ascending') for c in orden if c in tabla.column_names])
+
+
+def _escribir_fichero(tabla, directorio, filas_por_grupo=FILAS_POR_GRUPO, sufijo=''):
+    """Escribe un fichero con estadísticas min/max por grupo de filas (renombrado atómico)."""
+    os.makedirs(directorio, exist_ok=True)
+    # El nombre empieza por el instante en ns: el orden alfabético es el orden de escritura
+    nombre = f"part-{time.time_ns()}-{uuid.uuid4().hex[:8]}{sufijo}.parquet"
+    temporal = os.path.join(directorio, f".{nombre}.tmp")  # los lectores ignoran los ficheros con '.'
+    pq.write_table(tabla, temporal, row_group_size=filas_por_grupo, compression=COMPRESION,
+                   write_statistics=True)
+    os.replace(temporal, os.path.join(directorio, nombre))
+    return os.path.join(directorio, nombre)
+
+
+def _particiones(tabla, fuente):
+    """Divide una tabla (con anio/mes) en {ruta relativa de partición: subtabla sin esas columnas}."""
+    columnas = columnas_particion(fuente)
+    claves = tabla.select(columnas).to_pandas()
+    resultado = {}
+    for valores, indices in claves.groupby(columnas, sort=True, dropna=False).indices.items():
+        valores = valores if isinstance(valores, tuple) else (valores,)
+        relativa = os.path.join(*[f"{c}={v}" for c, v in zip(columnas, valores)])
+        resultado[relativa] = tabla.take(pa.array(indices)).drop(columnas)
+    return resultado
+
+
+def _ficheros(directorio):
+    return sorted(os.path.join(directorio, f) for f in os.listdir(directorio)
+                  if f.endswith('.parquet') and not f.startswith(('.', '_')))
+
+
+# --- 3. ESCRITURA Y LECTURA ---
+
+def escribir(datos, fuente, raiz=RAIZ_LAGO, reemplazar=False, filas_por_grupo=FILAS_POR_GRUPO):
+    """
+    Añade una extracción al dataset de la fuente, un fichero ordenado por
+    partición tocada.
+
+    Args:
+        datos (pd.DataFrame | pa.Table): Filas crudas de la fuente.
+        fuente (str): Clave de FUENTES.
+        reemplazar (bool): Sustituir por completo las particiones tocadas (para
+            extracciones que vuelven a descargar todo el periodo).
+
+    Returns:
+        dict: Particiones, ficheros y filas escritas.
+    """
+    if isinstance(datos, pd.DataFrame):
+        datos = pa.Table.from_pandas(datos, preserve_index=False)
+    config = FUENTES[fuente]
+    tabla = _con_anio_mes(datos, config['fecha'])
+    base = ruta_fuente(fuente, raiz)
+    escritos = []
+    for relativa, subtabla in _particiones(tabla, fuente).items():
+        directorio = os.path.join(base, relativa)
+        anteriores = _ficheros(directorio) if reemplazar and os.path.isdir(directorio) else []
+        escritos.append(_escribir_fichero(_ordenar(subtabla, fuente), directorio, filas_por_grupo))
+        for fichero in anteriores:
+            os.remove(fichero)
+    return {'particiones': len(escritos), 'ficheros': escritos, 'filas': datos.num_rows}
+
+
+def leer(fuente, raiz=RAIZ_LAGO, desde=None, hasta=None, estaciones=None, columnas=None):
+    """
+    Lee un dataset del lago podando por partición (anio/mes/estación) y por
+    las estadísticas min/max de la columna de fecha en cada grupo de filas.
+
+    Returns:
+        pa.Table
+    """
+    config = FUENTES[fuente]
+    dataset = ds.dataset(ruta_fuente(fuente, raiz), format='parquet',
+                         partitioning=ds.partitioning(_esquema_particion(fuente), flavor='hive'))
+    filtro = None
+    columna_fecha = ds.field(config['fecha'])
+    tipo_fecha = dataset.schema.field(config['fecha']).type
+
+    def _valor(fecha, fin=False):
+        fecha = pd.Timestamp(fecha)
+        if pa.types.is_string(tipo_fecha) or pa.types.is_large_string(tipo_fecha):
+            # Texto ISO: el orden lexicográfico coincide con el cronológico
+            return (fecha + pd.Timedelta(days=1)).strftime('%Y-%m-%d') if fin else fecha.strftime('%Y-%m-%d')
+        return pa.scalar(fecha + pd.Timedelta(days=1) if fin else fecha).cast(tipo_fecha)
+
+    condiciones = []
+    if desde is not None:
+        inicio = pd.Timestamp(desde)
+        condiciones += [(ds.field('anio') > inicio.year) | ((ds.field('anio') == inicio.year) &
+                                                            (ds.field('mes') >= inicio.month)),
+                        columna_fecha >= _valor(desde)]
+    if hasta is not None:
+        fin = pd.Timestamp(hasta)
+        condiciones += [(ds.field('anio') < fin.year) | ((ds.field('anio') == fin.year) &
+                                                         (ds.field('mes') <= fin.month)),
+                        columna_fecha < _valor(hasta, fin=True)]
+    if estaciones is not None and config['estacion']:
+        condiciones.append(ds.field(config['estacion']).isin(list(estaciones)))
+    for condicion in condiciones:
+        filtro = condicion if filtro is None else filtro & condicion
+    return dataset.to_table(columns=columnas, filter=filtro)
+
+
+# --- 4. COMPACTACIÓN ---
+
+def compactar_particion(directorio, fuente, filas_por_grupo=FILAS_POR_GRUPO,
+                        bytes_pequeno=BYTES_FICHERO_PEQUENO):
+    """
+    Fusiona los ficheros de una partición en uno solo, ordenado y sin
+    duplicados por la clave de la fuente (se conserva la última versión).
+    Solo actúa si hay más de un fichero y alguno es pequeño, o si hay
+    grupos de filas menores que el objetivo.
+
+    Returns:
+        dict | None: Ficheros y filas antes/después, o None si no hacía falta.
+    """
+    ficheros = _ficheros(directorio)
+    if not ficheros:
+        return None
+    pequenos = [f for f in ficheros if os.path.getsize(f) < bytes_pequeno]
+    grupos = sum(pq.ParquetFile(f).metadata.num_row_groups for f in ficheros)
+    filas = sum(pq.ParquetFile(f).metadata.num_rows for f in ficheros)
+    grupos_objetivo = max(1, -(-filas // filas_por_grupo))
+    if (len(ficheros) < 2 or not pequenos) and grupos <= grupos_objetivo:
+        return None
+
+    # Bloqueo por partición: dos compactaciones no pueden reescribir la misma
+    bloqueo = os.path.join(directorio, '.compactando')
+    try:
+        descriptor = os.open(bloqueo, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return None
+    try:
+        # Ficheros en orden de escritura: ante claves repetidas gana el más reciente
+        tabla = pa.concat_tables([pq.read_table(f).append_column(
+            '_orden', pa.array(np.full(pq.ParquetFile(f).metadata.num_rows, i, dtype=np.int32)))
+            for i, f in enumerate(ficheros)], promote_options='default')
+        clave = [c for c in FUENTES[fuente]['clave'] if c in tabla.column_names]
+        antes = tabla.num_rows
+        if clave:
+            df_clave = tabla.select(clave + ['_orden']).to_pandas()
+            ultimas = ~df_clave.iloc[::-1].duplicated(clave).iloc[::-1].to_numpy()
+            tabla = tabla.filter(pa.array(ultimas))
+        tabla = _ordenar(tabla.drop(['_orden']), fuente)
+        nuevo = _escribir_fichero(tabla, directorio, filas_por_grupo, sufijo='-c')
+        # Ventana mínima entre el renombrado del nuevo fichero y el borrado de los antiguos
+        for fichero in ficheros:
+            os.remove(fichero)
+    finally:
+        os.close(descriptor)
+        os.remove(bloqueo)
+    return {'particion': directorio, 'ficheros_antes': len(ficheros), 'filas_antes': antes,
+            'filas_despues': tabla.num_rows, 'fichero': nuevo}
+
+
+def compactar(raiz=RAIZ_LAGO, fuentes=None, filas_por_grupo=FILAS_POR_GRUPO, bytes_pequeno=BYTES_FICHERO_PEQUENO):
+    """Compacta todas las particiones de las fuentes indicadas (todas por defecto)."""
+    resultados = []
+    for fuente in fuentes or FUENTES:
+        base = ruta_fuente(fuente, raiz)
+        for directorio, subdirectorios, _ in os.walk(base):
+            if subdirectorios:
+                continue  # solo las hojas contienen ficheros de datos
+            resultado = compactar_particion(directorio, fuente, filas_por_grupo, bytes_pequeno)
+            if resultado:
+                resultados.append(resultado)
+    return resultados
+
+
+def iniciar_compactacion_periodica(cada_segundos, raiz=RAIZ_LAGO, fuentes=None):
+    """
+    Lanza la compactación en un hilo en segundo plano cada 'cada_segundos'.
+
+    Returns:
+        threading.Event: Al activarlo (set()) el hilo termina tras la pasada en curso.
+    """
+    parar = threading.Event()
+
+    def _bucle():
+        while not parar.is_set():
+            compactar(raiz, fuentes)
+            parar.wait(cada_segundos)
+
+    threading.Thread(target=_bucle, name='compactacion_lago', daemon=True).start()
+    return parar
+
+
+def describir(raiz=RAIZ_LAGO):
+    """DataFrame con particiones, ficheros, grupos de filas, filas y MB por fuente."""
+    filas = []
+    for fuente in FUENTES:
+        base = ruta_fuente(fuente, raiz)
+        if not os.path.isdir(base):
+            continue
+        for directorio, subdirectorios, _ in os.walk(base):
+            ficheros = [] if subdirectorios else _ficheros(directorio)
+            for fichero in ficheros:
+                metadatos = pq.ParquetFile(fichero).metadata
+                filas.append({'fuente': fuente, 'particion': os.path.relpath(directorio, base),
+                              'grupos': metadatos.num_row_groups, 'filas': metadatos.num_rows,
+                              'mb': os.path.getsize(fichero) / 1e6})
+    if not filas:
+        return pd.DataFrame(columns=['fuente', 'particiones', 'ficheros', 'grupos', 'filas', 'mb'])
+    detalle = pd.DataFrame(filas)
+    return detalle.groupby('fuente').agg(particiones=('particion', 'nunique'), ficheros=('particion', 'size'),
+                                         grupos=('grupos', 'sum'), filas=('filas', 'sum'),
+                                         mb=('mb', 'sum')).reset_index()
+
+
+# --- 5. EJECUCIÓN PRINCIPAL ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lago de datos local: carga de extracciones y compactación")
+    parser.add_argument('--raiz', default=RAIZ_LAGO, help="Raíz del lago (LAGO_DATOS_PATH)")
+    parser.add_argument('--cargar', nargs=2, metavar=('FUENTE', 'PARQUET'),
+                        help="Añade un Parquet monolítico al dataset de la fuente")
+    parser.add_argument('--reemplazar', action='store_true', help="Con --cargar, sustituye las particiones tocadas")
+    parser.add_argument('--compactar', action='store_true', help="Compacta los ficheros pequeños")
+    parser.add_argument('--cada', type=int, help="Con --compactar, repite cada N segundos")
+    args = parser.parse_args()
+
+    if args.cargar:
+        fuente, ruta = args.cargar
+        resumen = escribir(pq.read_table(ruta), fuente, args.raiz, reemplazar=args.reemplazar)
+        print(f"✅ {resumen['filas']:,} filas de '{ruta}' en {resumen['particiones']} particiones de '{fuente}'.")
+
+    if args.compactar:
+        while True:
+            inicio = time.perf_counter()
+            resultados = compactar(args.raiz)
+            print(f"✅ Compactación: {len(resultados)} particiones reescritas "
+                  f"({sum(r['ficheros_antes'] for r in resultados)} ficheros -> {len(resultados)}, "
+                  f"{sum(r['filas_antes'] - r['filas_despues'] for r in resultados)} duplicados eliminados) "
+                  f"en {time.perf_counter() - inicio:.2f} s.")
+            if not args.cada:
+                break
+            time.sleep(args.cada)
+
+    print(describir(args.raiz).to_string(index=False, float_format=lambda x: f"{x:,.2f}"))
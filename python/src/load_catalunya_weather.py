@@ -23,8 +23,13 @@ import pandas as pd  # La librería fundamental para la manipulación de datos e
 from datetime import datetime  # Para manejar fechas y horas de forma sencilla.
 import time  # Utilizada para añadir pausas entre llamadas a la API.
 import os  # Permite interactuar con el sistema operativo, como leer variables de entorno.
+import argparse  # Para leer las opciones de la línea de comandos (p. ej. --silver).
 from google.cloud import storage  # La librería oficial de Google para interactuar con Cloud Storage.
 from dotenv import load_dotenv  # Herramienta para cargar secretos desde un archivo .env.
+from clima_silver import construir_clima_silver, cargar_en_bigquery  # Pivote vectorizado listo para silver.
+from calidad_datos import validar, describir_validacion, REGLAS_CLIMA_BRONZE  # Reglas de calidad de datos.
+from lago_datos import escribir as escribir_en_lago  # Lago local particionado (año/mes/estación).
+from instrumentacion import agregar_argumentos, crear_instrumentacion  # Tiempos, memoria y bytes por etapa.
 
 # --- 1. CONFIGURACIÓN GLOBAL Y PARÁMETROS ---
 # En esta sección se definen todas las variables que controlan el comportamiento del script.
@@ -40,6 +45,7 @@ load_dotenv()
 CATALUNYA_APP_TOKEN = os.getenv("CATALUNYA_APP_TOKEN")
 GCP_KEY_PATH = os.getenv("GCP_SERVICE_ACCOUNT_KEY_PATH")
 GCS_BUCKET_NAME = "dm-bi-project-raw-data" # Nombre del bucket en GCS donde se guardarán los datos.
+PROJECT_ID = "datamanagementbi" # Proyecto de BigQuery donde se carga la tabla silver (opción --silver).
 
 # --- Parámetros de la Extracción ---
 # Se define una lista con los identificadores de las estaciones de Barcelona
@@ -91,11 +97,13 @@ def fetch_catalunya_weather(start_date, station_codes, variables, app_token):
 
     Returns:
         pd.DataFrame: Un DataFrame de Pandas con todos los datos combinados, o un DataFrame vacío si falla.
+            Los bytes descargados de la API quedan en df.attrs['bytes_descargados'].
     """
     print("--- INICIANDO EXTRACCIÓN COMPLETA (CON PAGINACIÓN) ---")
     
     # Se crea una lista vacía que acumulará los datos de todas las estaciones y todas las páginas.
     all_stations_data = []
+    bytes_descargados = 0
     
     # Se itera sobre cada estación para procesarlas individualmente.
     for station_code in station_codes:
@@ -134,6 +142,7 @@ def fetch_catalunya_weather(start_date, station_codes, variables, app_token):
                 response = requests.get(RESOURCE_URL, params=params, timeout=900)
                 response.raise_for_status() # Lanza un error si el código de estado no es 2xx.
                 data_page = response.json() # Convierte la respuesta en una lista de diccionarios Python.
+                bytes_descargados += len(response.content)
                 
                 # --- Lógica para detener el bucle ---
                 if not data_page:
@@ -167,7 +176,9 @@ def fetch_catalunya_weather(start_date, station_codes, variables, app_token):
         
     print(f"\n--- EXTRACCIÓN COMPLETADA --- Total de registros obtenidos: {len(all_stations_data)}")
     # Se convierte la lista final de diccionarios en un DataFrame de Pandas para su manipulación.
-    return pd.DataFrame(all_stations_data)
+    df = pd.DataFrame(all_stations_data)
+    df.attrs['bytes_descargados'] = bytes_descargados
+    return df
 
 
 def upload_df_to_gcs(df, bucket_name, destination_blob_name):
@@ -178,6 +189,9 @@ def upload_df_to_gcs(df, bucket_name, destination_blob_name):
         df (pd.DataFrame): El DataFrame a subir.
         bucket_name (str): El nombre del bucket de destino en GCS.
         destination_blob_name (str): La ruta y nombre del archivo a crear en el bucket (ej. 'carpeta/archivo.parquet').
+
+    Returns:
+        int: Tamaño en bytes del Parquet subido.
     """
     # El formato Parquet es columnar y comprimido, ideal para analítica y mucho más eficiente que CSV.
     temp_file_path = "temp_catalunya_data.parquet"
@@ -193,16 +207,30 @@ def upload_df_to_gcs(df, bucket_name, destination_blob_name):
     print(f"Archivo '{destination_blob_name}' subido con éxito al bucket '{bucket_name}'.")
     
     # Se elimina el archivo temporal para mantener limpio el entorno de ejecución.
+    tamano = os.path.getsize(temp_file_path)
     os.remove(temp_file_path)
+    return tamano
 
 # --- 3. EJECUCIÓN PRINCIPAL DEL SCRIPT ---
 # El bloque `if __name__ == "__main__":` es una convención en Python.
 # Asegura que el código dentro de este bloque solo se ejecute cuando el archivo
 # es llamado directamente desde la terminal, y no cuando es importado por otro script.
 if __name__ == "__main__":
+
+    # Con --silver, además de los datos crudos se genera y carga la tabla silver de clima por tramo,
+    # de modo que el script 'bq/silver/07_silver_fact_clima_horario.sql' ya no tiene que ejecutarse.
+    parser = argparse.ArgumentParser(description="Extracción de datos meteorológicos de Catalunya")
+    parser.add_argument('--silver', action='store_true',
+                        help="Genera también silver_data.fact_clima_horario (por estación-hora y por tramo)")
+    agregar_argumentos(parser)
+    args = parser.parse_args()
+    # Cada paso se registra como etapa en metricas/ (y con --profile, con su perfil de CPU).
+    instrumentacion = crear_instrumentacion('load_catalunya_weather', args)
     
     # Paso 1: Orquestar la extracción de datos llamando a la función principal.
-    weather_df = fetch_catalunya_weather(START_DATE, ESTACIONES_BARCELONA, VARIABLES_DE_INTERES, CATALUNYA_APP_TOKEN)
+    with instrumentacion.etapa('extraccion') as etapa:
+        weather_df = fetch_catalunya_weather(START_DATE, ESTACIONES_BARCELONA, VARIABLES_DE_INTERES, CATALUNYA_APP_TOKEN)
+        etapa.filas, etapa.bytes_entrada = len(weather_df), weather_df.attrs.get('bytes_descargados')
     
     # Paso 2: Ejecutar la transformación y carga solo si la extracción fue exitosa.
     if not weather_df.empty:
@@ -211,18 +239,55 @@ if __name__ == "__main__":
         
         # Paso 2.1: Enriquecer los datos. Se crean nuevas columnas con los nombres legibles
         # a partir de los códigos, usando los diccionarios de metadatos.
-        weather_df['nom_estacio'] = weather_df['codi_estacio'].map(DICCIONARIO_ESTACIONES)
-        weather_df['nom_variable'] = weather_df['codi_variable'].map(DICCIONARIO_VARIABLES)
+        with instrumentacion.etapa('enriquecimiento', filas=len(weather_df)):
+            weather_df['nom_estacio'] = weather_df['codi_estacio'].map(DICCIONARIO_ESTACIONES)
+            weather_df['nom_variable'] = weather_df['codi_variable'].map(DICCIONARIO_VARIABLES)
         
         print("Datos enriquecidos. Columnas añadidas: 'nom_estacio', 'nom_variable'.")
+
+        # Paso 2.2: Comprobar la calidad de las lecturas en una sola pasada (valores no numéricos,
+        # estaciones o variables desconocidas, lecturas duplicadas). Solo se informa: las lecturas
+        # se suben igualmente y el paso a silver descarta los valores no numéricos.
+        with instrumentacion.etapa('validacion', filas=len(weather_df)):
+            validacion = validar(weather_df, REGLAS_CLIMA_BRONZE)
+        print("\n" + describir_validacion(validacion, "lecturas de la API"))
         
         # Paso 3: Definir un nombre único y descriptivo para el archivo en GCS.
         # Incluir fechas en el nombre es una buena práctica para el versionado.
         blob_name = f"api_raw_data/catalunya_clima_barcelona_{START_DATE.year}-presente_COMPLETO.parquet"
         
         # Paso 4: Orquestar la carga llamando a la función de subida.
-        upload_df_to_gcs(weather_df, GCS_BUCKET_NAME, blob_name)
+        with instrumentacion.etapa('subida_gcs', filas=len(weather_df)) as etapa:
+            etapa.bytes_salida = upload_df_to_gcs(weather_df, GCS_BUCKET_NAME, blob_name)
+
+        # Paso 4.1 (opcional): Si está configurado el lago local (LAGO_DATOS_PATH), se guardan también las
+        # lecturas particionadas por año/mes/estación. Como la extracción vuelve a descargar todo el
+        # periodo, se sustituyen las particiones tocadas en lugar de añadir ficheros.
+        if os.getenv("LAGO_DATOS_PATH"):
+            with instrumentacion.etapa('lago', filas=len(weather_df)):
+                resumen = escribir_en_lago(weather_df, 'raw_clima_historico', os.getenv("LAGO_DATOS_PATH"), reemplazar=True)
+            print(f"Lecturas guardadas en el lago local ({resumen['particiones']} particiones).")
+
+        # Paso 5 (opcional): Construir las tablas listas para silver en el propio paso de ingesta.
+        # El pivote por estación y hora y la asignación de tramos se hacen de forma vectorizada
+        # (ver clima_silver.py), evitando en el almacén el escaneo de todas las lecturas crudas
+        # y el JOIN por rango contra dim_tramo_horario.
+        if args.silver:
+            print("\n--- CONSTRUYENDO LAS TABLAS DE CLIMA LISTAS PARA SILVER ---")
+            with instrumentacion.etapa('silver', filas=len(weather_df)) as etapa:
+                clima_estacion_df, clima_tramo = construir_clima_silver(weather_df)
+                etapa.bytes_salida = (
+                    upload_df_to_gcs(clima_estacion_df, GCS_BUCKET_NAME, "silver_ready/clima_horario_por_estacion.parquet")
+                    + upload_df_to_gcs(clima_tramo.to_pandas(), GCS_BUCKET_NAME, "silver_ready/fact_clima_horario.parquet"))
+
+                # Se carga la tabla por tramo en BigQuery con las mismas credenciales que GCS.
+                from google.oauth2 import service_account
+                credenciales = service_account.Credentials.from_service_account_file(GCP_KEY_PATH)
+                filas = cargar_en_bigquery(clima_tramo, PROJECT_ID, credenciales)
+            print(f"Tabla 'silver_data.fact_clima_horario' cargada con {filas} filas.")
         
+        instrumentacion.cerrar()
+        print(f"\nEtapas ({instrumentacion.directorio}/):\n{instrumentacion.resumen()}")
         print("\n--- PROCESO FINALIZADO CON ÉXITO ---")
         
     else:
@@ -0,0 +1,264 @@
+# ============================================================================
+# MATERIALIZACIÓN INCREMENTAL DE LAS TABLAS GOLD
+# ============================================================================
+# Autor: Julio Clavijo
+# Versión: 1.0
+#
+# Descripción:
+# '06_silver_fact_consumo_horario.sql', '08_gold_modelo_final.sql' y
+# '09_gold_modelo_final_v2.sql' reconstruyen la tabla completa (CREATE OR
+# REPLACE) sobre todo el histórico. Este script reutiliza la misma SELECT de
+# cada fichero y, cuando la tabla ya existe, solo reescribe las particiones
+# 'fecha' afectadas:
+#
+#   1. Silver (fact_consumo_horario): se reescriben las fechas desde la última
+#      partición menos DIAS_REVISION días (o desde --desde) en adelante. Del
+#      bronze solo se leen las tablas anuales (raw_consumo_electrico_AAAA) de
+#      los años de esa ventana, no todo el histórico.
+#   2. Gold: las fechas afectadas son las de silver_data.fact_consumo_horario
+#      posteriores a la última partición de gold_data.modelo_final menos
+#      DIAS_REVISION días, o la ventana --desde/--hasta indicada.
+#   3. Para cada tabla, en una transacción: DELETE de esas fechas e INSERT de
+#      la SELECT filtrada a esas fechas. Como silver y gold están
+#      particionadas por fecha, solo se escanean esos días.
+#
+# Límite: los datos que llegan con más de DIAS_REVISION días de retraso
+# (por defecto 3; --dias-revision o MATERIALIZACION_DIAS_REVISION) no se
+# recogen en el refresco automático: hay que reescribirlos con --desde.
+# Los cambios en las dimensiones (calendario, geografía, población, fiestas)
+# afectan a todo el histórico: para ellos se usa --completo.
+# ============================================================================
+
+import os
+import re
+import time
+import argparse
+
+import pandas as pd
+
+from fuentes_datos import PROJECT_ID, crear_fuente
+
+# --- 1. CONFIGURACIÓN ---
+RUTA_BQ = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'bq')
+RUTA_SILVER = os.path.join(RUTA_BQ, 'silver')
+RUTA_GOLD = os.path.join(RUTA_BQ, 'gold')
+SCRIPTS_SILVER = ['06_silver_fact_consumo_horario.sql']
+SCRIPTS_GOLD = ['08_gold_modelo_final.sql', '09_gold_modelo_final_v2.sql']
+TABLA_ORIGEN = 'silver_data.fact_consumo_horario'
+DIAS_REVISION = int(os.getenv("MATERIALIZACION_DIAS_REVISION", 3))
+
+
+# --- 2. FUNCIONES AUXILIARES ---
+
+def leer_definicion(ruta_sql):
+    """
+    Extrae la tabla destino y la SELECT (con sus CTE) de un script CREATE OR REPLACE TABLE.
+
+    Returns:
+        tuple: ('dataset.tabla', sql_select sin el ';' final)
+    """
+    with open(ruta_sql, encoding='utf-8') as file:
+        sql = file.read()
+    coincidencia = re.search(r'CREATE\s+OR\s+REPLACE\s+TABLE\s+`([^`]+)`.*?\bAS\s+((?:WITH|SELECT)\b.*)', sql,
+                             re.IGNORECASE | re.DOTALL)
+    if coincidencia is None:
+        raise ValueError(f"'{ruta_sql}' no es un CREATE OR REPLACE TABLE ... AS SELECT")
+    tabla = '.'.join(coincidencia.group(1).split('.')[-2:])
+    return tabla, coincidencia.group(2).strip().rstrip(';').strip()
+
+
+def _lista_fechas_sql(fechas):
+    return ', '.join(f"DATE '{pd.Timestamp(f).date().isoformat()}'" for f in fechas)
+
+
+def sql_reemplazar_fechas(tabla, select, fechas):
+    """Script transaccional que reescribe solo las particiones de 'fechas'."""
+    destino, lista = f"`{PROJECT_ID}.{tabla}`", _lista_fechas_sql(fechas)
+    return (
+        "BEGIN TRANSACTION;\n"
+        f"DELETE FROM {destino} WHERE fecha IN ({lista});\n"
+        f"INSERT INTO {destino}\nSELECT * FROM (\n{select}\n) WHERE fecha IN ({lista});\n"
+        "COMMIT TRANSACTION;"
+    )
+
+
+def podar_tablas_anuales(select, desde, hasta=None):
+    """
+    Quita de una cadena de 'SELECT ... FROM `..._AAAA` UNION ALL ...' las
+    ramas de años fuera de [desde, hasta], para no escanear tablas bronze
+    anuales enteras que no aportan filas a la ventana.
+
+    Si ningún año cae en la ventana se conserva la última rama: el filtro por
+    fecha deja la SELECT vacía pero con el esquema correcto.
+    """
+    rama = r"SELECT\b[^;()]*?\bFROM\s+`[^`]*_(\d{4})`"
+    cadena = re.search(rf"{rama}(?:\s+UNION\s+ALL\s+{rama})*", select, re.IGNORECASE)
+    if cadena is None:
+        return select
+    ramas = [(r.group(0), int(r.group(1))) for r in re.finditer(rama, cadena.group(0), re.IGNORECASE)]
+    anio_hasta = pd.Timestamp(hasta).year if hasta is not None else None
+    utiles = [texto for texto, anio in ramas
+              if anio >= pd.Timestamp(desde).year and (anio_hasta is None or anio <= anio_hasta)]
+    union = ' UNION ALL\n  '.join(utiles or [ramas[-1][0]])
+    return select[:cadena.start()] + union + select[cadena.end():]
+
+
+def _filtro_ventana(desde, hasta=None):
+    filtro = f"fecha >= DATE '{pd.Timestamp(desde).date().isoformat()}'"
+    if hasta is not None:
+        filtro += f" AND fecha <= DATE '{pd.Timestamp(hasta).date().isoformat()}'"
+    return filtro
+
+
+def sql_reemplazar_ventana(tabla, select, desde, hasta=None):
+    """Script transaccional que reescribe las particiones desde 'desde' (hasta 'hasta', si se indica)."""
+    destino, filtro = f"`{PROJECT_ID}.{tabla}`", _filtro_ventana(desde, hasta)
+    return (
+        "BEGIN TRANSACTION;\n"
+        f"DELETE FROM {destino} WHERE {filtro};\n"
+        f"INSERT INTO {destino}\nSELECT * FROM (\n{podar_tablas_anuales(select, desde, hasta)}\n) WHERE {filtro};\n"
+        "COMMIT TRANSACTION;"
+    )
+
+
+def fechas_afectadas(fuente, tabla_gold, dias_revision=DIAS_REVISION, tabla_origen=TABLA_ORIGEN):
+    """
+    Fechas de silver posteriores a la última partición de gold (menos un
+    margen de revisión). None si la tabla gold está vacía.
+    """
+    ultima = fuente.ultima_fecha(tabla_gold)
+    if ultima is None:
+        return None
+    desde = ultima - pd.Timedelta(days=dias_revision)
+    sql = (f"SELECT DISTINCT fecha FROM `{PROJECT_ID}.{tabla_origen}` "
+           f"WHERE fecha > DATE '{desde.date().isoformat()}'")
+    return sorted(pd.to_datetime(fuente.leer_arrow(sql).column('fecha').to_pandas()))
+
+
+# --- 3. FUNCIÓN PRINCIPAL ---
+
+def refrescar_silver(fuente, completo=False, desde=None, hasta=None, dias_revision=DIAS_REVISION,
+                     scripts=SCRIPTS_SILVER, ruta_silver=RUTA_SILVER):
+    """
+    Refresca los hechos silver que se alimentan de bronze por ventana de fechas.
+
+    Sin 'desde', la ventana empieza en la última partición de la tabla menos
+    'dias_revision' días; sin 'hasta', no tiene límite superior.
+
+    Returns:
+        list: Un dict por tabla, con las mismas claves que materializar_gold().
+    """
+    resumen = []
+    for script in scripts:
+        ruta = os.path.join(ruta_silver, script)
+        tabla, select = leer_definicion(ruta)
+        reloj = time.perf_counter()
+
+        existe = not completo and fuente.existe_tabla(tabla)
+        inicio = desde or hasta
+        if existe and inicio is None:
+            ultima = fuente.ultima_fecha(tabla)
+            inicio = ultima - pd.Timedelta(days=dias_revision) if ultima is not None else None
+
+        if not existe or inicio is None:
+            fuente.ejecutar_fichero(ruta)
+            resumen.append({'tabla': tabla, 'modo': 'completo', 'fechas': None,
+                            'segundos': time.perf_counter() - reloj, 'bytes_escaneados': None})
+            continue
+
+        escaneados = fuente.bytes_escaneados(
+            f"SELECT * FROM (\n{podar_tablas_anuales(select, inicio, hasta)}\n) WHERE {_filtro_ventana(inicio, hasta)}")
+        fuente.ejecutar(sql_reemplazar_ventana(tabla, select, inicio, hasta))
+        resumen.append({'tabla': tabla, 'modo': 'ventana', 'fechas': (pd.Timestamp(inicio), hasta),
+                        'segundos': time.perf_counter() - reloj, 'bytes_escaneados': escaneados})
+    return resumen
+
+
+def materializar_gold(fuente, completo=False, desde=None, hasta=None, dias_revision=DIAS_REVISION,
+                      scripts=SCRIPTS_GOLD, ruta_gold=RUTA_GOLD, scripts_silver=SCRIPTS_SILVER,
+                      ruta_silver=RUTA_SILVER):
+    """
+    Refresca los hechos silver de bronze y materializa las tablas gold en
+    orden, completa o incrementalmente.
+
+    Args:
+        fuente (FuenteDatos): BigQuery o DuckDB local.
+        completo (bool): Reconstruir todas las tablas con su script original.
+        desde, hasta (str, optional): Ventana de fechas a reescribir; si no se
+            indica, se detecta a partir de la última partición de cada tabla.
+            Con solo 'desde', la ventana llega hasta la última fecha de silver.
+        dias_revision (int): Días ya cargados que se vuelven a reescribir.
+        scripts_silver (list): Scripts silver a refrescar antes de gold.
+
+    Returns:
+        list: Un dict por tabla con el modo, las fechas reescritas, los
+              segundos y los bytes escaneados (si el motor los informa).
+    """
+    resumen = refrescar_silver(fuente, completo, desde, hasta, dias_revision, scripts_silver, ruta_silver)
+    fechas = None
+    for script in scripts:
+        ruta = os.path.join(ruta_gold, script)
+        tabla, select = leer_definicion(ruta)
+        reloj = time.perf_counter()
+
+        if completo or not fuente.existe_tabla(tabla):
+            fuente.ejecutar_fichero(ruta)
+            resumen.append({'tabla': tabla, 'modo': 'completo', 'fechas': None,
+                            'segundos': time.perf_counter() - reloj, 'bytes_escaneados': None})
+            continue
+
+        if fechas is None:
+            # Las fechas se fijan con la primera tabla y se reutilizan en las siguientes
+            if desde and not hasta:
+                hasta = fuente.ultima_fecha(TABLA_ORIGEN) or desde
+            if desde or hasta:
+                fechas = list(pd.date_range(desde or hasta, hasta, freq='D'))
+            else:
+                fechas = fechas_afectadas(fuente, tabla, dias_revision) or []
+        if not fechas:
+            resumen.append({'tabla': tabla, 'modo': 'incremental', 'fechas': [],
+                            'segundos': 0.0, 'bytes_escaneados': 0})
+            continue
+
+        escaneados = fuente.bytes_escaneados(
+            f"SELECT * FROM (\n{select}\n) WHERE fecha IN ({_lista_fechas_sql(fechas)})")
+        fuente.ejecutar(sql_reemplazar_fechas(tabla, select, fechas))
+        resumen.append({'tabla': tabla, 'modo': 'incremental', 'fechas': fechas,
+                        'segundos': time.perf_counter() - reloj, 'bytes_escaneados': escaneados})
+    return resumen
+
+
+# --- 4. EJECUCIÓN PRINCIPAL ---
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description="Materialización (incremental) de silver_data.fact_consumo_horario "
+                                                 "y las tablas gold")
+    parser.add_argument('--fuente', choices=['bigquery', 'duckdb'], help="Sobrescribe FUENTE_DATOS")
+    parser.add_argument('--completo', action='store_true', help="Reconstruye las tablas completas")
+    parser.add_argument('--desde', help="Primera fecha (YYYY-MM-DD) a reescribir")
+    parser.add_argument('--hasta', help="Última fecha (YYYY-MM-DD) a reescribir (por defecto, la última de silver)")
+    parser.add_argument('--dias-revision', type=int, default=DIAS_REVISION,
+                        help="Días ya materializados que se reescriben por si llegan datos tardíos; lo que "
+                             "llegue con más retraso solo se recoge con --desde (MATERIALIZACION_DIAS_REVISION)")
+    args = parser.parse_args()
+
+    print("--- Iniciando la materialización de silver (consumo) y gold ---")
+    load_dotenv()
+    fuente = crear_fuente(args.fuente)
+    for paso in materializar_gold(fuente, args.completo, args.desde, args.hasta, args.dias_revision):
+        if paso['modo'] == 'completo':
+            detalle = "reconstruida completa"
+        elif paso['modo'] == 'ventana':
+            inicio, fin = paso['fechas']
+            detalle = f"particiones reescritas desde {inicio.date()}"
+            if fin is not None:
+                detalle += f" hasta {pd.Timestamp(fin).date()}"
+        elif not paso['fechas']:
+            detalle = "sin fechas nuevas"
+        else:
+            detalle = (f"{len(paso['fechas'])} particiones reescritas "
+                       f"({paso['fechas'][0].date()} a {paso['fechas'][-1].date()})")
+        if paso['modo'] != 'completo' and paso['bytes_escaneados'] is not None:
+            detalle += f", {paso['bytes_escaneados'] / 1e6:,.1f} MB escaneados"
+        print(f"✅ {paso['tabla']}: {detalle} en {paso['segundos']:.2f} s.")
@@ -0,0 +1,392 @@
+# ============================================================================
+# MONITORIZACIÓN INCREMENTAL DE LA PRECISIÓN DE LAS PREDICCIONES
+# ============================================================================
+# Autor: Julio Clavijo
+# Versión: 1.0
+#
+# Descripción:
+# El MAPE solo se calculaba una vez, al entrenar, sobre un holdout fijo. Este
+# módulo sigue la precisión de gold_data.predicciones_modelo_final a medida
+# que llega el consumo real:
+#
+#   1. Acumuladores fusionables por (sector, código postal, tramo, día):
+#      número de pares, sumas de error, error absoluto, error cuadrático,
+#      error porcentual y consumo real. Fusionar es sumar, así que cualquier
+#      ventana o nivel (sector, código postal, tramo) se obtiene de ellos.
+#   2. Cada ejecución lee solo los reales de los últimos DIAS_REVISION días ya
+#      procesados en adelante (o desde --desde, para reprocesar correcciones):
+#      el coste es proporcional a los datos nuevos. Releer esos días recoge el
+#      resto de un día que estaba a medio cargar en la ejecución anterior.
+#   3. Los acumuladores se guardan por mes en MONITORIZACION_PATH/acumuladores/;
+#      una actualización reescribe solo los meses afectados y sustituye los
+#      días recibidos (reprocesar un día no lo cuenta dos veces).
+#   4. Las tablas de precisión móvil (7 y 28 días) y las alertas de deriva se
+#      calculan leyendo solo los meses de las ventanas, sin recorrer el histórico.
+#
+# Alertas: MAPE de la última semana por encima de UMBRAL_DERIVA_MAPE veces el
+# de las 4 semanas anteriores, sesgo relativo por encima de UMBRAL_SESGO, o
+# MAPE de un sector por encima del de entrenamiento (modelos_entrenados_por_sector.pkl).
+# ============================================================================
+
+import os
+import glob
+import json
+import time
+import argparse
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+# --- 1. CONFIGURACIÓN ---
+PROJECT_ID = "datamanagementbi"
+TABLA_PREDICCIONES = "gold_data.predicciones_modelo_final"
+TABLA_REALES = "gold_data.modelo_final_v2"
+DIRECTORIO_MONITORIZACION = os.getenv("MONITORIZACION_PATH", 'monitorizacion')
+MODEL_FILE = 'modelos_entrenados_por_sector.pkl'
+DIAS_REVISION = int(os.getenv("MONITORIZACION_DIAS_REVISION", 3))  # días ya procesados que se releen
+
+CLAVES = ['id_sector_economico', 'id_geografia', 'id_tramo_horario', 'fecha']
+SUMAS = ['n', 'n_pct', 'suma_real', 'suma_error', 'suma_abs_error', 'suma_cuadrado_error', 'suma_pct_error']
+# Niveles de las tablas de precisión móvil
+NIVELES = {
+    'sector': ['id_sector_economico'],
+    'sector_geografia': ['id_sector_economico', 'id_geografia'],
+    'sector_tramo': ['id_sector_economico', 'id_tramo_horario'],
+}
+VENTANAS_DIAS = (7, 28)
+VENTANA_RECIENTE_DIAS = 7
+VENTANA_REFERENCIA_DIAS = 28
+UMBRAL_DERIVA_MAPE = 1.5   # MAPE reciente / MAPE de referencia
+UMBRAL_SESGO = 0.10        # |suma del error| / suma del real
+MIN_OBSERVACIONES = 48     # pares mínimos por serie y ventana para alertar
+
+
+# --- 2. ACUMULADORES ---
+
+def acumular(df):
+    """
+    Acumuladores por (sector, código postal, tramo, día) de pares real/predicho.
+
+    Args:
+        df (pd.DataFrame): CLAVES, consumo_kwh_real y consumo_kwh_predicho.
+
+    Returns:
+        pd.DataFrame: CLAVES + SUMAS.
+    """
+    real = df['consumo_kwh_real'].to_numpy(dtype=np.float64)
+    error = df['consumo_kwh_predicho'].to_numpy(dtype=np.float64) - real
+    validos = ~(np.isnan(real) | np.isnan(error))
+    con_pct = validos & (real != 0)
+    sumas = pd.DataFrame({
+        'n': validos.astype(np.int64),
+        'n_pct': con_pct.astype(np.int64),
+        'suma_real': np.where(validos, real, 0.0),
+        'suma_error': np.where(validos, error, 0.0),
+        'suma_abs_error': np.where(validos, np.abs(error), 0.0),
+        'suma_cuadrado_error': np.where(validos, error ** 2, 0.0),
+        'suma_pct_error': np.where(con_pct, np.abs(error) / np.where(con_pct, np.abs(real), 1.0), 0.0),
+    })
+    claves = df[CLAVES].assign(fecha=pd.to_datetime(df['fecha']).dt.normalize(),
+                               id_geografia=df['id_geografia'].astype(str))
+    acumulador = pd.concat([claves.reset_index(drop=True), sumas], axis=1)
+    acumulador = acumulador.groupby(CLAVES, as_index=False, sort=True, observed=True)[SUMAS].sum()
+    return acumulador[acumulador['n'] > 0].reset_index(drop=True)
+
+
+def fusionar(acumuladores, claves=CLAVES):
+    """Fusiona acumuladores (suma por 'claves'); con claves de menos columnas, agrega."""
+    acumuladores = [a for a in acumuladores if a is not None and len(a)]
+    if not acumuladores:
+        return pd.DataFrame(columns=list(claves) + SUMAS)
+    return pd.concat(acumuladores, ignore_index=True).groupby(list(claves), as_index=False, sort=True)[SUMAS].sum()
+
+
+def metricas(acumulador):
+    """Añade mae, mape (%), wape (%), rmse, sesgo (kWh por par) y sesgo relativo (%)."""
+    n = acumulador['n'].where(acumulador['n'] > 0)
+    real = acumulador['suma_real'].abs().where(acumulador['suma_real'] != 0)
+    return acumulador.assign(
+        mae=acumulador['suma_abs_error'] / n,
+        mape=100 * acumulador['suma_pct_error'] / acumulador['n_pct'].where(acumulador['n_pct'] > 0),
+        wape=100 * acumulador['suma_abs_error'] / real,
+        rmse=np.sqrt(acumulador['suma_cuadrado_error'] / n),
+        sesgo=acumulador['suma_error'] / n,
+        sesgo_relativo=100 * acumulador['suma_error'] / real,
+    )
+
+
+# --- 3. ALMACÉN POR MESES ---
+
+class AlmacenAcumuladores:
+    """
+    Acumuladores diarios en un Parquet por mes (acumuladores/AAAA-MM.parquet)
+    y un estado JSON con la última fecha procesada.
+    """
+
+    def __init__(self, directorio=DIRECTORIO_MONITORIZACION):
+        self.directorio = directorio
+        self.directorio_meses = os.path.join(directorio, 'acumuladores')
+        self.ruta_estado = os.path.join(directorio, 'estado.json')
+
+    def _ruta_mes(self, mes):
+        return os.path.join(self.directorio_meses, f"{mes}.parquet")
+
+    def estado(self):
+        if os.path.exists(self.ruta_estado):
+            with open(self.ruta_estado, encoding='utf-8') as file:
+                return json.load(file)
+        return {}
+
+    def guardar_estado(self, estado):
+        os.makedirs(self.directorio, exist_ok=True)
+        temporal = f"{self.ruta_estado}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as file:
+            json.dump(estado, file, indent=2, sort_keys=True)
+        os.replace(temporal, self.ruta_estado)
+
+    def ultima_fecha(self):
+        fecha = self.estado().get('ultima_fecha')
+        return pd.Timestamp(fecha) if fecha else None
+
+    def meses(self):
+        return sorted(os.path.basename(r)[:-len('.parquet')] for r in glob.glob(self._ruta_mes('*')))
+
+    def leer(self, desde=None, hasta=None):
+        """Acumuladores diarios entre dos fechas, leyendo solo los meses que las cubren."""
+        desde = pd.Timestamp(desde) if desde is not None else None
+        hasta = pd.Timestamp(hasta) if hasta is not None else None
+        partes = []
+        for mes in self.meses():
+            inicio_mes = pd.Timestamp(f"{mes}-01")
+            if (hasta is not None and inicio_mes > hasta) or (desde is not None and inicio_mes + pd.offsets.MonthEnd(0) < desde):
+                continue
+            parte = pd.read_parquet(self._ruta_mes(mes))
+            if desde is not None:
+                parte = parte[parte['fecha'] >= desde]
+            if hasta is not None:
+                parte = parte[parte['fecha'] <= hasta]
+            partes.append(parte)
+        return pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(columns=CLAVES + SUMAS)
+
+    def escribir(self, acumulador):
+        """Sustituye los días de 'acumulador' en sus meses. Returns: meses reescritos."""
+        os.makedirs(self.directorio_meses, exist_ok=True)
+        meses = acumulador['fecha'].dt.strftime('%Y-%m')
+        for mes, nuevo in acumulador.groupby(meses, sort=True):
+            ruta = self._ruta_mes(mes)
+            if os.path.exists(ruta):
+                anterior = pd.read_parquet(ruta)
+                nuevo = pd.concat([anterior[~anterior['fecha'].isin(nuevo['fecha'].unique())], nuevo], ignore_index=True)
+            temporal = f"{ruta}.{os.getpid()}.tmp"
+            nuevo.sort_values(CLAVES, ignore_index=True).to_parquet(temporal, index=False)
+            os.replace(temporal, ruta)
+        return int(meses.nunique())
+
+
+# --- 4. ACTUALIZACIÓN INCREMENTAL ---
+
+def leer_pares(fuente, desde, leer_predicciones=None):
+    """
+    Pares (real, predicho) con fecha >= desde: reales del gold y predicciones
+    de la tabla de predicciones (o de leer_predicciones(desde), p. ej. DuckDB local).
+    """
+    from fuentes_datos import construir_consulta
+
+    columnas = CLAVES
+    reales = fuente.consultar(construir_consulta(TABLA_REALES, columnas + ['consumo_kwh'], desde=desde))
+    if leer_predicciones is None:
+        predicciones = fuente.consultar(construir_consulta(TABLA_PREDICCIONES, columnas + ['consumo_kwh_predicho'], desde=desde))
+    else:
+        predicciones = leer_predicciones(desde)
+    for df in (reales, predicciones):
+        df['fecha'] = pd.to_datetime(df['fecha'])
+        df['id_geografia'] = df['id_geografia'].astype(str)
+    pares = reales.rename(columns={'consumo_kwh': 'consumo_kwh_real'}).merge(
+        predicciones[columnas + ['consumo_kwh_predicho']], on=columnas, how='inner')
+    return pares
+
+
+def actualizar(fuente, almacen, desde=None, leer_predicciones=None, dias_revision=DIAS_REVISION):
+    """
+    Incorpora a los acumuladores los reales llegados desde la última ejecución.
+
+    Los días se sustituyen enteros, así que releer los últimos 'dias_revision'
+    días ya procesados completa los que estaban a medio cargar sin contar dos
+    veces los pares que ya se habían acumulado.
+
+    Args:
+        fuente: Fuente de datos (fuentes_datos.crear_fuente()).
+        almacen (AlmacenAcumuladores): Acumuladores y estado.
+        desde (str, optional): Reprocesa desde esta fecha (sustituye esos días).
+        leer_predicciones (callable, optional): desde -> DataFrame de predicciones.
+        dias_revision (int): Días hasta la última fecha procesada (incluida) que se releen.
+
+    Returns:
+        dict: Métricas de la actualización.
+    """
+    inicio = time.perf_counter()
+    ultima = almacen.ultima_fecha()
+    if desde is None:
+        desde = (ultima - pd.Timedelta(days=dias_revision - 1)) if ultima is not None else None
+    pares = leer_pares(fuente, desde, leer_predicciones)
+    acumulador = acumular(pares)
+    meses = almacen.escribir(acumulador) if len(acumulador) else 0
+    if len(acumulador):
+        nueva = acumulador['fecha'].max()
+        estado = almacen.estado()
+        estado.update({
+            'ultima_fecha': max(nueva, ultima).date().isoformat() if ultima is not None else nueva.date().isoformat(),
+            'actualizado': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'actualizaciones': estado.get('actualizaciones', 0) + 1,
+        })
+        almacen.guardar_estado(estado)
+    return {
+        'desde': pd.Timestamp(desde).date().isoformat() if desde is not None else None,
+        'pares': int(len(pares)),
+        'acumuladores': int(len(acumulador)),
+        'dias': int(acumulador['fecha'].nunique()) if len(acumulador) else 0,
+        'meses_reescritos': meses,
+        'ultima_fecha': almacen.estado().get('ultima_fecha'),
+        'segundos': round(time.perf_counter() - inicio, 3),
+    }
+
+
+# --- 5. PRECISIÓN MÓVIL Y ALERTAS ---
+
+def precision_movil(almacen, hasta=None, ventanas=VENTANAS_DIAS, niveles=NIVELES):
+    """
+    Métricas por nivel sobre las ventanas de 'ventanas' días que terminan en 'hasta'.
+
+    Returns:
+        pd.DataFrame: nivel, ventana_dias, hasta, columnas del nivel, SUMAS y métricas.
+    """
+    hasta = pd.Timestamp(hasta) if hasta is not None else almacen.ultima_fecha()
+    if hasta is None:
+        return pd.DataFrame()
+    diario = almacen.leer(desde=hasta - pd.Timedelta(days=max(ventanas) - 1), hasta=hasta)
+    tablas = []
+    for ventana in ventanas:
+        en_ventana = diario[diario['fecha'] > hasta - pd.Timedelta(days=ventana)]
+        for nivel, claves in niveles.items():
+            tabla = metricas(fusionar([en_ventana], claves))
+            tablas.append(tabla.assign(nivel=nivel, ventana_dias=ventana, hasta=hasta))
+    resultado = pd.concat(tablas, ignore_index=True)
+    primeras = ['nivel', 'ventana_dias', 'hasta', 'id_sector_economico', 'id_geografia', 'id_tramo_horario']
+    return resultado[primeras + [c for c in resultado.columns if c not in primeras]]
+
+
+def alertas_deriva(almacen, hasta=None, mape_entrenamiento=None):
+    """
+    Series (sector, código postal) y sectores cuya precisión reciente se ha degradado.
+
+    Args:
+        almacen (AlmacenAcumuladores): Acumuladores diarios.
+        hasta (str, optional): Fin de la ventana reciente (última fecha procesada).
+        mape_entrenamiento (dict, optional): {id_sector_economico: MAPE (%) de entrenamiento}.
+
+    Returns:
+        pd.DataFrame: Una fila por alerta (tipo, nivel, sector, código postal, valor, referencia).
+    """
+    hasta = pd.Timestamp(hasta) if hasta is not None else almacen.ultima_fecha()
+    if hasta is None:
+        return pd.DataFrame()
+    corte = hasta - pd.Timedelta(days=VENTANA_RECIENTE_DIAS)
+    diario = almacen.leer(desde=corte - pd.Timedelta(days=VENTANA_REFERENCIA_DIAS - 1), hasta=hasta)
+    claves = ['id_sector_economico', 'id_geografia']
+    reciente = metricas(fusionar([diario[diario['fecha'] > corte]], claves))
+    referencia = metricas(fusionar([diario[diario['fecha'] <= corte]], claves))
+    comparada = reciente.merge(referencia[claves + ['n', 'mape']], on=claves, how='left', suffixes=('', '_referencia'))
+    suficientes = comparada['n'] >= MIN_OBSERVACIONES
+
+    alertas = []
+    deriva = suficientes & (comparada['n_referencia'] >= MIN_OBSERVACIONES) & \
+        (comparada['mape'] > UMBRAL_DERIVA_MAPE * comparada['mape_referencia'])
+    alertas.append(comparada.assign(tipo='deriva_mape', nivel='sector_geografia',
+                                    valor=comparada['mape'], referencia=comparada['mape_referencia'])[deriva])
+    sesgo = suficientes & (comparada['sesgo_relativo'].abs() > 100 * UMBRAL_SESGO)
+    alertas.append(comparada.assign(tipo='sesgo', nivel='sector_geografia',
+                                    valor=comparada['sesgo_relativo'], referencia=100 * UMBRAL_SESGO)[sesgo])
+    if mape_entrenamiento:
+        por_sector = metricas(fusionar([diario[diario['fecha'] > corte]], ['id_sector_economico']))
+        por_sector['referencia'] = por_sector['id_sector_economico'].map(mape_entrenamiento)
+        peor = por_sector['mape'] > UMBRAL_DERIVA_MAPE * por_sector['referencia']
+        alertas.append(por_sector.assign(tipo='mape_sobre_entrenamiento', nivel='sector',
+                                         id_geografia=None, valor=por_sector['mape'])[peor])
+
+    columnas = ['tipo', 'nivel', 'id_sector_economico', 'id_geografia', 'n', 'valor', 'referencia']
+    resultado = pd.concat([a[columnas] for a in alertas], ignore_index=True)
+    return resultado.assign(hasta=hasta.date().isoformat())
+
+
+def mape_de_entrenamiento(ruta_modelos=MODEL_FILE):
+    """MAPE (%) de entrenamiento por id de sector desde el pickle de modelos (vacío si no existe)."""
+    import pickle
+    from fuentes_datos import SECTORES
+
+    if not os.path.exists(ruta_modelos):
+        return {}
+    with open(ruta_modelos, 'rb') as file:
+        resultados = pickle.load(file)
+    ids = {nombre: id_sector for id_sector, nombre in SECTORES.items()}
+    return {ids[nombre]: r['mape'] for nombre, r in resultados.items() if nombre in ids and 'mape' in r}
+
+
+# --- 6. EJECUCIÓN ---
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from fuentes_datos import crear_fuente, construir_consulta
+
+    parser = argparse.ArgumentParser(description="Actualiza la precisión de las predicciones con los reales nuevos")
+    parser.add_argument('--desde', help="Reprocesa los reales desde esta fecha (YYYY-MM-DD)")
+    parser.add_argument('--dias-revision', type=int, default=DIAS_REVISION,
+                        help="Días ya procesados que se releen por si estaban a medio cargar")
+    parser.add_argument('--directorio', default=DIRECTORIO_MONITORIZACION, help="Directorio de acumuladores y tablas")
+    parser.add_argument('--destino-local', help="Base DuckDB local con las predicciones (batch_prediction.py --destino-local)")
+    parser.add_argument('--modelos', default=MODEL_FILE, help="Pickle de modelos con el MAPE de entrenamiento")
+    args = parser.parse_args()
+
+    print("--- Iniciando la monitorización de la precisión ---")
+    load_dotenv()
+    almacen = AlmacenAcumuladores(args.directorio)
+    leer_predicciones = None
+    if args.destino_local:
+        import duckdb
+
+        def leer_predicciones(desde):
+            consulta = construir_consulta(TABLA_PREDICCIONES, CLAVES + ['consumo_kwh_predicho'], desde=desde)
+            consulta = consulta.replace(f"`{PROJECT_ID}.{TABLA_PREDICCIONES}`", TABLA_PREDICCIONES.replace('.', '__'))
+            with duckdb.connect(args.destino_local, read_only=True) as conexion:
+                return conexion.execute(consulta).df()
+
+    try:
+        resumen = actualizar(crear_fuente(), almacen, desde=args.desde, leer_predicciones=leer_predicciones,
+                             dias_revision=args.dias_revision)
+    except Exception as e:
+        print(f"❌ Error al actualizar los acumuladores: {e}")
+        exit()
+    print(f"✅ Paso 1: {resumen['pares']:,} pares leídos desde {resumen['desde'] or 'el inicio'} -> "
+          f"{resumen['acumuladores']:,} acumuladores de {resumen['dias']} días "
+          f"({resumen['meses_reescritos']} meses reescritos, {resumen['segundos']:.2f} s). "
+          f"Última fecha: {resumen['ultima_fecha']}.")
+
+    tabla = precision_movil(almacen)
+    if tabla.empty:
+        print("Sin acumuladores: no hay tablas de precisión ni alertas.")
+        exit()
+    ruta_tabla = os.path.join(args.directorio, 'precision_movil.parquet')
+    tabla.to_parquet(ruta_tabla, index=False)
+    sectores = tabla[(tabla['nivel'] == 'sector')]
+    print(f"\nPaso 2: Precisión móvil guardada en '{ruta_tabla}':")
+    print(sectores[['ventana_dias', 'id_sector_economico', 'n', 'mape', 'wape', 'sesgo_relativo']].round(2).to_string(index=False))
+
+    alertas = alertas_deriva(almacen, mape_entrenamiento=mape_de_entrenamiento(args.modelos))
+    if len(alertas):
+        with open(os.path.join(args.directorio, 'alertas.jsonl'), 'a', encoding='utf-8') as file:
+            for registro in alertas.to_dict(orient='records'):
+                file.write(json.dumps(registro, ensure_ascii=False, default=str) + '\n')
+        print(f"\n⚠️ Paso 3: {len(alertas)} alertas de deriva ({alertas['tipo'].value_counts().to_dict()}) "
+              f"añadidas a '{args.directorio}/alertas.jsonl'.")
+    else:
+        print("\n✅ Paso 3: Sin alertas de deriva.")
@@ -0,0 +1,394 @@
+# ============================================================================
+# MOTOR DE REJILLAS DE ESCENARIOS (WHAT-IF A ESCALA DE CIUDAD)
+# ============================================================================
+# Autor: Julio Clavijo
+# Versión: 1.0
+#
+# Descripción:
+# 'comparar_escenarios' evalúa un único código postal, sector y fecha con un
+# bucle en Python. Este motor evalúa rejillas completas de escenarios
+#   temperatura x humedad x fecha x tramo x código postal x sector
+# que pueden llegar a millones de filas:
+#
+#   1. La rejilla nunca se materializa: cada trozo (chunk) se genera a partir
+#      de un rango de índices planos con np.unravel_index.
+#   2. Los trozos se puntúan en un pool de procesos. Cada proceso carga los
+#      modelos y el contexto una sola vez (initializer).
+#   3. Los resultados se escriben en streaming a Parquet (o Arrow IPC) como un
+#      row group por trozo, con un número acotado de trozos en vuelo, de modo
+#      que la memoria es constante independientemente del tamaño de la rejilla.
+#
+# Los lags de consumo se aproximan con la media histórica por
+# (sector, código postal, tramo), igual que en 'predecir_demanda.py'.
+# ============================================================================
+
+import os
+import time
+import pickle
+import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from pronostico_multihorizonte import (
+    SECTOR_MAP, TRAMOS_POR_DIA, COLUMNAS_CLIMA, COLUMNAS_TEMP_ESTACION, DIAS_SEMANA, SIN_FIESTA,
+    climatologia_por_tramo, categorias_historico, columnas_categoricas
+)
+
+warnings.filterwarnings('ignore', category=FutureWarning)
+
+# --- 1. CONFIGURACIÓN ---
+FILAS_POR_TROZO = 250_000
+COLUMNAS_LAG = ['consumo_lag_1_hora', 'consumo_lag_2_horas', 'consumo_lag_1_dia', 'consumo_media_movil_7d']
+# Orden de las dimensiones de la rejilla (de la más externa a la más interna).
+# El sector va fuera para que cada trozo use, casi siempre, un único modelo.
+DIMENSIONES = ['sector', 'fecha', 'tramo', 'codigo_postal', 'temperatura', 'humedad']
+
+ESQUEMA_SALIDA = pa.schema([
+    ('id_sector_economico', pa.int8()),
+    ('fecha', pa.date32()),
+    ('id_tramo_horario', pa.int8()),
+    ('id_geografia', pa.dictionary(pa.int32(), pa.string())),
+    ('temperatura_media_ciudad', pa.float32()),
+    ('humedad_media_ciudad', pa.float32()),
+    ('consumo_kwh_predicho', pa.float32()),
+])
+
+
+# --- 2. DEFINICIÓN DE LA REJILLA ---
+
+class RejillaEscenarios:
+    """
+    Producto cartesiano perezoso de escenarios.
+
+    Cada fila de la rejilla se identifica por un índice plano; las
+    coordenadas de un rango de índices se obtienen con np.unravel_index.
+    """
+
+    def __init__(self, temperaturas, humedades, fechas, codigos_postales, sectores=None, tramos=None):
+        self.sectores = np.asarray(list(SECTOR_MAP.keys()) if sectores is None else sectores, dtype=np.int64)
+        self.fechas = pd.to_datetime(pd.Index(fechas)).normalize()
+        self.tramos = np.asarray(range(1, TRAMOS_POR_DIA + 1) if tramos is None else tramos, dtype=np.int64)
+        self.codigos_postales = pd.Index(codigos_postales)
+        self.temperaturas = np.asarray(temperaturas, dtype=np.float64)
+        self.humedades = np.asarray(humedades, dtype=np.float64)
+        self.forma = (len(self.sectores), len(self.fechas), len(self.tramos),
+                      len(self.codigos_postales), len(self.temperaturas), len(self.humedades))
+
+    def __len__(self):
+        return int(np.prod(self.forma))
+
+    def trozos(self, filas_por_trozo=FILAS_POR_TROZO):
+        """Genera (inicio, fin) de cada trozo sin materializar la rejilla."""
+        for inicio in range(0, len(self), filas_por_trozo):
+            yield inicio, min(inicio + filas_por_trozo, len(self))
+
+    def coordenadas(self, inicio, fin):
+        """
+        Returns:
+            dict: Índices posicionales de cada dimensión para las filas [inicio, fin).
+        """
+        indices = np.unravel_index(np.arange(inicio, fin, dtype=np.int64), self.forma)
+        return dict(zip(DIMENSIONES, indices))
+
+
+# --- 3. CONTEXTO COMPARTIDO CON LOS PROCESOS ---
+
+def preparar_contexto(df_historico, rejilla, festivos=(), indice_eventos=None):
+    """
+    Precalcula en arrays compactos todo lo que no depende del escenario.
+
+    Args:
+        df_historico (pd.DataFrame): Histórico con el esquema de gold_data.modelo_final_v2.
+        rejilla (RejillaEscenarios): Rejilla a evaluar.
+        festivos (iterable, optional): Fechas festivas.
+        indice_eventos (IndiceEventos, optional): Festivos y fiestas de barrio por
+            código postal. Sin él no hay fiestas de barrio en ningún escenario.
+
+    Returns:
+        dict: Contexto serializable que se envía una vez a cada proceso.
+    """
+    climatologia = climatologia_por_tramo(df_historico)
+    completa = pd.MultiIndex.from_product([range(1, 13), range(1, TRAMOS_POR_DIA + 1)])
+    climatologia = climatologia.reindex(completa).reindex(columns=COLUMNAS_CLIMA)
+    clima = climatologia.fillna(climatologia.mean()).to_numpy().reshape(12, TRAMOS_POR_DIA, len(COLUMNAS_CLIMA))
+
+    fechas = rejilla.fechas
+    festivos = {pd.Timestamp(f).normalize() for f in festivos}
+    calendario = {
+        'anio': fechas.year.to_numpy(),
+        'mes': fechas.month.to_numpy(),
+        'dia_del_mes': fechas.day.to_numpy(),
+        'dia_semana': fechas.weekday.to_numpy(),
+        'es_festivo': np.array([f in festivos for f in fechas]),
+    }
+
+    # Fiestas de barrio de todos los pares (fecha, código postal) en una sola consulta
+    n_fechas, n_cp = len(fechas), len(rejilla.codigos_postales)
+    eventos = {'es_fiesta_barrio': np.zeros((n_fechas, n_cp), dtype=bool),
+               'nombre_fiesta': np.full((n_fechas, n_cp), SIN_FIESTA, dtype=object)}
+    if indice_eventos is not None:
+        consulta = indice_eventos.consultar(np.repeat(fechas.values, n_cp),
+                                            np.tile(np.asarray(rejilla.codigos_postales), n_fechas),
+                                            sin_evento=SIN_FIESTA)
+        eventos = {c: consulta[c].reshape(n_fechas, n_cp) for c in eventos}
+        calendario['es_festivo'] |= indice_eventos.es_festivo(fechas)
+
+    sectores = {}
+    for id_sector in rejilla.sectores:
+        df_sector = df_historico[df_historico['id_sector_economico'] == id_sector]
+        categorias = categorias_historico(df_sector)
+
+        por_cp = (df_sector.sort_values('fecha')
+                  .drop_duplicates('id_geografia', keep='last')
+                  .set_index('id_geografia')
+                  .reindex(rejilla.codigos_postales))
+
+        # Media histórica por (código postal, tramo) como aproximación de los lags
+        medias = (df_sector.groupby(['id_geografia', 'id_tramo_horario'])['consumo_kwh'].mean()
+                  .reindex(pd.MultiIndex.from_product([rejilla.codigos_postales, rejilla.tramos])))
+        perfil = medias.to_numpy().reshape(len(rejilla.codigos_postales), len(rejilla.tramos))
+
+        sectores[int(id_sector)] = {
+            'categorias': categorias,
+            'poblacion': por_cp['poblacion'].to_numpy(dtype=np.float64) if 'poblacion' in por_cp else None,
+            'nombre_barrio': por_cp['nombre_barrio'].to_numpy() if 'nombre_barrio' in por_cp else None,
+            'nombre_distrito': por_cp['nombre_distrito'].to_numpy() if 'nombre_distrito' in por_cp else None,
+            'perfil_consumo': perfil,
+        }
+
+    return {'rejilla': rejilla, 'clima': clima, 'calendario': calendario, 'eventos': eventos,
+            'sectores': sectores}
+
+
+def construir_features(contexto, coords, id_sector, features, categoricas):
+    """
+    Construye el DataFrame de features de las filas de un trozo para un sector.
+
+    Todas las columnas se obtienen por indexación de arrays (sin bucles por fila).
+    Solo las features de 'categoricas' (columnas_categoricas() del modelo) se
+    envían como pd.Categorical; el resto, con su tipo original. Las
+    temperaturas de estación se desplazan con la temperatura del escenario
+    respecto a la climatología del mes y tramo; el resto del clima
+    (precipitación) sale de la climatología.
+    """
+    rejilla = contexto['rejilla']
+    cal = contexto['calendario']
+    sector = contexto['sectores'][id_sector]
+    categorias = sector['categorias']
+
+    i_fecha, i_tramo, i_cp = coords['fecha'], coords['tramo'], coords['codigo_postal']
+    tramo = rejilla.tramos[i_tramo]
+    mes = cal['mes'][i_fecha]
+    temperatura = rejilla.temperaturas[coords['temperatura']]
+    humedad = rejilla.humedades[coords['humedad']]
+    clima = contexto['clima'][mes - 1, tramo - 1]
+    perfil = sector['perfil_consumo'][i_cp, i_tramo]
+    dia_semana = cal['dia_semana'][i_fecha]
+
+    columnas = {
+        'anio': cal['anio'][i_fecha],
+        'mes': mes,
+        'dia_del_mes': cal['dia_del_mes'][i_fecha],
+        'es_fin_de_semana': dia_semana >= 5,
+        'es_festivo': cal['es_festivo'][i_fecha],
+        'es_fiesta_barrio': contexto['eventos']['es_fiesta_barrio'][i_fecha, i_cp],
+        'poblacion': sector['poblacion'][i_cp] if sector['poblacion'] is not None else np.nan,
+        'temperatura_media_ciudad': temperatura,
+        'humedad_media_ciudad': humedad,
+        'temp_cuadrado': temperatura ** 2,
+        'dist_confort': np.abs(temperatura - 20),
+        'temp_x_humedad': temperatura * humedad,
+    }
+    desfase = temperatura - clima[:, COLUMNAS_CLIMA.index('temperatura_media_ciudad')]
+    for j, nombre in enumerate(COLUMNAS_CLIMA):
+        columnas.setdefault(nombre, clima[:, j] + desfase if nombre in COLUMNAS_TEMP_ESTACION else clima[:, j])
+    for nombre in COLUMNAS_LAG:
+        columnas[nombre] = perfil
+
+    valores_categoricos = {
+        'id_geografia': np.asarray(rejilla.codigos_postales)[i_cp],
+        'id_tramo_horario': tramo,
+        'dia_de_la_semana_nombre': np.asarray(DIAS_SEMANA, dtype=object)[dia_semana],
+        'nombre_barrio': sector['nombre_barrio'][i_cp] if sector['nombre_barrio'] is not None else None,
+        'nombre_distrito': sector['nombre_distrito'][i_cp] if sector['nombre_distrito'] is not None else None,
+        'nombre_fiesta': contexto['eventos']['nombre_fiesta'][i_fecha, i_cp],
+    }
+    for nombre, valores in valores_categoricos.items():
+        if nombre in features and valores is not None:
+            if nombre in categoricas:
+                columnas[nombre] = pd.Categorical(valores, categories=categorias.get(nombre))
+            else:
+                columnas[nombre] = valores
+
+    return pd.DataFrame({c: columnas[c] for c in features})
+
+
+# --- 4. PROCESOS DE PUNTUACIÓN ---
+_CONTEXTO_PROCESO = None
+
+
+def _inicializar_proceso(ruta_modelos, contexto):
+    """Carga modelos y contexto una única vez por proceso."""
+    global _CONTEXTO_PROCESO
+    with open(ruta_modelos, 'rb') as file:
+        resultados = pickle.load(file)
+    modelos = {sector: res['modelo'] for sector, res in resultados.items()}
+    for modelo in modelos.values():
+        modelo.set_params(n_jobs=1)  # el paralelismo lo aporta el pool
+    _CONTEXTO_PROCESO = (modelos, contexto)
+
+
+def puntuar_trozo(inicio, fin, modelos=None, contexto=None):
+    """
+    Puntúa las filas [inicio, fin) de la rejilla.
+
+    Returns:
+        tuple: (inicio, fin, predicciones float32)
+    """
+    if modelos is None:
+        modelos, contexto = _CONTEXTO_PROCESO
+    rejilla = contexto['rejilla']
+    coords = rejilla.coordenadas(inicio, fin)
+    predicciones = np.full(fin - inicio, np.nan, dtype=np.float32)
+
+    sectores_trozo = rejilla.sectores[coords['sector']]
+    for id_sector in np.unique(sectores_trozo):
+        modelo = modelos.get(SECTOR_MAP[int(id_sector)])
+        if modelo is None:
+            continue
+        mascara = sectores_trozo == id_sector
+        coords_sector = {d: v[mascara] for d, v in coords.items()}
+        features = modelo.get_booster().feature_names
+        X = construir_features(contexto, coords_sector, int(id_sector), features, columnas_categoricas(modelo))
+        predicciones[mascara] = modelo.predict(X)
+    return inicio, fin, predicciones
+
+
+def _tabla_resultado(rejilla, inicio, fin, predicciones):
+    coords = rejilla.coordenadas(inicio, fin)
+    fechas = rejilla.fechas.values.astype('datetime64[D]')[coords['fecha']]
+    id_geografia = pa.DictionaryArray.from_arrays(
+        pa.array(coords['codigo_postal'].astype(np.int32)),
+        pa.array(rejilla.codigos_postales.astype(str))
+    )
+    return pa.table({
+        'id_sector_economico': pa.array(rejilla.sectores[coords['sector']].astype(np.int8)),
+        'fecha': pa.array(fechas, type=pa.date32()),
+        'id_tramo_horario': pa.array(rejilla.tramos[coords['tramo']].astype(np.int8)),
+        'id_geografia': id_geografia,
+        'temperatura_media_ciudad': pa.array(rejilla.temperaturas[coords['temperatura']].astype(np.float32)),
+        'humedad_media_ciudad': pa.array(rejilla.humedades[coords['humedad']].astype(np.float32)),
+        'consumo_kwh_predicho': pa.array(predicciones),
+    }, schema=ESQUEMA_SALIDA)
+
+
+class _Escritor:
+    """Escritor en streaming a Parquet (.parquet) o Arrow IPC (.arrow)."""
+
+    def __init__(self, ruta):
+        if ruta.endswith('.arrow'):
+            self._sink = pa.OSFile(ruta, 'wb')
+            self._writer = pa.ipc.new_file(self._sink, ESQUEMA_SALIDA)
+        else:
+            self._sink = None
+            self._writer = pq.ParquetWriter(ruta, ESQUEMA_SALIDA, compression='zstd')
+
+    def escribir(self, tabla):
+        self._writer.write_table(tabla)
+
+    def cerrar(self):
+        self._writer.close()
+        if self._sink is not None:
+            self._sink.close()
+
+
+def evaluar_rejilla(rejilla, ruta_modelos, df_historico, ruta_salida, festivos=(),
+                    n_procesos=None, filas_por_trozo=FILAS_POR_TROZO, indice_eventos=None):
+    """
+    Evalúa una rejilla completa y la escribe en streaming en ruta_salida.
+
+    Args:
+        rejilla (RejillaEscenarios): Escenarios a evaluar.
+        ruta_modelos (str): Pickle de modelos generado por 'train_model_final.py'.
+        df_historico (pd.DataFrame): Histórico para perfiles, categorías y climatología.
+        ruta_salida (str): Fichero .parquet o .arrow de destino.
+        festivos (iterable, optional): Fechas festivas.
+        n_procesos (int, optional): Procesos del pool. 0 = en el proceso actual.
+        filas_por_trozo (int): Filas por trozo (y por row group de salida).
+        indice_eventos (IndiceEventos, optional): Festivos y fiestas de barrio.
+
+    Returns:
+        dict: Filas, trozos, segundos y filas/s.
+    """
+    contexto = preparar_contexto(df_historico, rejilla, festivos, indice_eventos)
+    n_procesos = os.cpu_count() if n_procesos is None else n_procesos
+    escritor = _Escritor(ruta_salida)
+    inicio_reloj = time.perf_counter()
+    n_trozos = 0
+
+    try:
+        if n_procesos == 0:
+            _inicializar_proceso(ruta_modelos, contexto)
+            for inicio, fin in rejilla.trozos(filas_por_trozo):
+                escritor.escribir(_tabla_resultado(rejilla, *puntuar_trozo(inicio, fin)))
+                n_trozos += 1
+        else:
+            with ProcessPoolExecutor(max_workers=n_procesos, initializer=_inicializar_proceso,
+                                     initargs=(ruta_modelos, contexto)) as pool:
+                # Como máximo 2 trozos en vuelo por proceso: memoria acotada y orden preservado
+                en_vuelo = deque()
+                for inicio, fin in rejilla.trozos(filas_por_trozo):
+                    en_vuelo.append(pool.submit(puntuar_trozo, inicio, fin))
+                    if len(en_vuelo) >= 2 * n_procesos:
+                        escritor.escribir(_tabla_resultado(rejilla, *en_vuelo.popleft().result()))
+                        n_trozos += 1
+                while en_vuelo:
+                    escritor.escribir(_tabla_resultado(rejilla, *en_vuelo.popleft().result()))
+                    n_trozos += 1
+    finally:
+        escritor.cerrar()
+
+    segundos = time.perf_counter() - inicio_reloj
+    return {'filas': len(rejilla), 'trozos': n_trozos, 'segundos': segundos,
+            'filas_por_segundo': len(rejilla) / segundos if segundos else 0.0}
+
+
+# --- 5. EJECUCIÓN PRINCIPAL ---
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from fuentes_datos import crear_fuente
+    from indice_eventos import cargar_indice, RUTA_INDICE
+
+    print("--- Iniciando el motor de rejillas de escenarios ---")
+    load_dotenv()
+    TABLE_ID = "gold_data.modelo_final_v2"
+    MODEL_FILE = 'modelos_entrenados_por_sector.pkl'
+    OUTPUT_FILE = 'escenarios_estres.parquet'
+
+    print(f"\nPaso 1: Cargando histórico desde '{TABLE_ID}'...")
+    try:
+        df_historico = crear_fuente().leer_tabla(TABLE_ID)
+        print(f"✅ Carga de datos completada. Se han cargado {len(df_historico)} registros.")
+    except Exception as e:
+        print(f"❌ Error al cargar datos desde la fuente: {e}")
+        exit()
+
+    # Ola de calor de julio: 5 a 40 °C, humedad 30-90 %, todos los CP y sectores
+    rejilla = RejillaEscenarios(
+        temperaturas=np.arange(5, 41, 1.0),
+        humedades=np.arange(30, 91, 10.0),
+        fechas=pd.date_range('2025-07-01', '2025-07-31'),
+        codigos_postales=sorted(df_historico['id_geografia'].unique()),
+    )
+    print(f"\nPaso 2: Evaluando {len(rejilla):,} escenarios...")
+    indice_eventos = cargar_indice()
+    if indice_eventos is None:
+        print(f"   (sin '{RUTA_INDICE}': escenarios sin festivos ni fiestas de barrio; genéralo con 'indice_eventos.py')")
+    resumen = evaluar_rejilla(rejilla, MODEL_FILE, df_historico, OUTPUT_FILE, indice_eventos=indice_eventos)
+    print(f"✅ {resumen['filas']:,} escenarios en {resumen['segundos']:.1f} s "
+          f"({resumen['filas_por_segundo']:,.0f} filas/s). Resultados en '{OUTPUT_FILE}'.")
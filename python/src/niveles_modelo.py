@@ -0,0 +1,161 @@
+# ============================================================================
+# FAMILIAS DE MODELOS POR NIVELES DE LATENCIA
+# ============================================================================
+# Autor: Julio Clavijo
+# Versión: 1.0
+#
+# Descripción:
+# Cada sector tenía un único modelo de hasta 1000 árboles de profundidad 8,
+# igual para la predicción por lotes que para las consultas interactivas.
+# Este módulo construye, a partir del modelo entrenado, una familia de niveles:
+#
+#   1. 'completo': todos los árboles (incluidos los posteriores a la mejor
+#      iteración del early stopping).
+#   2. 'truncado': el mismo booster limitado a best_iteration + 1 árboles
+#      (iteration_range); no ocupa memoria adicional.
+#   3. 'destilado': un modelo poco profundo ajustado a las predicciones del
+#      modelo truncado sobre el conjunto de entrenamiento; su early stopping
+#      usa el último tramo cronológico del entrenamiento, no el de prueba.
+#
+# De cada nivel se mide el MAPE sobre el conjunto de prueba, la latencia de
+# una predicción de una fila (p50/p95) y el coste por fila en lote. El
+# predictor elige el nivel más preciso que cabe en un presupuesto de latencia.
+# ============================================================================
+
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.metrics import mean_absolute_percentage_error
+
+# --- 1. CONFIGURACIÓN ---
+NIVELES = ('completo', 'truncado', 'destilado')
+PROFUNDIDAD_DESTILADO = int(os.getenv("DESTILADO_PROFUNDIDAD", 6))
+ARBOLES_DESTILADO = int(os.getenv("DESTILADO_MAX_ARBOLES", 100))
+TASA_DESTILADO = 0.3
+FRACCION_VALIDACION_DESTILADO = 0.2  # final del entrenamiento reservado al early stopping del destilado
+MUESTRAS_LATENCIA = 200   # predicciones de una fila por nivel
+FILAS_LOTE_LATENCIA = 20_000
+
+
+# --- 2. PREDICCIÓN POR NIVEL ---
+
+def rango_nivel(nivel):
+    """iteration_range del nivel para XGBRegressor.predict / inplace_predict."""
+    return tuple(nivel['iteration_range'])
+
+
+def predecir_nivel(nivel, X):
+    """Predicción de un nivel (X con las features y tipos del entrenamiento)."""
+    return nivel['modelo'].predict(X, iteration_range=rango_nivel(nivel))
+
+
+def medir_latencia(nivel, X, muestras=MUESTRAS_LATENCIA, filas_lote=FILAS_LOTE_LATENCIA, semilla=0):
+    """
+    Latencia de un nivel: p50/p95 de predicciones de una fila (ms) y
+    microsegundos por fila en un lote.
+    """
+    rng = np.random.default_rng(semilla)
+    posiciones = rng.choice(len(X), size=min(muestras, len(X)), replace=False)
+    predecir_nivel(nivel, X.iloc[[posiciones[0]]])  # calentamiento
+    tiempos = []
+    for posicion in posiciones:
+        reloj = time.perf_counter()
+        predecir_nivel(nivel, X.iloc[[posicion]])
+        tiempos.append((time.perf_counter() - reloj) * 1000)
+    lote = X.iloc[:filas_lote]
+    reloj = time.perf_counter()
+    predecir_nivel(nivel, lote)
+    return {
+        'latencia_p50_ms': float(np.percentile(tiempos, 50)),
+        'latencia_p95_ms': float(np.percentile(tiempos, 95)),
+        'us_por_fila_lote': (time.perf_counter() - reloj) * 1e6 / max(len(lote), 1),
+    }
+
+
+# --- 3. CONSTRUCCIÓN DE LOS NIVELES ---
+
+def destilar(modelo, X_train, profundidad=PROFUNDIDAD_DESTILADO, max_arboles=ARBOLES_DESTILADO,
+             fraccion_validacion=FRACCION_VALIDACION_DESTILADO):
+    """
+    Modelo poco profundo ajustado a las predicciones del modelo (maestro)
+    truncado a su mejor iteración. El early stopping usa el último
+    'fraccion_validacion' (cronológico) de X_train, de modo que el conjunto
+    de prueba con el que se compara el nivel no interviene en su ajuste.
+    """
+    corte = int(len(X_train) * (1 - fraccion_validacion))
+    X_ajuste, X_validacion = X_train[:corte], X_train[corte:]
+    alumno = xgb.XGBRegressor(objective='reg:squarederror', n_estimators=max_arboles, learning_rate=TASA_DESTILADO,
+                              max_depth=profundidad, early_stopping_rounds=10, enable_categorical=True,
+                              n_jobs=modelo.get_params().get('n_jobs'))
+    alumno.fit(X_ajuste, modelo.predict(X_ajuste),
+               eval_set=[(X_validacion, modelo.predict(X_validacion))], verbose=False)
+    return alumno
+
+
+def construir_niveles(modelo, X_train, X_test, y_test, destilado=True):
+    """
+    Familia de niveles de un modelo entrenado con early stopping.
+
+    Args:
+        modelo (xgb.XGBRegressor): Modelo completo del sector.
+        X_train, X_test, y_test: Conjuntos del entrenamiento (división cronológica).
+        destilado (bool): Si se entrena el nivel destilado.
+
+    Returns:
+        dict: {nivel: {'modelo', 'iteration_range', 'arboles', 'profundidad',
+            'mape', 'latencia_p50_ms', 'latencia_p95_ms', 'us_por_fila_lote',
+            'segundos_construccion'}}
+    """
+    total = modelo.get_booster().num_boosted_rounds()
+    try:
+        mejor = int(modelo.best_iteration) + 1
+    except AttributeError:
+        mejor = total
+    niveles = {
+        'completo': {'modelo': modelo, 'iteration_range': (0, total), 'arboles': total, 'segundos_construccion': 0.0},
+        'truncado': {'modelo': modelo, 'iteration_range': (0, mejor), 'arboles': mejor, 'segundos_construccion': 0.0},
+    }
+    if destilado:
+        reloj = time.perf_counter()
+        alumno = destilar(modelo, X_train)
+        arboles = alumno.get_booster().num_boosted_rounds()
+        try:
+            arboles = int(alumno.best_iteration) + 1
+        except AttributeError:
+            pass
+        niveles['destilado'] = {'modelo': alumno, 'iteration_range': (0, arboles), 'arboles': arboles,
+                                'segundos_construccion': time.perf_counter() - reloj}
+    for nivel in niveles.values():
+        nivel['profundidad'] = nivel['modelo'].get_params().get('max_depth')
+        nivel['mape'] = mean_absolute_percentage_error(y_test, predecir_nivel(nivel, X_test)) * 100
+        nivel.update(medir_latencia(nivel, X_test))
+    return niveles
+
+
+# --- 4. ELECCIÓN POR PRESUPUESTO ---
+
+def elegir_nivel(niveles, presupuesto_ms=None, medida='latencia_p95_ms'):
+    """
+    Nombre del nivel más preciso (menor MAPE) cuya latencia cabe en el
+    presupuesto; sin presupuesto, el truncado (o el completo). Si ninguno
+    cabe, el más rápido.
+    """
+    if presupuesto_ms is None:
+        return 'truncado' if 'truncado' in niveles else next(iter(niveles))
+    caben = [n for n, nivel in niveles.items() if nivel[medida] <= presupuesto_ms]
+    if caben:
+        return min(caben, key=lambda n: niveles[n]['mape'])
+    return min(niveles, key=lambda n: niveles[n][medida])
+
+
+def resumen_niveles(niveles_por_sector):
+    """Tabla de texto de los niveles de cada sector."""
+    filas = [{'sector': sector, 'nivel': nombre,
+              **{k: v for k, v in nivel.items() if k not in ('modelo', 'iteration_range')}}
+             for sector, niveles in niveles_por_sector.items() for nombre, nivel in niveles.items()]
+    tabla = pd.DataFrame(filas, columns=['sector', 'nivel', 'arboles', 'profundidad', 'mape', 'latencia_p50_ms',
+                                         'latencia_p95_ms', 'us_por_fila_lote', 'segundos_construccion'])
+    return tabla.round(3).to_string(index=False)
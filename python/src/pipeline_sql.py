@@ -0,0 +1,261 @@
+# ============================================================================
+# EJECUTOR EN PARALELO DEL PIPELINE SQL (BQ/SILVER Y BQ/GOLD)
+# ============================================================================
+# Autor: Julio Clavijo
+# Versión: 1.0
+#
+# Descripción:
+# Los scripts numerados de 'bq/silver' (01-08) y 'bq/gold' (08-09) se
+# ejecutaban a mano y en orden, aunque muchos son independientes entre sí.
+# Este script:
+#
+#   1. Lee cada script, su tabla destino (CREATE ... TABLE) y las tablas que
+#      referencia, y construye con ello un grafo de dependencias (DAG).
+#   2. Ejecuta en paralelo los nodos cuyas dependencias ya han terminado.
+#   3. Omite los nodos sin cambios: la firma de un nodo combina el hash del
+#      SQL, las firmas de los nodos de los que depende y la fecha de última
+#      modificación de las tablas externas (bronze). Si coincide con la de la
+#      última ejecución correcta y la tabla existe, no se vuelve a ejecutar.
+#   4. Informa del tiempo de cada nodo.
+#
+# Funciona contra BigQuery o contra la réplica local en DuckDB (fuentes_datos).
+# ============================================================================
+
+import os
+import re
+import json
+import glob
+import time
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from fuentes_datos import crear_fuente
+
+# --- 1. CONFIGURACIÓN ---
+RUTA_BQ = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'bq')
+CAPAS = ['silver', 'gold']
+RUTA_ESTADO = os.getenv("PIPELINE_ESTADO_PATH", '.estado_pipeline_sql.json')
+N_HILOS = 4
+
+
+# --- 2. CONSTRUCCIÓN DEL GRAFO ---
+
+def _nombre_tabla(referencia):
+    """`proyecto.dataset.tabla` -> 'dataset.tabla'."""
+    return '.'.join(referencia.split('.')[-2:])
+
+
+def leer_nodo(ruta_sql):
+    """
+    Analiza un script del pipeline.
+
+    Returns:
+        dict: nombre, ruta, destino ('dataset.tabla'), entradas (tablas
+              leídas, sin el destino) y hash del contenido.
+    """
+    with open(ruta_sql, encoding='utf-8') as file:
+        sql = file.read()
+    sin_comentarios = re.sub(r'--[^\n]*', '', sql)
+    destino = re.search(r'CREATE\s+(?:OR\s+REPLACE\s+)?TABLE\s+`([^`]+)`', sin_comentarios, re.IGNORECASE)
+    if destino is None:
+        raise ValueError(f"'{ruta_sql}' no crea ninguna tabla")
+    destino = _nombre_tabla(destino.group(1))
+    # Las referencias a tablas son identificadores con al menos dataset.tabla
+    referencias = {_nombre_tabla(r) for r in re.findall(r'`([\w-]+(?:\.[\w-]+){1,2})`', sin_comentarios)}
+    return {
+        'nombre': os.path.splitext(os.path.basename(ruta_sql))[0],
+        'ruta': ruta_sql,
+        'destino': destino,
+        'entradas': sorted(referencias - {destino}),
+        'hash_sql': hashlib.sha1(sql.encode('utf-8')).hexdigest(),
+    }
+
+
+def construir_dag(ruta_bq=RUTA_BQ, capas=CAPAS, omitir=()):
+    """
+    Lee los scripts de las capas indicadas y resuelve las dependencias.
+
+    Los nodos de 'omitir' no se ejecutan y su tabla destino pasa a ser una
+    entrada externa (p. ej. fact_clima_horario cargada por clima_silver).
+
+    Returns:
+        dict: {nombre_nodo: nodo}, donde cada nodo incluye 'depende_de'
+              (nodos productores de sus entradas) y 'externas' (entradas
+              que ningún script del pipeline produce, p. ej. bronze).
+    """
+    nodos = {}
+    for capa in capas:
+        for ruta in sorted(glob.glob(os.path.join(ruta_bq, capa, '*.sql'))):
+            nodo = leer_nodo(ruta)
+            if nodo['nombre'] not in omitir:
+                nodos[nodo['nombre']] = nodo
+    productores = {nodo['destino']: nombre for nombre, nodo in nodos.items()}
+    for nodo in nodos.values():
+        nodo['depende_de'] = sorted({productores[t] for t in nodo['entradas'] if t in productores})
+        nodo['externas'] = [t for t in nodo['entradas'] if t not in productores]
+    return nodos
+
+
+def firma_nodo(nodo, firmas_previas, fuente):
+    """
+    Firma de un nodo a partir del hash de su SQL, las firmas de sus
+    dependencias y la última modificación de sus entradas externas. None si
+    alguna entrada externa no informa de su modificación o si alguna
+    dependencia no tiene firma (se ejecutan siempre, y lo que dependa de
+    ellos también).
+    """
+    if any(firmas_previas[d] is None for d in nodo['depende_de']):
+        return None
+    partes = [nodo['hash_sql']]
+    partes += [f"{d}={firmas_previas[d]}" for d in nodo['depende_de']]
+    for tabla in nodo['externas']:
+        modificacion = fuente.ultima_modificacion(tabla)
+        if modificacion is None:
+            return None
+        partes.append(f"{tabla}@{modificacion}")
+    return hashlib.sha1('|'.join(partes).encode('utf-8')).hexdigest()
+
+
+# --- 3. EJECUCIÓN ---
+
+def _cargar_estado(ruta_estado):
+    if ruta_estado and os.path.exists(ruta_estado):
+        with open(ruta_estado, encoding='utf-8') as file:
+            return json.load(file)
+    return {}
+
+
+def _guardar_estado(estado, ruta_estado):
+    if not ruta_estado:
+        return
+    temporal = f"{ruta_estado}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as file:
+        json.dump(estado, file, indent=2, sort_keys=True)
+    os.replace(temporal, ruta_estado)
+
+
+def ejecutar_dag(fuente, nodos, n_hilos=N_HILOS, forzar=False, ruta_estado=RUTA_ESTADO, ejecutar_nodo=None):
+    """
+    Ejecuta el grafo respetando las dependencias, en paralelo.
+
+    Args:
+        fuente (FuenteDatos): BigQuery o DuckDB local.
+        nodos (dict): Salida de construir_dag().
+        n_hilos (int): Nodos ejecutándose a la vez.
+        forzar (bool): Ejecutar todos los nodos aunque no hayan cambiado.
+        ruta_estado (str): JSON con la firma de la última ejecución correcta
+            de cada nodo (None para no persistir).
+        ejecutar_nodo (callable, optional): fn(fuente, nodo) que ejecuta un
+            nodo; por defecto, fuente.ejecutar_fichero(nodo['ruta']).
+
+    Returns:
+        list: Un dict por nodo con estado ('ejecutado', 'omitido', 'error',
+              'bloqueado'), segundos, inicio relativo y error si lo hubo.
+    """
+    ejecutar_nodo = ejecutar_nodo or (lambda fuente, nodo: fuente.ejecutar_fichero(nodo['ruta']))
+    estado = _cargar_estado(ruta_estado)
+    pendientes = dict(nodos)
+    resultados, firmas, en_curso = {}, {}, {}
+    reloj = time.perf_counter()
+
+    def _tarea(nodo):
+        inicio = time.perf_counter()
+        ejecutar_nodo(fuente, nodo)
+        return inicio - reloj, time.perf_counter() - inicio
+
+    with ThreadPoolExecutor(max_workers=n_hilos) as pool:
+        while pendientes or en_curso:
+            listos = [n for n, nodo in pendientes.items() if all(d in resultados for d in nodo['depende_de'])]
+            if not listos and not en_curso:
+                raise ValueError(f"Dependencias circulares entre: {sorted(pendientes)}")
+
+            for nombre in listos:
+                nodo = pendientes.pop(nombre)
+                if any(resultados[d]['estado'] in ('error', 'bloqueado') for d in nodo['depende_de']):
+                    resultados[nombre] = {'nodo': nombre, 'estado': 'bloqueado', 'inicio': None, 'segundos': 0.0}
+                    continue
+                firma = firma_nodo(nodo, firmas, fuente)
+                firmas[nombre] = firma
+                if (not forzar and firma is not None and estado.get(nombre) == firma
+                        and fuente.existe_tabla(nodo['destino'])):
+                    resultados[nombre] = {'nodo': nombre, 'estado': 'omitido', 'inicio': None, 'segundos': 0.0}
+                    continue
+                en_curso[pool.submit(_tarea, nodo)] = nombre
+
+            if not en_curso:
+                continue  # los nodos omitidos pueden haber desbloqueado otros
+            terminados, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+            for futuro in terminados:
+                nombre = en_curso.pop(futuro)
+                try:
+                    inicio, segundos = futuro.result()
+                    resultados[nombre] = {'nodo': nombre, 'estado': 'ejecutado', 'inicio': inicio, 'segundos': segundos}
+                    if firmas[nombre] is not None:
+                        estado[nombre] = firmas[nombre]
+                        _guardar_estado(estado, ruta_estado)
+                except Exception as e:
+                    resultados[nombre] = {'nodo': nombre, 'estado': 'error', 'inicio': None, 'segundos': 0.0,
+                                          'error': str(e)}
+                    estado.pop(nombre, None)
+                    _guardar_estado(estado, ruta_estado)
+
+    return [resultados[n] for n in nodos]
+
+
+def informe(resultados, segundos_totales):
+    """Tabla de texto con los tiempos por nodo y el paralelismo efectivo."""
+    lineas = [f"{'nodo':<36} {'estado':<10} {'inicio':>8} {'segundos':>9}"]
+    for r in resultados:
+        inicio = f"{r['inicio']:.2f}" if r['inicio'] is not None else '-'
+        lineas.append(f"{r['nodo']:<36} {r['estado']:<10} {inicio:>8} {r['segundos']:>9.2f}"
+                      + (f"  {r['error']}" if r.get('error') else ''))
+    suma = sum(r['segundos'] for r in resultados)
+    lineas.append(f"Tiempo total: {segundos_totales:.2f} s (suma de nodos {suma:.2f} s, "
+                  f"paralelismo efectivo {suma / segundos_totales if segundos_totales else 0:.1f}x)")
+    return '\n'.join(lineas)
+
+
+# --- 4. EJECUCIÓN PRINCIPAL ---
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description="Ejecuta el pipeline SQL de 'bq/' como un DAG en paralelo")
+    parser.add_argument('--fuente', choices=['bigquery', 'duckdb'], help="Sobrescribe FUENTE_DATOS")
+    parser.add_argument('--capas', nargs='+', default=CAPAS, help="Subdirectorios de 'bq/' a incluir")
+    parser.add_argument('--omitir', nargs='+', default=[],
+                        help="Nodos que no se ejecutan (su tabla se carga por otra vía)")
+    parser.add_argument('--hilos', type=int, default=N_HILOS, help="Nodos ejecutándose a la vez")
+    parser.add_argument('--forzar', action='store_true', help="Ejecuta todos los nodos aunque no hayan cambiado")
+    parser.add_argument('--gold-incremental', action='store_true',
+                        help="Refresca fact_consumo_horario y las tablas gold existentes solo en las fechas "
+                             "nuevas (materializacion_gold)")
+    parser.add_argument('--estado', default=RUTA_ESTADO, help="Fichero JSON con las firmas de la última ejecución")
+    parser.add_argument('--mostrar', action='store_true', help="Solo muestra el grafo, sin ejecutar")
+    args = parser.parse_args()
+
+    load_dotenv()
+    nodos = construir_dag(capas=args.capas, omitir=args.omitir)
+    print(f"--- Pipeline SQL: {len(nodos)} nodos ---")
+    for nombre, nodo in nodos.items():
+        print(f"   - {nombre} -> {nodo['destino']} (depende de: {', '.join(nodo['depende_de']) or 'bronze'})")
+    if args.mostrar:
+        exit()
+
+    ejecutar_nodo = None
+    if args.gold_incremental:
+        from materializacion_gold import SCRIPTS_SILVER, materializar_gold
+
+        def ejecutar_nodo(fuente, nodo):
+            script = os.path.basename(nodo['ruta'])
+            if os.path.basename(os.path.dirname(nodo['ruta'])) == 'gold':
+                materializar_gold(fuente, scripts=[script], scripts_silver=[])
+            elif script in SCRIPTS_SILVER:
+                materializar_gold(fuente, scripts=[], scripts_silver=[script])
+            else:
+                fuente.ejecutar_fichero(nodo['ruta'])
+
+    fuente = crear_fuente(args.fuente)
+    inicio = time.perf_counter()
+    resultados = ejecutar_dag(fuente, nodos, args.hilos, args.forzar, args.estado, ejecutar_nodo)
+    print("\n" + informe(resultados, time.perf_counter() - inicio))
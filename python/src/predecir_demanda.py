@@ -7,8 +7,11 @@
 # Descripción:
 # Este script carga los modelos segmentados entrenados por 'train_model_final.py'
 # y los utiliza para realizar predicciones de demanda para escenarios específicos.
+# Si el pickle trae niveles de latencia (niveles_modelo.py), cada predicción usa
+# el nivel más preciso que cabe en el presupuesto (PREDICCION_PRESUPUESTO_MS).
 # ============================================================================
 
+import os
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -16,6 +19,9 @@ from datetime import datetime
 import pickle
 import warnings
 
+from indice_eventos import cargar_indice
+from niveles_modelo import elegir_nivel, predecir_nivel
+
 warnings.filterwarnings('ignore', category=FutureWarning)
 
 # --- 1. CARGA DE MODELOS ENTRENADOS (PICKLE) ---
@@ -23,12 +29,15 @@ print("--- Iniciando Sistema de Predicción de Demanda ---")
 print("\nPaso 1: Cargando modelos entrenados...")
 
 MODEL_FILE = 'modelos_entrenados_por_sector.pkl'
+# Latencia máxima por predicción (ms, p95 medido al entrenar); sin valor, el nivel truncado
+PRESUPUESTO_MS = float(os.getenv("PREDICCION_PRESUPUESTO_MS")) if os.getenv("PREDICCION_PRESUPUESTO_MS") else None
 try:
     with open(MODEL_FILE, 'rb') as file:
         resultados_cargados = pickle.load(file)
     
     # Extraemos solo el objeto del modelo de la estructura guardada
     modelos_entrenados = {sector: res['modelo'] for sector, res in resultados_cargados.items()}
+    niveles_entrenados = {sector: res['niveles'] for sector, res in resultados_cargados.items() if res.get('niveles')}
     print(f"✅ Modelos para los sectores {list(modelos_entrenados.keys())} cargados correctamente.")
     
 except FileNotFoundError:
@@ -39,16 +48,29 @@ except FileNotFoundError:
 # --- 2. DEFINICIÓN DE LA CLASE PREDICTORA ---
 
 class PredictorDemanda:
-    def __init__(self, modelos):
+    def __init__(self, modelos, indice_eventos=None, niveles=None, presupuesto_ms=None):
         self.modelos = modelos
+        # Niveles de latencia por sector (opcional) y presupuesto por defecto en ms
+        self.niveles = niveles or {}
+        self.presupuesto_ms = presupuesto_ms
+        # Índice de festivos y fiestas de barrio (indice_eventos.py); sin él, el escenario no tiene fiesta
+        self.indice_eventos = indice_eventos
         self.tramo_horario_map = {1: '00-06h', 2: '06-12h', 3: '12-18h', 4: '18-00h'}
 
-    def _preparar_features(self, datos_entrada, historicos):
+    def _preparar_features(self, datos_entrada, historicos, categoricas=None):
         """Prepara el DataFrame de una fila para la predicción."""
         
         # Copiamos para no modificar el original
         df_pred = datos_entrada.copy()
 
+        # Festivos y fiestas de barrio a partir de la fecha y el código postal del escenario
+        if self.indice_eventos is not None and 'fecha' in df_pred.columns:
+            df_pred = self.indice_eventos.anotar(df_pred, sin_evento='Sin fiesta')
+        else:
+            for col, valor in {'es_festivo': False, 'es_fiesta_barrio': False, 'nombre_fiesta': 'Sin fiesta'}.items():
+                if col not in df_pred.columns:
+                    df_pred[col] = valor
+
         # Añadir features temporales (lags) usando los datos históricos
         # ¡IMPORTANTE! Para una predicción real, necesitaríamos los datos reales de las últimas horas/días.
         # Aquí lo SIMULAMOS usando el promedio histórico como una aproximación razonable.
@@ -61,30 +83,43 @@ class PredictorDemanda:
         df_pred['temp_cuadrado'] = df_pred['temperatura_media_ciudad'] ** 2
         df_pred['dist_confort'] = abs(df_pred['temperatura_media_ciudad'] - 20)
 
-        # Convertir tipos a categóricos (usando los códigos directamente)
-        for col in ['id_geografia', 'id_tramo_horario', 'nombre_fiesta', 'dia_de_la_semana_nombre', 'nombre_barrio', 'nombre_distrito']:
+        # Convertir tipos a categóricos (usando los códigos directamente); si se conocen,
+        # solo las columnas que el modelo trató como categóricas al entrenar
+        if categoricas is None:
+            categoricas = ['id_geografia', 'id_tramo_horario', 'nombre_fiesta', 'dia_de_la_semana_nombre', 'nombre_barrio', 'nombre_distrito']
+        for col in categoricas:
             if col in df_pred.columns:
                  df_pred[col] = pd.Categorical(df_pred[col])
         
         return df_pred
 
-    def predecir(self, sector, datos_entrada, historicos):
-        """Realiza una predicción para un escenario dado."""
+    def nivel(self, sector, presupuesto_ms=None):
+        """Nombre del nivel que se usará para el sector (None sin niveles)."""
+        if sector not in self.niveles:
+            return None
+        return elegir_nivel(self.niveles[sector], presupuesto_ms if presupuesto_ms is not None else self.presupuesto_ms)
+
+    def predecir(self, sector, datos_entrada, historicos, presupuesto_ms=None):
+        """Realiza una predicción para un escenario dado (con el nivel que quepa en el presupuesto)."""
         
         if sector not in self.modelos:
             raise ValueError(f"Sector '{sector}' no válido. Modelos disponibles: {list(self.modelos.keys())}")
         
-        modelo = self.modelos[sector]
+        nombre_nivel = self.nivel(sector, presupuesto_ms)
+        nivel = self.niveles[sector][nombre_nivel] if nombre_nivel else None
+        modelo = nivel['modelo'] if nivel else self.modelos[sector]
         
         # Preparar las features para la predicción
-        df_pred = self._preparar_features(datos_entrada, historicos)
+        booster = modelo.get_booster()
+        categoricas = [f for f, tipo in zip(booster.feature_names, booster.feature_types or []) if tipo == 'c'] or None
+        df_pred = self._preparar_features(datos_entrada, historicos, categoricas)
         
         # Asegurar que las columnas están en el mismo orden que en el entrenamiento
-        features_ordenadas = modelo.get_booster().feature_names
+        features_ordenadas = booster.feature_names
         df_pred = df_pred[features_ordenadas]
         
         # Realizar predicción
-        prediccion = modelo.predict(df_pred)
+        prediccion = predecir_nivel(nivel, df_pred) if nivel else modelo.predict(df_pred)
         return prediccion[0]
 
 # --- 3. EJEMPLO DE USO ---
@@ -92,7 +127,8 @@ if __name__ == "__main__":
     print("\nPaso 2: Realizando una predicción de ejemplo...")
     
     # Creamos una instancia del predictor
-    predictor = PredictorDemanda(modelos_entrenados)
+    predictor = PredictorDemanda(modelos_entrenados, indice_eventos=cargar_indice(),
+                                 niveles=niveles_entrenados, presupuesto_ms=PRESUPUESTO_MS)
 
     # Definimos un escenario para el que queremos predecir
     # NOTA: Los datos históricos son una simplificación. En producción, se usarían datos reales.
@@ -100,7 +136,8 @@ if __name__ == "__main__":
     datos_historicos_simulados = pd.DataFrame({'consumo_kwh': [20000, 21000]}) # Lo convertimos a un DataFrame
     
     escenario = pd.DataFrame([{
-        'id_geografia': 8001,
+        'fecha': '2025-07-15',
+        'id_geografia': '08001',
         'id_tramo_horario': 4, # Tarde-noche (18-00h)
         'temperatura_media_ciudad': 28.5,
         'humedad_media_ciudad': 65.0,
@@ -109,8 +146,6 @@ if __name__ == "__main__":
         'poblacion': 22000,
         'dia_del_mes': 15,
         'es_fin_de_semana': False,
-        'es_festivo': False,
-        'nombre_fiesta': 'Sin fiesta',
         'dia_de_la_semana_nombre': 'Tuesday',
         'nombre_barrio': 'El Gòtic',
         'nombre_distrito': 'Ciutat Vella',
@@ -130,6 +165,8 @@ if __name__ == "__main__":
         print("⚡ RESULTADO DE LA PREDICCIÓN ⚡")
         print("="*50)
         print(f"Sector: {sector_a_predecir}")
+        if predictor.nivel(sector_a_predecir):
+            print(f"Nivel del modelo: {predictor.nivel(sector_a_predecir)}")
         print(f"Escenario (Temperatura): {escenario['temperatura_media_ciudad'].iloc[0]}°C")
         print(f"Consumo Predicho: {consumo_predicho:,.0f} kWh")
         print("="*50)
@@ -0,0 +1,448 @@
+# ============================================================================
+# MOTOR DE PRONÓSTICO MULTI-HORIZONTE (RECURSIVO Y VECTORIZADO)
+# ============================================================================
+# Autor: Julio Clavijo
+# Versión: 1.0
+#
+# Descripción:
+# Los modelos por sector dependen de 'consumo_lag_1_hora', 'consumo_lag_2_horas',
+# 'consumo_lag_1_dia' y 'consumo_media_movil_7d'. Para pronosticar más de un
+# tramo hacia delante hay que realimentar cada predicción como lag del paso
+# siguiente. Este módulo avanza TODOS los códigos postales de un sector a la
+# vez, tramo a tramo, con una única llamada a 'predict' por paso:
+#
+#   - El histórico reciente de cada serie (sector, id_geografia) se guarda en
+#     un buffer circular 2-D (n_codigos_postales x 28 tramos).
+#   - Los lags se leen del buffer por índice y la media móvil se mantiene de
+#     forma incremental (suma y recuento por fila), sin bucles en Python.
+#
+# Nota: en entrenamiento la media móvil de 28 tramos incluye el tramo actual
+# (rolling sobre el propio 'consumo_kwh'). Al pronosticar ese valor no se
+# conoce, así que aquí se usa la media de los 28 tramos anteriores.
+# ============================================================================
+
+import time
+import pickle
+import warnings
+
+import numpy as np
+import pandas as pd
+
+warnings.filterwarnings('ignore', category=FutureWarning)
+
+# --- 1. CONFIGURACIÓN ---
+SECTOR_MAP = {1: 'Industrial', 2: 'Residencial', 3: 'Servicios'}
+TRAMOS_POR_DIA = 4
+VENTANA_MEDIA_MOVIL = 28  # 4 tramos * 7 días, igual que en el entrenamiento
+
+COLUMNAS_CLIMA = [
+    'temperatura_media_ciudad', 'humedad_media_ciudad', 'precipitacion_total_ciudad',
+    'temp_raval', 'temp_zuniversitaria', 'temp_fabra', 'temp_spread_montana_centro'
+]
+# Temperaturas por estación: al fijar la de ciudad se desplazan lo mismo, de modo
+# que conservan su diferencia climatológica (y temp_spread_montana_centro no cambia)
+COLUMNAS_TEMP_ESTACION = ['temp_raval', 'temp_zuniversitaria', 'temp_fabra']
+COLUMNAS_ESTATICAS_CP = ['nombre_barrio', 'nombre_distrito', 'poblacion']
+# Mismo formato que dim_calendario, indexado por datetime.weekday()
+DIAS_SEMANA = ['lunes', 'martes', 'miércoles', 'jueves', 'viernes', 'sábado', 'domingo']
+SIN_FIESTA = 'Sin fiesta'
+
+
+# --- 2. FUNCIONES AUXILIARES ---
+
+def indice_paso(fechas, tramos):
+    """Convierte (fecha, tramo 1-4) en un índice entero de paso consecutivo."""
+    dias = pd.to_datetime(fechas).values.astype('datetime64[D]').astype(np.int64)
+    return dias * TRAMOS_POR_DIA + (np.asarray(tramos, dtype=np.int64) - 1)
+
+
+def paso_a_fecha_tramo(paso):
+    dia, tramo = divmod(int(paso), TRAMOS_POR_DIA)
+    return pd.Timestamp(np.datetime64(dia, 'D')), tramo + 1
+
+
+def _categorias_desde(df, columna):
+    """Categorías tal y como las genera .astype('category') en el entrenamiento."""
+    if columna not in df.columns:
+        return None
+    return pd.Index(df[columna].dropna().unique()).sort_values()
+
+
+def categorias_historico(df):
+    """
+    {columna: categorías} de las columnas de texto o categóricas del histórico
+    (las que el entrenamiento convierte a 'category'), más los tramos 1-4.
+    """
+    categorias = {c: _categorias_desde(df, c) for c in df.columns if df[c].dtype.name in ('object', 'category')}
+    categorias.setdefault('id_tramo_horario', pd.Index(range(1, TRAMOS_POR_DIA + 1)))
+    return categorias
+
+
+def columnas_categoricas(modelo):
+    """
+    Features que el modelo trata como categóricas ('c' en feature_types). Los
+    tipos los decide el entrenamiento: p. ej. 'id_tramo_horario' es entero en
+    los modelos de train_model_final.py y enviarlo como categórica falla.
+    """
+    booster = modelo.get_booster() if hasattr(modelo, 'get_booster') else modelo
+    return {f for f, tipo in zip(booster.feature_names or [], booster.feature_types or []) if tipo == 'c'}
+
+
+def climatologia_por_tramo(df_historico):
+    """
+    Calcula el clima medio por (mes, tramo) para rellenar el clima futuro
+    cuando no se dispone de un pronóstico meteorológico.
+
+    Returns:
+        pd.DataFrame: Indexado por (mes, id_tramo_horario) con COLUMNAS_CLIMA.
+    """
+    columnas = [c for c in COLUMNAS_CLIMA if c in df_historico.columns]
+    df = df_historico[['fecha', 'id_tramo_horario'] + columnas].copy()
+    df['mes'] = pd.to_datetime(df['fecha']).dt.month
+    return df.groupby(['mes', 'id_tramo_horario'])[columnas].mean()
+
+
+def construir_clima_futuro(climatologia, fechas, temperatura=None, humedad=None):
+    """
+    Genera un clima futuro por (fecha, tramo) a partir de la climatología,
+    sustituyendo opcionalmente la temperatura y la humedad por valores fijos.
+    Las temperaturas de estación se desplazan con la de ciudad
+    (COLUMNAS_TEMP_ESTACION) para que el modelo no reciba un clima incoherente.
+
+    Returns:
+        pd.DataFrame: Con 'fecha', 'id_tramo_horario' y las columnas de clima.
+    """
+    fechas = pd.to_datetime(pd.Index(fechas)).normalize()
+    rejilla = pd.MultiIndex.from_product([fechas, range(1, TRAMOS_POR_DIA + 1)],
+                                         names=['fecha', 'id_tramo_horario']).to_frame(index=False)
+    rejilla['mes'] = rejilla['fecha'].dt.month
+    clima = rejilla.merge(climatologia.reset_index(), on=['mes', 'id_tramo_horario'], how='left').drop(columns='mes')
+    if temperatura is not None:
+        desfase = float(temperatura) - clima['temperatura_media_ciudad']
+        for columna in COLUMNAS_TEMP_ESTACION:
+            if columna in clima:
+                clima[columna] = clima[columna] + desfase
+        clima['temperatura_media_ciudad'] = float(temperatura)
+    if humedad is not None:
+        clima['humedad_media_ciudad'] = float(humedad)
+    return clima
+
+
+# --- 3. ESTADO DE LAGS POR SECTOR ---
+
+class EstadoLags:
+    """
+    Estado recursivo de todas las series de un sector.
+
+    El buffer circular guarda el consumo del paso absoluto 'p' en la columna
+    p % VENTANA_MEDIA_MOVIL, de modo que el lag k del paso t está en
+    (t - k) % VENTANA_MEDIA_MOVIL. Los huecos del histórico quedan como NaN,
+    que XGBoost trata como valores ausentes igual que en el entrenamiento.
+    """
+
+    def __init__(self, df_sector, categorias=None):
+        """
+        Args:
+            df_sector (pd.DataFrame): Histórico de un único sector con al menos
+                'fecha', 'id_tramo_horario', 'id_geografia' y 'consumo_kwh'.
+            categorias (dict, optional): {columna: categorías} usadas en el
+                entrenamiento. Por defecto se derivan de df_sector.
+        """
+        pasos = indice_paso(df_sector['fecha'], df_sector['id_tramo_horario'])
+        self.ultimo_paso = int(pasos.max())
+
+        self.ids = pd.Index(df_sector['id_geografia'].unique()).sort_values()
+        n = len(self.ids)
+
+        # Volcar los últimos 28 tramos en el buffer circular (operación vectorizada)
+        recientes = pasos > self.ultimo_paso - VENTANA_MEDIA_MOVIL
+        filas = self.ids.get_indexer(df_sector['id_geografia'].values[recientes])
+        columnas = pasos[recientes] % VENTANA_MEDIA_MOVIL
+        self.buffer = np.full((n, VENTANA_MEDIA_MOVIL), np.nan)
+        self.buffer[filas, columnas] = df_sector['consumo_kwh'].values[recientes]
+
+        validos = ~np.isnan(self.buffer)
+        self.suma = np.where(validos, self.buffer, 0.0).sum(axis=1)
+        self.recuento = validos.sum(axis=1).astype(np.float64)
+
+        # Atributos estáticos por código postal (último valor conocido)
+        ultimos = (df_sector.assign(_paso=pasos)
+                   .sort_values('_paso')
+                   .drop_duplicates('id_geografia', keep='last')
+                   .set_index('id_geografia')
+                   .reindex(self.ids))
+        self.estaticos = {c: ultimos[c].values for c in COLUMNAS_ESTATICAS_CP if c in ultimos.columns}
+
+        self.categorias = categorias or categorias_historico(df_sector)
+
+    def lag(self, paso, k):
+        return self.buffer[:, (paso - k) % VENTANA_MEDIA_MOVIL]
+
+    def media_movil(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.recuento > 0, self.suma / self.recuento, np.nan)
+
+    def avanzar(self, paso, valores):
+        """Escribe las predicciones del paso en el buffer y actualiza la media móvil."""
+        columna = paso % VENTANA_MEDIA_MOVIL
+        saliente = self.buffer[:, columna]
+        sale_valido = ~np.isnan(saliente)
+        self.suma -= np.where(sale_valido, saliente, 0.0)
+        self.recuento -= sale_valido
+
+        entra_valido = ~np.isnan(valores)
+        self.suma += np.where(entra_valido, valores, 0.0)
+        self.recuento += entra_valido
+        self.buffer[:, columna] = valores
+        self.ultimo_paso = paso
+
+
+# --- 4. MOTOR DE PRONÓSTICO ---
+
+def categorica_constante(valor, n, categorias):
+    if categorias is None:
+        categorias = pd.Index([valor])
+    codigo = categorias.get_indexer([valor])[0]
+    return pd.Categorical.from_codes(np.full(n, codigo, dtype=np.int64), categories=categorias)
+
+
+def plantilla_features(estado, features, categoricas, filas=None):
+    """
+    DataFrame con las columnas estáticas por código postal ya rellenas.
+
+    Args:
+        estado (EstadoLags): Estado del sector.
+        features (list): Features del modelo.
+        categoricas (set): Features categóricas del modelo (columnas_categoricas()).
+        filas (np.ndarray, optional): Posiciones de las series a incluir. Por defecto, todas.
+    """
+    ids = estado.ids if filas is None else estado.ids[filas]
+    plantilla = pd.DataFrame(index=pd.RangeIndex(len(ids)))
+    if 'id_geografia' in features:
+        if 'id_geografia' in categoricas:
+            plantilla['id_geografia'] = pd.Categorical(ids, categories=estado.categorias.get('id_geografia'))
+        else:
+            plantilla['id_geografia'] = np.asarray(ids)
+    for columna, valores in estado.estaticos.items():
+        if columna in features:
+            valores = valores if filas is None else valores[filas]
+            if columna in categoricas:
+                plantilla[columna] = pd.Categorical(valores, categories=estado.categorias.get(columna))
+            else:
+                plantilla[columna] = valores
+    return plantilla
+
+
+def completar_features(plantilla, features, contexto, categorias, lags, categoricas):
+    """
+    Añade a la plantilla las features comunes del paso y los lags de consumo.
+
+    Args:
+        plantilla (pd.DataFrame): Resultado de plantilla_features().
+        features (list): Features del modelo, en orden.
+        contexto (dict): Resultado de contexto_paso() (incluye 'id_tramo_horario').
+        categorias (dict): {columna: categorías} del entrenamiento.
+        lags (dict): {columna: array} con los lags de cada serie (y demás
+            valores propios de cada serie, como las fiestas de barrio).
+        categoricas (set): Features categóricas del modelo (columnas_categoricas()).
+
+    Returns:
+        pd.DataFrame: Matriz de features con las columnas en el orden del modelo.
+    """
+    X = plantilla.copy(deep=False)
+    n = len(X)
+    for columna in features:
+        if columna in X.columns or columna in lags:
+            continue
+        if columna in categoricas:
+            X[columna] = categorica_constante(contexto[columna], n, categorias.get(columna))
+        elif columna in contexto:
+            X[columna] = contexto[columna]
+    for columna, valores in lags.items():
+        X[columna] = valores
+    return X[features]
+
+
+def contexto_paso(fecha, tramo, clima_futuro, climatologia, festivos):
+    """Features comunes a toda la ciudad para un paso (calendario + clima)."""
+    contexto = {
+        'anio': fecha.year,
+        'mes': fecha.month,
+        'dia_del_mes': fecha.day,
+        'dia_de_la_semana_nombre': DIAS_SEMANA[fecha.weekday()],
+        'es_fin_de_semana': fecha.weekday() >= 5,
+        'es_festivo': fecha.normalize() in festivos,
+        'es_fiesta_barrio': False,
+        'nombre_fiesta': SIN_FIESTA,
+    }
+    clima = None
+    if clima_futuro is not None and (fecha.normalize(), tramo) in clima_futuro.index:
+        clima = clima_futuro.loc[(fecha.normalize(), tramo)]
+    elif (fecha.month, tramo) in climatologia.index:
+        clima = climatologia.loc[(fecha.month, tramo)]
+    elif len(climatologia) and tramo in climatologia.index.get_level_values('id_tramo_horario'):
+        # Mes sin histórico: media del tramo en el resto de meses
+        clima = climatologia.xs(tramo, level='id_tramo_horario').mean()
+    for columna in COLUMNAS_CLIMA:
+        contexto[columna] = float(clima[columna]) if clima is not None and columna in clima.index else np.nan
+
+    temperatura = contexto['temperatura_media_ciudad']
+    contexto['temp_cuadrado'] = temperatura ** 2
+    contexto['dist_confort'] = abs(temperatura - 20)
+    contexto['temp_x_humedad'] = temperatura * contexto['humedad_media_ciudad']
+    return contexto
+
+
+def eventos_paso(indice_eventos, fecha, ids, categorias, categoricas):
+    """Fiestas de barrio de cada serie en la fecha del paso (una consulta al IndiceEventos)."""
+    eventos = indice_eventos.consultar(np.full(len(ids), fecha.normalize().to_datetime64()), ids,
+                                       sin_evento=SIN_FIESTA)
+    nombre_fiesta = eventos['nombre_fiesta']
+    if 'nombre_fiesta' in categoricas:
+        nombre_fiesta = pd.Categorical(nombre_fiesta, categories=categorias.get('nombre_fiesta'))
+    return {'es_fiesta_barrio': eventos['es_fiesta_barrio'], 'nombre_fiesta': nombre_fiesta}
+
+
+def pronosticar_sector(modelo, estado, n_pasos, clima_futuro=None, climatologia=None, festivos=(),
+                       indice_eventos=None):
+    """
+    Pronostica n_pasos tramos para todas las series de un sector.
+
+    Args:
+        modelo: Modelo XGBoost entrenado del sector.
+        estado (EstadoLags): Estado inicial del sector (se modifica in situ).
+        n_pasos (int): Número de tramos a pronosticar.
+        clima_futuro (pd.DataFrame, optional): Indexado por (fecha, id_tramo_horario)
+            con las columnas de clima. Si falta un paso se usa la climatología.
+        climatologia (pd.DataFrame, optional): Resultado de climatologia_por_tramo().
+        festivos (iterable, optional): Fechas festivas del horizonte.
+        indice_eventos (IndiceEventos, optional): Festivos y fiestas de barrio por código postal.
+
+    Returns:
+        tuple: (pasos, matriz n_pasos x n_codigos_postales de consumo predicho)
+    """
+    features = modelo.get_booster().feature_names
+    categoricas = columnas_categoricas(modelo)
+    plantilla = plantilla_features(estado, features, categoricas)
+    climatologia = climatologia if climatologia is not None else pd.DataFrame()
+    festivos = {pd.Timestamp(f).normalize() for f in festivos}
+    if indice_eventos is not None:
+        festivos |= set(indice_eventos.fechas_festivas())
+
+    pasos = np.arange(estado.ultimo_paso + 1, estado.ultimo_paso + 1 + n_pasos)
+    predicciones = np.empty((n_pasos, len(estado.ids)))
+
+    for i, paso in enumerate(pasos):
+        fecha, tramo = paso_a_fecha_tramo(paso)
+        contexto = contexto_paso(fecha, tramo, clima_futuro, climatologia, festivos)
+        contexto['id_tramo_horario'] = tramo
+        lags = {
+            'consumo_lag_1_hora': estado.lag(paso, 1),
+            'consumo_lag_2_horas': estado.lag(paso, 2),
+            'consumo_lag_1_dia': estado.lag(paso, TRAMOS_POR_DIA),
+            'consumo_media_movil_7d': estado.media_movil(),
+        }
+        if indice_eventos is not None:
+            lags.update(eventos_paso(indice_eventos, fecha, estado.ids, estado.categorias, categoricas))
+        X = completar_features(plantilla, features, contexto, estado.categorias, lags, categoricas)
+
+        predicciones[i] = modelo.predict(X)
+        estado.avanzar(paso, predicciones[i])
+
+    return pasos, predicciones
+
+
+def pronosticar_ciudad(modelos, df_historico, horizonte_dias=7, clima_futuro=None, festivos=(), categorias=None,
+                       indice_eventos=None):
+    """
+    Pronóstico recursivo de todos los sectores y códigos postales.
+
+    Args:
+        modelos (dict): {sector_nombre: modelo}.
+        df_historico (pd.DataFrame): Histórico con el esquema de gold_data.modelo_final_v2.
+            Basta con los últimos 7 días para los lags, pero con más historia la
+            climatología de respaldo es más fiable.
+        horizonte_dias (int): Días a pronosticar (4 tramos por día).
+        clima_futuro (pd.DataFrame, optional): Pronóstico meteorológico con
+            'fecha', 'id_tramo_horario' y las columnas de clima.
+        festivos (iterable, optional): Fechas festivas del horizonte.
+        categorias (dict, optional): {sector_nombre: {columna: categorías}} del entrenamiento.
+        indice_eventos (IndiceEventos, optional): Festivos y fiestas de barrio por código postal.
+
+    Returns:
+        pd.DataFrame: fecha, id_tramo_horario, id_geografia, id_sector_economico,
+            sector_nombre, consumo_kwh_predicho.
+    """
+    n_pasos = horizonte_dias * TRAMOS_POR_DIA
+    climatologia = climatologia_por_tramo(df_historico)
+    if clima_futuro is not None:
+        clima_futuro = clima_futuro.assign(fecha=pd.to_datetime(clima_futuro['fecha']).dt.normalize())
+        clima_futuro = clima_futuro.set_index(['fecha', 'id_tramo_horario'])
+
+    resultados = []
+    for id_sector, sector_nombre in SECTOR_MAP.items():
+        if sector_nombre not in modelos:
+            continue
+        df_sector = df_historico[df_historico['id_sector_economico'] == id_sector]
+        if df_sector.empty:
+            continue
+        estado = EstadoLags(df_sector, categorias=(categorias or {}).get(sector_nombre))
+        pasos, predicciones = pronosticar_sector(
+            modelos[sector_nombre], estado, n_pasos,
+            clima_futuro=clima_futuro, climatologia=climatologia, festivos=festivos,
+            indice_eventos=indice_eventos
+        )
+        dias, tramos = np.divmod(pasos, TRAMOS_POR_DIA)
+        n = len(estado.ids)
+        resultados.append(pd.DataFrame({
+            'fecha': np.repeat(dias.astype('datetime64[D]'), n),
+            'id_tramo_horario': np.repeat(tramos + 1, n),
+            'id_geografia': np.tile(estado.ids.values, n_pasos),
+            'id_sector_economico': id_sector,
+            'sector_nombre': sector_nombre,
+            'consumo_kwh_predicho': predicciones.ravel(),
+        }))
+
+    if not resultados:
+        return pd.DataFrame(columns=['fecha', 'id_tramo_horario', 'id_geografia', 'id_sector_economico',
+                                     'sector_nombre', 'consumo_kwh_predicho'])
+    return pd.concat(resultados, ignore_index=True)
+
+
+# --- 5. EJECUCIÓN PRINCIPAL ---
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from fuentes_datos import crear_fuente
+    from indice_eventos import cargar_indice
+
+    print("--- Iniciando el pronóstico multi-horizonte ---")
+    load_dotenv()
+    TABLE_ID = "gold_data.modelo_final_v2"
+    MODEL_FILE = 'modelos_entrenados_por_sector.pkl'
+    HORIZONTE_DIAS = 7
+
+    print("\nPaso 1: Cargando modelos entrenados...")
+    try:
+        with open(MODEL_FILE, 'rb') as file:
+            resultados_cargados = pickle.load(file)
+        modelos_entrenados = {sector: res['modelo'] for sector, res in resultados_cargados.items()}
+        print(f"✅ Modelos para los sectores {list(modelos_entrenados.keys())} cargados correctamente.")
+    except FileNotFoundError:
+        print(f"❌ ERROR: No se encontró el archivo de modelos '{MODEL_FILE}'.")
+        exit()
+
+    print(f"\nPaso 2: Cargando histórico desde '{TABLE_ID}'...")
+    try:
+        df_historico = crear_fuente().leer_tabla(TABLE_ID)
+        print(f"✅ Carga de datos completada. Se han cargado {len(df_historico)} registros.")
+    except Exception as e:
+        print(f"❌ Error al cargar datos desde la fuente: {e}")
+        exit()
+
+    print(f"\nPaso 3: Pronosticando {HORIZONTE_DIAS} días para todos los sectores y códigos postales...")
+    inicio = time.perf_counter()
+    df_pronostico = pronosticar_ciudad(modelos_entrenados, df_historico, horizonte_dias=HORIZONTE_DIAS,
+                                       indice_eventos=cargar_indice())
+    duracion = time.perf_counter() - inicio
+    print(f"✅ {len(df_pronostico)} predicciones generadas en {duracion:.2f} s.")
+    print(df_pronostico.groupby(['fecha', 'sector_nombre'])['consumo_kwh_predicho'].sum().unstack().to_string())
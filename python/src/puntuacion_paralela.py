@@ -0,0 +1,222 @@
+# ============================================================================
+# PUNTUACIÓN MULTIPROCESO CON MEMORIA COMPARTIDA
+# ============================================================================
+# Autor: Julio Clavijo
+# Versión: 1.0
+#
+# Descripción:
+# Modo paralelo de 'batch_prediction.py'. En lugar de copiar cada sector a un
+# DataFrame de features y puntuarlo secuencialmente:
+#
+#   1. La matriz de features de todos los sectores se vuelca UNA vez, como
+#      float32, en un bloque de memoria compartida (las columnas categóricas
+#      se guardan como códigos, que es lo que XGBoost usa internamente).
+#   2. Cada sector se ordena por id_geografia y se reparte en fragmentos
+#      (sector, rango de id_geografia) entre un pool de procesos.
+#   3. Cada proceso puntúa su fragmento sobre una vista de la memoria
+#      compartida (sin copiar la entrada) y escribe el resultado en su tramo
+#      de un array de salida preasignado, también compartido.
+#   4. Opcionalmente, cada proceso calcula también las contribuciones TreeSHAP
+#      de su fragmento y deja las top-k de cada fila en otros dos arrays
+#      compartidos (índice de feature y valor).
+# ============================================================================
+
+import time
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from explicabilidad import contribuciones_trozo, top_contribuciones
+
+# --- 1. CONFIGURACIÓN ---
+FILAS_POR_FRAGMENTO = 200_000
+DTYPE_FEATURES = np.float32
+
+
+# --- 2. FUNCIONES AUXILIARES ---
+
+def rango_iteraciones(modelo):
+    """
+    Rango de árboles que usa XGBRegressor.predict: hasta la mejor iteración
+    si el modelo se entrenó con early stopping, o todos los árboles si no.
+    """
+    try:
+        return 0, int(modelo.best_iteration) + 1
+    except AttributeError:
+        return 0, 0
+
+
+def volcar_features(df_sector, features, destino, orden):
+    """
+    Escribe las features de un sector en una matriz numérica preasignada.
+
+    Las columnas de texto o categóricas se codifican como en el modo
+    secuencial (.astype('category') sobre el propio sector) y se guardan sus
+    códigos; los códigos -1 (nulos) pasan a NaN.
+
+    Args:
+        df_sector (pd.DataFrame): Sector con el Feature Engineering aplicado.
+        features (list): Columnas en el orden que espera el modelo.
+        destino (np.ndarray): Matriz (n_filas, n_features) donde escribir.
+        orden (np.ndarray): Permutación de filas a aplicar al volcar.
+    """
+    for j, columna in enumerate(features):
+        serie = df_sector[columna]
+        if serie.dtype.name in ['object', 'category']:
+            codigos = serie.astype('category').cat.codes.to_numpy()
+            valores = np.where(codigos < 0, np.nan, codigos)
+        else:
+            valores = serie.to_numpy(dtype=np.float64, na_value=np.nan)
+        destino[:, j] = valores[orden]
+
+
+def _fragmentos_por_geografia(ids_ordenados, filas_por_fragmento):
+    """
+    Divide un sector (ya ordenado por id_geografia) en rangos contiguos de
+    filas sin partir nunca un mismo id_geografia entre dos fragmentos.
+    """
+    n = len(ids_ordenados)
+    if n == 0:
+        return []
+    inicios_grupo = np.flatnonzero(np.r_[True, ids_ordenados[1:] != ids_ordenados[:-1]])
+    objetivos = np.arange(filas_por_fragmento, n, filas_por_fragmento)
+    cortes = np.unique(inicios_grupo[np.clip(np.searchsorted(inicios_grupo, objetivos), 0, len(inicios_grupo) - 1)])
+    limites = np.unique(np.r_[0, cortes, n])
+    return list(zip(limites[:-1], limites[1:]))
+
+
+# --- 3. PROCESOS DE PUNTUACIÓN ---
+_ESTADO_PROCESO = {}
+
+
+def _inicializar_proceso(ruta_modelos, nombre_entrada, nombre_salida, top_k=0, nombre_indices=None,
+                         nombre_valores=None):
+    """Se conecta a la memoria compartida y carga los modelos una vez por proceso."""
+    with open(ruta_modelos, 'rb') as file:
+        resultados = pickle.load(file)
+    modelos = {sector: res['modelo'] for sector, res in resultados.items()}
+    for modelo in modelos.values():
+        modelo.get_booster().set_param({'nthread': 1})  # un núcleo por proceso
+    _ESTADO_PROCESO['modelos'] = modelos
+    _ESTADO_PROCESO['entrada'] = shared_memory.SharedMemory(name=nombre_entrada)
+    _ESTADO_PROCESO['salida'] = shared_memory.SharedMemory(name=nombre_salida)
+    _ESTADO_PROCESO['top_k'] = top_k
+    if top_k:
+        _ESTADO_PROCESO['indices'] = shared_memory.SharedMemory(name=nombre_indices)
+        _ESTADO_PROCESO['valores'] = shared_memory.SharedMemory(name=nombre_valores)
+
+
+def _puntuar_fragmento(sector, offset_bytes, forma, inicio, fin, offset_salida):
+    """Puntúa las filas [inicio, fin) de un sector directamente sobre la memoria compartida."""
+    reloj = time.perf_counter()
+    modelo = _ESTADO_PROCESO['modelos'][sector]
+    matriz = np.ndarray(forma, dtype=DTYPE_FEATURES, buffer=_ESTADO_PROCESO['entrada'].buf, offset=offset_bytes)
+    salida = np.ndarray((offset_salida + forma[0],), dtype=np.float32, buffer=_ESTADO_PROCESO['salida'].buf)
+
+    predicciones = modelo.get_booster().inplace_predict(matriz[inicio:fin], iteration_range=rango_iteraciones(modelo))
+    salida[offset_salida + inicio:offset_salida + fin] = predicciones
+
+    k = _ESTADO_PROCESO['top_k']
+    if k:
+        contribuciones = contribuciones_trozo(modelo.get_booster(), matriz[inicio:fin], rango_iteraciones(modelo))
+        forma_top = (offset_salida + forma[0], k)
+        indices = np.ndarray(forma_top, dtype=np.int16, buffer=_ESTADO_PROCESO['indices'].buf)
+        valores = np.ndarray(forma_top, dtype=np.float32, buffer=_ESTADO_PROCESO['valores'].buf)
+        fila = slice(offset_salida + inicio, offset_salida + fin)
+        indices[fila], valores[fila] = top_contribuciones(contribuciones, k)
+    return fin - inicio, time.perf_counter() - reloj
+
+
+# --- 4. FUNCIÓN PRINCIPAL ---
+
+def puntuar_en_paralelo(bloques, modelos, ruta_modelos, n_procesos, filas_por_fragmento=FILAS_POR_FRAGMENTO,
+                        top_k=0, explicaciones=None):
+    """
+    Puntúa varios sectores en paralelo compartiendo la matriz de features.
+
+    Args:
+        bloques (dict): {sector_nombre: df_sector con el Feature Engineering aplicado}.
+        modelos (dict): {sector_nombre: modelo}, para conocer las features de cada sector.
+        ruta_modelos (str): Pickle de modelos que cargará cada proceso.
+        n_procesos (int): Número de procesos del pool.
+        filas_por_fragmento (int): Tamaño objetivo de cada fragmento.
+        top_k (int): Contribuciones a conservar por fila (0 = sin explicación).
+        explicaciones (dict, optional): Con top_k > 0, se rellena con
+            {sector_nombre: (índices de feature, valores)}, alineados con df_sector.
+
+    Returns:
+        tuple: ({sector_nombre: predicciones alineadas con las filas de df_sector}, métricas)
+    """
+    # Disposición de cada sector dentro de los bloques compartidos
+    disposicion = {}
+    bytes_entrada, filas_totales = 0, 0
+    for sector, df_sector in bloques.items():
+        features = modelos[sector].get_booster().feature_names
+        forma = (len(df_sector), len(features))
+        disposicion[sector] = {'features': features, 'forma': forma,
+                               'offset_bytes': bytes_entrada, 'offset_salida': filas_totales}
+        bytes_entrada += forma[0] * forma[1] * np.dtype(DTYPE_FEATURES).itemsize
+        filas_totales += forma[0]
+
+    entrada = shared_memory.SharedMemory(create=True, size=max(bytes_entrada, 1))
+    salida = shared_memory.SharedMemory(create=True, size=max(filas_totales * 4, 1))
+    memorias_top = []
+    if top_k:
+        top_k = min(top_k, min(len(d['features']) for d in disposicion.values()))
+        memorias_top = [shared_memory.SharedMemory(create=True, size=max(filas_totales * top_k * itemsize, 1))
+                        for itemsize in (2, 4)]  # int16 y float32
+    try:
+        # Volcado único de las features, cada sector ordenado por id_geografia
+        fragmentos = []
+        for sector, df_sector in bloques.items():
+            d = disposicion[sector]
+            ids = df_sector['id_geografia'].to_numpy()
+            d['orden'] = np.argsort(ids, kind='stable')
+            matriz = np.ndarray(d['forma'], dtype=DTYPE_FEATURES, buffer=entrada.buf, offset=d['offset_bytes'])
+            volcar_features(df_sector, d['features'], matriz, d['orden'])
+            del matriz
+            for inicio, fin in _fragmentos_por_geografia(ids[d['orden']], filas_por_fragmento):
+                fragmentos.append((sector, d['offset_bytes'], d['forma'], int(inicio), int(fin), d['offset_salida']))
+
+        reloj = time.perf_counter()
+        nombres_top = [m.name for m in memorias_top] or [None, None]
+        with ProcessPoolExecutor(max_workers=n_procesos, initializer=_inicializar_proceso,
+                                 initargs=(ruta_modelos, entrada.name, salida.name, top_k, *nombres_top)) as pool:
+            resultados = list(pool.map(_puntuar_fragmento, *zip(*fragmentos))) if fragmentos else []
+        segundos = time.perf_counter() - reloj
+
+        # Devolver las predicciones en el orden original de cada sector
+        predicciones_salida = np.ndarray((filas_totales,), dtype=np.float32, buffer=salida.buf)
+        predicciones = {}
+        for sector, d in disposicion.items():
+            pred_sector = np.empty(d['forma'][0], dtype=np.float32)
+            pred_sector[d['orden']] = predicciones_salida[d['offset_salida']:d['offset_salida'] + d['forma'][0]]
+            predicciones[sector] = pred_sector
+        del predicciones_salida  # liberar la vista antes de cerrar la memoria compartida
+
+        if top_k and explicaciones is not None:
+            indices_salida = np.ndarray((filas_totales, top_k), dtype=np.int16, buffer=memorias_top[0].buf)
+            valores_salida = np.ndarray((filas_totales, top_k), dtype=np.float32, buffer=memorias_top[1].buf)
+            for sector, d in disposicion.items():
+                tramo = slice(d['offset_salida'], d['offset_salida'] + d['forma'][0])
+                indices, valores = np.empty((d['forma'][0], top_k), np.int16), np.empty((d['forma'][0], top_k), np.float32)
+                indices[d['orden']], valores[d['orden']] = indices_salida[tramo], valores_salida[tramo]
+                explicaciones[sector] = (indices, valores)
+            del indices_salida, valores_salida
+    finally:
+        for memoria in [entrada, salida] + memorias_top:
+            memoria.close()
+            memoria.unlink()
+
+    segundos_cpu = sum(s for _, s in resultados)
+    metricas = {
+        'filas': filas_totales,
+        'fragmentos': len(fragmentos),
+        'procesos': n_procesos,
+        'segundos': segundos,
+        'filas_por_segundo': filas_totales / segundos if segundos else 0.0,
+        'filas_por_segundo_y_nucleo': filas_totales / segundos_cpu if segundos_cpu else 0.0,
+    }
+    return predicciones, metricas
@@ -0,0 +1,365 @@
+# ============================================================================
+# CONSUMIDOR DE PUNTUACIÓN EN STREAMING (MICRO-LOTES)
+# ============================================================================
+# Autor: Julio Clavijo
+# Versión: 1.0
+#
+# Descripción:
+# Hasta ahora las predicciones solo se generan con el proceso por lotes
+# completo ('batch_prediction.py'). Este consumidor procesa las lecturas de
+# consumo a medida que llegan:
+#
+#   1. Lee micro-lotes de una cola local o de un directorio de aterrizaje
+#      ("landing") en el que se depositan ficheros Parquet.
+#   2. Mantiene el estado de lags de cada serie (sector, id_geografia) en un
+#      buffer circular 2-D, igual que el motor multi-horizonte.
+#   3. Emite, en el mismo micro-lote, el pronóstico del siguiente tramo de
+#      cada serie afectada (una llamada a 'predict' por sector y tramo).
+#   4. Escribe los pronósticos en un sumidero de solo-anexado (un Parquet
+#      nuevo por micro-lote) y solo entonces confirma los ficheros leídos.
+#
+# Los productores deben escribir cada fichero de forma atómica (fichero
+# temporal + renombrado); 'depositar_fichero' lo hace así y sirve de productor
+# local para pruebas.
+# ============================================================================
+
+import os
+import glob
+import time
+import queue
+import pickle
+import shutil
+import argparse
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from pronostico_multihorizonte import (
+    SECTOR_MAP, TRAMOS_POR_DIA, VENTANA_MEDIA_MOVIL, EstadoLags,
+    indice_paso, paso_a_fecha_tramo, climatologia_por_tramo, contexto_paso,
+    plantilla_features, completar_features, eventos_paso, columnas_categoricas
+)
+
+warnings.filterwarnings('ignore', category=FutureWarning)
+
+# --- 1. CONFIGURACIÓN ---
+COLUMNAS_ENTRADA = ['fecha', 'id_geografia', 'id_sector_economico', 'id_tramo_horario', 'consumo_kwh']
+INTERVALO_SEGUNDOS = 5
+
+
+# --- 2. ESTADO DE LAS SERIES ---
+
+class EstadoStreaming:
+    """
+    Estado de lags de todas las series, actualizable por micro-lotes.
+
+    A diferencia del pronóstico multi-horizonte, cada serie avanza a su
+    propio ritmo: se guarda el último paso observado por serie y, al llegar
+    una lectura posterior, los tramos intermedios que falten se marcan como
+    NaN en el buffer circular.
+    """
+
+    def __init__(self, df_historico, clima_futuro=None, festivos=(), indice_eventos=None):
+        """
+        Args:
+            df_historico (pd.DataFrame): Histórico inicial (esquema modelo_final_v2).
+            clima_futuro (pd.DataFrame, optional): Pronóstico meteorológico indexado
+                por (fecha, id_tramo_horario). Si falta, se usa la climatología.
+            festivos (iterable, optional): Fechas festivas.
+            indice_eventos (IndiceEventos, optional): Festivos y fiestas de barrio por código postal.
+        """
+        self.climatologia = climatologia_por_tramo(df_historico)
+        self.clima_futuro = clima_futuro
+        self.festivos = {pd.Timestamp(f).normalize() for f in festivos}
+        self.indice_eventos = indice_eventos
+        if indice_eventos is not None:
+            self.festivos |= set(indice_eventos.fechas_festivas())
+        self.sectores = {}
+        for id_sector in SECTOR_MAP:
+            df_sector = df_historico[df_historico['id_sector_economico'] == id_sector]
+            if df_sector.empty:
+                continue
+            estado = EstadoLags(df_sector)
+            pasos = indice_paso(df_sector['fecha'], df_sector['id_tramo_horario'])
+            ultimo = pd.Series(pasos).groupby(df_sector['id_geografia'].values).max()
+            estado.ultimo_por_serie = ultimo.reindex(estado.ids).to_numpy(dtype=np.int64)
+            self.sectores[id_sector] = estado
+
+    def _posiciones(self, estado, ids):
+        """Posición de cada id en el estado, añadiendo las series nuevas."""
+        nuevos = pd.Index(ids).unique().difference(estado.ids)
+        if len(nuevos):
+            estado.ids = estado.ids.append(nuevos)
+            estado.buffer = np.vstack([estado.buffer, np.full((len(nuevos), VENTANA_MEDIA_MOVIL), np.nan)])
+            estado.ultimo_por_serie = np.r_[estado.ultimo_por_serie, np.full(len(nuevos), np.iinfo(np.int64).min // 2)]
+            for columna, valores in estado.estaticos.items():
+                relleno = np.full(len(nuevos), np.nan) if valores.dtype.kind in 'fi' else np.full(len(nuevos), None)
+                estado.estaticos[columna] = np.concatenate([valores.astype(relleno.dtype, copy=False), relleno])
+        return estado.ids.get_indexer(ids)
+
+    def actualizar(self, df_lote):
+        """
+        Incorpora un micro-lote de lecturas de consumo.
+
+        Returns:
+            dict: {id_sector: posiciones de las series afectadas}
+        """
+        afectados = {}
+        pasos_lote = indice_paso(df_lote['fecha'], df_lote['id_tramo_horario'])
+        for id_sector, estado in self.sectores.items():
+            mascara = df_lote['id_sector_economico'].to_numpy() == id_sector
+            if not mascara.any():
+                continue
+            filas = self._posiciones(estado, df_lote['id_geografia'].to_numpy()[mascara])
+            pasos = pasos_lote[mascara]
+            valores = df_lote['consumo_kwh'].to_numpy(dtype=np.float64)[mascara]
+
+            # Se procesan los pasos en orden; normalmente un micro-lote trae uno solo
+            for paso in np.unique(pasos):
+                en_paso = pasos == paso
+                f, v = filas[en_paso], valores[en_paso]
+                ultimo = estado.ultimo_por_serie[f]
+
+                # Series que avanzan: vaciar los tramos intermedios que no han llegado
+                avanzan = paso > ultimo
+                if avanzan.any():
+                    fa = f[avanzan]
+                    hueco = np.minimum(paso - ultimo[avanzan] - 1, VENTANA_MEDIA_MOVIL - 1)
+                    k = np.arange(1, VENTANA_MEDIA_MOVIL)
+                    columnas = (paso - k) % VENTANA_MEDIA_MOVIL
+                    vaciar = k[None, :] <= hueco[:, None]
+                    bloque = estado.buffer[np.ix_(fa, columnas)]
+                    estado.buffer[np.ix_(fa, columnas)] = np.where(vaciar, np.nan, bloque)
+                    estado.ultimo_por_serie[fa] = paso
+
+                # Lecturas tardías dentro de la ventana corrigen el valor; las más antiguas se ignoran
+                en_ventana = paso > ultimo - VENTANA_MEDIA_MOVIL
+                estado.buffer[f[en_ventana], paso % VENTANA_MEDIA_MOVIL] = v[en_ventana]
+
+            afectados[id_sector] = np.unique(filas)
+        return afectados
+
+    def pronosticar_siguiente(self, modelos, afectados):
+        """
+        Pronostica el siguiente tramo de cada serie afectada.
+
+        Returns:
+            pd.DataFrame: fecha, id_tramo_horario, id_geografia, id_sector_economico,
+                consumo_kwh_predicho.
+        """
+        resultados = []
+        for id_sector, filas in afectados.items():
+            modelo = modelos.get(SECTOR_MAP[id_sector])
+            if modelo is None or len(filas) == 0:
+                continue
+            estado = self.sectores[id_sector]
+            features = modelo.get_booster().feature_names
+            categoricas = columnas_categoricas(modelo)
+            siguientes = estado.ultimo_por_serie[filas] + 1
+
+            for paso in np.unique(siguientes):
+                f = filas[siguientes == paso]
+                fecha, tramo = paso_a_fecha_tramo(paso)
+                contexto = contexto_paso(fecha, tramo, self.clima_futuro, self.climatologia, self.festivos)
+                contexto['id_tramo_horario'] = tramo
+
+                # El buffer de cada serie contiene exactamente los 28 tramos anteriores a 'paso'
+                ventana = estado.buffer[f]
+                recuento = (~np.isnan(ventana)).sum(axis=1)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    media = np.where(recuento > 0, np.nansum(ventana, axis=1) / recuento, np.nan)
+                lags = {
+                    'consumo_lag_1_hora': ventana[:, (paso - 1) % VENTANA_MEDIA_MOVIL],
+                    'consumo_lag_2_horas': ventana[:, (paso - 2) % VENTANA_MEDIA_MOVIL],
+                    'consumo_lag_1_dia': ventana[:, (paso - TRAMOS_POR_DIA) % VENTANA_MEDIA_MOVIL],
+                    'consumo_media_movil_7d': media,
+                }
+                if self.indice_eventos is not None:
+                    lags.update(eventos_paso(self.indice_eventos, fecha, estado.ids[f], estado.categorias,
+                                             categoricas))
+                X = completar_features(plantilla_features(estado, features, categoricas, f), features,
+                                       contexto, estado.categorias, lags, categoricas)
+                resultados.append(pd.DataFrame({
+                    'fecha': fecha,
+                    'id_tramo_horario': tramo,
+                    'id_geografia': estado.ids[f],
+                    'id_sector_economico': id_sector,
+                    'consumo_kwh_predicho': modelo.predict(X),
+                }))
+
+        if not resultados:
+            return pd.DataFrame(columns=['fecha', 'id_tramo_horario', 'id_geografia',
+                                         'id_sector_economico', 'consumo_kwh_predicho'])
+        return pd.concat(resultados, ignore_index=True)
+
+
+# --- 3. FUENTES Y SUMIDERO ---
+
+def depositar_fichero(df, directorio, nombre=None):
+    """
+    Productor local: deposita un DataFrame en el directorio de aterrizaje de
+    forma atómica (el consumidor nunca ve ficheros a medio escribir).
+
+    Returns:
+        str: Ruta del fichero depositado.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    nombre = nombre or f"consumo_{time.time_ns()}.parquet"
+    ruta_tmp = os.path.join(directorio, f".{nombre}.tmp")
+    df.to_parquet(ruta_tmp, index=False)
+    ruta = os.path.join(directorio, nombre)
+    os.replace(ruta_tmp, ruta)
+    return ruta
+
+
+class FuenteDirectorio:
+    """Lee los Parquet nuevos de un directorio y los mueve a 'procesados/' al confirmar."""
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self.directorio_procesados = os.path.join(directorio, 'procesados')
+        os.makedirs(self.directorio_procesados, exist_ok=True)
+
+    def leer(self):
+        rutas = sorted(glob.glob(os.path.join(self.directorio, '[!.]*.parquet')))
+        if not rutas:
+            return None, []
+        df = pd.concat([pd.read_parquet(r) for r in rutas], ignore_index=True)
+        return df, rutas
+
+    def confirmar(self, rutas):
+        for ruta in rutas:
+            shutil.move(ruta, os.path.join(self.directorio_procesados, os.path.basename(ruta)))
+
+
+class FuenteCola:
+    """Lee todos los DataFrames pendientes de una queue.Queue local."""
+
+    def __init__(self, cola):
+        self.cola = cola
+
+    def leer(self):
+        pendientes = []
+        while True:
+            try:
+                pendientes.append(self.cola.get_nowait())
+            except queue.Empty:
+                break
+        if not pendientes:
+            return None, []
+        return pd.concat(pendientes, ignore_index=True), []
+
+    def confirmar(self, _):
+        pass
+
+
+class SumideroParquet:
+    """Sumidero de solo-anexado: un fichero Parquet nuevo por micro-lote."""
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+
+    def escribir(self, df, id_lote):
+        depositar_fichero(df, self.directorio, nombre=f"pronosticos_{time.time_ns()}_{id_lote:06d}.parquet")
+
+
+# --- 4. CONSUMIDOR ---
+
+class ConsumidorStreaming:
+    def __init__(self, modelos, estado, fuente, sumidero):
+        self.modelos = modelos
+        self.estado = estado
+        self.fuente = fuente
+        self.sumidero = sumidero
+        self.lotes_procesados = 0
+
+    def procesar_lote(self):
+        """
+        Procesa un micro-lote completo (leer -> actualizar -> pronosticar -> escribir -> confirmar).
+
+        Returns:
+            int: Número de pronósticos emitidos (0 si no había datos nuevos).
+        """
+        df_lote, token = self.fuente.leer()
+        if df_lote is None or df_lote.empty:
+            return 0
+        afectados = self.estado.actualizar(df_lote[COLUMNAS_ENTRADA])
+        df_pronosticos = self.estado.pronosticar_siguiente(self.modelos, afectados)
+        df_pronosticos['emitido_en'] = pd.Timestamp.now(tz='UTC')
+        df_pronosticos['id_lote'] = self.lotes_procesados
+        self.sumidero.escribir(df_pronosticos, self.lotes_procesados)
+        self.fuente.confirmar(token)  # solo tras escribir: semántica al-menos-una-vez
+        self.lotes_procesados += 1
+        return len(df_pronosticos)
+
+    def ejecutar(self, intervalo_segundos=INTERVALO_SEGUNDOS, max_lotes=None):
+        """Bucle de consumo. Se detiene con Ctrl+C o al alcanzar max_lotes."""
+        try:
+            while max_lotes is None or self.lotes_procesados < max_lotes:
+                inicio = time.perf_counter()
+                emitidos = self.procesar_lote()
+                if emitidos:
+                    print(f"   - Lote {self.lotes_procesados - 1}: {emitidos} pronósticos emitidos "
+                          f"en {time.perf_counter() - inicio:.2f} s")
+                else:
+                    time.sleep(intervalo_segundos)
+        except KeyboardInterrupt:
+            print("\nConsumidor detenido por el usuario.")
+
+
+# --- 5. EJECUCIÓN PRINCIPAL ---
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from fuentes_datos import crear_fuente
+    from indice_eventos import cargar_indice
+
+    parser = argparse.ArgumentParser(description="Consumidor de puntuación en streaming por micro-lotes")
+    parser.add_argument('--landing', default='landing_consumo', help="Directorio de aterrizaje de Parquet")
+    parser.add_argument('--salida', default='pronosticos_streaming', help="Directorio del sumidero de solo-anexado")
+    parser.add_argument('--intervalo', type=float, default=INTERVALO_SEGUNDOS, help="Segundos entre sondeos")
+    parser.add_argument('--demo', action='store_true',
+                        help="Reproduce el último día del histórico depositándolo tramo a tramo en el landing")
+    args = parser.parse_args()
+
+    print("--- Iniciando el consumidor de puntuación en streaming ---")
+    load_dotenv()
+    TABLE_ID = "gold_data.modelo_final_v2"
+    MODEL_FILE = 'modelos_entrenados_por_sector.pkl'
+
+    print("\nPaso 1: Cargando modelos entrenados...")
+    try:
+        with open(MODEL_FILE, 'rb') as file:
+            resultados_cargados = pickle.load(file)
+        modelos_entrenados = {sector: res['modelo'] for sector, res in resultados_cargados.items()}
+        print(f"✅ Modelos para los sectores {list(modelos_entrenados.keys())} cargados correctamente.")
+    except FileNotFoundError:
+        print(f"❌ ERROR: No se encontró el archivo de modelos '{MODEL_FILE}'.")
+        exit()
+
+    print(f"\nPaso 2: Inicializando el estado de lags desde '{TABLE_ID}'...")
+    try:
+        df_historico = crear_fuente().leer_tabla(TABLE_ID)
+        df_historico['fecha'] = pd.to_datetime(df_historico['fecha'])
+        print(f"✅ Carga de datos completada. Se han cargado {len(df_historico)} registros.")
+    except Exception as e:
+        print(f"❌ Error al cargar datos desde la fuente: {e}")
+        exit()
+
+    max_lotes = None
+    if args.demo:
+        # El último día se retira del estado inicial y se deposita tramo a tramo
+        ultimo_dia = df_historico['fecha'].max()
+        df_reproducir = df_historico[df_historico['fecha'] == ultimo_dia]
+        df_historico = df_historico[df_historico['fecha'] < ultimo_dia]
+        for tramo, df_tramo in df_reproducir.groupby('id_tramo_horario'):
+            depositar_fichero(df_tramo[COLUMNAS_ENTRADA], args.landing)
+        max_lotes = 1
+
+    estado = EstadoStreaming(df_historico, indice_eventos=cargar_indice())
+    consumidor = ConsumidorStreaming(modelos_entrenados, estado, FuenteDirectorio(args.landing),
+                                     SumideroParquet(args.salida))
+    print(f"\nPaso 3: Escuchando '{args.landing}' (pronósticos en '{args.salida}')...")
+    consumidor.ejecutar(intervalo_segundos=args.intervalo, max_lotes=max_lotes)
+    print("\n--- Consumidor finalizado ---")
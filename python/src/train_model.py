@@ -2,34 +2,38 @@
 import pandas as pd
 import xgboost as xgb
 from sklearn.metrics import mean_absolute_percentage_error
-import shap
-import matplotlib.pyplot as plt
 import os
-from google.oauth2 import service_account
 from dotenv import load_dotenv
+from fuentes_datos import crear_fuente, construir_consulta, COLUMNAS_MODELO_FINAL
+from instrumentacion import crear_instrumentacion
+from explicabilidad import explicar_modelo, guardar_explicacion, describir_explicacion, MAX_FILAS
+from ajuste_hiperparametros import hiperparametros
 
 # --- 1. CARGA DE DATOS DESDE BIGQUERY ---
 print("--- Iniciando el pipeline de entrenamiento de modelo ---")
+instrumentacion = crear_instrumentacion('train_model')
 print("Paso 1: Cargando datos desde la tabla Gold 'modelo_final'...")
 
 # Carga las variables de entorno para la autenticación
 load_dotenv()
-GCP_KEY_PATH = os.getenv("GCP_SERVICE_ACCOUNT_KEY_PATH")
-PROJECT_ID = "datamanagementbi"  # Tu ID de proyecto de GCP
 TABLE_ID = "gold_data.modelo_final"
+# Ventana de entrenamiento ('YYYY-MM-DD'); None = todo el histórico
+FECHA_DESDE, FECHA_HASTA = None, None
 
 # Autenticación y ejecución de la consulta
+etapa = instrumentacion.iniciar('lectura')
 try:
-    credentials = service_account.Credentials.from_service_account_file(GCP_KEY_PATH)
-    query = f"SELECT * FROM `{PROJECT_ID}.{TABLE_ID}` ORDER BY fecha, id_tramo_horario"
-    df = pd.read_gbq(query, project_id=PROJECT_ID, credentials=credentials, progress_bar_type=None)
+    query = construir_consulta(TABLE_ID, COLUMNAS_MODELO_FINAL, desde=FECHA_DESDE, hasta=FECHA_HASTA)
+    df = crear_fuente().consultar(query).sort_values(['fecha', 'id_tramo_horario'], kind='stable', ignore_index=True)
     print(f"Carga de datos completada. Se han cargado {len(df)} registros.")
+    etapa.terminar(filas=len(df))
 except Exception as e:
-    print(f"Error al cargar datos desde BigQuery: {e}")
+    print(f"Error al cargar datos desde la fuente: {e}")
     exit() # Detiene el script si no se pueden cargar los datos
 
 # --- 2. PREPARACIÓN DE DATOS Y FEATURE ENGINEERING ---
 print("\nPaso 2: Preparando datos para el entrenamiento...")
+etapa = instrumentacion.iniciar('feature_engineering', filas=len(df))
 # Asegurar que 'fecha' es de tipo datetime y establecerla como índice
 df['fecha'] = pd.to_datetime(df['fecha'])
 df.set_index('fecha', inplace=True)
@@ -73,41 +77,42 @@ X_test = X[-test_size:]
 y_train = y[:-test_size]
 y_test = y[-test_size:]
 print(f"Datos divididos cronológicamente: {len(X_train)} registros para entrenamiento, {len(X_test)} para prueba.")
+etapa.terminar()
 
 # --- 5. ENTRENAMIENTO DEL MODELO XGBOOST ---
 print("\nPaso 5: Entrenando el modelo XGBoost...")
+etapa = instrumentacion.iniciar('fit', filas=len(X_train))
 model = xgb.XGBRegressor(
     objective='reg:squarederror',
-    n_estimators=1000,
-    learning_rate=0.05,
-    max_depth=8,
+    **hiperparametros(),  # modelo global: valores por defecto (el ajuste es por sector)
     early_stopping_rounds=10,
     eval_metric='mape',
     enable_categorical=True # ¡Clave para que XGBoost entienda las categorías!
 )
 model.fit(X_train, y_train, eval_set=[(X_test, y_test)], verbose=False)
+etapa.terminar()
 print("Modelo entrenado con éxito.")
 
 # --- 6. EVALUACIÓN DEL MODELO ---
 print("\nPaso 6: Evaluando el rendimiento del modelo...")
-y_pred = model.predict(X_test)
+with instrumentacion.etapa('evaluacion', filas=len(X_test)):
+    y_pred = model.predict(X_test)
 mape = mean_absolute_percentage_error(y_test, y_pred)
 print("="*50)
 print(f"  RESULTADO FINAL -> MAPE: {mape:.4f}")
 print("="*50)
 
 # --- 7. INTERPRETACIÓN DEL MODELO (SHAP) ---
-print("\nPaso 7: Generando gráfico de importancia de características (SHAP)...")
-
-explainer = shap.Explainer(model)
-shap_values = explainer(X_test, check_additivity=False)
-
-# ¡CORRECCIÓN! Volvemos al método simple de ploteo
-shap.summary_plot(shap_values, X_test, plot_type="bar")
-
-# Guardamos la figura que SHAP ha creado automáticamente
-plt.savefig('shap_summary_final.png', bbox_inches='tight')
-plt.close()
-
-print("Gráfico 'shap_summary_final.png' guardado en el directorio del proyecto.")
+print(f"\nPaso 7: Generando gráfico de importancia de características (SHAP, máx. {MAX_FILAS} filas)...")
+
+# TreeSHAP nativo de XGBoost sobre una muestra estratificada (tramo, mes, código postal)
+with instrumentacion.etapa('shap') as etapa:
+    explicacion = explicar_modelo(model, X_test)
+    rutas = guardar_explicacion('final', explicacion, titulo='Importancia de Features')
+    etapa.filas = explicacion['filas']
+
+print(f"Gráficos '{os.path.basename(rutas['barras'])}' y '{os.path.basename(rutas['beeswarm'])}' "
+      f"y tabla '{os.path.basename(rutas['importancia'])}' guardados ({describir_explicacion(explicacion)}).")
+instrumentacion.cerrar()
+print(f"\nEtapas ({instrumentacion.directorio}/):\n{instrumentacion.resumen()}")
 print("\n--- Pipeline de entrenamiento finalizado ---")
\ No newline at end of file
@@ -9,45 +9,59 @@
 # 1. Segmentación: Entrena un modelo especializado para cada sector económico.
 # 2. Feature Engineering Avanzado: Incluye lags horarios, diarios y features no lineales.
 # 3. Evaluación Robusta: Utiliza una división cronológica para evitar data leakage.
+# Las etapas (lectura, feature engineering, fit, SHAP, guardado) se registran en
+# metricas/; con --profile se guarda además un perfil de CPU por etapa.
+# Cada sector guarda además sus niveles de latencia (completo, truncado a la
+# mejor iteración y destilado) con su MAPE y latencia medidos (niveles_modelo.py).
+# Los hiperparámetros de cada sector salen de ajuste_hiperparametros.py si se
+# han ajustado (HIPERPARAMETROS_PATH) y, si no, de los valores por defecto.
 # ============================================================================
 
 # --- 0. IMPORTACIÓN DE LIBRERÍAS ---
 import pandas as pd
 import xgboost as xgb
 from sklearn.metrics import mean_absolute_percentage_error
-import shap
-import matplotlib.pyplot as plt
 import os
-from google.oauth2 import service_account
 from dotenv import load_dotenv
+from fuentes_datos import crear_fuente, leer_por_sector, describir_lectura, COLUMNAS_MODELO_FINAL_V2
+from instrumentacion import crear_instrumentacion
+from explicabilidad import explicar_modelos, guardar_explicacion, describir_explicacion, MAX_FILAS, MAX_SEGUNDOS
+from niveles_modelo import construir_niveles, resumen_niveles
+from ajuste_hiperparametros import hiperparametros
 import warnings
 import pickle
 
 warnings.filterwarnings('ignore', category=FutureWarning)
 print("--- Iniciando el pipeline de entrenamiento de modelo v4.0 (Segmentado) ---")
+instrumentacion = crear_instrumentacion('train_model_final')
 
 # --- 1. CARGA DE DATOS DESDE BIGQUERY (Se hace una sola vez) ---
 print("\nPaso 1: Cargando y preparando el dataset completo...")
 load_dotenv()
-GCP_KEY_PATH = os.getenv("GCP_SERVICE_ACCOUNT_KEY_PATH")
-PROJECT_ID = "datamanagementbi"
 TABLE_ID = "gold_data.modelo_final_v2" 
+# Ventana de entrenamiento ('YYYY-MM-DD'); None = todo el histórico
+FECHA_DESDE, FECHA_HASTA = None, None
+# Máximo de árboles (con early stopping); benchmark.py lo reduce para acotar el tiempo a gran escala
+MAX_ARBOLES = int(os.getenv("ENTRENAMIENTO_MAX_ARBOLES", 1000))
+# '0' omite el nivel destilado (los niveles completo y truncado no cuestan entrenamiento)
+DESTILAR = os.getenv("ENTRENAMIENTO_DESTILADO", '1') == '1'
+etapa = instrumentacion.iniciar('lectura')
 try:
-    credentials = service_account.Credentials.from_service_account_file(GCP_KEY_PATH)
-    query = f"SELECT * FROM `{PROJECT_ID}.{TABLE_ID}` ORDER BY fecha, id_tramo_horario, id_geografia"
-    df_full = pd.read_gbq(query, project_id=PROJECT_ID, credentials=credentials, progress_bar_type='console')
-    
-    # Mapeo de IDs a nombres para facilitar el bucle
-    sector_map = {1: 'Industrial', 2: 'Residencial', 3: 'Servicios'}
-    df_full['sector_nombre'] = df_full['id_sector_economico'].map(sector_map)
-    
-    print(f"✅ Carga de datos completada. Se han cargado {len(df_full)} registros.")
+    # Solo las columnas del modelo, filtradas por sector y fecha en la consulta;
+    # cada sector se ordena cronológicamente en local (sin ORDER BY global)
+    datos_por_sector, metricas_lectura = leer_por_sector(
+        crear_fuente(), TABLE_ID, COLUMNAS_MODELO_FINAL_V2, desde=FECHA_DESDE, hasta=FECHA_HASTA)
+    print(f"✅ Carga de datos completada: {describir_lectura(metricas_lectura)}.")
+    etapa.terminar(filas=metricas_lectura['filas'],
+                   bytes_entrada=metricas_lectura.get('bytes_transferidos') or metricas_lectura.get('bytes_escaneados'))
 except Exception as e:
-    print(f"❌ Error al cargar datos desde BigQuery: {e}")
+    print(f"❌ Error al cargar datos desde la fuente: {e}")
     exit()
 
 # Diccionario para guardar los resultados de cada modelo
 resultados_finales = {}
+# Modelo y conjunto de prueba de cada sector para la explicación
+datos_explicacion = {}
 
 # --- 2. BUCLE DE ENTRENAMIENTO POR SECTOR ---
 for sector_nombre in ['Industrial', 'Residencial', 'Servicios']:
@@ -56,11 +70,12 @@ for sector_nombre in ['Industrial', 'Residencial', 'Servicios']:
     print("="*80)
 
     # 2.1. Filtrar datos para el sector actual
-    df_sector = df_full[df_full['sector_nombre'] == sector_nombre].copy()
+    df_sector = datos_por_sector[sector_nombre]
     print(f"   - Registros para este sector: {len(df_sector)}")
 
     # 2.2. Feature Engineering (Temporal y No Lineal)
     print("   - Aplicando Feature Engineering...")
+    etapa = instrumentacion.iniciar(f'feature_engineering/{sector_nombre}', filas=len(df_sector))
     df_sector['fecha'] = pd.to_datetime(df_sector['fecha'])
 
     # Lags Horarios y Diarios
@@ -93,37 +108,48 @@ for sector_nombre in ['Industrial', 'Residencial', 'Servicios']:
     X_train, X_test = X[:test_size_index], X[test_size_index:]
     y_train, y_test = y[:test_size_index], y[test_size_index:]
     print(f"   - Datos divididos: {len(X_train)} para entrenamiento, {len(X_test)} para prueba.")
+    etapa.terminar()
 
     # 2.5. Entrenamiento del Modelo
     print("   - Entrenando modelo XGBoost...")
-    model = xgb.XGBRegressor(objective='reg:squarederror', n_estimators=1000, learning_rate=0.05, max_depth=8, early_stopping_rounds=10, eval_metric='mape', enable_categorical=True)
-    model.fit(X_train, y_train, eval_set=[(X_test, y_test)], verbose=False)
+    with instrumentacion.etapa(f'fit/{sector_nombre}', filas=len(X_train)):
+        parametros = {**hiperparametros(sector_nombre), 'n_estimators': MAX_ARBOLES}
+        model = xgb.XGBRegressor(objective='reg:squarederror', **parametros, early_stopping_rounds=10, eval_metric='mape', enable_categorical=True)
+        model.fit(X_train, y_train, eval_set=[(X_test, y_test)], verbose=False)
 
     # 2.6. Evaluación
-    y_pred = model.predict(X_test)
+    with instrumentacion.etapa(f'evaluacion/{sector_nombre}', filas=len(X_test)):
+        y_pred = model.predict(X_test)
     mape = mean_absolute_percentage_error(y_test, y_pred) * 100
     print("\n" + "-"*40)
     print(f"  📊 RESULTADO PARA {sector_nombre.upper()} -> MAPE: {mape:.2f}%")
     print("-"*40 + "\n")
 
-    # 2.7. Interpretabilidad (SHAP)
-    print("   - Generando gráfico SHAP...")
-    explainer = shap.Explainer(model)
-    shap_values = explainer(X_test)
-    
-    shap.summary_plot(shap_values, X_test, plot_type="bar")
-    fig = plt.gcf()
-    fig.set_size_inches(10, 8)
-    plt.title(f'Importancia de Features - Sector {sector_nombre}')
-    plt.tight_layout()
-    
-    output_path = os.path.join(os.getcwd(), f'shap_summary_{sector_nombre}.png')
-    fig.savefig(output_path, bbox_inches='tight')
-    plt.close(fig)
-    print(f"   - Gráfico SHAP guardado en: {output_path}")
+    # 2.7. Niveles de latencia (completo, truncado, destilado) con su precisión y latencia
+    print("   - Construyendo los niveles de latencia del modelo...")
+    with instrumentacion.etapa(f'niveles/{sector_nombre}', filas=len(X_train)):
+        niveles = construir_niveles(model, X_train, X_test, y_test, destilado=DESTILAR)
 
-    # Guardar resultados
-    resultados_finales[sector_nombre] = {'mape': mape, 'modelo': model}
+    # Guardar resultados (la explicación se calcula después, para todos los sectores a la vez)
+    resultados_finales[sector_nombre] = {'mape': mape, 'modelo': model, 'niveles': niveles}
+    datos_explicacion[sector_nombre] = (model, X_test)
+
+# --- 2.8. INTERPRETABILIDAD (TREESHAP NATIVO, EN PARALELO POR SECTOR) ---
+print("\n" + "="*80)
+print(f"🔎 EXPLICANDO LOS MODELOS (máx. {MAX_FILAS} filas y {MAX_SEGUNDOS:.0f} s por sector)")
+print("="*80)
+with instrumentacion.etapa('shap') as etapa:
+    explicaciones = explicar_modelos(datos_explicacion)
+    etapa.filas = sum(explicacion['filas'] for explicacion in explicaciones.values())
+tablas_importancia = []
+for sector_nombre, explicacion in explicaciones.items():
+    rutas = guardar_explicacion(sector_nombre, explicacion, titulo=f'Importancia de Features - Sector {sector_nombre}')
+    tablas_importancia.append(explicacion['importancia'].assign(sector=sector_nombre))
+    print(f"   - {sector_nombre}: {describir_explicacion(explicacion)}")
+    print(f"     Gráficos en: {rutas['barras']}, {rutas['beeswarm']}")
+if tablas_importancia:
+    pd.concat(tablas_importancia, ignore_index=True).to_csv('shap_importancia_por_sector.csv', index=False)
+    print("   - Tabla de importancia por sector guardada en: shap_importancia_por_sector.csv")
 
 # --- 3. RESUMEN FINAL ---
 print("\n" + "="*80)
@@ -131,6 +157,8 @@ print("🏆 RESUMEN FINAL DE RENDIMIENTO POR SECTOR")
 print("="*80)
 for sector, resultado in resultados_finales.items():
     print(f"  - {sector}: {resultado['mape']:.2f}% MAPE")
+print("\n  Niveles de latencia por sector:")
+print(resumen_niveles({sector: resultado['niveles'] for sector, resultado in resultados_finales.items()}))
 
 # --- 4. GUARDAR MODELOS ENTRENADOS ---
 print("\n" + "="*80)
@@ -141,11 +169,17 @@ print("="*80)
 # Lo guardaremos usando pickle.
 output_model_path = 'modelos_entrenados_por_sector.pkl'
 
+etapa = instrumentacion.iniciar('guardado')
 try:
     with open(output_model_path, 'wb') as file:
         pickle.dump(resultados_finales, file)
     print(f"✅ Modelos guardados correctamente en: {output_model_path}")
+    etapa.terminar(bytes_salida=os.path.getsize(output_model_path))
 except Exception as e:
     print(f"❌ Error al guardar los modelos: {e}")
+    etapa.terminar(ok=False)
+
+instrumentacion.cerrar()
+print(f"\nEtapas ({instrumentacion.directorio}/):\n{instrumentacion.resumen()}")
 
 print("\n--- Proceso completo finalizado ---")
\ No newline at end of file
@@ -14,32 +14,35 @@
 import pandas as pd
 import xgboost as xgb
 from sklearn.metrics import mean_absolute_percentage_error
-import shap
-import matplotlib.pyplot as plt
-import os
-from google.oauth2 import service_account
 from dotenv import load_dotenv
+from fuentes_datos import crear_fuente, construir_consulta, COLUMNAS_MODELO_FINAL_V2, ORDEN_CRONOLOGICO
+from instrumentacion import crear_instrumentacion
+from explicabilidad import explicar_modelo, guardar_explicacion, describir_explicacion, MAX_FILAS, MAX_SEGUNDOS
+from ajuste_hiperparametros import hiperparametros
 
 print("--- Iniciando el pipeline de entrenamiento de modelo v3.0 ---")
+instrumentacion = crear_instrumentacion('train_model_mejorado')
 
 # --- 1. CARGA DE DATOS DESDE BIGQUERY ---
 print("\nPaso 1: Cargando datos desde la tabla Gold 'modelo_final_v2'...")
 load_dotenv()
-GCP_KEY_PATH = os.getenv("GCP_SERVICE_ACCOUNT_KEY_PATH")
-PROJECT_ID = "datamanagementbi"
 TABLE_ID = "gold_data.modelo_final_v2" 
+# Ventana de entrenamiento ('YYYY-MM-DD'); None = todo el histórico
+FECHA_DESDE, FECHA_HASTA = None, None
+etapa = instrumentacion.iniciar('lectura')
 try:
-    credentials = service_account.Credentials.from_service_account_file(GCP_KEY_PATH)
-    # ORDENAMOS CRONOLÓGICAMENTE para los lags
-    query = f"SELECT * FROM `{PROJECT_ID}.{TABLE_ID}` ORDER BY fecha, id_tramo_horario, id_geografia"
-    df = pd.read_gbq(query, project_id=PROJECT_ID, credentials=credentials, progress_bar_type='console')
+    query = construir_consulta(TABLE_ID, COLUMNAS_MODELO_FINAL_V2, desde=FECHA_DESDE, hasta=FECHA_HASTA)
+    # ORDENAMOS CRONOLÓGICAMENTE para los lags (en local, no en el almacén)
+    df = crear_fuente().consultar(query).sort_values(ORDEN_CRONOLOGICO, kind='stable', ignore_index=True)
     print(f"✅ Carga de datos completada. Se han cargado {len(df)} registros.")
+    etapa.terminar(filas=len(df))
 except Exception as e:
-    print(f"❌ Error al cargar datos desde BigQuery: {e}")
+    print(f"❌ Error al cargar datos desde la fuente: {e}")
     exit()
 
 # --- 2. PREPARACIÓN DE DATOS Y FEATURE ENGINEERING MEJORADO ---
 print("\nPaso 2: Preparando datos y aplicando Feature Engineering Avanzado...")
+etapa = instrumentacion.iniciar('feature_engineering', filas=len(df))
 df['fecha'] = pd.to_datetime(df['fecha'])
 
 # 2.1. Ingeniería de Características Temporales (CON LAGS HORARIOS)
@@ -96,20 +99,23 @@ test_size_index = int(len(df) * (1 - test_size_ratio))
 X_train, X_test = X[:test_size_index], X[test_size_index:]
 y_train, y_test = y[:test_size_index], y[test_size_index:]
 print(f"✅ Datos divididos: {len(X_train)} para entrenamiento, {len(X_test)} para prueba.")
+etapa.terminar()
 
 
 # --- 5. ENTRENAMIENTO DEL MODELO XGBOOST ---
 # (Esta sección no cambia)
 print("\nPaso 5: Entrenando el modelo XGBoost...")
-model = xgb.XGBRegressor(objective='reg:squarederror', n_estimators=1000, learning_rate=0.05, max_depth=8, early_stopping_rounds=10, eval_metric='mape', enable_categorical=True)
-model.fit(X_train, y_train, eval_set=[(X_test, y_test)], verbose=False)
+with instrumentacion.etapa('fit', filas=len(X_train)):
+    model = xgb.XGBRegressor(objective='reg:squarederror', **hiperparametros(), early_stopping_rounds=10, eval_metric='mape', enable_categorical=True)
+    model.fit(X_train, y_train, eval_set=[(X_test, y_test)], verbose=False)
 print("✅ Modelo entrenado con éxito.")
 
 
 # --- 6. EVALUACIÓN DEL MODELO ---
 # (Esta sección no cambia)
 print("\nPaso 6: Evaluando el rendimiento...")
-y_pred = model.predict(X_test)
+with instrumentacion.etapa('evaluacion', filas=len(X_test)):
+    y_pred = model.predict(X_test)
 mape = mean_absolute_percentage_error(y_test, y_pred) * 100
 print("\n" + "="*50)
 print(f"  RESULTADO FINAL -> MAPE: {mape:.2f}%")
@@ -117,24 +123,20 @@ print("="*50 + "\n")
 
 
 # --- 7. INTERPRETACIÓN DEL MODELO (SHAP) ---
-# (Esta sección no cambia, usamos la versión compatible)
-print("Paso 7: Generando análisis de interpretabilidad (SHAP)...")
-explainer = shap.Explainer(model)
-shap_values = explainer(X_test, check_additivity=False)
-
-print("   Generando gráfico de barras de importancia...")
-shap.summary_plot(shap_values, X_test, plot_type="bar")
-
-fig = plt.gcf()
-fig.set_size_inches(10, 8)
-plt.tight_layout()
-
-output_path = os.path.join(os.getcwd(), 'shap_summary_final.png')
+# TreeSHAP nativo sobre una muestra estratificada del conjunto de prueba
+print(f"Paso 7: Generando análisis de interpretabilidad (SHAP, máx. {MAX_FILAS} filas y {MAX_SEGUNDOS:.0f} s)...")
+with instrumentacion.etapa('shap') as etapa:
+    explicacion = explicar_modelo(model, X_test)
+    etapa.filas = explicacion['filas']
+print(f"   {describir_explicacion(explicacion)}")
 try:
-    fig.savefig(output_path, bbox_inches='tight')
-    print(f"✅ Gráfico SHAP guardado en: {output_path}")
+    rutas = guardar_explicacion('final', explicacion, titulo='Importancia de Features')
+    print(f"✅ Gráficos SHAP guardados en: {rutas['barras']} y {rutas['beeswarm']}")
+    print(f"✅ Tabla de importancia guardada en: {rutas['importancia']}")
 except Exception as e:
     print(f"❌ Error al guardar el gráfico SHAP: {e}")
-plt.close(fig)
 
-print("\n--- Pipeline de entrenamiento finalizado ---")
\ No newline at end of file
+print("\n--- Pipeline de entrenamiento finalizado ---")
+
+instrumentacion.cerrar()
+print(f"\nEtapas ({instrumentacion.directorio}/):\n{instrumentacion.resumen()}")
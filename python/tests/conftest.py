@@ -0,0 +1,55 @@
+"""
+Datos y modelos compartidos por las pruebas de humo.
+
+Los modelos se entrenan ejecutando 'train_model_final.py' tal cual sobre una
+tabla gold sintética pequeña (FUENTE_DATOS=duckdb), para probar el resto de
+módulos con los tipos de features que produce el entrenamiento real.
+"""
+
+import os
+import sys
+import pickle
+import subprocess
+
+import pytest
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+sys.path.insert(0, SRC)
+
+CODIGOS_POSTALES = 3
+SIN_FIESTA = 'Sin fiesta'
+
+
+@pytest.fixture(scope='session')
+def lago_sintetico(tmp_path_factory):
+    """Raíz DATOS_LOCALES_PATH con gold_data.modelo_final_v2 sintética (3 códigos postales, 1 año)."""
+    from datos_sinteticos import generar_modelo_final_v2, escribir_gold
+    raiz = tmp_path_factory.mktemp('lago')
+    tabla, _ = generar_modelo_final_v2(codigos_postales=CODIGOS_POSTALES, sin_fiesta=SIN_FIESTA)
+    escribir_gold(tabla, str(raiz))
+    return raiz
+
+
+@pytest.fixture(scope='session')
+def entorno_local(lago_sintetico):
+    return {**os.environ, 'FUENTE_DATOS': 'duckdb', 'DATOS_LOCALES_PATH': str(lago_sintetico), 'CACHE_GOLD': '0',
+            'INSTRUMENTACION': '0', 'ENTRENAMIENTO_MAX_ARBOLES': '30', 'ENTRENAMIENTO_DESTILADO': '0',
+            'EXPLICACION_MAX_FILAS': '200', 'MPLBACKEND': 'Agg', 'PYTHONPATH': SRC}
+
+
+@pytest.fixture(scope='session')
+def modelos_train_model_final(lago_sintetico, entorno_local):
+    """{sector_nombre: XGBRegressor} guardados por train_model_final.py."""
+    salida = subprocess.run([sys.executable, os.path.join(SRC, 'train_model_final.py')], cwd=lago_sintetico,
+                            env=entorno_local, capture_output=True, text=True, timeout=900)
+    ruta = lago_sintetico / 'modelos_entrenados_por_sector.pkl'
+    assert ruta.exists(), salida.stdout[-2000:] + salida.stderr[-2000:]
+    with open(ruta, 'rb') as file:
+        return {sector: res['modelo'] for sector, res in pickle.load(file).items()}
+
+
+@pytest.fixture(scope='session')
+def historico(lago_sintetico):
+    """Tabla gold sintética completa como DataFrame (la lectura de los scripts)."""
+    from fuentes_datos import FuenteDuckDB
+    return FuenteDuckDB(str(lago_sintetico)).leer_tabla('gold_data.modelo_final_v2')
@@ -0,0 +1,14 @@
+import os
+import subprocess
+import sys
+
+from conftest import SRC
+
+
+def test_explicar_con_flota_se_rechaza(tmp_path):
+    salida = subprocess.run([sys.executable, os.path.join(SRC, 'batch_prediction.py'),
+                             '--flota', str(tmp_path), '--explicar', '3'],
+                            cwd=tmp_path, capture_output=True, text=True, timeout=300,
+                            env={**os.environ, 'PYTHONPATH': SRC, 'FUENTE_DATOS': 'duckdb'})
+    assert salida.returncode == 2
+    assert '--explicar no admite --flota' in salida.stderr
@@ -0,0 +1,45 @@
+import pandas as pd
+
+from cache_escenarios import CacheEscenarios, calcular_huella_historico, normalizar_escenario
+
+
+def test_predictores_distintos_no_comparten_ni_invalidan_entradas():
+    cache = CacheEscenarios(ttl_segundos=None)
+    escenario = normalizar_escenario(8001, 'Industrial', '2025-07-15', 3, 28.46, 60, False)
+    historico_a = pd.DataFrame({'mes': [7, 7], 'poblacion': [1000, 2000]})
+    historico_b = historico_a.assign(poblacion=[1000, 2500])
+    version_a = f"modelos-{calcular_huella_historico(historico_a)}"
+    version_b = f"modelos-{calcular_huella_historico(historico_b)}"
+    assert version_a != version_b
+    assert calcular_huella_historico(historico_a.set_index('mes', drop=False)) == calcular_huella_historico(historico_a)
+
+    cache.guardar(version_a, escenario, {'demanda': 1.0})
+    assert cache.obtener(version_b, escenario) is None
+    cache.guardar(version_b, escenario, {'demanda': 2.0})
+    assert cache.obtener(version_a, escenario) == {'demanda': 1.0}
+    assert cache.obtener(version_b, escenario) == {'demanda': 2.0}
+    assert cache.metricas()['versiones'] == 2
+
+
+def test_escenarios_cercanos_devuelven_su_propia_prediccion():
+    import numpy as np
+    import xgboost as xgb
+
+    # Escalón en 28.5 °C: 28.46 y 28.54 caían en la misma clave redondeada
+    temperaturas = np.round(np.arange(27.0, 30.0, 0.02), 2)
+    modelo = xgb.XGBRegressor(n_estimators=20, max_depth=2)
+    modelo.fit(pd.DataFrame({'temperatura_media_ciudad': temperaturas}), (temperaturas > 28.5) * 100.0)
+
+    def predecir(temperatura):
+        X = pd.DataFrame({'temperatura_media_ciudad': [temperatura]})
+        return {'prediccion_kw': float(modelo.predict(X)[0]), 'input': {'temperatura': temperatura}}
+
+    cache = CacheEscenarios(ttl_segundos=None)
+    sin_cache = {t: predecir(t) for t in (28.46, 28.54)}
+    assert sin_cache[28.46]['prediccion_kw'] != sin_cache[28.54]['prediccion_kw']
+    for _ in range(2):
+        for temperatura, esperado in sin_cache.items():
+            escenario = normalizar_escenario(8001, 'Residencial', '2025-07-15', 3, temperatura, 65, False)
+            resultado = cache.obtener_o_calcular('v', escenario, lambda: predecir(temperatura))
+            assert resultado == esperado
+    assert cache.metricas()['aciertos'] == 2
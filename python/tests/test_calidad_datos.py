@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+from calidad_datos import _Vistos, validar, describir_validacion, REGLAS_CLIMA_BRONZE, REGLAS_AEMET_BRONZE
+
+
+def test_vistos_con_lote_vacio():
+    vistos = _Vistos()
+    vistos.anadir(np.array([3, 1], dtype=np.uint64))
+    vistos.anadir(np.array([], dtype=np.uint64))
+    assert vistos.contiene(np.array([1, 2], dtype=np.uint64)).tolist() == [True, False]
+    vistos.anadir(np.array([2], dtype=np.uint64))
+    assert vistos.contiene(np.array([2, 5], dtype=np.uint64)).tolist() == [True, False]
+
+
+def test_columna_categorical_y_regla_sin_columna():
+    lecturas = pd.DataFrame({
+        'data_lectura': ['2024-01-01T00:00', '2024-01-01T00:00', '2024-01-01T00:00'],
+        'codi_estacio': pd.Categorical(['X4', 'D5', 'ZZ']),
+        'codi_variable': pd.Categorical(['32', '32', '32']),
+        'valor_lectura': ['10.5', '11', 'abc'],
+    })
+    informe = validar(lecturas, REGLAS_CLIMA_BRONZE).informe().set_index('regla')
+    assert informe.loc['estacion_conocida', 'violaciones'] == 1
+    assert informe.loc['valor_numerico', 'violaciones'] == 1
+
+    aemet = pd.DataFrame({'fecha': ['2024-01-01', '2024-01-02'], 'tmed': [12.0, 60.0],
+                          'tmin': [8.0, 9.0], 'tmax': [15.0, 16.0]})
+    validador = validar(aemet, REGLAS_AEMET_BRONZE)
+    informe = validador.informe().set_index('regla')
+    assert informe.loc['precipitacion_no_negativa', 'aplicable'] == 'no'
+    assert informe.loc['precipitacion_no_negativa', 'filas'] == 0
+    assert informe.loc['tmed_en_rango', 'violaciones'] == 1
+    assert 'prec' in describir_validacion(validador, 'aemet')
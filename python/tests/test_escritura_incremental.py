@@ -0,0 +1,74 @@
+import re
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from escritura_incremental import EscritorBigQuery, EscritorLocal
+
+
+def _predicciones(fechas, predicho=1.0):
+    return pd.DataFrame({
+        'fecha': pd.to_datetime(fechas), 'id_geografia': '08001', 'id_sector_economico': 1,
+        'sector_nombre': 'Industrial', 'id_tramo_horario': 1, 'consumo_kwh_real': 1.0, 'consumo_kwh_predicho': predicho,
+    })
+
+
+def test_particiones_completo_y_lote_vacio(tmp_path):
+    escritor = EscritorLocal(str(tmp_path / 'predicciones.duckdb'))
+    escritor.escribir(_predicciones(['2024-01-01', '2024-01-02']), modo='particiones')
+    escritor.escribir(_predicciones(['2024-01-02'], predicho=2.0), modo='particiones')
+    assert escritor.leer()['consumo_kwh_predicho'].tolist() == [1.0, 2.0]
+
+    # Un lote vacío (p. ej. una ventana sin datos) no genera 'IN ()' ni toca la tabla
+    assert escritor.escribir(_predicciones([]), modo='particiones')['fechas'] == 0
+    assert escritor.escribir(_predicciones([]), modo='merge')['fechas'] == 0
+    assert len(escritor.leer()) == 2
+
+    escritor.escribir(_predicciones(['2024-02-01'], predicho=3.0), modo='completo')
+    assert escritor.leer()['consumo_kwh_predicho'].tolist() == [3.0]
+
+
+class _ClienteBigQuery:
+    """Catálogo mínimo de BigQuery: {tabla: particionada}, con un fallo opcional en un renombrado."""
+
+    def __init__(self, *args, **kwargs):
+        self.tablas = {}
+        self.fallar_en = None
+
+    def get_table(self, tabla):
+        if tabla not in self.tablas:
+            raise LookupError(tabla)
+        return SimpleNamespace(time_partitioning=SimpleNamespace(field='fecha') if self.tablas[tabla] else None)
+
+    def delete_table(self, tabla, not_found_ok=False):
+        self.tablas.pop(tabla, None)
+
+    def query(self, sql):
+        creada = re.match(r"CREATE OR REPLACE TABLE `([^`]+)` PARTITION BY", sql)
+        renombrada = re.match(r"ALTER TABLE `([^`]+)` RENAME TO `([^`]+)`", sql)
+        if creada:
+            self.tablas[creada.group(1)] = True
+        elif renombrada:
+            if self.fallar_en == renombrada.group(1):
+                self.fallar_en = None
+                raise RuntimeError("corte entre renombrados")
+            origen = renombrada.group(1)
+            self.tablas[origen.rsplit('.', 1)[0] + '.' + renombrada.group(2)] = self.tablas.pop(origen)
+        return SimpleNamespace(result=lambda: None)
+
+
+def test_migracion_interrumpida_no_pierde_la_tabla(monkeypatch):
+    from google.cloud import bigquery
+    monkeypatch.setattr(bigquery, 'Client', _ClienteBigQuery)
+    escritor = EscritorBigQuery('proyecto', 'gold_data.predicciones')
+    cliente = escritor.client
+    cliente.tablas['proyecto.gold_data.predicciones'] = False
+    cliente.fallar_en = escritor.tabla_migracion
+
+    with pytest.raises(RuntimeError):
+        escritor._asegurar_tabla()
+    assert set(cliente.tablas) == {escritor.tabla_respaldo, escritor.tabla_migracion}
+
+    escritor._asegurar_tabla()
+    assert cliente.tablas == {'proyecto.gold_data.predicciones': True}
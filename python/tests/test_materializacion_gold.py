@@ -0,0 +1,55 @@
+import os
+
+import pandas as pd
+
+from materializacion_gold import (materializar_gold, leer_definicion, podar_tablas_anuales, RUTA_SILVER,
+                                  SCRIPTS_SILVER, TABLA_ORIGEN)
+
+
+class _Fuente:
+    def __init__(self, ultima_silver):
+        self.ultima_silver = pd.Timestamp(ultima_silver)
+        self.consultas = []
+
+    def existe_tabla(self, tabla):
+        return True
+
+    def ultima_fecha(self, tabla):
+        assert tabla == TABLA_ORIGEN
+        return self.ultima_silver
+
+    def bytes_escaneados(self, sql):
+        return None
+
+    def ejecutar(self, sql):
+        self.consultas.append(sql)
+
+
+def test_solo_desde_llega_hasta_la_ultima_fecha_de_silver():
+    fuente = _Fuente('2024-01-05')
+    silver, *gold = materializar_gold(fuente, desde='2024-01-03')
+    assert silver['modo'] == 'ventana' and silver['fechas'] == (pd.Timestamp('2024-01-03'), None)
+    assert gold and all(paso['fechas'] == list(pd.date_range('2024-01-03', '2024-01-05')) for paso in gold)
+    assert "DATE '2024-01-05'" in fuente.consultas[1]
+
+
+def test_solo_hasta_reescribe_ese_dia():
+    silver, *gold = materializar_gold(_Fuente('2024-01-05'), hasta='2024-01-02')
+    assert silver['fechas'] == (pd.Timestamp('2024-01-02'), '2024-01-02')
+    assert all(paso['fechas'] == [pd.Timestamp('2024-01-02')] for paso in gold)
+
+
+def test_silver_solo_relee_la_ventana_de_revision_y_sus_anios_de_bronze():
+    fuente = _Fuente('2025-01-02')
+    silver = materializar_gold(fuente, dias_revision=5, scripts=[])[0]
+    assert silver['fechas'] == (pd.Timestamp('2024-12-28'), None)
+    sql = fuente.consultas[0]
+    assert sql.count("WHERE fecha >= DATE '2024-12-28'") == 2
+    assert 'raw_consumo_electrico_2024' in sql and 'raw_consumo_electrico_2025' in sql
+    assert 'raw_consumo_electrico_2023' not in sql and 'CREATE OR REPLACE' not in sql
+
+
+def test_podar_tablas_anuales_fuera_de_rango_conserva_el_esquema():
+    _, select = leer_definicion(os.path.join(RUTA_SILVER, SCRIPTS_SILVER[0]))
+    podada = podar_tablas_anuales(select, '2030-01-01')
+    assert podada.count('raw_consumo_electrico_') == 1 and 'UNION ALL' not in podada
@@ -0,0 +1,35 @@
+import pandas as pd
+
+from fuentes_datos import FuenteDuckDB
+from monitorizacion_precision import AlmacenAcumuladores, actualizar, CLAVES
+
+
+def _pares(fechas_tramos):
+    filas = [{'id_sector_economico': 1, 'id_geografia': '08001', 'id_tramo_horario': tramo,
+              'fecha': pd.Timestamp(fecha), 'consumo_kwh': 100.0 * tramo} for fecha, tramo in fechas_tramos]
+    return pd.DataFrame(filas)
+
+
+def test_dia_a_medio_cargar_se_completa_en_la_siguiente_ejecucion(tmp_path):
+    completos = [(f, t) for f in ('2024-03-01', '2024-03-02', '2024-03-03') for t in (1, 2, 3, 4)]
+    reales_todos = _pares(completos)
+    predicciones = reales_todos.rename(columns={'consumo_kwh': 'consumo_kwh_predicho'})
+    predicciones['consumo_kwh_predicho'] *= 1.1
+
+    def leer_predicciones(desde):
+        return predicciones[predicciones['fecha'] >= pd.Timestamp(desde)] if desde is not None else predicciones
+
+    (tmp_path / 'gold_data').mkdir()
+    ruta_reales = tmp_path / 'gold_data' / 'modelo_final_v2.parquet'
+    almacen = AlmacenAcumuladores(str(tmp_path / 'monitorizacion'))
+
+    # Primera ejecución: el día 2 solo tiene cargados dos de sus cuatro tramos
+    reales_todos[:6].to_parquet(ruta_reales, index=False)
+    actualizar(FuenteDuckDB(str(tmp_path)), almacen, leer_predicciones=leer_predicciones)
+    assert almacen.ultima_fecha() == pd.Timestamp('2024-03-02')
+
+    reales_todos.to_parquet(ruta_reales, index=False)
+    resumen = actualizar(FuenteDuckDB(str(tmp_path)), almacen, leer_predicciones=leer_predicciones)
+    por_dia = almacen.leer().groupby('fecha')['n'].sum()
+    assert por_dia.tolist() == [4, 4, 4] and resumen['desde'] == '2024-02-29'
+    assert almacen.leer()[CLAVES].duplicated().sum() == 0
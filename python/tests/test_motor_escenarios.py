@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from motor_escenarios import RejillaEscenarios, evaluar_rejilla
+
+
+def test_rejilla_con_modelos_de_train_model_final(modelos_train_model_final, historico, lago_sintetico, tmp_path):
+    rejilla = RejillaEscenarios(
+        temperaturas=np.array([10.0, 35.0]), humedades=np.array([50.0]),
+        fechas=pd.date_range('2024-07-15', periods=2), codigos_postales=historico['id_geografia'].unique(),
+        sectores=np.array([1, 2, 3]), tramos=np.array([1, 3]),
+    )
+    ruta_salida = tmp_path / 'escenarios.parquet'
+    metricas = evaluar_rejilla(rejilla, str(lago_sintetico / 'modelos_entrenados_por_sector.pkl'), historico,
+                               str(ruta_salida), n_procesos=0, filas_por_trozo=10)
+
+    resultado = pd.read_parquet(ruta_salida)
+    assert metricas['filas'] == len(resultado) == len(rejilla)
+    assert np.isfinite(resultado['consumo_kwh_predicho']).all()
+    assert sorted(resultado['id_tramo_horario'].unique()) == [1, 3]
+
+
+def test_temperaturas_de_estacion_siguen_a_la_del_escenario(historico):
+    from motor_escenarios import preparar_contexto, construir_features
+    from pronostico_multihorizonte import COLUMNAS_CLIMA, climatologia_por_tramo, construir_clima_futuro
+
+    rejilla = RejillaEscenarios(temperaturas=np.array([5.0, 38.0]), humedades=np.array([50.0]),
+                                fechas=['2024-07-15'], codigos_postales=historico['id_geografia'].unique()[:1],
+                                sectores=np.array([1]), tramos=np.array([3]))
+    contexto = preparar_contexto(historico, rejilla)
+    features = construir_features(contexto, rejilla.coordenadas(0, len(rejilla)), 1, COLUMNAS_CLIMA, set())
+
+    climatologia = climatologia_por_tramo(historico).loc[(7, 3)]
+    desfase = features['temperatura_media_ciudad'] - climatologia['temperatura_media_ciudad']
+    for estacion in ['temp_raval', 'temp_zuniversitaria', 'temp_fabra']:
+        np.testing.assert_allclose(features[estacion], climatologia[estacion] + desfase)
+    np.testing.assert_allclose(features['temp_spread_montana_centro'], climatologia['temp_spread_montana_centro'])
+
+    futuro = construir_clima_futuro(climatologia_por_tramo(historico), ['2024-07-15'], temperatura=38.0)
+    fila = futuro[futuro['id_tramo_horario'] == 3].iloc[0]
+    assert fila['temp_raval'] == pytest.approx(climatologia['temp_raval'] + 38.0 - climatologia['temperatura_media_ciudad'])
@@ -0,0 +1,20 @@
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from niveles_modelo import construir_niveles
+
+
+def test_destilado_no_usa_el_conjunto_de_prueba():
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame({'temperatura': rng.uniform(0, 35, 1200), 'tramo': rng.integers(1, 5, 1200)})
+    y = (X['temperatura'] - 20) ** 2 + 50 * X['tramo'] + rng.normal(0, 5, 1200)
+    X_train, X_test, y_train, y_test = X[:1000], X[1000:], y[:1000], y[1000:]
+    modelo = xgb.XGBRegressor(n_estimators=60, max_depth=4, early_stopping_rounds=10)
+    modelo.fit(X_train, y_train, eval_set=[(X_test, y_test)], verbose=False)
+
+    niveles = construir_niveles(modelo, X_train, X_test, y_test)
+    otros = construir_niveles(modelo, X_train, X_test.iloc[::-1] * 2, y_test.iloc[::-1])
+    assert (bytes(niveles['destilado']['modelo'].get_booster().save_raw())
+            == bytes(otros['destilado']['modelo'].get_booster().save_raw()))
+    assert niveles['destilado']['mape'] != otros['destilado']['mape']
@@ -0,0 +1,25 @@
+from pipeline_sql import ejecutar_dag
+
+
+class _Fuente:
+    """Fuente mínima: la entrada externa no informa de su modificación."""
+
+    def ultima_modificacion(self, tabla):
+        return None
+
+    def existe_tabla(self, tabla):
+        return True
+
+
+def _nodo(nombre, depende_de=(), externas=()):
+    return {'nombre': nombre, 'destino': f'ds.{nombre}', 'hash_sql': nombre, 'depende_de': list(depende_de),
+            'externas': list(externas), 'ruta': None}
+
+
+def test_dependiente_de_nodo_sin_firma_se_ejecuta_siempre(tmp_path):
+    nodos = {'silver': _nodo('silver', externas=['bronze.lecturas']), 'gold': _nodo('gold', depende_de=['silver'])}
+    ruta_estado = str(tmp_path / 'estado.json')
+    for _ in range(2):
+        resultados = ejecutar_dag(_Fuente(), nodos, n_hilos=2, ruta_estado=ruta_estado,
+                                  ejecutar_nodo=lambda fuente, nodo: None)
+        assert [r['estado'] for r in resultados] == ['ejecutado', 'ejecutado']
@@ -0,0 +1,17 @@
+import numpy as np
+
+from pronostico_multihorizonte import pronosticar_ciudad, columnas_categoricas, TRAMOS_POR_DIA
+
+
+def test_tramo_entero_en_modelos_de_train_model_final(modelos_train_model_final):
+    for modelo in modelos_train_model_final.values():
+        assert 'id_tramo_horario' not in columnas_categoricas(modelo)
+        assert 'id_geografia' in columnas_categoricas(modelo)
+
+
+def test_pronostico_con_modelos_de_train_model_final(modelos_train_model_final, historico):
+    pronostico = pronosticar_ciudad(modelos_train_model_final, historico, horizonte_dias=2)
+    series = historico.groupby(['id_sector_economico', 'id_geografia']).ngroups
+    assert len(pronostico) == series * 2 * TRAMOS_POR_DIA
+    assert np.isfinite(pronostico['consumo_kwh_predicho']).all()
+    assert (pronostico['consumo_kwh_predicho'] > 0).all()
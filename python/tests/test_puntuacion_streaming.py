@@ -0,0 +1,26 @@
+import glob
+
+import numpy as np
+import pandas as pd
+
+from puntuacion_streaming import (EstadoStreaming, ConsumidorStreaming, FuenteDirectorio, SumideroParquet,
+                                  depositar_fichero, COLUMNAS_ENTRADA)
+
+
+def test_micro_lote_de_extremo_a_extremo(modelos_train_model_final, historico, tmp_path):
+    ultimo_dia = historico['fecha'].max()
+    pasado = historico[historico['fecha'] < ultimo_dia]
+    lote = historico[(historico['fecha'] == ultimo_dia) & (historico['id_tramo_horario'] == 1)]
+
+    consumidor = ConsumidorStreaming(modelos_train_model_final, EstadoStreaming(pasado),
+                                     FuenteDirectorio(str(tmp_path / 'landing')), SumideroParquet(str(tmp_path / 'salida')))
+    depositar_fichero(lote[COLUMNAS_ENTRADA], str(tmp_path / 'landing'))
+    emitidos = consumidor.procesar_lote()
+
+    assert emitidos == len(lote)
+    pronosticos = pd.concat(pd.read_parquet(r) for r in glob.glob(str(tmp_path / 'salida' / '*.parquet')))
+    assert (pronosticos['id_tramo_horario'] == 2).all()
+    assert (pd.to_datetime(pronosticos['fecha']) == pd.Timestamp(ultimo_dia)).all()
+    assert np.isfinite(pronosticos['consumo_kwh_predicho']).all()
+    # El fichero leído se confirma (movido a procesados/) solo tras escribir
+    assert len(glob.glob(str(tmp_path / 'landing' / 'procesados' / '*.parquet'))) == 1